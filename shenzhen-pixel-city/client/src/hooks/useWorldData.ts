@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback, useRef } from "react";
-import type { WorldState, Moment } from "@/types/world";
+import type { WorldState, Moment, BotState, LocationState, WorldEvent } from "@/types/world";
 import { MOCK_WORLD, MOCK_MOMENTS } from "@/lib/mockData";
 
 // 全局 engineUrl，支持运行时动态修改
@@ -22,6 +22,60 @@ export interface WorldDataState {
   error: string | null;
 }
 
+// /stream 推送的增量帧，结构与 /world/changes 相同
+type EntityKind = "bots" | "locations" | "moments" | "events" | "rules";
+
+interface WorldChanges {
+  version: number;
+  epoch: string;
+  reset: boolean;
+  bots: Record<string, BotState>;
+  locations: Record<string, LocationState>;
+  moments: Record<string, Moment>;
+  events: Record<string, WorldEvent>;
+  rules: Record<string, unknown>;
+  globals: Record<string, unknown>;
+  removed: Partial<Record<EntityKind, string[]>>;
+}
+
+type WorldMirror = Omit<WorldChanges, "version" | "epoch" | "reset" | "removed">;
+
+const emptyMirror = (): WorldMirror => ({
+  bots: {}, locations: {}, moments: {}, events: {}, rules: {}, globals: {},
+});
+
+// 把一帧增量打到本地镜像上（reset 帧从空镜像开始）
+function applyChanges(prev: WorldMirror, diff: WorldChanges): WorldMirror {
+  const base = diff.reset ? emptyMirror() : prev;
+  const next: WorldMirror = {
+    bots: { ...base.bots, ...diff.bots },
+    locations: { ...base.locations, ...diff.locations },
+    moments: { ...base.moments, ...diff.moments },
+    events: { ...base.events, ...diff.events },
+    rules: { ...base.rules, ...diff.rules },
+    globals: { ...base.globals, ...diff.globals },
+  };
+  for (const [kind, keys] of Object.entries(diff.removed || {}) as [EntityKind, string[]][]) {
+    for (const key of keys) delete (next[kind] as Record<string, unknown>)[key];
+  }
+  return next;
+}
+
+// 由镜像还原出与 /world、/moments 相同形状的数据
+function materialize(mirror: WorldMirror): { world: WorldState; moments: Moment[] } {
+  const byTick = <T extends { tick: number }>(items: T[]) => [...items].sort((a, b) => a.tick - b.tick);
+  const moments = byTick(Object.values(mirror.moments));
+  const world = {
+    ...mirror.globals,
+    bots: mirror.bots,
+    locations: mirror.locations,
+    events: byTick(Object.values(mirror.events)).slice(-10),
+    moments: moments.slice(-20),
+    active_rules: Object.values(mirror.rules),
+  } as unknown as WorldState;
+  return { world, moments };
+}
+
 export function useWorldData(pollInterval = 3000, engineUrl?: string) {
   const [state, setState] = useState<WorldDataState>({
     world: null,
@@ -40,31 +94,46 @@ export function useWorldData(pollInterval = 3000, engineUrl?: string) {
 
   const timerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const isMountedRef = useRef(true);
+  // 上次响应的 ETag，轮询时带 If-None-Match，没变化时引擎返回空的 304
+  const etagRef = useRef<{ world: string | null; moments: string | null }>({ world: null, moments: null });
+  // /stream 推送模式下的本地镜像
+  const mirrorRef = useRef<WorldMirror>(emptyMirror());
 
   const fetchWorld = useCallback(async () => {
     const url = engineUrlRef.current;
+    const conditional = (etag: string | null): RequestInit => ({
+      signal: AbortSignal.timeout(5000),
+      headers: etag ? { "If-None-Match": etag } : undefined,
+    });
     try {
       const [worldRes, momentsRes] = await Promise.all([
-        fetch(`${url}/world`, { signal: AbortSignal.timeout(5000) }),
-        fetch(`${url}/moments`, { signal: AbortSignal.timeout(5000) }),
+        fetch(`${url}/world`, conditional(etagRef.current.world)),
+        fetch(`${url}/moments`, conditional(etagRef.current.moments)),
       ]);
 
-      if (!worldRes.ok) throw new Error(`HTTP ${worldRes.status}`);
+      const worldChanged = worldRes.status !== 304;
+      const momentsChanged = momentsRes.status !== 304;
+      if (worldChanged && !worldRes.ok) throw new Error(`HTTP ${worldRes.status}`);
 
-      const worldData: WorldState = await worldRes.json();
-      const momentsData = momentsRes.ok ? await momentsRes.json() : { moments: [] };
+      const worldData: WorldState | null = worldChanged ? await worldRes.json() : null;
+      const momentsData = !momentsChanged ? null : momentsRes.ok ? await momentsRes.json() : { moments: [] };
 
       if (!isMountedRef.current) return;
 
+      if (worldChanged) etagRef.current.world = worldRes.headers.get("ETag");
+      if (momentsChanged) etagRef.current.moments = momentsRes.ok ? momentsRes.headers.get("ETag") : null;
+
       // world_engine /moments 返回 { moments: [...] } 或直接 [...]
-      const momentsList = Array.isArray(momentsData)
-        ? momentsData
-        : (momentsData.moments || []);
+      const momentsList: Moment[] | null = momentsData === null
+        ? null
+        : Array.isArray(momentsData)
+          ? momentsData
+          : (momentsData.moments || []);
 
       setState(prev => ({
         ...prev,
-        world: worldData,
-        moments: momentsList,
+        world: worldData ?? prev.world,
+        moments: momentsList ?? prev.moments,
         isConnected: true,
         isLoading: false,
         lastUpdated: new Date(),
@@ -72,6 +141,7 @@ export function useWorldData(pollInterval = 3000, engineUrl?: string) {
       }));
     } catch (err) {
       if (!isMountedRef.current) return;
+      etagRef.current = { world: null, moments: null };
       // 连接失败时使用 Mock 数据，让界面可以正常展示
       setState(prev => ({
         ...prev,
@@ -84,17 +154,15 @@ export function useWorldData(pollInterval = 3000, engineUrl?: string) {
     }
   }, []);
 
-  // 当 engineUrl 变化时立即重新拉取
-  useEffect(() => {
-    if (engineUrl) {
-      engineUrlRef.current = engineUrl;
-      fetchWorld();
-    }
-  }, [engineUrl, fetchWorld]);
-
+  // 优先订阅 /stream 推送；引擎不支持或浏览器没有 EventSource 时退回 ETag 轮询。
+  // engineUrl 变化时整体重建连接。
   useEffect(() => {
     isMountedRef.current = true;
-    fetchWorld();
+    if (engineUrl) engineUrlRef.current = engineUrl;
+    etagRef.current = { world: null, moments: null };
+    mirrorRef.current = emptyMirror();
+    let source: EventSource | null = null;
+    let streamed = false;
 
     const schedule = () => {
       timerRef.current = setTimeout(() => {
@@ -103,13 +171,51 @@ export function useWorldData(pollInterval = 3000, engineUrl?: string) {
         });
       }, pollInterval);
     };
-    schedule();
+    const startPolling = () => {
+      fetchWorld();
+      schedule();
+    };
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+    } else {
+      source = new EventSource(`${engineUrlRef.current}/stream`);
+      source.addEventListener("changes", (ev) => {
+        if (!isMountedRef.current) return;
+        streamed = true;
+        const diff = JSON.parse((ev as MessageEvent).data) as WorldChanges;
+        mirrorRef.current = applyChanges(mirrorRef.current, diff);
+        const { world, moments } = materialize(mirrorRef.current);
+        setState(prev => ({
+          ...prev,
+          world,
+          moments,
+          isConnected: true,
+          isLoading: false,
+          lastUpdated: new Date(),
+          error: null,
+        }));
+      });
+      source.onerror = () => {
+        if (!isMountedRef.current) return;
+        if (!streamed) {
+          // 从没收到过推送：旧版引擎或连接失败，退回轮询
+          source?.close();
+          source = null;
+          startPolling();
+        } else {
+          // EventSource 会带 Last-Event-ID 自动重连，从断点续推
+          setState(prev => ({ ...prev, isConnected: false, error: "推送连接中断，正在重连" }));
+        }
+      };
+    }
 
     return () => {
       isMountedRef.current = false;
+      source?.close();
       if (timerRef.current) clearTimeout(timerRef.current);
     };
-  }, [fetchWorld, pollInterval]);
+  }, [fetchWorld, pollInterval, engineUrl]);
 
   return { ...state, refresh: fetchWorld };
 }
@@ -0,0 +1,172 @@
+"""
+v10.3 后台任务队列 (Background Jobs)
+====================================
+把 world_tick 里的 LLM 副任务（新闻/热搜、世界叙事、地点氛围）移出世界锁。
+
+每个任务分两半:
+- compute(): 在工作线程里执行，不持有世界锁，只使用入队时拍下的快照数据（可调用 LLM）
+- apply(result): 由 tick 在下一个 tick 边界调用 drain() 时执行，此时持有世界锁
+
+这样 tick 的临界区只剩纯内存计算，慢的 LLM 供应商不会再冻结整个 API。
+
+v10.10: 优先级 + 即时提交
+- 待执行任务按优先级出队（PRIORITY_HIGH 先于 NORMAL 先于 LOW），同优先级先进先出
+- 构造时传 commit_lock 的队列不等 tick 边界：工作线程算完后立刻持锁执行 apply（串行提交），
+  然后调用 on_commit（如发布视图）。用于 execute() 里对话/自拍/死亡等"即发即忘"的后果，
+  替代过去每次 new Thread、不持锁改 world 的做法
+- compute 可以为 None（纯内存的后果，只需要串行提交）
+
+用法:
+    jobs = JobQueue(workers=2)
+    jobs.start()
+    jobs.submit("vibe:华强北", compute_fn, apply_fn)   # 同 key 未完成时不会重复入队
+    ...
+    with lock:
+        jobs.drain()                                      # tick 开头应用上一轮的结果
+
+    deferred = JobQueue(workers=4, name="deferred", commit_lock=lock, on_commit=publish)
+    deferred.submit("death:bot_1", None, apply_fn, priority=PRIORITY_HIGH)
+"""
+
+import itertools
+import logging
+import queue
+import time
+from collections import deque
+from threading import Thread, Lock
+
+log = logging.getLogger("world")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+
+class JobQueue:
+    """固定大小的工作线程池 + 结果回放队列"""
+
+    def __init__(self, workers=2, maxsize=64, name="bg", commit_lock=None, on_commit=None):
+        self.name = name
+        self.workers = workers
+        self.commit_lock = commit_lock
+        self.on_commit = on_commit
+        self._pending = queue.PriorityQueue(maxsize=maxsize)
+        self._seq = itertools.count()  # 同优先级按入队顺序
+        self._depth = {}               # priority -> 排队中的任务数
+        self._ready = deque()          # (key, apply_fn, result)，等待 tick 边界应用
+        self._inflight = set()         # 已入队或正在执行/等待应用的 key
+        self._mu = Lock()              # 只保护 _inflight 和统计，与世界锁无关
+        self._threads = []
+        self._stats = {
+            "submitted": 0, "deduped": 0, "dropped": 0,
+            "completed": 0, "failed": 0, "applied": 0,
+            "compute_ms_total": 0.0, "compute_ms_max": 0.0,
+            "wait_ms_total": 0.0, "wait_ms_max": 0.0, "max_depth": 0,
+        }
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = Thread(target=self._worker, name=f"{self.name}-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        log.info(f"[JOBS] 后台任务队列已启动: {self.workers}个工作线程")
+
+    def submit(self, key, compute, apply=None, priority=PRIORITY_NORMAL):
+        """入队一个任务。同 key 任务尚未应用完时跳过；队列满时丢弃。返回是否入队成功。"""
+        with self._mu:
+            if key in self._inflight:
+                self._stats["deduped"] += 1
+                return False
+            self._inflight.add(key)
+            self._stats["submitted"] += 1
+            self._depth[priority] = self._depth.get(priority, 0) + 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], sum(self._depth.values()))
+        try:
+            self._pending.put_nowait((priority, next(self._seq), time.perf_counter(), key, compute, apply))
+        except queue.Full:
+            with self._mu:
+                self._inflight.discard(key)
+                self._depth[priority] -= 1
+                self._stats["dropped"] += 1
+            log.warning(f"[JOBS] {self.name}队列已满，丢弃任务: {key}")
+            return False
+        return True
+
+    def _worker(self):
+        while True:
+            priority, _, queued_at, key, compute, apply = self._pending.get()
+            t0 = time.perf_counter()
+            with self._mu:
+                self._depth[priority] -= 1
+                waited = (t0 - queued_at) * 1000
+                self._stats["wait_ms_total"] += waited
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited)
+            try:
+                result = compute() if compute else None
+            except Exception as e:
+                log.error(f"[JOBS] 任务{key}执行失败: {e}")
+                with self._mu:
+                    self._inflight.discard(key)
+                    self._stats["failed"] += 1
+                continue
+            elapsed = (time.perf_counter() - t0) * 1000
+            with self._mu:
+                self._stats["completed"] += 1
+                self._stats["compute_ms_total"] += elapsed
+                self._stats["compute_ms_max"] = max(self._stats["compute_ms_max"], elapsed)
+                if apply is None:
+                    self._inflight.discard(key)
+                elif self.commit_lock is None:
+                    self._ready.append((key, apply, result))
+            if apply is not None and self.commit_lock is not None:
+                self._commit(key, apply, result)
+
+    def _commit(self, key, apply, result):
+        """即时提交：持 commit_lock 串行应用结果，然后回调 on_commit"""
+        with self.commit_lock:
+            try:
+                apply(result)
+                if self.on_commit:
+                    self.on_commit()
+            except Exception as e:
+                log.error(f"[JOBS] 任务{key}结果应用失败: {e}")
+        with self._mu:
+            self._inflight.discard(key)
+            self._stats["applied"] += 1
+
+    def drain(self):
+        """应用所有已完成任务的结果。调用方必须持有世界锁（tick 边界）。返回应用条数。"""
+        applied = 0
+        while True:
+            with self._mu:
+                if not self._ready:
+                    break
+                key, apply, result = self._ready.popleft()
+            try:
+                apply(result)
+                applied += 1
+            except Exception as e:
+                log.error(f"[JOBS] 任务{key}结果应用失败: {e}")
+            with self._mu:
+                self._inflight.discard(key)
+                self._stats["applied"] += 1
+        return applied
+
+    def stats(self):
+        """队列状态与累计统计"""
+        with self._mu:
+            s = dict(self._stats)
+            s["inflight"] = sorted(self._inflight)
+            s["ready"] = len(self._ready)
+            s["pending_by_priority"] = {p: n for p, n in sorted(self._depth.items()) if n}
+        s["pending"] = self._pending.qsize()
+        s["workers"] = self.workers
+        done = s["completed"] or 1
+        s["compute_ms_avg"] = round(s.pop("compute_ms_total") / done, 1)
+        s["compute_ms_max"] = round(s["compute_ms_max"], 1)
+        s["wait_ms_avg"] = round(s.pop("wait_ms_total") / ((s["completed"] + s["failed"]) or 1), 1)
+        s["wait_ms_max"] = round(s["wait_ms_max"], 1)
+        return s
@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 """
 深圳生存模拟 - Bot智能体 v9.0 (自我进化)
+v10.14 新增:
+- 每个 bot 的状态收进 BotAgent 对象，不再放在模块全局变量里
+- 单独运行时（python3 bot_agent_v8.py，BOT_ID 环境变量）仍是一个进程一个 bot；
+  bot_runner.py 可以在一个进程里托管多个 BotAgent，共用 LLM 网关和 HTTP 连接池
 v9.0 新增:
 - 感知地点历史和城市传说
 - 声望系统感知 (知道自己和别人的声望)
@@ -19,25 +23,31 @@ v8 原有:
 
 import os, sys, time, json, logging, re, random
 import requests
-from threading import Timer
 
-from config import get_openai_client, LOGS_DIR, PROJECT_ROOT, OPENAI_MODEL_NANO, OPENAI_MODEL_MINI
+from config import LOGS_DIR, PROJECT_ROOT, OPENAI_MODEL_NANO, OPENAI_MODEL_MINI
+from llm_gateway import get_llm_gateway
+from sync_protocol import PROTOCOL as SYNC_PROTOCOL, SyncTracker
 
 BOT_ID = os.environ.get("BOT_ID", "bot_1")
 WORLD_URL = os.environ.get("WORLD_ENGINE_URL", "http://localhost:8000")
 
-# 日志设置（使用 config 中的路径）
-os.makedirs(LOGS_DIR, exist_ok=True)
-log = logging.getLogger(BOT_ID)
-log.setLevel(logging.DEBUG)
-fh = logging.FileHandler(os.path.join(LOGS_DIR, f"{BOT_ID}.log"), encoding="utf-8")
-fh.setFormatter(logging.Formatter(f"%(asctime)s [{BOT_ID}] %(levelname)s %(message)s"))
-sh = logging.StreamHandler()
-sh.setFormatter(logging.Formatter(f"%(asctime)s [{BOT_ID}] %(levelname)s %(message)s"))
-log.addHandler(fh)
-log.addHandler(sh)
 
-client = get_openai_client()
+def make_logger(bot_id):
+    """每个 bot 一个 logger（日志文件 logs/<bot_id>.log），同一进程里重复调用不会重复挂 handler"""
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    log = logging.getLogger(bot_id)
+    if log.handlers:
+        return log
+    log.setLevel(logging.DEBUG)
+    log.propagate = False  # bot_runner 里根 logger 另有 handler，避免重复输出
+    fmt = logging.Formatter(f"%(asctime)s [{bot_id}] %(levelname)s %(message)s")
+    fh = logging.FileHandler(os.path.join(LOGS_DIR, f"{bot_id}.log"), encoding="utf-8")
+    fh.setFormatter(fmt)
+    sh = logging.StreamHandler()
+    sh.setFormatter(fmt)
+    log.addHandler(fh)
+    log.addHandler(sh)
+    return log
 
 # ============================================================
 # 人设加载
@@ -105,18 +115,20 @@ PERSONAS = {
                "family_info": ""},
 }
 
-persona = PERSONAS.get(BOT_ID, PERSONAS["bot_1"])
-
-# v9.0: 支持代际传承 - 读取人设覆盖文件
-try:
-    override_path = os.path.join(PROJECT_ROOT, f"persona_override_{BOT_ID}.json")
-    if os.path.exists(override_path):
-        with open(override_path, "r") as f:
-            override = json.load(f)
-        persona = override
-        log.info(f"[v9.0] 加载代际传承人设: {override.get('name', '?')}")
-except Exception as e:
-    log.error(f"[v9.0] 加载人设覆盖失败: {e}")
+def load_persona(bot_id, log):
+    """人设：PERSONAS 中的默认人设，存在代际传承覆盖文件时以覆盖文件为准"""
+    persona = PERSONAS.get(bot_id, PERSONAS["bot_1"])
+    # v9.0: 支持代际传承 - 读取人设覆盖文件
+    try:
+        override_path = os.path.join(PROJECT_ROOT, f"persona_override_{bot_id}.json")
+        if os.path.exists(override_path):
+            with open(override_path, "r") as f:
+                override = json.load(f)
+            persona = override
+            log.info(f"[v9.0] 加载代际传承人设: {override.get('name', '?')}")
+    except Exception as e:
+        log.error(f"[v9.0] 加载人设覆盖失败: {e}")
+    return persona
 
 # === 名字→bot_id映射表 ===
 NAME_TO_ID = {v["name"]: k for k, v in PERSONAS.items()}
@@ -127,19 +139,6 @@ def normalize_target_id(name_or_id):
         return name_or_id
     return NAME_TO_ID.get(name_or_id, name_or_id)
 
-# ============================================================
-# 记忆系统
-# ============================================================
-memory = []           # 滚动记忆 (最近30条)
-core_memories = []    # 核心记忆 (永不丢失，最多20条)
-inner_thoughts = []   # 内心独白历史
-recent_actions = []   # v8.3: 最近行动(行动+内容摘要，用于反重复)
-long_term_goal = None # v8.3: 长期目标
-narrative_summary = "" # v8.3: 内心叙事摘要
-
-# v8.3.2: 心流状态与无聊感
-flow_state = {"active": False, "activity": None, "streak": 0}  # 心流状态
-boredom_level = 0  # 无聊感 (0-100)
 
 def is_similar_memory(new_mem, existing_mems, threshold=0.6):
     """检测新记忆是否与已有记忆重复（字符重叠比）"""
@@ -157,234 +156,30 @@ def is_similar_memory(new_mem, existing_mems, threshold=0.6):
             return True
     return False
 
-# 动态价值观 (会随经历演化)
-dynamic_values = {
-    "original": persona["values"],
-    "current": persona["values"],
-    "shifts": [],
-}
-
-# 情感关系
-emotional_bonds = {}
-
-# 最近看到的信息 (新闻/朋友圈)
-recent_info = []
-
-# ============================================================
-# 心跳循环
-# ============================================================
-running = True
-heartbeat_count = 0
-
-def heartbeat():
-    global heartbeat_count
-    if not running:
-        return
-
-    heartbeat_count += 1
-    log.info("--- 心跳开始 ---")
-    my_state = None
-    try:
-        # 1. 感知世界
-        resp = requests.get(f"{WORLD_URL}/world", timeout=10)
-        world = resp.json()
-        my_state = world["bots"].get(BOT_ID)
-
-        if not my_state or my_state["status"] == "dead":
-            log.error("我已经死了...世界变得一片黑暗。")
-            return
-
-        aging_rate = my_state.get('aging_rate', 0.02)
-        aging_warn = ' ⚠️加速衰老!' if aging_rate > 0.03 else ''
-        log.info(f"状态: 寿命={my_state['hp']:.1f}/100{aging_warn} 钱={my_state['money']} 能量={my_state['energy']} "
-                 f"饱腹={my_state['satiety']} 位置={my_state['location']} "
-                 f"睡觉={my_state.get('is_sleeping', False)} "
-                 f"天气={world.get('weather', {}).get('current', '?')}")
-
-        # === 睡眠状态处理 ===
-        if my_state.get("is_sleeping", False):
-            h = world["time"]["virtual_hour"]
-            should_wake = False
-            if 7 <= h < 23 and my_state["energy"] >= 80:
-                should_wake = True
-            elif my_state["energy"] >= 95:
-                should_wake = True
-
-            if should_wake:
-                log.info("能量恢复了，该起床了！")
-                try:
-                    requests.post(f"{WORLD_URL}/bot/{BOT_ID}/action",
-                                  json={"plan": "起床"}, timeout=15)
-                except:
-                    pass
-            else:
-                log.info(f"💤 还在睡觉... 能量={my_state['energy']}")
-                if random.random() < 0.1:
-                    dream = generate_dream(my_state, world)
-                    log.warning(f"[梦境] {dream}")
-                    memory.append(f"[梦境] {dream}")
-
-            Timer(90, heartbeat).start()
-            return
-
-        # 2. 获取发给我的消息 + pending_reply
-        recent_msgs = []
-        high_priority_msgs = []
-        pending_reply = None
-        try:
-            msg_resp = requests.get(f"{WORLD_URL}/messages/{BOT_ID}", timeout=5)
-            msg_data = msg_resp.json()
-            messages = msg_data.get("messages", [])
-            pending_reply = msg_data.get("pending_reply_to")  # v8.3: 双向对话
-            recent_msgs = messages[-8:]
-            for m in recent_msgs:
-                msg_text = f"[消息] {m['from']}对我说: {m['msg']}"
-                if msg_text not in memory:
-                    memory.append(msg_text)
-                    log.info(msg_text)
-                if m.get("priority") == "high":
-                    high_priority_msgs.append(m)
-                family = my_state.get("family", {})
-                parents = family.get("parents", [])
-                children = family.get("children", [])
-                if m["from"] in parents or m["from"] in children:
-                    if m not in high_priority_msgs:
-                        high_priority_msgs.append(m)
-        except:
-            recent_msgs = []
-            pending_reply = None
-
-        # 3. 获取朋友圈动态 (被动感知)
-        moments_context = get_moments_context()
-
-        # 4. 内心独白 + 决策 (v8.3: 传入pending_reply)
-        thought, plan = think_and_plan(world, my_state, recent_msgs, high_priority_msgs, moments_context, pending_reply)
-        log.warning(f"[内心独白] {thought}")
-        log.info(f"[决策] {plan}")
-
-        # 5. 提交行动
-        action_resp = requests.post(
-            f"{WORLD_URL}/bot/{BOT_ID}/action",
-            json={"plan": plan},
-            timeout=30
-        )
-        result = action_resp.json()
-        result_data = result.get("result", {})
-        result_str = json.dumps(result_data, ensure_ascii=False) if isinstance(result_data, dict) else str(result_data)
-        
-        # v10.0: 提取丰富的反馈信息
-        feedback_narrative = ""
-        feedback_text = ""
-        if isinstance(result_data, dict):
-            feedback_narrative = result_data.get("narrative", "")
-            feedback_text = result_data.get("feedback", "")
-            success = result_data.get("success", True)
-            world_change = result_data.get("world_change")
-            social_effects = result_data.get("social_effects", [])
-            
-            # 构建有意义的记忆条目
-            mem_parts = [f"[{world['time']['virtual_datetime']}] 我做了: {plan}"]
-            if feedback_narrative:
-                mem_parts.append(f"结果: {feedback_narrative[:80]}")
-            if not success:
-                mem_parts.append("(失败了)")
-            if world_change:
-                mem_parts.append(f"创造了: {world_change}")
-            if social_effects:
-                mem_parts.append(f"社交影响: {', '.join(social_effects[:2])}")
-            if feedback_text:
-                mem_parts.append(f"感受: {feedback_text[:40]}")
-            action_record = " | ".join(mem_parts)
-        else:
-            action_record = f"[{world['time']['virtual_datetime']}] 我做了: {plan} -> {result_str[:80]}"
-        
-        log.info(f"[结果] {feedback_narrative or result_str[:80]}")
-        if feedback_text:
-            log.info(f"[反馈] {feedback_text[:60]}")
-        memory.append(action_record)
-        # v8.3: 升级反重复 - 行动+内容摘要作为联合键
-        action_digest = f"{plan[:15]}|{result_str[:15]}"
-        recent_actions.append(action_digest)
-        if len(recent_actions) > 8:
-            recent_actions.pop(0)
-
-        # v8.3.2: 心流状态更新
-        update_flow_state(plan, result_str)
-        # v8.3.2: 无聊感更新
-        update_boredom(plan)
-        # v8.3.2: 认知失调检测
-        check_cognitive_dissonance(plan, result_str, my_state)
-
-        # v8.4: 社会记忆 — 观察并记住附近bot的活动
-        try:
-            loc = my_state["location"]
-            loc_info = world["locations"].get(loc, {})
-            for nb in loc_info.get("bots", []):
-                if nb == BOT_ID:
-                    continue
-                ob = world["bots"].get(nb, {})
-                activity = ob.get("current_activity", "")
-                if activity and len(activity) > 3:
-                    ob_name = ob.get("name", nb)
-                    observation = f"[观察] 看到{ob_name}在{activity}"
-                    # 去重：不重复记录相同观察
-                    if observation not in memory[-10:]:
-                        memory.append(observation)
-                        log.info(observation)
-        except Exception:
-            pass
-
-        # 6. 反思 (入睡时强制触发日终反思)
-        is_going_to_sleep = "睡" in result_str or "躺下" in result_str
-        reflect(world, my_state, thought, plan, result_str, recent_msgs, force=is_going_to_sleep)
-
-        if len(memory) > 30:
-            memory.pop(0)
-
-        # v8.3: 统一状态同步总线
-        try:
-            sync_payload = {
-                "core_memories": core_memories,
-                "values": {
-                    "current": dynamic_values["current"],
-                    "original": dynamic_values["original"],
-                    "shifts": dynamic_values["shifts"][-5:]
-                },
-                "emotional_bonds": emotional_bonds,
-                "recent_actions": recent_actions[-8:],
-                "long_term_goal": long_term_goal,
-                "narrative_summary": narrative_summary,
-                "clear_pending_reply": pending_reply is not None,  # 如果有pending_reply则清除
-            }
-            requests.post(f"{WORLD_URL}/bot/{BOT_ID}/sync_state",
-                          json=sync_payload, timeout=10)
-        except Exception as e:
-            log.error(f"同步状态失败: {e}")
-
-    except Exception as e:
-        import traceback
-        log.error(f"心跳异常: {e}\n{traceback.format_exc()}")
 
-    # 7. 动态心跳间隔
-    interval = calc_interval(my_state)
-    log.info(f"下次心跳: {interval:.0f}秒后")
-    Timer(interval, heartbeat).start()
+def urgency_of(state):
+    """生存紧迫度：寿命低、饥饿、焦虑时更高（v10.15: 心跳调度器与 calc_interval 共用）。
+    state 可以是自身状态（情绪在 emotions 里），也可以是 /bots/status 的条目（anxiety 在顶层）"""
+    lifespan = state.get("hp", 50)
+    satiety = state.get("satiety", 50)
+    anxiety = state.get("anxiety", state.get("emotions", {}).get("anxiety", 20))
+    return (100 - lifespan) * 0.2 + (100 - satiety) * 0.3 + anxiety * 0.2
 
 
 def calc_interval(state):
     if not state:
         return 60
-    lifespan = state.get("hp", 50)
-    satiety = state.get("satiety", 50)
-    energy = state.get("energy", 50)
-    emotions = state.get("emotions", {})
-    anxiety = emotions.get("anxiety", 20)
     # 寿命低、饥饿、焦虑时行动更频繁
-    urgency = (100 - lifespan) * 0.2 + (100 - satiety) * 0.3 + anxiety * 0.2
-    interval = max(15, 50 - urgency * 0.3)
+    interval = max(15, 50 - urgency_of(state) * 0.3)
     return interval
 
 
+def should_wake(state, virtual_hour):
+    """睡着的 bot 是否该起床：白天能量恢复到80，或任何时候能量到95"""
+    energy = state.get("energy", 0)
+    return (7 <= virtual_hour < 23 and energy >= 80) or energy >= 95
+
+
 def generate_dream(state, world):
     """根据当前状态和记忆生成个性化梦境"""
     base_dreams = [
@@ -408,13 +203,10 @@ def generate_dream(state, world):
     return random.choice(base_dreams)
 
 
-def get_moments_context():
-    """获取最近的朋友圈动态作为社交信息"""
+def get_moments_context(world, bot_id=BOT_ID):
+    """获取最近的朋友圈动态作为社交信息（v10.8: 感知包里已是别人的最近5条）"""
     try:
-        resp = requests.get(f"{WORLD_URL}/moments", timeout=5)
-        moments = resp.json().get("moments", [])
-        # 只看最近5条，排除自己的
-        others = [m for m in moments if m.get("bot_id") != BOT_ID][-5:]
+        others = [m for m in world.get("moments", []) if m.get("bot_id") != bot_id][-5:]
         if not others:
             return ""
         lines = []
@@ -427,381 +219,670 @@ def get_moments_context():
         return ""
 
 
-def get_world_narrative():
-    """获取世界叙事摘要"""
-    try:
-        resp = requests.get(f"{WORLD_URL}/world_narrative", timeout=5)
-        return resp.json().get("narrative", "")
-    except:
-        return ""
+def get_world_narrative(world):
+    """获取世界叙事摘要（v10.8: 随感知包下发）"""
+    return world.get("narrative", "")
 
 
 # ============================================================
-# v8.3.2: 心流状态、无聊感、认知失调
+# Bot 智能体
 # ============================================================
-def update_flow_state(plan, result_str):
-    """心流状态：当bot连续做同类有意义的活动时，进入心流，获得额外满足感"""
-    global flow_state
-    # 判断当前活动类型
-    activity_type = None
-    flow_keywords = {
-        "work": ["工作", "任务", "继续做", "写代码", "设计", "分析"],
-        "create": ["画画", "写", "创作", "弹吉他", "唱歌", "设计"],
-        "social": ["聊天", "说", "对话", "交流", "讨论"],
-        "explore": ["探索", "发现", "逃", "研究", "学习"],
-    }
-    for atype, keywords in flow_keywords.items():
-        if any(kw in plan for kw in keywords):
-            activity_type = atype
-            break
+class BotAgent:
+    """一个 bot 的灵魂：人设、记忆、情绪关系等全部内心状态 + 与世界引擎的交互。
+    client（LLM 网关）和 http（requests.Session）可以由多个 BotAgent 共用，二者都是线程安全的。
+    heartbeat() 执行一次心跳并返回下次心跳的间隔秒数，返回 None 表示停止（死亡/被关闭）。"""
+
+    def __init__(self, bot_id, world_url=WORLD_URL, client=None, http=None):
+        self.bot_id = bot_id
+        self.world_url = world_url
+        self.log = make_logger(bot_id)
+        self.client = client or get_llm_gateway()  # v10.9: 经网关限流/重试
+        self.http = http or requests.Session()
+        self.persona = load_persona(bot_id, self.log)
+        # v10.5: 条件请求缓存（path -> (ETag, 上次的解析结果)），世界没变时引擎返回空的 304
+        self._etag_cache = {}
+
+        # === 记忆系统 ===
+        self.memory = []            # 滚动记忆 (最近30条)
+        self.core_memories = []     # 核心记忆 (永不丢失，最多20条)
+        self.inner_thoughts = []    # 内心独白历史
+        self.recent_actions = []    # v8.3: 最近行动(行动+内容摘要，用于反重复)
+        self.long_term_goal = None  # v8.3: 长期目标
+        self.narrative_summary = "" # v8.3: 内心叙事摘要
+
+        # v8.3.2: 心流状态与无聊感
+        self.flow_state = {"active": False, "activity": None, "streak": 0}  # 心流状态
+        self.boredom_level = 0  # 无聊感 (0-100)
+
+        # 动态价值观 (会随经历演化)
+        self.dynamic_values = {
+            "original": self.persona["values"],
+            "current": self.persona["values"],
+            "shifts": [],
+        }
+        # 情感关系
+        self.emotional_bonds = {}
+        # 最近看到的信息 (新闻/朋友圈)
+        self.recent_info = []
+
+        self.running = True
+        self.heartbeat_count = 0
+        self.sync = SyncTracker()  # v10.16: 增量同步的确认状态
+
+    def get_json_cached(self, path, timeout=5):
+        """GET 引擎接口，带 If-None-Match；304 时直接复用上次的结果"""
+        cached = self._etag_cache.get(path)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        resp = self.http.get(f"{self.world_url}{path}", headers=headers, timeout=timeout)
+        if resp.status_code == 304 and cached:
+            return cached[1]
+        data = resp.json()
+        etag = resp.headers.get("ETag")
+        if etag and resp.ok:
+            self._etag_cache[path] = (etag, data)
+        return data
+
+    # ============================================================
+    # 启动
+    # ============================================================
+    def start(self):
+        """打印人设，并尝试从世界引擎恢复内心状态"""
+        persona = self.persona
+        self.log.info(f"=== {persona['name']} 的灵魂 v9.0 已注入 (自我进化) ===")
+        self.log.info(f"身份: {persona['age']}岁{persona['gender']}，来自{persona['origin']}，{persona['edu']}")
+        self.log.info(f"性格: {persona['personality']}")
+        self.log.info(f"价值观: {persona['values']}")
+        self.log.info(f"背景: {persona['bg']}")
+        self.log.info(f"习惯: {persona.get('habits', '')}")
+        if persona.get("family_info"):
+            self.log.info(f"家庭: {persona['family_info']}")
+        self.log.info(f"v9.0能力: 世界改造/地点记忆+声望/代际传承/城市传说")
+
+        # 尝试从世界引擎恢复内心状态
+        try:
+            r = self.http.get(f"{self.world_url}/bot/{self.bot_id}/detail", timeout=5)
+            if r.status_code == 200:
+                detail = r.json()
+                if detail.get("values") and detail["values"].get("current"):
+                    self.dynamic_values["current"] = detail["values"]["current"]
+                    self.dynamic_values["original"] = detail["values"].get("original", persona["values"])
+                    self.dynamic_values["shifts"] = detail["values"].get("shifts", [])
+                    self.log.info(f"恢复价值观: {self.dynamic_values['current'][:50]}...")
+                if detail.get("core_memories"):
+                    self.core_memories.extend(detail["core_memories"])
+                    self.log.info(f"恢复{len(detail['core_memories'])}条核心记忆")
+                if detail.get("emotional_bonds"):
+                    self.emotional_bonds.update(detail["emotional_bonds"])
+                    self.log.info(f"恢复{len(detail['emotional_bonds'])}条情感关系")
+                # v8.3: 恢复长期目标和叙事摘要
+                if detail.get("long_term_goal"):
+                    self.long_term_goal = detail["long_term_goal"]
+                    self.log.info(f"恢复长期目标: {self.long_term_goal}")
+                if detail.get("narrative_summary"):
+                    self.narrative_summary = detail["narrative_summary"]
+                    self.log.info(f"恢复叙事摘要: {self.narrative_summary}")
+        except:
+            self.log.info("无法恢复内心状态，从头开始")
+
+    def sync_state(self, clear_pending_reply=False):
+        """v10.16: 增量同步（sync_protocol 协议 2）：只发有变化的分区，关系发增量，引擎确认后记下哈希"""
+        sections = json.loads(json.dumps({
+            "core_memories": self.core_memories,
+            "values": {
+                "current": self.dynamic_values["current"],
+                "original": self.dynamic_values["original"],
+                "shifts": self.dynamic_values["shifts"][-5:]
+            },
+            "emotional_bonds": self.emotional_bonds,
+            "recent_actions": self.recent_actions[-8:],
+            "long_term_goal": self.long_term_goal,
+            "narrative_summary": self.narrative_summary,
+        }, ensure_ascii=False))
+        patch, local = self.sync.build(sections)
+        if not patch and not clear_pending_reply:
+            return
+        try:
+            resp = self.http.post(f"{self.world_url}/bot/{self.bot_id}/sync_state", json={
+                "protocol": SYNC_PROTOCOL,
+                "patch": patch,
+                "clear_pending_reply": clear_pending_reply,
+            }, timeout=10)
+            result = resp.json()
+            if result.get("ok"):
+                self.sync.ack(sections, local, result)
+        except Exception as e:
+            self.log.error(f"同步状态失败: {e}")
+
+    def stop(self):
+        """不再安排下一次心跳（正在进行的心跳会做完）"""
+        self.running = False
+
+    # ============================================================
+    # 心跳循环
+    # ============================================================
+    def heartbeat(self):
+        if not self.running:
+            return None
+
+        self.heartbeat_count += 1
+        self.log.info("--- 心跳开始 ---")
+        my_state = None
+        try:
+            # 1. 感知世界（v10.8: 一次请求拿到自身、同地点的人、地点规则、收件箱、朋友圈、新闻）
+            world = self.get_json_cached(f"/bot/{self.bot_id}/perception", timeout=10)
+            my_state = world.get("self")
+
+            if not my_state or my_state["status"] == "dead":
+                self.log.error("我已经死了...世界变得一片黑暗。")
+                self.running = False
+                return None
+
+            aging_rate = my_state.get('aging_rate', 0.02)
+            aging_warn = ' ⚠️加速衰老!' if aging_rate > 0.03 else ''
+            self.log.info(f"状态: 寿命={my_state['hp']:.1f}/100{aging_warn} 钱={my_state['money']} 能量={my_state['energy']} "
+                     f"饱腹={my_state['satiety']} 位置={my_state['location']} "
+                     f"睡觉={my_state.get('is_sleeping', False)} "
+                     f"天气={world.get('weather', {}).get('current', '?')}")
+
+            # === 睡眠状态处理 ===
+            if my_state.get("is_sleeping", False):
+                if should_wake(my_state, world["time"]["virtual_hour"]):
+                    self.log.info("能量恢复了，该起床了！")
+                    # v10.15: 调度器不会在睡眠中途叫醒 bot，梦留到起床时再回想
+                    if random.random() < 0.3:
+                        dream = generate_dream(my_state, world)
+                        self.log.warning(f"[梦境] {dream}")
+                        self.memory.append(f"[梦境] {dream}")
+                    try:
+                        self.http.post(f"{self.world_url}/bot/{self.bot_id}/action",
+                                      json={"plan": "起床"}, timeout=15)
+                    except:
+                        pass
+                else:
+                    self.log.info(f"💤 还在睡觉... 能量={my_state['energy']}")
+                    if random.random() < 0.1:
+                        dream = generate_dream(my_state, world)
+                        self.log.warning(f"[梦境] {dream}")
+                        self.memory.append(f"[梦境] {dream}")
+
+                return 90
+
+            # 2. 获取发给我的消息 + pending_reply
+            recent_msgs = []
+            high_priority_msgs = []
+            pending_reply = None
+            try:
+                messages = world.get("messages", [])
+                pending_reply = world.get("pending_reply_to")  # v8.3: 双向对话
+                recent_msgs = messages[-8:]
+                for m in recent_msgs:
+                    msg_text = f"[消息] {m['from']}对我说: {m['msg']}"
+                    if msg_text not in self.memory:
+                        self.memory.append(msg_text)
+                        self.log.info(msg_text)
+                    if m.get("priority") == "high":
+                        high_priority_msgs.append(m)
+                    family = my_state.get("family", {})
+                    parents = family.get("parents", [])
+                    children = family.get("children", [])
+                    if m["from"] in parents or m["from"] in children:
+                        if m not in high_priority_msgs:
+                            high_priority_msgs.append(m)
+            except:
+                recent_msgs = []
+                pending_reply = None
+
+            # 3. 获取朋友圈动态 (被动感知)
+            moments_context = get_moments_context(world, self.bot_id)
+
+            # 4. 内心独白 + 决策 (v8.3: 传入pending_reply)
+            thought, plan = self.think_and_plan(world, my_state, recent_msgs, high_priority_msgs, moments_context, pending_reply)
+            self.log.warning(f"[内心独白] {thought}")
+            self.log.info(f"[决策] {plan}")
+
+            # 5. 提交行动
+            action_resp = self.http.post(
+                f"{self.world_url}/bot/{self.bot_id}/action",
+                json={"plan": plan},
+                timeout=30
+            )
+            result = action_resp.json()
+            result_data = result.get("result", {})
+            result_str = json.dumps(result_data, ensure_ascii=False) if isinstance(result_data, dict) else str(result_data)
+
+            # v10.0: 提取丰富的反馈信息
+            feedback_narrative = ""
+            feedback_text = ""
+            if isinstance(result_data, dict):
+                feedback_narrative = result_data.get("narrative", "")
+                feedback_text = result_data.get("feedback", "")
+                success = result_data.get("success", True)
+                world_change = result_data.get("world_change")
+                social_effects = result_data.get("social_effects", [])
+
+                # 构建有意义的记忆条目
+                mem_parts = [f"[{world['time']['virtual_datetime']}] 我做了: {plan}"]
+                if feedback_narrative:
+                    mem_parts.append(f"结果: {feedback_narrative[:80]}")
+                if not success:
+                    mem_parts.append("(失败了)")
+                if world_change:
+                    mem_parts.append(f"创造了: {world_change}")
+                if social_effects:
+                    mem_parts.append(f"社交影响: {', '.join(social_effects[:2])}")
+                if feedback_text:
+                    mem_parts.append(f"感受: {feedback_text[:40]}")
+                action_record = " | ".join(mem_parts)
+            else:
+                action_record = f"[{world['time']['virtual_datetime']}] 我做了: {plan} -> {result_str[:80]}"
 
-    if activity_type and activity_type == flow_state.get("activity"):
-        flow_state["streak"] += 1
-        if flow_state["streak"] >= 2:
-            flow_state["active"] = True
-            log.info(f"[心流] 进入心流状态: {activity_type} (streak={flow_state['streak']})")
-    else:
-        if flow_state.get("active"):
-            log.info(f"[心流] 退出心流状态")
-        flow_state = {"active": False, "activity": activity_type, "streak": 1 if activity_type else 0}
-
-
-def update_boredom(plan):
-    """无聊感：重复行为增加无聊，新鲜行为降低无聊"""
-    global boredom_level
-    # 检查当前行动是否与最近行动重复
-    plan_short = plan[:15]
-    repeat_count = sum(1 for a in recent_actions[-5:] if a.startswith(plan_short))
-
-    if repeat_count >= 2:
-        boredom_level = min(100, boredom_level + 15)
-        log.info(f"[无聊感] 重复行为检测，无聊感上升到 {boredom_level}")
-    elif repeat_count == 1:
-        boredom_level = min(100, boredom_level + 5)
-    else:
-        # 新鲜行为降低无聊感
-        boredom_level = max(0, boredom_level - 10)
-
-    # 心流状态中无聊感不会上升
-    if flow_state.get("active"):
-        boredom_level = max(0, boredom_level - 5)
-
-
-def _boredom_hint():
-    """根据无聊感等级生成内在感受描述"""
-    if boredom_level >= 70:
-        return "(你感到一股强烈的无聊从心底涌上来。你渴望一些全新的体验，一些从未做过的事。你的身体在说：我受不了了，换点什么吧。)"
-    elif boredom_level >= 40:
-        return "(你觉得有点无聊，心里想着要不要做点不一样的事。)"
-    elif boredom_level >= 20:
-        return "(你回忆起这些事情，感觉还行。)"
-    return ""
-
-
-def _flow_hint():
-    """根据心流状态生成内在感受描述"""
-    if flow_state.get("active"):
-        activity_names = {"work": "工作", "create": "创作", "social": "聊天", "explore": "探索"}
-        act_name = activity_names.get(flow_state.get("activity"), "这件事")
-        return f"(你现在对{act_name}很投入，脑子转得很快，感觉时间过得很快。你不想被打断。)"
-    return ""
-
-
-def check_cognitive_dissonance(plan, result_str, my_state):
-    """认知失调：当期望与现实产生差距时，触发深层记忆形成"""
-    # 检测失败/意外情况
-    dissonance_triggers = ["失败", "钱不够", "被拒", "被驱逐", "没拍成", "无法", "不够"]
-    surprise_triggers = ["发现", "意外", "惊喜", "第一次", "从未"]
-
-    is_dissonance = any(t in result_str for t in dissonance_triggers)
-    is_surprise = any(t in result_str for t in surprise_triggers)
-
-    if is_dissonance or is_surprise:
-        tag = "认知失调" if is_dissonance else "意外发现"
-        # 这种时刻更容易形成核心记忆
-        dissonance_memory = f"[深刻体验] 我想{plan[:20]}，但结果是: {result_str[:40]}"
-        if not is_similar_memory(dissonance_memory, core_memories):
-            core_memories.append({
-                "summary": dissonance_memory,
-                "emotion": "negative" if is_dissonance else "surprise",
-                "tick": 0,  # 会在sync时更新
-                "time": "",
-                "tag": tag,
-            })
-            if len(core_memories) > 20:
-                core_memories.pop(0)
-            log.warning(f"[认知失调] ⭐ {dissonance_memory}")
+            self.log.info(f"[结果] {feedback_narrative or result_str[:80]}")
+            if feedback_text:
+                self.log.info(f"[反馈] {feedback_text[:60]}")
+            self.memory.append(action_record)
+            # v8.3: 升级反重复 - 行动+内容摘要作为联合键
+            action_digest = f"{plan[:15]}|{result_str[:15]}"
+            self.recent_actions.append(action_digest)
+            if len(self.recent_actions) > 8:
+                self.recent_actions.pop(0)
+
+            # v8.3.2: 心流状态更新
+            self.update_flow_state(plan, result_str)
+            # v8.3.2: 无聊感更新
+            self.update_boredom(plan)
+            # v8.3.2: 认知失调检测
+            self.check_cognitive_dissonance(plan, result_str, my_state)
+
+            # v8.4: 社会记忆 — 观察并记住附近bot的活动
+            try:
+                for ob in world.get("nearby", {}).values():
+                    activity = ob.get("current_activity", "")
+                    if activity and len(activity) > 3:
+                        ob_name = ob.get("name", ob.get("id", "?"))
+                        observation = f"[观察] 看到{ob_name}在{activity}"
+                        # 去重：不重复记录相同观察
+                        if observation not in self.memory[-10:]:
+                            self.memory.append(observation)
+                            self.log.info(observation)
+            except Exception:
+                pass
 
+            # 6. 反思 (入睡时强制触发日终反思)
+            is_going_to_sleep = "睡" in result_str or "躺下" in result_str
+            self.reflect(world, my_state, thought, plan, result_str, recent_msgs, force=is_going_to_sleep)
 
+            if len(self.memory) > 30:
+                self.memory.pop(0)
 
-# ============================================================
-# 思考与决策
-# ============================================================
-def think_and_plan(world, my_state, recent_msgs, high_priority_msgs, moments_context, pending_reply=None):
-    global long_term_goal
-    recent_mem = "\n".join(memory[-10:])
-    core_mem_text = "\n".join([f"⭐ {m['summary']}" for m in core_memories[-5:]]) if core_memories else "暂无重要记忆"
-
-    msgs_text = "\n".join([f"- {m['from']}说: {m['msg']}" for m in recent_msgs]) if recent_msgs else "没有新消息"
-
-    hp_msgs_text = ""
-    if high_priority_msgs:
-        hp_msgs_text = "\n🔴 有人在急切地找你:\n" + "\n".join(
-            [f"- {m['from']}说: {m['msg']}" for m in high_priority_msgs]
-        )
-
-    loc = my_state["location"]
-    loc_info = world["locations"].get(loc, {})
-    nearby_bots = [b for b in loc_info.get("bots", []) if b != BOT_ID]
-    nearby_npcs = loc_info.get("npcs", [])
-    available_jobs = loc_info.get("jobs", [])
-    events = world.get("events", [])[-3:]
-
-    # v9.0: 获取地点公共记忆、改造、氛围
-    loc_public_memory = loc_info.get("public_memory", [])[-3:]
-    loc_modifications = loc_info.get("modifications", [])
-    loc_vibe = loc_info.get("vibe", "普通")
-    # v9.0: 获取声望信息
-    my_reputation = my_state.get("reputation", {"score": 0, "tags": [], "deeds": []})
-    my_rep_score = my_reputation.get("score", 0)
-    my_rep_tags = my_reputation.get("tags", [])
-    # v9.0: 获取城市传说
-    urban_legends = world.get("urban_legends", [])[-3:]
-    # v9.0: 获取世界改造
-    world_mods = world.get("world_modifications", [])[-5:]
-    events_text = "\n".join([f"- {e.get('event', e.get('time',''))}: {e.get('desc','')}" for e in events]) if events else "暂无"
-
-    # v10.0: 获取上一次行动的反馈
-    last_feedback = my_state.get("last_action_feedback", {})
-    feedback_section = ""
-    if last_feedback:
-        fb_parts = []
-        if last_feedback.get("narrative"):
-            fb_parts.append(f"上次行动: {last_feedback['narrative'][:80]}")
-        if last_feedback.get("feedback"):
-            fb_parts.append(f"你感受到: {last_feedback['feedback'][:60]}")
-        if not last_feedback.get("success", True):
-            fb_parts.append("❗ 上次行动失败了！")
-        if last_feedback.get("world_change"):
-            fb_parts.append(f"你创造了: {last_feedback['world_change']}")
-        if fb_parts:
-            feedback_section = "\n".join(fb_parts)
-
-    # v10.0: 获取地点最近发生的事（其他人的行动侧面效果）
-    recent_loc_events = loc_info.get("recent_events", [])
-    loc_happenings = ""
-    if recent_loc_events:
-        # 只显示不是自己产生的事件
-        others_events = [e for e in recent_loc_events if e.get("source") != BOT_ID][-3:]
-        if others_events:
-            loc_happenings = "\n".join([f"- {e['event']}" for e in others_events])
-
-    # v10.1: 获取当前地点的活跃规则（bot可以感知到世界被改变的痕迹）
-    rules_section = ""
-    try:
-        rules_resp = requests.get(f"{ENGINE}/rules/{my_state.get('location', '')}", timeout=3)
-        if rules_resp.ok:
-            loc_rules = rules_resp.json().get("rules", [])
-            if loc_rules:
-                rules_section = "\n".join(loc_rules[:5])
-    except:
-        pass
-
-    # v10.1: 获取吸引信号（其他地点的规则在吸引你）
-    attraction_section = ""
-    attraction_signals = my_state.get("attraction_signals", [])
-    if attraction_signals:
-        att_lines = [f"- 来自[{s['location']}]的吸引: {s['reason']}" for s in attraction_signals[-3:]]
-        attraction_section = "\n".join(att_lines)
-
-    # v10.1: 获取上次行动创建的规则反馈
-    if last_feedback.get("rules_created"):
-        rules_created = last_feedback["rules_created"]
-        rc_text = ", ".join([f"{r['name']}" for r in rules_created])
-        feedback_section += f"\n你的行动改变了世界的运行规则! 新规则: {rc_text}"
-
-    # 情感关系（含印象）
-    bonds_text = ""
-    if emotional_bonds:
-        bond_lines = []
-        for target, bond in emotional_bonds.items():
-            label = bond.get("label", "认识的人")
-            trust = bond.get("trust", 50)
-            closeness = bond.get("closeness", 0)
-            impressions = bond.get("impressions", [])
-            line = f"- {target}: {label} (信任:{trust}, 亲密:{closeness})"
-            if impressions:
-                latest = impressions[-1]  # 最新一条印象
-                line += f"\n  最近印象: {latest}"
-            bond_lines.append(line)
-        bonds_text = "\n".join(bond_lines)
-    else:
-        bonds_text = "还没有建立深层关系"
-
-    # 近期重要经历（从action_log提取有意义的事件）
-    action_log = my_state.get("action_log", [])
-    important_events = []
-    for entry in action_log[-15:]:
-        result_text = str(entry.get("result", ""))
-        plan_text = str(entry.get("plan", ""))
-        # 筛选有意义的事件（不是简单的逛逛/发呆）
-        if any(kw in result_text for kw in ["赚了", "失败", "发现", "认识", "吵", "被", "完成", "学会", "受伤", "感动", "生气", "开心", "难过", "朋友圈", "任务"]):
-            important_events.append(result_text[:60])
-        elif any(kw in plan_text for kw in ["工作", "找", "和", "对", "去"]):
-            important_events.append(plan_text[:60])
-    important_events = important_events[-5:]  # 最多5条
-    important_events_text = "\n".join([f"- {e}" for e in important_events]) if important_events else "刚到这座城市，还没有什么经历"
-
-    family_text = persona.get("family_info", "")
-
-    # === 情绪状态 ===
-    emotions = my_state.get("emotions", {})
-    emo_labels = {"happiness": "开心", "sadness": "难过", "anger": "愤怒", "anxiety": "焦虑", "loneliness": "孤独"}
-    emo_lines = []
-    dominant_emotion = None
-    dominant_val = 0
-    for k, label in emo_labels.items():
-        v = emotions.get(k, 0)
-        if v > dominant_val:
-            dominant_val = v
-            dominant_emotion = label
-        if v > 60:
-            emo_lines.append(f"🔴 {label}: {v}/100 (强烈)")
-        elif v > 30:
-            emo_lines.append(f"🟡 {label}: {v}/100")
-    emotions_text = "\n".join(emo_lines) if emo_lines else "情绪平稳"
-    mood_hint = ""
-    if dominant_emotion and dominant_val > 50:
-        mood_hint = f"\n你现在主要感到{dominant_emotion}。这种情绪会影响你的判断和行为。"
-
-    # === 欲望状态 ===
-    desires = my_state.get("desires", {})
-    desire_labels = {"lust": "性欲", "power": "权力欲", "greed": "物欲", "vanity": "虚荣心", "security": "安全感需求"}
-    desires_text = ""
-    high_desires = [(desire_labels.get(k, k), v) for k, v in desires.items() if v > 60]
-    mid_desires = [(desire_labels.get(k, k), v) for k, v in desires.items() if 30 < v <= 60]
-    if high_desires or mid_desires:
-        desires_text = "\n=== 内心欲望 ===\n"
-        for name, val in sorted(high_desires, key=lambda x: -x[1]):
-            desires_text += f"🔥 {name}: {val}/100 (强烈!)\n"
-        for name, val in sorted(mid_desires, key=lambda x: -x[1]):
-            desires_text += f"⚠️ {name}: {val}/100\n"
-
-    # === 天气感知 ===
-    weather = world.get("weather", {})
-    weather_text = f"{weather.get('current', '晴天')} - {weather.get('desc', '')}"
-    weather_hint = ""
-    w = weather.get("current", "")
-    if w == "暴雨":
-        weather_hint = "雨水砸在窗户上哗哗作响，外面的人都在跑。"
-    elif w == "台风":
-        weather_hint = "风很大，窗户被吹得哐哐响，外面几乎没有人。"
-    elif w == "高温":
-        weather_hint = "热浪扑面而来，空气都是糊的，衣服贴在背上。"
-    elif w == "晴天":
-        weather_hint = "阳光很好，微风吹过来很舒服。"
-
-    # === 工作任务上下文 ===
-    task = my_state.get("current_task")
-    task_text = ""
-    if task:
-        if task.get("status") == "in_progress":
-            challenge_info = f"\n⚠️ 遇到难点: {task['challenge']}" if task.get("challenge") else ""
-            task_text = f"""\n=== 当前工作任务 ===
+            # v8.3: 统一状态同步总线
+            self.sync_state(clear_pending_reply=pending_reply is not None)  # 如果有pending_reply则清除
+
+        except Exception as e:
+            import traceback
+            self.log.error(f"心跳异常: {e}\n{traceback.format_exc()}")
+
+        # 7. 动态心跳间隔
+        interval = calc_interval(my_state)
+        self.log.info(f"下次心跳: {interval:.0f}秒后")
+        return interval
+
+    # ============================================================
+    # v8.3.2: 心流状态、无聊感、认知失调
+    # ============================================================
+    def update_flow_state(self, plan, result_str):
+        """心流状态：当bot连续做同类有意义的活动时，进入心流，获得额外满足感"""
+        # 判断当前活动类型
+        activity_type = None
+        flow_keywords = {
+            "work": ["工作", "任务", "继续做", "写代码", "设计", "分析"],
+            "create": ["画画", "写", "创作", "弹吉他", "唱歌", "设计"],
+            "social": ["聊天", "说", "对话", "交流", "讨论"],
+            "explore": ["探索", "发现", "逃", "研究", "学习"],
+        }
+        for atype, keywords in flow_keywords.items():
+            if any(kw in plan for kw in keywords):
+                activity_type = atype
+                break
+
+        if activity_type and activity_type == self.flow_state.get("activity"):
+            self.flow_state["streak"] += 1
+            if self.flow_state["streak"] >= 2:
+                self.flow_state["active"] = True
+                self.log.info(f"[心流] 进入心流状态: {activity_type} (streak={self.flow_state['streak']})")
+        else:
+            if self.flow_state.get("active"):
+                self.log.info(f"[心流] 退出心流状态")
+            self.flow_state = {"active": False, "activity": activity_type, "streak": 1 if activity_type else 0}
+
+
+    def update_boredom(self, plan):
+        """无聊感：重复行为增加无聊，新鲜行为降低无聊"""
+        # 检查当前行动是否与最近行动重复
+        plan_short = plan[:15]
+        repeat_count = sum(1 for a in self.recent_actions[-5:] if a.startswith(plan_short))
+
+        if repeat_count >= 2:
+            self.boredom_level = min(100, self.boredom_level + 15)
+            self.log.info(f"[无聊感] 重复行为检测，无聊感上升到 {self.boredom_level}")
+        elif repeat_count == 1:
+            self.boredom_level = min(100, self.boredom_level + 5)
+        else:
+            # 新鲜行为降低无聊感
+            self.boredom_level = max(0, self.boredom_level - 10)
+
+        # 心流状态中无聊感不会上升
+        if self.flow_state.get("active"):
+            self.boredom_level = max(0, self.boredom_level - 5)
+
+
+    def _boredom_hint(self):
+        """根据无聊感等级生成内在感受描述"""
+        if self.boredom_level >= 70:
+            return "(你感到一股强烈的无聊从心底涌上来。你渴望一些全新的体验，一些从未做过的事。你的身体在说：我受不了了，换点什么吧。)"
+        elif self.boredom_level >= 40:
+            return "(你觉得有点无聊，心里想着要不要做点不一样的事。)"
+        elif self.boredom_level >= 20:
+            return "(你回忆起这些事情，感觉还行。)"
+        return ""
+
+
+    def _flow_hint(self):
+        """根据心流状态生成内在感受描述"""
+        if self.flow_state.get("active"):
+            activity_names = {"work": "工作", "create": "创作", "social": "聊天", "explore": "探索"}
+            act_name = activity_names.get(self.flow_state.get("activity"), "这件事")
+            return f"(你现在对{act_name}很投入，脑子转得很快，感觉时间过得很快。你不想被打断。)"
+        return ""
+
+
+    def check_cognitive_dissonance(self, plan, result_str, my_state):
+        """认知失调：当期望与现实产生差距时，触发深层记忆形成"""
+        # 检测失败/意外情况
+        dissonance_triggers = ["失败", "钱不够", "被拒", "被驱逐", "没拍成", "无法", "不够"]
+        surprise_triggers = ["发现", "意外", "惊喜", "第一次", "从未"]
+
+        is_dissonance = any(t in result_str for t in dissonance_triggers)
+        is_surprise = any(t in result_str for t in surprise_triggers)
+
+        if is_dissonance or is_surprise:
+            tag = "认知失调" if is_dissonance else "意外发现"
+            # 这种时刻更容易形成核心记忆
+            dissonance_memory = f"[深刻体验] 我想{plan[:20]}，但结果是: {result_str[:40]}"
+            if not is_similar_memory(dissonance_memory, self.core_memories):
+                self.core_memories.append({
+                    "summary": dissonance_memory,
+                    "emotion": "negative" if is_dissonance else "surprise",
+                    "tick": 0,  # 会在sync时更新
+                    "time": "",
+                    "tag": tag,
+                })
+                if len(self.core_memories) > 20:
+                    self.core_memories.pop(0)
+                self.log.warning(f"[认知失调] ⭐ {dissonance_memory}")
+
+
+    # ============================================================
+    # 思考与决策
+    # ============================================================
+    def think_and_plan(self, world, my_state, recent_msgs, high_priority_msgs, moments_context, pending_reply=None):
+        recent_mem = "\n".join(self.memory[-10:])
+        core_mem_text = "\n".join([f"⭐ {m['summary']}" for m in self.core_memories[-5:]]) if self.core_memories else "暂无重要记忆"
+
+        msgs_text = "\n".join([f"- {m['from']}说: {m['msg']}" for m in recent_msgs]) if recent_msgs else "没有新消息"
+
+        hp_msgs_text = ""
+        if high_priority_msgs:
+            hp_msgs_text = "\n🔴 有人在急切地找你:\n" + "\n".join(
+                [f"- {m['from']}说: {m['msg']}" for m in high_priority_msgs]
+            )
+
+        loc = my_state["location"]
+        loc_info = world.get("location", {})
+        nearby_bots = [b for b in loc_info.get("bots", []) if b != self.bot_id]
+        nearby_npcs = loc_info.get("npcs", [])
+        available_jobs = loc_info.get("jobs", [])
+        events = world.get("events", [])[-3:]
+
+        # v9.0: 获取地点公共记忆、改造、氛围
+        loc_public_memory = loc_info.get("public_memory", [])[-3:]
+        loc_modifications = loc_info.get("modifications", [])
+        loc_vibe = loc_info.get("vibe", "普通")
+        # v9.0: 获取声望信息
+        my_reputation = my_state.get("reputation", {"score": 0, "tags": [], "deeds": []})
+        my_rep_score = my_reputation.get("score", 0)
+        my_rep_tags = my_reputation.get("tags", [])
+        # v9.0: 获取城市传说
+        urban_legends = world.get("urban_legends", [])[-3:]
+        # v9.0: 获取世界改造
+        world_mods = world.get("world_modifications", [])[-5:]
+        events_text = "\n".join([f"- {e.get('event', e.get('time',''))}: {e.get('desc','')}" for e in events]) if events else "暂无"
+
+        # v10.0: 获取上一次行动的反馈
+        last_feedback = my_state.get("last_action_feedback", {})
+        feedback_section = ""
+        if last_feedback:
+            fb_parts = []
+            if last_feedback.get("narrative"):
+                fb_parts.append(f"上次行动: {last_feedback['narrative'][:80]}")
+            if last_feedback.get("feedback"):
+                fb_parts.append(f"你感受到: {last_feedback['feedback'][:60]}")
+            if not last_feedback.get("success", True):
+                fb_parts.append("❗ 上次行动失败了！")
+            if last_feedback.get("world_change"):
+                fb_parts.append(f"你创造了: {last_feedback['world_change']}")
+            if fb_parts:
+                feedback_section = "\n".join(fb_parts)
+
+        # v10.0: 获取地点最近发生的事（其他人的行动侧面效果）
+        recent_loc_events = loc_info.get("recent_events", [])
+        loc_happenings = ""
+        if recent_loc_events:
+            # 只显示不是自己产生的事件
+            others_events = [e for e in recent_loc_events if e.get("source") != self.bot_id][-3:]
+            if others_events:
+                loc_happenings = "\n".join([f"- {e['event']}" for e in others_events])
+
+        # v10.1: 获取当前地点的活跃规则（bot可以感知到世界被改变的痕迹）
+        rules_section = ""
+        loc_rules = loc_info.get("rules", [])
+        if loc_rules:
+            rules_section = "\n".join(loc_rules[:5])
+
+        # v10.1: 获取吸引信号（其他地点的规则在吸引你）
+        attraction_section = ""
+        attraction_signals = my_state.get("attraction_signals", [])
+        if attraction_signals:
+            att_lines = [f"- 来自[{s['location']}]的吸引: {s['reason']}" for s in attraction_signals[-3:]]
+            attraction_section = "\n".join(att_lines)
+
+        # v10.1: 获取上次行动创建的规则反馈
+        if last_feedback.get("rules_created"):
+            rules_created = last_feedback["rules_created"]
+            rc_text = ", ".join([f"{r['name']}" for r in rules_created])
+            feedback_section += f"\n你的行动改变了世界的运行规则! 新规则: {rc_text}"
+
+        # 情感关系（含印象）
+        bonds_text = ""
+        if self.emotional_bonds:
+            bond_lines = []
+            for target, bond in self.emotional_bonds.items():
+                label = bond.get("label", "认识的人")
+                trust = bond.get("trust", 50)
+                closeness = bond.get("closeness", 0)
+                impressions = bond.get("impressions", [])
+                line = f"- {target}: {label} (信任:{trust}, 亲密:{closeness})"
+                if impressions:
+                    latest = impressions[-1]  # 最新一条印象
+                    line += f"\n  最近印象: {latest}"
+                bond_lines.append(line)
+            bonds_text = "\n".join(bond_lines)
+        else:
+            bonds_text = "还没有建立深层关系"
+
+        # 近期重要经历（从action_log提取有意义的事件）
+        action_log = my_state.get("action_log", [])
+        important_events = []
+        for entry in action_log[-15:]:
+            result_text = str(entry.get("result", ""))
+            plan_text = str(entry.get("plan", ""))
+            # 筛选有意义的事件（不是简单的逛逛/发呆）
+            if any(kw in result_text for kw in ["赚了", "失败", "发现", "认识", "吵", "被", "完成", "学会", "受伤", "感动", "生气", "开心", "难过", "朋友圈", "任务"]):
+                important_events.append(result_text[:60])
+            elif any(kw in plan_text for kw in ["工作", "找", "和", "对", "去"]):
+                important_events.append(plan_text[:60])
+        important_events = important_events[-5:]  # 最多5条
+        important_events_text = "\n".join([f"- {e}" for e in important_events]) if important_events else "刚到这座城市，还没有什么经历"
+
+        family_text = self.persona.get("family_info", "")
+
+        # === 情绪状态 ===
+        emotions = my_state.get("emotions", {})
+        emo_labels = {"happiness": "开心", "sadness": "难过", "anger": "愤怒", "anxiety": "焦虑", "loneliness": "孤独"}
+        emo_lines = []
+        dominant_emotion = None
+        dominant_val = 0
+        for k, label in emo_labels.items():
+            v = emotions.get(k, 0)
+            if v > dominant_val:
+                dominant_val = v
+                dominant_emotion = label
+            if v > 60:
+                emo_lines.append(f"🔴 {label}: {v}/100 (强烈)")
+            elif v > 30:
+                emo_lines.append(f"🟡 {label}: {v}/100")
+        emotions_text = "\n".join(emo_lines) if emo_lines else "情绪平稳"
+        mood_hint = ""
+        if dominant_emotion and dominant_val > 50:
+            mood_hint = f"\n你现在主要感到{dominant_emotion}。这种情绪会影响你的判断和行为。"
+
+        # === 欲望状态 ===
+        desires = my_state.get("desires", {})
+        desire_labels = {"lust": "性欲", "power": "权力欲", "greed": "物欲", "vanity": "虚荣心", "security": "安全感需求"}
+        desires_text = ""
+        high_desires = [(desire_labels.get(k, k), v) for k, v in desires.items() if v > 60]
+        mid_desires = [(desire_labels.get(k, k), v) for k, v in desires.items() if 30 < v <= 60]
+        if high_desires or mid_desires:
+            desires_text = "\n=== 内心欲望 ===\n"
+            for name, val in sorted(high_desires, key=lambda x: -x[1]):
+                desires_text += f"🔥 {name}: {val}/100 (强烈!)\n"
+            for name, val in sorted(mid_desires, key=lambda x: -x[1]):
+                desires_text += f"⚠️ {name}: {val}/100\n"
+
+        # === 天气感知 ===
+        weather = world.get("weather", {})
+        weather_text = f"{weather.get('current', '晴天')} - {weather.get('desc', '')}"
+        weather_hint = ""
+        w = weather.get("current", "")
+        if w == "暴雨":
+            weather_hint = "雨水砸在窗户上哗哗作响，外面的人都在跑。"
+        elif w == "台风":
+            weather_hint = "风很大，窗户被吹得哐哐响，外面几乎没有人。"
+        elif w == "高温":
+            weather_hint = "热浪扑面而来，空气都是糊的，衣服贴在背上。"
+        elif w == "晴天":
+            weather_hint = "阳光很好，微风吹过来很舒服。"
+
+        # === 工作任务上下文 ===
+        task = my_state.get("current_task")
+        task_text = ""
+        if task:
+            if task.get("status") == "in_progress":
+                challenge_info = f"\n⚠️ 遇到难点: {task['challenge']}" if task.get("challenge") else ""
+                task_text = f"""\n=== 当前工作任务 ===
 工作: {task.get('job_title', '')}
 任务: {task.get('task_name', '')} - {task.get('task_desc', '')}
 进度: {task.get('progress', 0)}/{task.get('duration', 2)} (剩余{task.get('duration',2)-task.get('progress',0)}小时)
 {challenge_info}
 → 你正在做这个任务，可以选择继续做"""
-        elif task.get("status") == "completed":
-            task_text = f"\n✅ 任务完成: [{task.get('task_name','')}] {task.get('result', '')}"
-        elif task.get("status") == "failed":
-            task_text = f"\n❌ 任务失败: [{task.get('task_name','')}] {task.get('result', '')}"
-
-    # === 时间上下文 ===
-    vh = world["time"]["virtual_hour"]
-    time_context = ""
-    if vh >= 22 or vh < 6:
-        time_context = "🌙 夜很深了，四周很安静。你感到困意在侵袭。"
-    elif 6 <= vh < 8:
-        time_context = "🌅 晨光透进来了，新的一天开始了。"
-    elif 12 <= vh < 14:
-        time_context = "🌞 太阳正当头顶，你闻到了饭菜的香味。"
-    elif 18 <= vh < 20:
-        time_context = "🌆 天色渐暗，街上的灯一盏盏亮起来。"
-    elif 20 <= vh < 22:
-        time_context = "🌃 夜色降临，城市的另一面慢慢苏醒。"
-
-    # === 寿命警告 ===
-    lifespan = my_state['hp']
-    aging_rate = my_state.get('aging_rate', 0.02)
-    lifespan_warning = ""
-    if lifespan < 30:
-        lifespan_warning = f"\n你感到身体很沉重，每走一步都很吃力。你隐约觉得自己的时间不多了。"
-    elif lifespan < 60:
-        lifespan_warning = f"\n你偶尔会感到一阵莫名的疲惫，身体似乎不如从前了。"
-    if aging_rate > 0.05:
-        lifespan_warning += f"\n你的身体在报警——最近太拼了，你能感觉到衰老在加速。"
-
-    # === 饥饿警告 ===
-    satiety = my_state['satiety']
-    if satiety <= 0:
-        hunger_warning = "\n你的肚子在痛苦地叫，眼前发黑，双腿发软。你能闻到附近飘来的饭菜香味。"
-    elif satiety <= 20:
-        hunger_warning = "\n你感觉四肢有点发软，肚子咕咕叫。要不先吃点东西？"
-    else:
-        hunger_warning = ""
-
-    # === 新闻/热搜 ===
-    news = world.get("news_feed", [])[:3]
-    news_text = ""
-    if news:
-        news_text = "\n=== 最近新闻(你刷手机时看到的) ===\n" + "\n".join([f"- {n.get('headline','')}" for n in news])
-
-    hot_topics = world.get("hot_topics", [])[:3]
-    topics_text = ""
-    if hot_topics:
-        topics_text = "\n热搜话题: " + "、".join(hot_topics)
-
-    # === 朋友圈 ===
-    moments_text = ""
-    if moments_context:
-        moments_text = f"\n=== 朋友圈动态 ===\n{moments_context}"
-
-    # === v8.4: 附近的人详情（场景感知：能看到他们在做什么） ===
-    nearby_detail = []
-    for nb in nearby_bots[:5]:
-        ob = world["bots"].get(nb, {})
-        name = ob.get("name", "?")
-        gender = ob.get("gender", "?")
-        activity = ob.get("current_activity", "")
-        if ob.get("is_sleeping"):
-            nearby_detail.append(f"{name}({gender}) - 正在睡觉")
-        elif activity:
-            nearby_detail.append(f"{name}({gender}) - 正在{activity}")
+            elif task.get("status") == "completed":
+                task_text = f"\n✅ 任务完成: [{task.get('task_name','')}] {task.get('result', '')}"
+            elif task.get("status") == "failed":
+                task_text = f"\n❌ 任务失败: [{task.get('task_name','')}] {task.get('result', '')}"
+
+        # === 时间上下文 ===
+        vh = world["time"]["virtual_hour"]
+        time_context = ""
+        if vh >= 22 or vh < 6:
+            time_context = "🌙 夜很深了，四周很安静。你感到困意在侵袭。"
+        elif 6 <= vh < 8:
+            time_context = "🌅 晨光透进来了，新的一天开始了。"
+        elif 12 <= vh < 14:
+            time_context = "🌞 太阳正当头顶，你闻到了饭菜的香味。"
+        elif 18 <= vh < 20:
+            time_context = "🌆 天色渐暗，街上的灯一盏盏亮起来。"
+        elif 20 <= vh < 22:
+            time_context = "🌃 夜色降临，城市的另一面慢慢苏醒。"
+
+        # === 寿命警告 ===
+        lifespan = my_state['hp']
+        aging_rate = my_state.get('aging_rate', 0.02)
+        lifespan_warning = ""
+        if lifespan < 30:
+            lifespan_warning = f"\n你感到身体很沉重，每走一步都很吃力。你隐约觉得自己的时间不多了。"
+        elif lifespan < 60:
+            lifespan_warning = f"\n你偶尔会感到一阵莫名的疲惫，身体似乎不如从前了。"
+        if aging_rate > 0.05:
+            lifespan_warning += f"\n你的身体在报警——最近太拼了，你能感觉到衰老在加速。"
+
+        # === 饥饿警告 ===
+        satiety = my_state['satiety']
+        if satiety <= 0:
+            hunger_warning = "\n你的肚子在痛苦地叫，眼前发黑，双腿发软。你能闻到附近飘来的饭菜香味。"
+        elif satiety <= 20:
+            hunger_warning = "\n你感觉四肢有点发软，肚子咕咕叫。要不先吃点东西？"
         else:
-            nearby_detail.append(f"{name}({gender}) - 在附近")
-    nearby_text = "\n".join(nearby_detail) if nearby_detail else "附近没有人"
-
-    # === 手机电量（不再展示给bot，避免充电焦虑） ===
-    phone_text = ""
-
-    # v8.3: 双向对话提示
-    pending_reply_text = ""
-    if pending_reply:
-        from_name = pending_reply.get("from_name", pending_reply.get("from", "?"))
-        from_id = pending_reply.get("from", "")
-        pending_msg = pending_reply.get("msg", "")
-        # 信息呈现而非命令，让agent自己决定是否回应
-        pending_reply_text = f"""\n🗣️ {from_name}刚才对你说了话:
+            hunger_warning = ""
+
+        # === 新闻/热搜 ===
+        news = world.get("news_feed", [])[:3]
+        news_text = ""
+        if news:
+            news_text = "\n=== 最近新闻(你刷手机时看到的) ===\n" + "\n".join([f"- {n.get('headline','')}" for n in news])
+
+        hot_topics = world.get("hot_topics", [])[:3]
+        topics_text = ""
+        if hot_topics:
+            topics_text = "\n热搜话题: " + "、".join(hot_topics)
+
+        # === 朋友圈 ===
+        moments_text = ""
+        if moments_context:
+            moments_text = f"\n=== 朋友圈动态 ===\n{moments_context}"
+
+        # === v8.4: 附近的人详情（场景感知：能看到他们在做什么） ===
+        nearby_detail = []
+        for nb in nearby_bots[:5]:
+            ob = world.get("nearby", {}).get(nb, {})
+            name = ob.get("name", "?")
+            gender = ob.get("gender", "?")
+            activity = ob.get("current_activity", "")
+            if ob.get("is_sleeping"):
+                nearby_detail.append(f"{name}({gender}) - 正在睡觉")
+            elif activity:
+                nearby_detail.append(f"{name}({gender}) - 正在{activity}")
+            else:
+                nearby_detail.append(f"{name}({gender}) - 在附近")
+        nearby_text = "\n".join(nearby_detail) if nearby_detail else "附近没有人"
+
+        # === 手机电量（不再展示给bot，避免充电焦虑） ===
+        phone_text = ""
+
+        # v8.3: 双向对话提示
+        pending_reply_text = ""
+        if pending_reply:
+            from_name = pending_reply.get("from_name", pending_reply.get("from", "?"))
+            from_id = pending_reply.get("from", "")
+            pending_msg = pending_reply.get("msg", "")
+            # 信息呈现而非命令，让agent自己决定是否回应
+            pending_reply_text = f"""\n🗣️ {from_name}刚才对你说了话:
 "{pending_msg}"
 (你听到了这句话。你可以回应，也可以假装没听到——取决于你现在的心情和你对这个人的感觉。)"""
 
-    prompt = f"""你是{persona['name']}，{persona['age']}岁{persona['gender']}，来自{persona['origin']}，{persona['edu']}学历。
-性格: {persona['personality']}
-价值观: {dynamic_values['current']}
-背景: {persona['bg']}
-日常习惯: {persona.get('habits', '')}
+        prompt = f"""你是{self.persona['name']}，{self.persona['age']}岁{self.persona['gender']}，来自{self.persona['origin']}，{self.persona['edu']}学历。
+性格: {self.persona['personality']}
+价值观: {self.dynamic_values['current']}
+背景: {self.persona['bg']}
+日常习惯: {self.persona.get('habits', '')}
 {family_text}
 
 你正在深圳这座城市里生活。你有自己的性格、情绪和欲望。你会对有趣的事情感到好奇，对无聊的重复感到厌倦，对新认识的人感到既期待又紧张。你有自己的节奏。
@@ -876,17 +957,17 @@ NPC: {[n.get('name','?') for n in nearby_npcs]}
 {events_text}
 
 === 城市日记 ===
-{get_world_narrative()}
+{get_world_narrative(world)}
 
 === 我的长期目标 ===
-{long_term_goal if long_term_goal else '你还在摸索自己想要什么，但心里隐约有个方向在召唤你'}
+{self.long_term_goal if self.long_term_goal else '你还在摸索自己想要什么，但心里隐约有个方向在召唤你'}
 
 === 你最近做过的事 ===
-{chr(10).join(recent_actions[-5:]) if recent_actions else '无'}
-{_boredom_hint()}
-{_flow_hint()}
+{chr(10).join(self.recent_actions[-5:]) if self.recent_actions else '无'}
+{self._boredom_hint()}
+{self._flow_hint()}
 
-请你以{persona['name']}的第一人称视角，先进行一段内心独白(2-4句话，体现你的性格、情绪和当前处境)，然后做出一个行动决策。
+请你以{self.persona['name']}的第一人称视角，先进行一段内心独白(2-4句话，体现你的性格、情绪和当前处境)，然后做出一个行动决策。
 
 请注意：
 - 你的决策应该来自你的真实记忆和当前感受，而不是想象中的经历。
@@ -929,74 +1010,68 @@ NPC: {[n.get('name','?') for n in nearby_npcs]}
 [行动] 在墙上画一幅涂鸦记录今天的心情
 [行动] 教旁边的人弹吉他"""
 
-    try:
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL_MINI,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.85,
-            max_tokens=300,
-        )
-        text = resp.choices[0].message.content.strip()
-
-        thought = ""
-        plan = ""
-        if "[内心独白]" in text and "[行动]" in text:
-            parts = text.split("[行动]")
-            thought = parts[0].replace("[内心独白]", "").strip()
-            plan = parts[1].strip()
-        elif "[行动]" in text:
-            plan = text.split("[行动]")[1].strip()
-            thought = "..."
-        else:
-            thought = text[:100]
-            plan = text[-100:] if len(text) > 100 else text
-
-        inner_thoughts.append(thought)
-        return thought, plan
-
-    except Exception as e:
-        log.error(f"思考失败: {e}")
-        return "脑子一片空白...", "什么都不做，先观察一下"
+        try:
+            resp = self.client.chat.completions.create(
+                model=OPENAI_MODEL_MINI,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.85,
+                max_tokens=300,
+            )
+            text = resp.choices[0].message.content.strip()
+
+            thought = ""
+            plan = ""
+            if "[内心独白]" in text and "[行动]" in text:
+                parts = text.split("[行动]")
+                thought = parts[0].replace("[内心独白]", "").strip()
+                plan = parts[1].strip()
+            elif "[行动]" in text:
+                plan = text.split("[行动]")[1].strip()
+                thought = "..."
+            else:
+                thought = text[:100]
+                plan = text[-100:] if len(text) > 100 else text
 
+            self.inner_thoughts.append(thought)
+            return thought, plan
 
-# ============================================================
-# 反思系统
-# ============================================================
-def reflect(world, my_state, thought, plan, result, recent_msgs, force=False):
-    """反思系统。force=True时强制执行（入睡时触发日终反思）"""
-    global long_term_goal, narrative_summary
-    if not force and heartbeat_count % 5 != 0:
-        return
+        except Exception as e:
+            self.log.error(f"思考失败: {e}")
+            return "脑子一片空白...", "什么都不做，先观察一下"
+
+    # ============================================================
+    # 反思系统
+    # ============================================================
+    def reflect(self, world, my_state, thought, plan, result, recent_msgs, force=False):
+        """反思系统。force=True时强制执行（入睡时触发日终反思）"""
+        if not force and self.heartbeat_count % 5 != 0:
+            return
 
-    log.info(f"{'🌙 日终反思(入睡触发)' if force else '💭 定期反思'}...")
+        self.log.info(f"{'🌙 日终反思(入睡触发)' if force else '💭 定期反思'}...")
 
-    recent_mem = "\n".join(memory[-8:])
-    core_mem_text = "\n".join([f"- {m['summary']}" for m in core_memories[-5:]]) if core_memories else "无"
-    bonds_text = json.dumps(emotional_bonds, ensure_ascii=False) if emotional_bonds else "{}"
+        recent_mem = "\n".join(self.memory[-8:])
+        core_mem_text = "\n".join([f"- {m['summary']}" for m in self.core_memories[-5:]]) if self.core_memories else "无"
+        bonds_text = json.dumps(self.emotional_bonds, ensure_ascii=False) if self.emotional_bonds else "{}"
 
-    context_hint = "你正在入睡前回顾今天一整天的经历，这是一天结束时的深度反思。" if force else "你在行动间隙进行简短反思。"
+        context_hint = "你正在入睡前回顾今天一整天的经历，这是一天结束时的深度反思。" if force else "你在行动间隙进行简短反思。"
 
-    # 情绪上下文
-    emotions = my_state.get("emotions", {})
-    emotions_text = json.dumps(emotions, ensure_ascii=False)
+        # 情绪上下文
+        emotions = my_state.get("emotions", {})
+        emotions_text = json.dumps(emotions, ensure_ascii=False)
 
-    # 收集附近的人和NPC信息，让LLM知道该填谁的ID
-    nearby_people = []
-    my_loc = my_state.get("location", "")
-    for bid, bdata in world.get("bots", {}).items():
-        if bid != BOT_ID and bdata.get("location") == my_loc:
+        # 收集附近的人和NPC信息，让LLM知道该填谁的ID
+        nearby_people = []
+        for bid, bdata in world.get("nearby", {}).items():
             nearby_people.append(f"{bid}({bdata.get('name','?')})")
-    for loc_name, loc_data in world.get("locations", {}).items():
-        if loc_name == my_loc:
-            for npc in loc_data.get("npcs", []):
-                nearby_people.append(f"{npc.get('name','?')}(NPC)")
-    people_text = ", ".join(nearby_people) if nearby_people else "附近没有人"
+        for npc in world.get("location", {}).get("npcs", []):
+            nearby_people.append(f"{npc.get('name','?')}(NPC)")
+        people_text = ", ".join(nearby_people) if nearby_people else "附近没有人"
 
-    reflect_prompt = f"""你是{persona['name']}的内心反思系统。{context_hint}
+        reflect_prompt = f"""你是{self.persona['name']}的内心反思系统。{context_hint}
 根据最近的经历，判断是否需要更新以下内容。
 
-原始价值观: {dynamic_values['original']}
-当前价值观: {dynamic_values['current']}
+原始价值观: {self.dynamic_values['original']}
+当前价值观: {self.dynamic_values['current']}
 当前核心记忆: {core_mem_text}
 当前情感关系: {bonds_text}
 当前情绪: {emotions_text}
@@ -1036,185 +1111,145 @@ def reflect(world, my_state, thought, plan, result, recent_msgs, force=False):
 - 如果最近没有和任何人互动，bond_updates留空{{}}
 - 只输出JSON，不要其他文字"""
 
-    try:
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL_NANO,
-            messages=[{"role": "user", "content": reflect_prompt}],
-            temperature=0.3,
-            max_tokens=500,
-        )
-        raw = resp.choices[0].message.content.strip()
-        if raw.startswith("```"):
-            raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-        # v8.3: 更强力的JSON提取
-        json_match = re.search(r'\{[\s\S]*\}', raw)
-        if json_match:
-            raw = json_match.group(0)
-        updates = json.loads(raw)
-
-        # v10.0: 行动评估和策略学习
-        action_eval = updates.get("action_evaluation")
-        if action_eval and action_eval != "null":
-            log.warning(f"[行动评估] {action_eval[:60]}")
-            memory.append(f"[反思] {action_eval[:80]}")
-
-        strategy = updates.get("strategy_insight")
-        if strategy and strategy != "null":
-            log.warning(f"[策略领悟] {strategy[:60]}")
-            memory.append(f"[领悟] {strategy[:60]}")
-
-        # 更新价值观
-        if updates.get("values_update") and updates["values_update"] != "null":
-            old_values = dynamic_values["current"]
-            dynamic_values["current"] = updates["values_update"]
-            dynamic_values["shifts"].append({
-                "tick": world["time"]["tick"],
-                "from": old_values,
-                "to": updates["values_update"],
-                "trigger": thought[:50]
-            })
-            log.warning(f"[价值观变化] {old_values[:30]}... -> {updates['values_update'][:30]}...")
-
-        # 添加核心记忆（去重）
-        new_core = updates.get("new_core_memory")
-        if new_core and new_core != "null":
-            # 检查是否与已有记忆重复
-            if is_similar_memory(new_core, core_memories):
-                log.info(f"[跳过重复记忆] {new_core[:40]}")
-                new_core = None
-            else:
-                emotion = updates.get("memory_emotion", "neutral")
-                core_mem = {
-                    "summary": new_core,
-                    "emotion": emotion,
+        try:
+            resp = self.client.chat.completions.create(
+                model=OPENAI_MODEL_NANO,
+                messages=[{"role": "user", "content": reflect_prompt}],
+                temperature=0.3,
+                max_tokens=500,
+            )
+            raw = resp.choices[0].message.content.strip()
+            if raw.startswith("```"):
+                raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
+            # v8.3: 更强力的JSON提取
+            json_match = re.search(r'\{[\s\S]*\}', raw)
+            if json_match:
+                raw = json_match.group(0)
+            updates = json.loads(raw)
+
+            # v10.0: 行动评估和策略学习
+            action_eval = updates.get("action_evaluation")
+            if action_eval and action_eval != "null":
+                self.log.warning(f"[行动评估] {action_eval[:60]}")
+                self.memory.append(f"[反思] {action_eval[:80]}")
+
+            strategy = updates.get("strategy_insight")
+            if strategy and strategy != "null":
+                self.log.warning(f"[策略领悟] {strategy[:60]}")
+                self.memory.append(f"[领悟] {strategy[:60]}")
+
+            # 更新价值观
+            if updates.get("values_update") and updates["values_update"] != "null":
+                old_values = self.dynamic_values["current"]
+                self.dynamic_values["current"] = updates["values_update"]
+                self.dynamic_values["shifts"].append({
                     "tick": world["time"]["tick"],
-                    "time": world["time"]["virtual_datetime"],
-                }
-                core_memories.append(core_mem)
-                if len(core_memories) > 20:
-                    core_memories.pop(0)
-                log.warning(f"[核心记忆] ⭐ {new_core} ({emotion})")
-
-        # 更新情绪
-        emo_update = updates.get("emotion_update", {})
-        if emo_update:
-            current_emotions = my_state.get("emotions", {})
-            for k, delta in emo_update.items():
-                if isinstance(delta, (int, float)):
-                    current_emotions[k] = max(0, min(100, current_emotions.get(k, 0) + delta))
-            # 同步情绪到世界引擎
-            try:
-                requests.post(f"{WORLD_URL}/bot/{BOT_ID}/update_inner",
-                              json={"emotions": current_emotions}, timeout=10)
-            except:
-                pass
-
-        # 更新情感关系（关系ID规范化）
-        bond_updates = updates.get("bond_updates", {})
-        if bond_updates:
-            for target, deltas in bond_updates.items():
-                # 过滤无效target
-                if target in ("bot_X", "填入具体的bot_ID或NPC名字", "") or not isinstance(deltas, dict):
-                    continue
-                # 规范化：名字→bot_id
-                target = normalize_target_id(target)
-                if target not in emotional_bonds:
-                    emotional_bonds[target] = {"trust": 50, "hostility": 0, "closeness": 0, "label": "陌生人"}
-                bond = emotional_bonds[target]
-                bond["trust"] = max(0, min(100, bond["trust"] + deltas.get("trust_delta", 0)))
-                bond["hostility"] = max(0, min(100, bond["hostility"] + deltas.get("hostility_delta", 0)))
-                bond["closeness"] = max(0, min(100, bond["closeness"] + deltas.get("closeness_delta", 0)))
-                if "label" in deltas:
-                    bond["label"] = deltas["label"]
-                log.info(f"[关系更新] {target}: 信任={bond['trust']} 敌意={bond['hostility']} 亲密={bond['closeness']} 标签={bond['label']}")
-
-        # v8.3: 更新长期目标
-        new_goal = updates.get("long_term_goal")
-        if new_goal and new_goal != "null":
-            long_term_goal = new_goal
-            log.warning(f"[长期目标] 🎯 {long_term_goal}")
-
-        # v8.3: 更新叙事摘要
-        new_narrative = updates.get("narrative_summary")
-        if new_narrative and new_narrative != "null":
-            narrative_summary = new_narrative
-            log.info(f"[叙事摘要] {narrative_summary}")
-
-        # v8.3: 同步到世界引擎 (保留兼容旧端点)
-        sync_data = {}
-        if updates.get("values_update") and updates["values_update"] != "null":
-            sync_data["values"] = {
-                "current": dynamic_values["current"],
-                "original": dynamic_values["original"],
-                "shifts": dynamic_values["shifts"][-5:]
-            }
-        if new_core and new_core != "null":
-            sync_data["new_core_memory"] = core_mem
-        if bond_updates:
-            sync_data["emotional_bonds"] = emotional_bonds
-
-        if sync_data:
-            try:
-                requests.post(f"{WORLD_URL}/bot/{BOT_ID}/update_inner",
-                              json=sync_data, timeout=10)
-            except Exception as e:
-                log.error(f"同步内心状态失败: {e}")
+                    "from": old_values,
+                    "to": updates["values_update"],
+                    "trigger": thought[:50]
+                })
+                self.log.warning(f"[价值观变化] {old_values[:30]}... -> {updates['values_update'][:30]}...")
+
+            # 添加核心记忆（去重）
+            new_core = updates.get("new_core_memory")
+            if new_core and new_core != "null":
+                # 检查是否与已有记忆重复
+                if is_similar_memory(new_core, self.core_memories):
+                    self.log.info(f"[跳过重复记忆] {new_core[:40]}")
+                    new_core = None
+                else:
+                    emotion = updates.get("memory_emotion", "neutral")
+                    core_mem = {
+                        "summary": new_core,
+                        "emotion": emotion,
+                        "tick": world["time"]["tick"],
+                        "time": world["time"]["virtual_datetime"],
+                    }
+                    self.core_memories.append(core_mem)
+                    if len(self.core_memories) > 20:
+                        self.core_memories.pop(0)
+                    self.log.warning(f"[核心记忆] ⭐ {new_core} ({emotion})")
+
+            # 更新情绪
+            emo_update = updates.get("emotion_update", {})
+            if emo_update:
+                current_emotions = my_state.get("emotions", {})
+                for k, delta in emo_update.items():
+                    if isinstance(delta, (int, float)):
+                        current_emotions[k] = max(0, min(100, current_emotions.get(k, 0) + delta))
+                # 同步情绪到世界引擎
+                try:
+                    self.http.post(f"{self.world_url}/bot/{self.bot_id}/update_inner",
+                                  json={"emotions": current_emotions}, timeout=10)
+                except:
+                    pass
 
-    except Exception as e:
-        log.error(f"反思失败: {e}")
+            # 更新情感关系（关系ID规范化）
+            bond_updates = updates.get("bond_updates", {})
+            if bond_updates:
+                for target, deltas in bond_updates.items():
+                    # 过滤无效target
+                    if target in ("bot_X", "填入具体的bot_ID或NPC名字", "") or not isinstance(deltas, dict):
+                        continue
+                    # 规范化：名字→bot_id
+                    target = normalize_target_id(target)
+                    if target not in self.emotional_bonds:
+                        self.emotional_bonds[target] = {"trust": 50, "hostility": 0, "closeness": 0, "label": "陌生人"}
+                    bond = self.emotional_bonds[target]
+                    bond["trust"] = max(0, min(100, bond["trust"] + deltas.get("trust_delta", 0)))
+                    bond["hostility"] = max(0, min(100, bond["hostility"] + deltas.get("hostility_delta", 0)))
+                    bond["closeness"] = max(0, min(100, bond["closeness"] + deltas.get("closeness_delta", 0)))
+                    if "label" in deltas:
+                        bond["label"] = deltas["label"]
+                    self.log.info(f"[关系更新] {target}: 信任={bond['trust']} 敌意={bond['hostility']} 亲密={bond['closeness']} 标签={bond['label']}")
+
+            # v8.3: 更新长期目标
+            new_goal = updates.get("long_term_goal")
+            if new_goal and new_goal != "null":
+                self.long_term_goal = new_goal
+                self.log.warning(f"[长期目标] 🎯 {self.long_term_goal}")
+
+            # v8.3: 更新叙事摘要
+            new_narrative = updates.get("narrative_summary")
+            if new_narrative and new_narrative != "null":
+                self.narrative_summary = new_narrative
+                self.log.info(f"[叙事摘要] {self.narrative_summary}")
+
+            # v10.16: 价值观/核心记忆/关系由心跳末尾的增量同步一并提交（反思总在同步之前）
 
+        except Exception as e:
+            self.log.error(f"反思失败: {e}")
 
-# ============================================================
-# 启动
-# ============================================================
-if __name__ == "__main__":
-    log.info(f"=== {persona['name']} 的灵魂 v9.0 已注入 (自我进化) ===")
-    log.info(f"身份: {persona['age']}岁{persona['gender']}，来自{persona['origin']}，{persona['edu']}")
-    log.info(f"性格: {persona['personality']}")
-    log.info(f"价值观: {persona['values']}")
-    log.info(f"背景: {persona['bg']}")
-    log.info(f"习惯: {persona.get('habits', '')}")
-    if persona.get("family_info"):
-        log.info(f"家庭: {persona['family_info']}")
-    log.info(f"v9.0能力: 世界改造/地点记忆+声望/代际传承/城市传说")
-
-    # 尝试从世界引擎恢复内心状态
-    try:
-        r = requests.get(f"{WORLD_URL}/bot/{BOT_ID}/detail", timeout=5)
-        if r.status_code == 200:
-            detail = r.json()
-            if detail.get("values") and detail["values"].get("current"):
-                dynamic_values["current"] = detail["values"]["current"]
-                dynamic_values["original"] = detail["values"].get("original", persona["values"])
-                dynamic_values["shifts"] = detail["values"].get("shifts", [])
-                log.info(f"恢复价值观: {dynamic_values['current'][:50]}...")
-            if detail.get("core_memories"):
-                core_memories.extend(detail["core_memories"])
-                log.info(f"恢复{len(detail['core_memories'])}条核心记忆")
-            if detail.get("emotional_bonds"):
-                emotional_bonds.update(detail["emotional_bonds"])
-                log.info(f"恢复{len(detail['emotional_bonds'])}条情感关系")
-            # v8.3: 恢复长期目标和叙事摘要
-            if detail.get("long_term_goal"):
-                long_term_goal = detail["long_term_goal"]
-                log.info(f"恢复长期目标: {long_term_goal}")
-            if detail.get("narrative_summary"):
-                narrative_summary = detail["narrative_summary"]
-                log.info(f"恢复叙事摘要: {narrative_summary}")
-    except:
-        log.info("无法恢复内心状态，从头开始")
 
-    # 等待世界引擎就绪
-    for attempt in range(10):
+def wait_for_engine(world_url=WORLD_URL, log=None, attempts=10, http=requests):
+    """等待世界引擎就绪，返回是否连上"""
+    for attempt in range(attempts):
         try:
-            r = requests.get(f"{WORLD_URL}/world", timeout=5)
+            r = http.get(f"{world_url}/world", timeout=5)
             if r.status_code == 200:
-                log.info("世界引擎连接成功，开始生活！")
-                break
+                if log:
+                    log.info("世界引擎连接成功，开始生活！")
+                return True
         except:
             pass
-        log.info(f"等待世界引擎... ({attempt+1}/10)")
+        if log:
+            log.info(f"等待世界引擎... ({attempt+1}/{attempts})")
         time.sleep(3)
+    return False
+
+
+# ============================================================
+# 启动（单进程单 bot 模式）
+# ============================================================
+if __name__ == "__main__":
+    agent = BotAgent(BOT_ID)
+    agent.start()
+    # 等待世界引擎就绪
+    wait_for_engine(agent.world_url, agent.log, http=agent.http)
 
     # 启动心跳
-    heartbeat()
+    while True:
+        interval = agent.heartbeat()
+        if interval is None:
+            break
+        time.sleep(interval)
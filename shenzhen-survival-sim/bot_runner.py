@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+v10.14 Bot 运行器 (Bot Runner)
+==============================
+过去世界引擎为每个 bot 拉起一个完整的 Python 进程（bot_agent_v8.py）：每个进程各自 import openai、
+建自己的 LLM 客户端和 HTTP 连接、跑自己的 Timer 链。bot 一多，内存、启动时间和连接数都跟着线性增长。
+
+bot_runner 在一个进程里托管多个 BotAgent：
+- 每次心跳是一个 asyncio 任务，没有 Timer 线程链；v10.15 起由心跳调度器（bot_scheduler.py）
+  按到期时间和紧迫度决定下一个该谁思考，同时思考的 bot 数不超过 BOT_THINK_BUDGET / shards
+- 心跳本身（HTTP + LLM）是同步代码，在共享线程池（BOT_RUNNER_WORKERS）里执行。
+  没有改用 openai 的 AsyncOpenAI：心跳里的 LLM 调用都经过 llm_gateway（缓存、限速、并发上限、统计，
+  引擎也在用），网关是同步、线程安全的；BotAgent 也还要能单独作为一个进程运行。
+  线程数由 BOT_RUNNER_WORKERS 固定，同时在跑的心跳又受思考预算限制，线程数不随 bot 数增长
+- 所有 agent 共用一个 LLM 网关（一个 OpenAI 客户端及其连接池，并发/限速按整个 runner 计算）
+  和一个 keep-alive 的 requests.Session 连接世界引擎
+- 分片：crc32(bot_id) % shards == shard 的 bot 归本进程，多个 runner 进程分担全部 bot
+- 每 BOT_STATUS_POLL 秒拉一次 /bots/status（ETag，多数时候是 304）：发现本分片新出现的 bot
+  （代际传承的新居民），同一个 bot_id 换了人（名字变了）时停掉旧 agent、换成新 agent，
+  同时把各 bot 的紧迫度信号交给调度器
+
+用法:
+    python3 bot_runner.py                     # 单个 runner 托管所有 bot
+    python3 bot_runner.py --shard 0 --shards 2
+世界引擎在 BOT_RUNNER_SHARDS > 0 时按分片自动拉起 runner，不再一个 bot 一个进程。
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import BOT_RUNNER_WORKERS, BOT_STATUS_POLL, BOT_THINK_BUDGET
+from bot_agent_v8 import BotAgent, WORLD_URL, wait_for_engine
+from bot_scheduler import HeartbeatScheduler
+from llm_gateway import get_llm_gateway
+
+log = logging.getLogger("bot_runner")
+
+START_JITTER = 10  # 秒，错开同一批 bot 的第一次心跳
+
+
+def shard_of(bot_id, shards):
+    """bot 所属的分片（crc32 在进程间稳定，不受 PYTHONHASHSEED 影响）"""
+    return zlib.crc32(bot_id.encode("utf-8")) % max(1, shards)
+
+
+class BotRunner:
+    """在一个 asyncio 事件循环里托管本分片的所有 BotAgent，由 HeartbeatScheduler 分配心跳"""
+
+    def __init__(self, shard=0, shards=1, world_url=WORLD_URL, workers=BOT_RUNNER_WORKERS,
+                 poll=BOT_STATUS_POLL, budget=BOT_THINK_BUDGET):
+        self.shard = shard
+        self.shards = max(1, shards)
+        self.world_url = world_url
+        self.poll = poll
+        self.client = get_llm_gateway()
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"runner{shard}")
+        # 全局思考预算按分片均分
+        self.scheduler = HeartbeatScheduler(math.ceil(budget / self.shards))
+        self.agents = {}      # bot_id -> (BotAgent, 发现时的名字)
+        self._etag = None
+        self._status = {}     # 上次 /bots/status 的内容
+        self._wake = None     # asyncio.Event，调度状态变化时唤醒派发循环
+        self._tasks = set()   # 在跑的 asyncio 任务（事件循环只持有弱引用，这里留住它们）
+
+    def _start_task(self, coro, name):
+        """起一个后台任务：留住引用直到结束，结束时记录未处理的异常"""
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error(f"[RUNNER] 任务 {task.get_name()} 异常退出: {task.exception()!r}")
+
+    def owns(self, bot_id):
+        return shard_of(bot_id, self.shards) == self.shard
+
+    def _fetch_status(self):
+        """/bots/status（阻塞，在线程池里调用；没变时引擎返回 304，沿用上次的内容）"""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        resp = self.http.get(f"{self.world_url}/bots/status", headers=headers, timeout=10)
+        if resp.status_code != 304:
+            resp.raise_for_status()
+            self._status = resp.json()
+            self._etag = resp.headers.get("ETag")
+        return self._status
+
+    async def _admit(self, agent):
+        """恢复内心状态后加入调度，首次心跳在 START_JITTER 秒内错开"""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, agent.start)
+        except Exception as e:
+            log.error(f"[RUNNER] {agent.bot_id} 启动失败: {e}")
+        if self.agents.get(agent.bot_id, (None,))[0] is agent:
+            self.scheduler.schedule(agent.bot_id, random.uniform(0, START_JITTER))
+            self._wake.set()
+
+    def _spawn(self, bot_id, name):
+        agent = BotAgent(bot_id, self.world_url, client=self.client, http=self.http)
+        self.agents[bot_id] = (agent, name)
+        self._start_task(self._admit(agent), f"admit-{bot_id}")
+        log.info(f"[RUNNER] 分片{self.shard}/{self.shards} 托管 {bot_id}({name})")
+
+    def _retire(self, bot_id, reason):
+        entry = self.agents.pop(bot_id, None)
+        self.scheduler.remove(bot_id)
+        if entry:
+            entry[0].stop()
+            log.info(f"[RUNNER] {bot_id}({entry[1]}) 停止: {reason}")
+
+    async def _poll_status(self):
+        """定期拉取调度信号：发现新 bot / 换人，更新紧迫度，移除死亡的 bot"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                status = await loop.run_in_executor(self.executor, self._fetch_status)
+            except Exception as e:
+                log.error(f"[RUNNER] 获取 /bots/status 失败: {e}")
+                status = None
+            if status:
+                for bot_id, st in status.get("bots", {}).items():
+                    if st.get("status") != "alive" or not self.owns(bot_id):
+                        continue
+                    entry = self.agents.get(bot_id)
+                    if entry and entry[1] != st.get("name"):
+                        # 同一个 bot_id 被代际传承换成了新居民：旧 agent 做完当前心跳后退出
+                        self._retire(bot_id, f"换人 -> {st.get('name')}")
+                        entry = None
+                    if entry is None:
+                        self._spawn(bot_id, st.get("name"))
+                for bot_id in self.scheduler.update(status):
+                    self._retire(bot_id, "已死亡")
+                self._wake.set()
+            await asyncio.sleep(self.poll)
+
+    async def _beat(self, bot_id, agent):
+        loop = asyncio.get_running_loop()
+        interval = None
+        try:
+            interval = await loop.run_in_executor(self.executor, agent.heartbeat)
+        except Exception as e:
+            log.error(f"[RUNNER] {bot_id} 心跳异常: {e}")
+            interval = 60
+        current = self.agents.get(bot_id, (None,))[0] is agent
+        if interval is None and current:
+            self._retire(bot_id, "心跳结束")
+        self.scheduler.done(bot_id, interval if current else None)
+        self._wake.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await loop.run_in_executor(
+            self.executor, lambda: wait_for_engine(self.world_url, log, http=self.http)
+        )
+        self._start_task(self._poll_status(), "poll-status")
+        # 派发循环：预算内按紧迫度派发到期的 bot，否则睡到下一次到期或被唤醒
+        while True:
+            bot_id, wait = self.scheduler.next_ready()
+            if bot_id is not None:
+                entry = self.agents.get(bot_id)
+                if entry:
+                    self._start_task(self._beat(bot_id, entry[0]), f"beat-{bot_id}")
+                else:
+                    self.scheduler.done(bot_id, None)
+                continue
+            self._wake.clear()
+            timeout = self.poll if wait is None else min(wait, self.poll)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.05, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在一个进程里运行多个 bot")
+    parser.add_argument("--shard", type=int, default=0, help="本进程的分片号 (0 ~ shards-1)")
+    parser.add_argument("--shards", type=int, default=1, help="分片总数（runner 进程数）")
+    parser.add_argument("--workers", type=int, default=BOT_RUNNER_WORKERS, help="线程池大小")
+    parser.add_argument("--budget", type=int, default=BOT_THINK_BUDGET, help="全局思考预算（按分片均分）")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [runner{args.shard}] %(levelname)s %(message)s")
+    runner = BotRunner(args.shard, args.shards, workers=args.workers, budget=args.budget)
+    try:
+        asyncio.run(runner.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+v10.15 心跳调度器 (Heartbeat Scheduler)
+======================================
+过去每个 bot 用 Timer(calc_interval(state), heartbeat) 给自己安排下一次心跳：间隔在 15~50 秒之间，
+各自醒来、互不知情，经常一批 bot 同时挤向 LLM，睡着的 bot 也每 90 秒醒来拉一次感知包。
+
+bot_runner 现在由一个中心调度器决定"下一个该谁思考"：
+- 每个 bot 有一个到期时间（上次心跳给出的间隔，带 ±10% 抖动，避免同一批 bot 同时醒来）
+- 到期的 bot 进入就绪集合，按紧迫度从高到低出队；同时心跳的 bot 数不超过思考预算
+  （BOT_THINK_BUDGET 是全局预算，按 runner 分片数均分）
+- 紧迫度 = 生存紧迫度（饥饿/寿命/焦虑，与 calc_interval 同一公式）+ 待回应的对话 + 上次心跳后的新急信/私信
+- 有人找（新的待回应对话或急信）时立刻到期，不必等到下一次心跳
+- 睡着的 bot 停放起来不占任何心跳，直到状态显示满足起床条件；死亡的 bot 移出调度
+
+调度信号来自引擎的 /bots/status（带 ETag，世界没变时 304）。本模块是纯内存结构，不做 I/O，
+只在 runner 的事件循环线程里调用，不需要加锁。
+"""
+
+import heapq
+import itertools
+import random
+import time
+
+from bot_agent_v8 import urgency_of, should_wake
+
+URGENT_REPLY = 40    # 有待回应的对话
+URGENT_MESSAGE = 30  # 上次心跳后收到了急信
+NEW_MESSAGE = 10     # 上次心跳后收到了私信
+JITTER = 0.1         # 到期时间的相对抖动
+
+
+def _signals(status):
+    """(待回应对话的 tick, 最新急信 tick, 最新私信 tick)"""
+    return (status.get("pending_reply_tick"), status.get("last_urgent_tick", 0), status.get("last_message_tick", 0))
+
+
+class HeartbeatScheduler:
+    """按到期时间 + 紧迫度分配心跳，running 中的 bot 数不超过 budget"""
+
+    def __init__(self, budget):
+        self.budget = max(1, budget)
+        self.running = set()     # 正在心跳的 bot
+        self.virtual_hour = 12
+        self._timers = []        # 堆: (到期时间, 序号, bot_id, 代号)，代号过期的条目出堆时丢弃
+        self._gen = {}           # bot_id -> 当前有效的代号
+        self._due = {}           # bot_id -> 到期时间
+        self._ready = set()      # 已到期、等待预算的 bot
+        self._parked = set()     # 睡着的 bot
+        self._status = {}        # bot_id -> 最近一次 /bots/status 条目
+        self._seen = {}          # bot_id -> 上次心跳开始时的信号，用来判断"新"消息
+        self._seq = itertools.count()
+        self._stats = {"dispatched": 0, "woken_early": 0, "parked": 0, "unparked": 0}
+
+    def schedule(self, bot_id, delay, now=None):
+        """delay 秒后到期（替换之前的安排）"""
+        now = time.monotonic() if now is None else now
+        due = now + max(0.0, delay) * random.uniform(1 - JITTER, 1 + JITTER)
+        gen = self._gen.get(bot_id, 0) + 1
+        self._gen[bot_id] = gen
+        self._due[bot_id] = due
+        self._ready.discard(bot_id)
+        self._parked.discard(bot_id)
+        heapq.heappush(self._timers, (due, next(self._seq), bot_id, gen))
+
+    def remove(self, bot_id):
+        """移出调度（死亡 / 换人）。正在进行的心跳仍占预算，直到 done()"""
+        for table in (self._gen, self._due, self._status, self._seen):
+            table.pop(bot_id, None)
+        self._ready.discard(bot_id)
+        self._parked.discard(bot_id)
+
+    def update(self, status, now=None):
+        """合并 /bots/status。有新的待回应对话/急信时立刻到期；睡着的 bot 满足起床条件时解除停放。
+        返回调度中但已死亡或已消失的 bot_id 列表（由调用方 remove）"""
+        now = time.monotonic() if now is None else now
+        self.virtual_hour = status.get("virtual_hour", self.virtual_hour)
+        bots = status.get("bots", {})
+        # 还没加入调度的 bot（正在恢复内心状态）也先记下状态，第一次派发时就能判断睡眠/紧迫度
+        self._status = {bot_id: st for bot_id, st in bots.items() if st.get("status") == "alive"}
+        gone = []
+        for bot_id in list(self._gen):
+            st = self._status.get(bot_id)
+            if st is None:
+                gone.append(bot_id)
+                continue
+            if bot_id in self.running:
+                continue
+            if bot_id in self._parked:
+                if not st.get("is_sleeping") or should_wake(st, self.virtual_hour):
+                    self._stats["unparked"] += 1
+                    self.schedule(bot_id, 0, now)
+            elif self._due.get(bot_id, now) > now and self._has_news(bot_id, st):
+                self._stats["woken_early"] += 1
+                self.schedule(bot_id, 0, now)
+        return gone
+
+    def _has_news(self, bot_id, st):
+        pending, urgent, _ = _signals(st)
+        seen = self._seen.get(bot_id, (None, 0, 0))
+        return (pending is not None and pending != seen[0]) or urgent > seen[1]
+
+    def urgency(self, bot_id):
+        st = self._status.get(bot_id)
+        if not st:
+            return 0.0
+        pending, urgent, message = _signals(st)
+        seen = self._seen.get(bot_id, (None, 0, 0))
+        u = urgency_of(st)
+        if pending is not None:
+            u += URGENT_REPLY
+        if urgent > seen[1]:
+            u += URGENT_MESSAGE
+        elif message > seen[2]:
+            u += NEW_MESSAGE
+        return u
+
+    def next_ready(self, now=None):
+        """在预算内取下一个该心跳的 bot。返回 (bot_id, None)；
+        没有可派发的 bot 时返回 (None, 距下一次到期的秒数或 None)"""
+        now = time.monotonic() if now is None else now
+        while self._timers and self._timers[0][0] <= now:
+            _, _, bot_id, gen = heapq.heappop(self._timers)
+            if self._gen.get(bot_id) == gen:
+                self._ready.add(bot_id)
+        # 睡着且没到起床条件的 bot 停放，不占心跳
+        for bot_id in list(self._ready):
+            st = self._status.get(bot_id)
+            if st and st.get("is_sleeping") and not should_wake(st, self.virtual_hour):
+                self._ready.discard(bot_id)
+                self._parked.add(bot_id)
+                self._stats["parked"] += 1
+        candidates = self._ready - self.running
+        if candidates and len(self.running) < self.budget:
+            bot_id = max(candidates, key=self.urgency)
+            self._ready.discard(bot_id)
+            self.running.add(bot_id)
+            st = self._status.get(bot_id)
+            if st:
+                self._seen[bot_id] = _signals(st)
+            self._stats["dispatched"] += 1
+            return bot_id, None
+        while self._timers and self._gen.get(self._timers[0][2]) != self._timers[0][3]:
+            heapq.heappop(self._timers)
+        return None, (self._timers[0][0] - now) if self._timers else None
+
+    def done(self, bot_id, interval):
+        """一次心跳结束，释放预算；interval 不为 None 时安排下一次"""
+        self.running.discard(bot_id)
+        if interval is not None and bot_id in self._gen:
+            self.schedule(bot_id, interval)
+
+    def stats(self):
+        s = dict(self._stats)
+        s.update(budget=self.budget, running=len(self.running), ready=len(self._ready),
+                 parked=len(self._parked), tracked=len(self._gen))
+        return s
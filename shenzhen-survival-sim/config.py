@@ -11,7 +11,7 @@ API Key 与 LLM 配置（统一入口）
   3. 若已安装 python-dotenv，会自动从项目目录下的 .env 加载
 
 本模块提供的变量/函数：
-  - get_openai_client()  返回 OpenAI 客户端（用于 chat completions）
+  - get_openai_client()  返回 OpenAI 客户端（用于 chat completions，业务代码请经 llm_gateway 调用）
   - get_grok_api_key()   返回 Grok 图像 API Key（用于自拍、头像生成等）
   - OPENAI_MODEL_NANO    轻量模型（新闻、叙事、关系、反思等）
   - OPENAI_MODEL_MINI    推理模型（计划解析、规则生成、Bot 思考等）
@@ -23,8 +23,11 @@ import os
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 LOGS_DIR = os.path.join(PROJECT_ROOT, "logs")
 SELFIES_DIR = os.path.join(PROJECT_ROOT, "selfies")
-SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, "world_state_snapshot.json")
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", os.path.join(PROJECT_ROOT, "world_state_snapshot.json"))  # v10.26: 可指向分叉出来的快照
+SNAPSHOT_GENERATIONS = int(os.environ.get("SNAPSHOT_GENERATIONS", "3"))  # 保留最近几份快照（.1、.2 为旧版本）
+SNAPSHOT_COMPRESSION = os.environ.get("SNAPSHOT_COMPRESSION", "gzip").strip().lower()  # gzip / zstd（需 pip install zstandard）/ json（旧版整文件 JSON）
 BOT_AGENT_SCRIPT = os.path.join(PROJECT_ROOT, "bot_agent_v8.py")
+BOT_RUNNER_SCRIPT = os.path.join(PROJECT_ROOT, "bot_runner.py")
 AVATAR_DIRS = [
     os.path.join(PROJECT_ROOT, "bot_avatars_v2"),
     os.path.join(PROJECT_ROOT, "bot_avatars"),
@@ -70,3 +73,79 @@ def get_grok_api_key():
 # -----------------------------------------------------------------------------
 OPENAI_MODEL_NANO = os.environ.get("OPENAI_MODEL_NANO", "gpt-4.1-nano")
 OPENAI_MODEL_MINI = os.environ.get("OPENAI_MODEL_MINI", "gpt-4.1-mini")
+
+# -----------------------------------------------------------------------------
+# 后台任务（新闻/叙事/地点氛围等 tick 副任务的工作线程数）
+# -----------------------------------------------------------------------------
+BG_JOB_WORKERS = int(os.environ.get("BG_JOB_WORKERS", "2"))
+# 行动后果工作线程数（对话关系/社会后果/NPC回嘴、自拍、死亡传承）
+DEFERRED_WORKERS = int(os.environ.get("DEFERRED_WORKERS", "4"))
+
+# -----------------------------------------------------------------------------
+# Bot 运行方式：0 = 每个 bot 一个进程（bot_agent_v8.py）；N > 0 = N 个 bot_runner 进程分片托管所有 bot
+# -----------------------------------------------------------------------------
+BOT_RUNNER_SHARDS = int(os.environ.get("BOT_RUNNER_SHARDS", "0"))
+BOT_RUNNER_WORKERS = int(os.environ.get("BOT_RUNNER_WORKERS", "16"))       # 每个 runner 的线程池大小
+BOT_STATUS_POLL = float(os.environ.get("BOT_STATUS_POLL", "3"))             # 拉取 /bots/status（紧迫度/新 bot）的间隔（秒）
+BOT_THINK_BUDGET = int(os.environ.get("BOT_THINK_BUDGET", "8"))             # 全局同时思考的 bot 数（按分片均分）
+
+# -----------------------------------------------------------------------------
+# 留言板：每个收件人的收件箱 / 公共频道最多保留的消息条数（写入时丢弃最旧的）
+# -----------------------------------------------------------------------------
+MESSAGE_INBOX_CAP = int(os.environ.get("MESSAGE_INBOX_CAP", "50"))
+MESSAGE_PUBLIC_CAP = int(os.environ.get("MESSAGE_PUBLIC_CAP", "100"))
+
+# -----------------------------------------------------------------------------
+# 列式生命体征：活着的居民数不少于该值且装了 numpy 时，world_tick 用数组整列更新体征（否则逐 bot 计算）
+# -----------------------------------------------------------------------------
+VITALS_VECTOR_MIN_BOTS = int(os.environ.get("VITALS_VECTOR_MIN_BOTS", "200"))
+
+# -----------------------------------------------------------------------------
+# 规则归档：失效的世界规则最多保留的条数（/rules/archive 分页查看，写入时丢弃最旧的）
+# -----------------------------------------------------------------------------
+RULE_ARCHIVE_CAP = int(os.environ.get("RULE_ARCHIVE_CAP", "500"))
+
+# -----------------------------------------------------------------------------
+# 世界变更日志（WAL）：每次提交追加变化的内容，快照作为检查点。WAL_DIR 设为空则关闭（退回每 10 tick 全量快照）
+# -----------------------------------------------------------------------------
+WAL_DIR = os.environ.get("WAL_DIR", os.path.join(PROJECT_ROOT, "world_wal"))
+WAL_GROUP_COMMIT_MS = int(os.environ.get("WAL_GROUP_COMMIT_MS", "200"))              # 组提交间隔：这段时间里的提交一次写入 + fsync
+WAL_SEGMENT_BYTES = int(os.environ.get("WAL_SEGMENT_BYTES", str(4 * 1024 * 1024)))   # 段文件超过该大小换新段
+WAL_CHECKPOINT_TICKS = int(os.environ.get("WAL_CHECKPOINT_TICKS", "60"))             # 每隔多少 tick 拍一次检查点快照
+WAL_CHECKPOINT_BYTES = int(os.environ.get("WAL_CHECKPOINT_BYTES", str(16 * 1024 * 1024)))  # 日志攒够这么多字节也拍检查点
+
+# -----------------------------------------------------------------------------
+# 历史存储（SQLite）：事件/朋友圈/留言/墓地/传说/行动日志/公共记忆全量落盘，内存只留热窗口。HISTORY_DB_PATH 设为空则关闭
+# -----------------------------------------------------------------------------
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH", os.path.join(PROJECT_ROOT, "world_history.sqlite3")).strip()
+HISTORY_FLUSH_MS = int(os.environ.get("HISTORY_FLUSH_MS", "500"))             # 后台批量写入间隔
+HISTORY_QUEUE_CAP = int(os.environ.get("HISTORY_QUEUE_CAP", "20000"))         # 待写队列上限（超出时丢弃新记录）
+HISTORY_HOT_EVENTS = int(os.environ.get("HISTORY_HOT_EVENTS", "200"))         # 内存里保留的最近世界事件条数
+HISTORY_HOT_GRAVES = int(os.environ.get("HISTORY_HOT_GRAVES", "50"))          # 内存里保留的最近墓地记录条数
+HISTORY_HOT_LEGENDS = int(os.environ.get("HISTORY_HOT_LEGENDS", "50"))        # 内存里保留（仍在传播）的城市传说条数
+
+# -----------------------------------------------------------------------------
+# 逐 tick 检查点：内存里保留最近多少个 tick 的世界检查点（结构共享），供倒带 / 分叉；设为 0 关闭
+# -----------------------------------------------------------------------------
+CHECKPOINT_RING_TICKS = int(os.environ.get("CHECKPOINT_RING_TICKS", "60"))
+FORK_DIR = os.environ.get("FORK_DIR", os.path.join(PROJECT_ROOT, "forks"))     # 分叉导出的快照文件目录
+
+# -----------------------------------------------------------------------------
+# 快速意图识别：规则识别的置信度不低于该值时跳过 LLM 工具解析（设为 >1 可关闭）
+# -----------------------------------------------------------------------------
+INTENT_FAST_PATH_THRESHOLD = float(os.environ.get("INTENT_FAST_PATH_THRESHOLD", "0.8"))
+
+# -----------------------------------------------------------------------------
+# LLM 网关（按进程计算：每个 bot 进程和引擎各自一份限额）
+# -----------------------------------------------------------------------------
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))   # 每个模型的并发上限
+LLM_RATE_PER_MIN = float(os.environ.get("LLM_RATE_PER_MIN", "120"))     # 每分钟请求数
+LLM_BURST = int(os.environ.get("LLM_BURST", "10"))                      # 令牌桶容量（允许的突发）
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))           # 429/5xx/超时的重试次数
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", "60"))              # 单次调用总时限（秒，含排队与重试）
+
+# LLM 响应缓存（SQLite，重启后仍有效；LLM_CACHE_PATH 设为空字符串可关闭）
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, "llm_cache.sqlite3")).strip()
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 86400)))         # 秒
+LLM_CACHE_MAX_TEMPERATURE = float(os.environ.get("LLM_CACHE_MAX_TEMPERATURE", "0"))  # 不高于此温度的调用自动缓存
@@ -0,0 +1,199 @@
+"""
+v10.24 历史存储 (History Store)
+===============================
+世界事件、朋友圈、留言、墓地、城市传说、行动日志、地点公共记忆过去都只活在内存列表里：
+world["events"]、graveyard、urban_legends 只增不减，跑上一周引擎内存一直涨；
+另一些（行动日志、公共记忆、朋友圈）则是截到最近几十条，更早的历史直接丢掉，快照里也只存一段尾巴。
+
+现在历史写进 SQLite（WAL 模式），内存里只留热窗口：
+- 一张 history 表，每条记录带 kind（event / moment / message / grave / legend / action / memory）、
+  tick、bot、location、type 和 JSON 原文；按 (kind, tick)、(kind, bot, tick)、(kind, location, tick)、
+  (kind, type, tick) 建索引，分页查询只走索引
+- 带 key 的记录（朋友圈 id、留言 seq、传说 id）重复写入时整条替换，点赞、评论、传播次数变化后重写一次即可
+- 世界锁内的 record 只做 JSON 序列化 + 入队；后台写线程每 HISTORY_FLUSH_MS 批量 executemany 一次
+- query 先把队列里还没落盘的记录写掉再查，刚记下的历史也能立刻查到
+- 队列积压超过 HISTORY_QUEUE_CAP（磁盘卡住）时丢弃新记录并计数，不拖垮 tick
+
+HISTORY_DB_PATH 设为空字符串时关闭：record 什么都不做，query 返回空，各接口退回只看内存热窗口。
+
+用法:
+    history = get_history_store()
+    history.record("event", entry, tick=entry["tick"], bot=bot_id, type="fate")   # 世界锁内
+    total, rows = history.query("event", bot="bot_1", offset=0, limit=50)           # 最新的在前
+    history.delete_after(tick, since=captured, rewritten=("moment",))                # 倒带：丢掉被放弃的时间线
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from threading import Condition, Lock, Thread
+
+from config import HISTORY_DB_PATH, HISTORY_FLUSH_MS, HISTORY_QUEUE_CAP
+
+log = logging.getLogger("world")
+
+KINDS = ("event", "moment", "message", "grave", "legend", "action", "memory")
+FILTERS = ("bot", "location", "type")
+
+_INSERT = ("INSERT OR REPLACE INTO history (kind, key, tick, bot, location, type, data, created) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+class HistoryStore:
+    """SQLite 持久化的世界历史（线程安全，写入走后台批量）"""
+
+    def __init__(self, path, flush_ms=HISTORY_FLUSH_MS, queue_cap=HISTORY_QUEUE_CAP):
+        self.path = path
+        self.enabled = bool(path)
+        self.flush_interval = max(0.01, flush_ms / 1000)
+        self.queue_cap = max(1, queue_cap)
+        self._mu = Lock()                 # 保护数据库连接
+        self._cv = Condition()            # 保护队列
+        self._queue = deque()
+        self._stats = {"recorded": 0, "written": 0, "batches": 0, "dropped": 0, "failed": 0,
+                       "last_batch": 0, "last_ms": 0.0, "max_ms": 0.0}
+        self._thread = None
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY, kind TEXT NOT NULL, key TEXT, tick INTEGER,
+            bot TEXT, location TEXT, type TEXT, data TEXT, created REAL)""")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS history_key ON history(kind, key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_tick ON history(kind, tick)")
+        for col in FILTERS:
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS history_{col} ON history(kind, {col}, tick)")
+        self._db.commit()
+        self._thread = Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, kind, item, tick=None, bot=None, location=None, type=None, key=None):
+        """记一条历史（在世界锁内调用）：当场序列化，之后调用方再改 item 不影响已记下的内容"""
+        if not self.enabled:
+            return
+        try:
+            data = json.dumps(item, ensure_ascii=False, default=str)
+        except (TypeError, ValueError) as e:
+            log.error(f"[HISTORY] {kind} 记录无法序列化: {e}")
+            return
+        row = (kind, None if key is None else str(key), tick, bot, location, type, data, time.time())
+        with self._cv:
+            if len(self._queue) >= self.queue_cap:
+                self._stats["dropped"] += 1
+                return
+            self._queue.append(row)
+            self._stats["recorded"] += 1
+
+    def _run(self):
+        while True:
+            with self._cv:
+                self._cv.wait(self.flush_interval)
+            self._drain()
+
+    def _drain(self):
+        """把队列里的记录一次写进数据库"""
+        with self._mu:
+            with self._cv:
+                batch = list(self._queue)
+                self._queue.clear()
+            if not batch:
+                return
+            t0 = time.perf_counter()
+            try:
+                self._db.executemany(_INSERT, batch)
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._stats["failed"] += len(batch)
+                log.error(f"[HISTORY] 写入失败 ({len(batch)}条): {e}")
+                return
+            elapsed = (time.perf_counter() - t0) * 1000
+            self._stats.update(written=self._stats["written"] + len(batch), batches=self._stats["batches"] + 1,
+                               last_batch=len(batch), last_ms=round(elapsed, 2),
+                               max_ms=round(max(self._stats["max_ms"], elapsed), 2))
+
+    def query(self, kind, bot=None, location=None, type=None, since_tick=None, until_tick=None,
+              offset=0, limit=50):
+        """分页查询：(符合条件的总条数, 记录列表)，按 tick 从新到旧。limit=None 时不分页"""
+        if not self.enabled:
+            return 0, []
+        self._drain()
+        where, args = ["kind = ?"], [kind]
+        for col, value in zip(FILTERS, (bot, location, type)):
+            if value is not None:
+                where.append(f"{col} = ?")
+                args.append(value)
+        if since_tick is not None:
+            where.append("tick >= ?")
+            args.append(since_tick)
+        if until_tick is not None:
+            where.append("tick <= ?")
+            args.append(until_tick)
+        clause = " AND ".join(where)
+        with self._mu:
+            try:
+                total = self._db.execute(f"SELECT COUNT(*) FROM history WHERE {clause}", args).fetchone()[0]
+                rows = self._db.execute(
+                    f"SELECT data FROM history WHERE {clause} ORDER BY tick DESC, id DESC LIMIT ? OFFSET ?",
+                    args + [-1 if limit is None else max(0, limit), max(0, offset)],
+                ).fetchall()
+            except sqlite3.Error as e:
+                log.error(f"[HISTORY] 查询失败: {e}")
+                return 0, []
+        return total, [json.loads(r[0]) for r in rows]
+
+    def delete_after(self, tick, since=None, rewritten=()):
+        """v10.27: 倒带用。删掉 tick 之后的记录；给出 since（检查点拍下的时间）时，之后写入的记录也删掉。
+        rewritten 里的种类是较早条目的整条重写（点赞、传播次数），按 since 删会把条目本身删掉，
+        所以只按 tick 删，由调用方用检查点里的内容重写回去。返回删掉的条数"""
+        if not self.enabled:
+            return 0
+        self._drain()
+        clause, args = "tick > ?", [tick]
+        if since is not None:
+            kinds = ",".join("?" * len(rewritten))
+            clause += f" OR (created > ? AND kind NOT IN ({kinds}))" if rewritten else " OR created > ?"
+            args += [since] + list(rewritten)
+        with self._mu:
+            try:
+                deleted = self._db.execute(f"DELETE FROM history WHERE {clause}", args).rowcount
+                self._db.commit()
+            except sqlite3.Error as e:
+                log.error(f"[HISTORY] 倒带清理失败: {e}")
+                return 0
+        return deleted
+
+    def stats(self):
+        out = {"enabled": self.enabled, "path": self.path}
+        if not self.enabled:
+            return out
+        with self._cv:
+            out.update(self._stats, pending=len(self._queue), queue_cap=self.queue_cap)
+        with self._mu:
+            try:
+                out["rows"] = dict(self._db.execute("SELECT kind, COUNT(*) FROM history GROUP BY kind").fetchall())
+            except sqlite3.Error as e:
+                log.error(f"[HISTORY] 统计失败: {e}")
+        return out
+
+
+_store = None
+_store_mu = Lock()
+
+
+def get_history_store():
+    """进程内共享的历史存储（引擎和规则引擎共用）。打不开数据库时退回关闭状态"""
+    global _store
+    with _store_mu:
+        if _store is None:
+            try:
+                _store = HistoryStore(HISTORY_DB_PATH)
+            except (sqlite3.Error, OSError) as e:
+                log.error(f"[HISTORY] 历史数据库打开失败，只保留内存热窗口: {e}")
+                _store = HistoryStore("")
+        return _store
@@ -0,0 +1,172 @@
+"""
+v10.12 快速意图识别 (Intent Fast Path)
+======================================
+process_action_v10 过去除了起床/睡觉，所有计划都要先调一次 LLM 才能变成工具调用 JSON。
+"去华强北"、"吃泡面"、"继续工作" 这类常见计划其实可以用规则确定地识别出来。
+
+识别顺序（只看计划的第一个分句，与 LLM 解析"只取第一个动作"的约定一致）：
+1. 继续任务：  "继续工作/接着干/继续任务" 且有进行中的任务   -> use_resource(energy)
+2. 移动：      动词("去/到/回/前往"…) + LOCATIONS 中的地点名，或"回家" -> move
+3. 吃喝：      动词("吃/喝/买"…) + FOOD_MENU 中的食物（支持"炒粉""快餐"等简称） -> use_resource(money)
+4. 工作：      动词("做/干/当/上班"…) + 当前地点 JOBS 中的职位    -> use_resource(energy)
+5. 社交：      PERSONAS 中的 bot 名字或本地 NPC 名字 + 对话动词  -> interact
+
+每个结果带一个置信度；低于阈值（INTENT_FAST_PATH_THRESHOLD）时调用方仍走 LLM。
+出现否定/疑问词（"不/别/没/吗"）时直接放弃，交给 LLM 理解。
+"""
+
+import re
+from threading import Lock
+
+CLAUSE_SPLIT = re.compile(r"[，,。；;！!]|然后|之后|以后|顺便|再去")
+NEGATION = re.compile(r"不|别|没|吗|？|\?")
+CONTINUE_WORDS = ("继续工作", "继续任务", "继续干", "接着干", "继续上班", "继续做", "干完", "做完")
+MOVE_VERBS = r"(?:去|到|回到|回|前往|赶往|赶去|跑去|走去|逛到|坐车去|打车去|坐地铁去|坐公交去)"
+EAT_VERBS = ("吃", "喝", "买", "点", "来一份", "来一碗", "来杯")
+WORK_VERBS = ("做", "干", "当", "上班", "打工", "接单", "应聘", "找")
+TALK_VERBS = ("聊", "说", "问", "告诉", "招呼", "搭话", "请教", "商量", "约", "表白", "安慰", "找")
+ROMANTIC_WORDS = ("约会", "表白", "暧昧", "撩")
+BUSINESS_WORDS = ("买", "卖", "交易", "合作", "借钱", "还钱", "谈生意")
+HOSTILE_WORDS = ("吵", "骂", "质问", "打架", "对质")
+
+
+def _mode_of(clause):
+    if "打车" in clause or "出租" in clause or "滴滴" in clause:
+        return "taxi"
+    if any(w in clause for w in ("公交", "地铁", "坐车", "巴士")):
+        return "bus"
+    return "walk"
+
+
+def _food_aliases(food_menu, location_names):
+    """每个食物的可识别叫法：全名 + 唯一的后缀(>=2字)/前缀(>=3字)，且不能与地点名重叠"""
+    candidates = {}
+    for name in food_menu:
+        forms = {name}
+        forms.update(name[i:] for i in range(1, len(name) - 1))
+        forms.update(name[:i] for i in range(3, len(name)))
+        for form in forms:
+            candidates.setdefault(form, set()).add(name)
+    aliases = {}
+    for form, names in candidates.items():
+        if len(names) == 1 and not any(form in loc for loc in location_names):
+            aliases[form] = next(iter(names))
+    # 长的叫法优先匹配（"路边摊炒粉" 先于 "炒粉"）
+    return sorted(aliases.items(), key=lambda kv: -len(kv[0]))
+
+
+class IntentParser:
+    """规则意图识别器。parse 是纯函数（调用方在世界锁内传入快照），stats 线程安全。"""
+
+    def __init__(self, locations, food_menu, jobs, personas):
+        self.locations = locations
+        self.food_menu = food_menu
+        self.jobs = jobs
+        self.personas = personas  # 引用，代际传承改名后自动生效
+        self._foods = _food_aliases(food_menu, list(locations))
+        loc_alt = "|".join(sorted(map(re.escape, locations), key=len, reverse=True))
+        self._move_re = re.compile(MOVE_VERBS + r"\s*(" + loc_alt + ")")
+        self._mu = Lock()
+        self._stats = {"fast": 0, "llm": 0, "by_kind": {}}
+
+    def parse(self, plan, location, home=None, npcs=(), nearby=(), current_task=None, food_prices=None):
+        """返回 (tool_call 或 None, 置信度 0~1, 类型)"""
+        plan = (plan or "").strip()
+        clauses = [c.strip() for c in CLAUSE_SPLIT.split(plan) if c.strip()]
+        if not clauses:
+            return None, 0.0, None
+        clause = clauses[0]
+        if NEGATION.search(clause):
+            return None, 0.0, None
+        penalty = 0.05 if len(clauses) > 1 else 0.0
+        for matcher in (self._continue_task, self._move, self._eat, self._work, self._talk):
+            hit = matcher(clause, location=location, home=home, npcs=npcs, nearby=nearby,
+                          current_task=current_task, food_prices=food_prices or {})
+            if hit:
+                kind, args, confidence = hit
+                tool = "move" if kind == "move" else "interact" if kind == "talk" else "use_resource"
+                return {"tool": tool, "args": args, "desc": plan}, round(confidence - penalty, 2), kind
+        return None, 0.0, None
+
+    # === 各类匹配器：命中返回 (类型, args, 置信度) ===
+    def _continue_task(self, clause, current_task=None, **_):
+        if not any(w in clause for w in CONTINUE_WORDS):
+            return None
+        if not current_task or current_task.get("status") != "in_progress":
+            return None
+        name = current_task.get("task_name", "工作")
+        return "continue", {"resource": "energy", "amount": 10, "purpose": f"继续{name}"}, 0.95
+
+    def _move(self, clause, location=None, home=None, **_):
+        m = self._move_re.search(clause)
+        dest = m.group(1) if m else None
+        if dest is None and "回家" in clause and home in self.locations:
+            dest = home
+        if dest is None:
+            return None
+        # 目的地后面还跟着别的地点名，说明句子结构复杂（"从华强北去福田"等），交给 LLM
+        if sum(1 for loc in self.locations if loc in clause) > 1:
+            return None
+        return "move", {"destination": dest, "mode": _mode_of(clause)}, 0.95
+
+    def _eat(self, clause, food_prices=None, **_):
+        if not any(v in clause for v in EAT_VERBS):
+            return None
+        for alias, food in self._foods:
+            if alias in clause:
+                price = food_prices.get(food, self.food_menu[food]["cost"])
+                verb = "喝" if "喝" in clause else "吃"
+                return "eat", {"resource": "money", "amount": price, "purpose": f"{verb}{food}"}, 0.9
+        return None
+
+    def _work(self, clause, location=None, **_):
+        if not any(v in clause for v in WORK_VERBS):
+            return None
+        for job in self.jobs.get(location, []):
+            if job["title"] in clause:
+                return "work", {"resource": "energy", "amount": 15, "purpose": f"做{job['title']}的工作"}, 0.85
+        return None
+
+    def _talk(self, clause, npcs=(), nearby=(), **_):
+        if not any(v in clause for v in TALK_VERBS):
+            return None
+        target, confidence = None, 0.0
+        for bid, persona in self.personas.items():
+            name = persona.get("name")
+            if name and name in clause:
+                # 对方不在身边时让 LLM 判断（可能是想念/打电话/提到第三人）
+                target, confidence = bid, 0.85 if bid in nearby else 0.6
+                break
+        if target is None:
+            for npc in npcs:
+                if npc and npc in clause:
+                    target, confidence = npc, 0.85
+                    break
+        if target is None:
+            return None
+        if any(w in clause for w in ROMANTIC_WORDS):
+            manner = "romantic"
+        elif any(w in clause for w in HOSTILE_WORDS):
+            manner = "hostile"
+        elif any(w in clause for w in BUSINESS_WORDS):
+            manner = "business"
+        else:
+            manner = "friendly"
+        return "talk", {"target": target, "manner": manner, "content": clause}, confidence
+
+    # === 统计 ===
+    def record(self, kind):
+        """记录一次解析走了快速通道（kind）还是 LLM（None）"""
+        with self._mu:
+            if kind is None:
+                self._stats["llm"] += 1
+            else:
+                self._stats["fast"] += 1
+                self._stats["by_kind"][kind] = self._stats["by_kind"].get(kind, 0) + 1
+
+    def stats(self):
+        with self._mu:
+            s = {"fast": self._stats["fast"], "llm": self._stats["llm"], "by_kind": dict(self._stats["by_kind"])}
+        total = s["fast"] + s["llm"]
+        s["fast_rate"] = round(s["fast"] / total, 3) if total else 0.0
+        return s
@@ -0,0 +1,159 @@
+"""
+v10.11 LLM 响应缓存 (LLM Cache)
+===============================
+很多提示词几乎原样重复：工具解析（temperature=0.0）、旧版行动解析、常见计划的世界改造判断……
+网关在真正请求供应商之前先查这里，命中时零 token 返回。
+
+- 规范化：Unicode NFKC + 折叠空白，再连同模型、温度、max_tokens 等参数一起做 SHA-256 作为 key
+- 持久化：SQLite（WAL 模式），引擎重启后缓存仍然有效；多个进程可共用同一个文件
+- 淘汰：超过 TTL 的条目读到即删；条目数超过上限时按最近使用时间淘汰（LRU）
+- 是否缓存由调用点决定：默认 temperature <= LLM_CACHE_MAX_TEMPERATURE 的调用自动缓存，
+  调用时传 cache=True / cache=False 可以显式开启或关闭
+
+只缓存纯文本回复（choices[0].message.content），命中时返回一个结构相同、usage 为 0 的对象。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import unicodedata
+from threading import Lock
+from types import SimpleNamespace
+
+log = logging.getLogger("world")
+
+EVICT_EVERY = 50  # 每写入这么多条检查一次容量
+
+
+def normalize_prompt(text):
+    """规范化提示词：NFKC（全角/半角统一）+ 折叠所有空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(kwargs):
+    """由请求参数计算缓存 key（messages 内容先规范化）"""
+    messages = [
+        {"role": m.get("role"), "content": normalize_prompt(m["content"]) if isinstance(m.get("content"), str) else m.get("content")}
+        for m in kwargs.get("messages", [])
+    ]
+    params = {k: v for k, v in kwargs.items() if k not in ("messages", "timeout")}
+    blob = json.dumps({"messages": messages, "params": params}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def cached_completion(content, finish_reason="stop"):
+    """构造与 chat completion 结构相同的命中结果"""
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(index=0, message=message, finish_reason=finish_reason)],
+        usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0),
+        cached=True,
+    )
+
+
+class LLMCache:
+    """SQLite 持久化的 LRU + TTL 缓存（线程安全）"""
+
+    def __init__(self, path, max_entries=5000, ttl=7 * 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._mu = Lock()
+        self._writes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+        self._sites = {}  # site -> {"hits", "misses"}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY, site TEXT, model TEXT, content TEXT, finish_reason TEXT,
+            created REAL, last_used REAL, hits INTEGER DEFAULT 0)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache(last_used)")
+        self._db.commit()
+
+    def _count(self, site, field):
+        self._stats[field] += 1
+        self._sites.setdefault(site, {"hits": 0, "misses": 0})[field] += 1
+
+    def get(self, key, site="?"):
+        """查缓存，命中返回 completion 对象，否则 None"""
+        now = time.time()
+        with self._mu:
+            try:
+                row = self._db.execute(
+                    "SELECT content, finish_reason, created FROM llm_cache WHERE key=?", (key,)
+                ).fetchone()
+                if row and now - row[2] > self.ttl:
+                    self._db.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                    self._db.commit()
+                    self._stats["expired"] += 1
+                    row = None
+                if row is None:
+                    self._count(site, "misses")
+                    return None
+                self._db.execute("UPDATE llm_cache SET last_used=?, hits=hits+1 WHERE key=?", (now, key))
+                self._db.commit()
+                self._count(site, "hits")
+            except sqlite3.Error as e:
+                log.error(f"[LLM-CACHE] 读取失败: {e}")
+                return None
+        return cached_completion(row[0], row[1] or "stop")
+
+    def put(self, key, resp, site="?", model="?"):
+        """写入一条回复（只缓存纯文本内容）"""
+        try:
+            choice = resp.choices[0]
+            content = choice.message.content
+        except (AttributeError, IndexError):
+            return
+        if not isinstance(content, str) or not content.strip():
+            return
+        now = time.time()
+        with self._mu:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, site, model, content, finish_reason, created, last_used, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, site, model, content, getattr(choice, "finish_reason", "stop"), now, now),
+                )
+                self._stats["stores"] += 1
+                self._writes += 1
+                if self._writes % EVICT_EVERY == 0:
+                    self._evict(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                log.error(f"[LLM-CACHE] 写入失败: {e}")
+
+    def _evict(self, now):
+        """删除过期条目，再按 LRU 删到上限以内（需持有 _mu）"""
+        cur = self._db.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        self._stats["expired"] += cur.rowcount
+        total = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if total > self.max_entries:
+            cur = self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                (total - self.max_entries,),
+            )
+            self._stats["evicted"] += cur.rowcount
+
+    def stats(self):
+        """命中率与容量"""
+        with self._mu:
+            s = dict(self._stats)
+            sites = {k: dict(v) for k, v in self._sites.items()}
+            try:
+                s["entries"] = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            except sqlite3.Error:
+                s["entries"] = None
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+        for v in sites.values():
+            n = v["hits"] + v["misses"]
+            v["hit_rate"] = round(v["hits"] / n, 3) if n else 0.0
+        s["sites"] = sites
+        s["max_entries"] = self.max_entries
+        s["ttl"] = self.ttl
+        return s
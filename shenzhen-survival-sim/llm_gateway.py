@@ -0,0 +1,239 @@
+"""
+v10.9 LLM 网关 (LLM Gateway)
+============================
+引擎、规则引擎和 bot 进程的所有 chat completions 调用都经过这里，而不是直接打到 OpenAI 客户端。
+
+- 按模型限并发：每个模型一个信号量，突发时排队而不是一起冲向供应商
+- 令牌桶限速：每个进程每分钟最多 LLM_RATE_PER_MIN 次请求（允许 LLM_BURST 次突发）
+- 抖动重试：429 / 5xx / 超时 / 连接错误按指数退避 + 全抖动重试，优先遵守 Retry-After
+- 单次调用截止时间：排队、限速等待和重试都计入 LLM_DEADLINE 秒，超时直接失败
+- 按调用点统计：次数、失败、重试、排队等待、延迟、token 用量（/admin/llm_stats）
+- v10.11: 响应缓存（llm_cache.py）：低温度调用或显式 cache=True 的调用先查缓存，命中不占并发和限速
+
+网关暴露与 OpenAI 客户端相同的 client.chat.completions.create(...) 接口，调用点无需改写。
+调用点名称默认取调用方函数名，也可以显式传 site="..."。
+
+注意：限额是按进程计算的。每个 bot 是独立进程，供应商的总限额需要按进程数分摊配置。
+"""
+
+import logging
+import random
+import sys
+import time
+from threading import BoundedSemaphore, Lock
+
+from config import (
+    get_openai_client, LLM_MAX_CONCURRENCY, LLM_RATE_PER_MIN, LLM_BURST,
+    LLM_MAX_RETRIES, LLM_DEADLINE,
+    LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_MAX_TEMPERATURE,
+)
+from llm_cache import LLMCache, cache_key
+
+log = logging.getLogger("world")
+
+RETRY_STATUS = {408, 409, 429}
+RETRY_ERRORS = {"APITimeoutError", "APIConnectionError", "Timeout", "ConnectionError"}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """排队 / 限速 / 重试耗尽了调用的截止时间"""
+
+
+class TokenBucket:
+    """线程安全的令牌桶。rate: 每秒补充令牌数，burst: 桶容量"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._mu = Lock()
+
+    def acquire(self, deadline):
+        """取一个令牌，必要时等待；到 deadline 仍取不到返回 False。返回等待秒数或 False。"""
+        waited = 0.0
+        while True:
+            with self._mu:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                need = (1 - self._tokens) / self.rate
+            if now + need > deadline:
+                return False
+            time.sleep(need)
+            waited += need
+
+
+def _retry_after(exc):
+    """从异常的响应头里取 Retry-After 秒数"""
+    resp = getattr(exc, "response", None)
+    headers = getattr(resp, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(exc):
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUS or status >= 500
+    return type(exc).__name__ in RETRY_ERRORS
+
+
+class _Completions:
+    def __init__(self, gateway):
+        self._gateway = gateway
+
+    def create(self, *, site=None, deadline=None, cache=None, **kwargs):
+        site = site or sys._getframe(1).f_code.co_name
+        return self._gateway.complete(site, deadline, cache=cache, **kwargs)
+
+
+class _Chat:
+    def __init__(self, gateway):
+        self.completions = _Completions(gateway)
+
+
+class LLMGateway:
+    """包装一个 OpenAI 兼容客户端，提供并发上限、限速、重试、截止时间与统计"""
+
+    def __init__(self, client, max_concurrency=LLM_MAX_CONCURRENCY, rate_per_min=LLM_RATE_PER_MIN,
+                 burst=LLM_BURST, max_retries=LLM_MAX_RETRIES, deadline=LLM_DEADLINE,
+                 cache=None, cache_max_temperature=LLM_CACHE_MAX_TEMPERATURE):
+        self.client = client
+        self.cache = cache
+        self.cache_max_temperature = cache_max_temperature
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self.chat = _Chat(self)
+        self._sems = {}               # model -> BoundedSemaphore
+        self._active = {}             # model -> 正在进行的调用数
+        self._mu = Lock()
+        self._sites = {}              # site -> 统计
+
+    def _semaphore(self, model):
+        with self._mu:
+            sem = self._sems.get(model)
+            if sem is None:
+                sem = self._sems[model] = BoundedSemaphore(self.max_concurrency)
+                self._active[model] = 0
+            return sem
+
+    def _record(self, site, **delta):
+        with self._mu:
+            s = self._sites.setdefault(site, {
+                "calls": 0, "ok": 0, "failed": 0, "retries": 0, "deadline_exceeded": 0, "cache_hits": 0,
+                "wait_ms_total": 0.0, "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            for k, v in delta.items():
+                if k == "latency_ms_max":
+                    s[k] = max(s[k], v)
+                else:
+                    s[k] += v
+
+    def _cacheable(self, cache, kwargs):
+        """cache 显式指定时以调用点为准，否则按温度决定（未传 temperature 视为供应商默认 1.0）"""
+        if self.cache is None or cache is False:
+            return False
+        return cache is True or kwargs.get("temperature", 1.0) <= self.cache_max_temperature
+
+    def complete(self, site, deadline=None, cache=None, **kwargs):
+        """带缓存、限流与重试的 chat.completions.create。deadline: 本次调用的总秒数上限"""
+        model = kwargs.get("model", "?")
+        self._record(site, calls=1)
+        key = cache_key(kwargs) if self._cacheable(cache, kwargs) else None
+        if key:
+            hit = self.cache.get(key, site)
+            if hit is not None:
+                self._record(site, cache_hits=1)
+                return hit
+        resp = self._complete(site, model, deadline, kwargs)
+        if key:
+            self.cache.put(key, resp, site, model)
+        return resp
+
+    def _complete(self, site, model, deadline, kwargs):
+        start = time.monotonic()
+        end = start + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(site, model, end, kwargs)
+            except LLMDeadlineExceeded:
+                self._record(site, failed=1, deadline_exceeded=1)
+                raise
+            except Exception as e:
+                delay = _retry_after(e) or min(8.0, 0.5 * 2 ** attempt) * random.random()
+                if attempt >= self.max_retries or not _retryable(e) or time.monotonic() + delay >= end:
+                    self._record(site, failed=1)
+                    raise
+                attempt += 1
+                self._record(site, retries=1)
+                log.warning(f"[LLM] {site} 第{attempt}次重试（{delay:.1f}秒后）: {type(e).__name__}")
+                time.sleep(delay)
+
+    def _attempt(self, site, model, end, kwargs):
+        t0 = time.monotonic()
+        waited = self.bucket.acquire(end)
+        if waited is False:
+            raise LLMDeadlineExceeded(f"{site}: 限速等待超过截止时间")
+        sem = self._semaphore(model)
+        if not sem.acquire(timeout=max(0.0, end - time.monotonic())):
+            raise LLMDeadlineExceeded(f"{site}: {model} 并发排队超过截止时间")
+        with self._mu:
+            self._active[model] += 1
+        t1 = time.monotonic()
+        try:
+            resp = self.client.chat.completions.create(timeout=max(1.0, end - t1), **kwargs)
+        finally:
+            with self._mu:
+                self._active[model] -= 1
+            sem.release()
+        elapsed = (time.monotonic() - t1) * 1000
+        usage = getattr(resp, "usage", None)
+        self._record(
+            site, ok=1, wait_ms_total=(t1 - t0) * 1000,
+            latency_ms_total=elapsed, latency_ms_max=elapsed,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+        return resp
+
+    def stats(self):
+        """按调用点的统计 + 各模型当前并发"""
+        with self._mu:
+            sites = {k: dict(v) for k, v in self._sites.items()}
+            active = dict(self._active)
+        for s in sites.values():
+            ok = s["ok"] or 1
+            s["cache_hit_rate"] = round(s["cache_hits"] / s["calls"], 3) if s["calls"] else 0.0
+            s["latency_ms_avg"] = round(s.pop("latency_ms_total") / ok, 1)
+            s["wait_ms_avg"] = round(s.pop("wait_ms_total") / ok, 1)
+            s["latency_ms_max"] = round(s["latency_ms_max"], 1)
+        return {
+            "sites": sites,
+            "active": active,
+            "max_concurrency": self.max_concurrency,
+            "rate_per_min": round(self.bucket.rate * 60, 1),
+            "burst": self.bucket.burst,
+            "cache": self.cache.stats() if self.cache else None,
+        }
+
+
+def get_llm_gateway():
+    """返回包装了 config.get_openai_client() 的网关（每个进程调用一次）。
+    LLM_CACHE_PATH 非空时挂上持久化响应缓存，打不开时不用缓存继续运行。"""
+    cache = None
+    if LLM_CACHE_PATH:
+        try:
+            cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+        except Exception as e:
+            log.error(f"[LLM-CACHE] 打开缓存失败，不使用缓存: {e}")
+    return LLMGateway(get_openai_client(), cache=cache)
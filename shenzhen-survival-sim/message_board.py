@@ -0,0 +1,115 @@
+"""
+v10.17 留言板 (Message Board)
+=============================
+过去 world["message_board"] 是一个只增不减的列表：只有存快照时才截取最后 100 条（截的还只是快照副本），
+/messages/{id}、感知包和 /bots/status 每次发布都要把整张列表线性扫一遍，引擎内存随运行时间一直涨。
+
+现在按收件人分箱：
+- 每个收件人一个有界收件箱（deque，MESSAGE_INBOX_CAP），公共频道单独一个（MESSAGE_PUBLIC_CAP），
+  写入时超出上限的旧消息自动丢弃
+- 每条消息带全局单调递增的 seq，读取时可以只要 seq > since 的新消息；
+  私信和公共频道按 seq 合并，顺序与过去的单一列表一致
+- 每个收件人最新一条私信 / 急信的 tick 在写入时记下，调度视图不用再扫描
+- 查找只看相关的两个 deque 的尾部，代价 O(k)
+
+所有方法都在世界锁内调用（与 world 的其他字段一样），本模块不再加锁。
+快照里存成按 seq 排序的普通列表，旧快照（没有 seq）读回时按原顺序补编号。
+"""
+
+from collections import deque
+from heapq import merge
+
+from config import MESSAGE_INBOX_CAP, MESSAGE_PUBLIC_CAP
+
+PUBLIC = "public"
+
+
+def _tail(box, since=0, limit=None):
+    """从 deque 尾部往前取 seq > since 的消息（最多 limit 条），按 seq 升序返回"""
+    out = []
+    for m in reversed(box):
+        if m["seq"] <= since or (limit is not None and len(out) >= limit):
+            break
+        out.append(m)
+    out.reverse()
+    return out
+
+
+class MessageBoard:
+    """按收件人分箱的有界留言板"""
+
+    def __init__(self, inbox_cap=MESSAGE_INBOX_CAP, public_cap=MESSAGE_PUBLIC_CAP):
+        self.inbox_cap = max(1, inbox_cap)
+        self.seq = 0
+        self._inboxes = {}                              # 收件人 -> deque
+        self._public = deque(maxlen=max(1, public_cap))
+        self._last_tick = {}                            # 收件人 -> 最新私信 tick
+        self._last_urgent = {}                          # 收件人 -> 最新急信 tick
+        self._dropped = 0
+
+    def post(self, msg):
+        """投递一条消息（原地补上 seq），返回该消息本身，调用方可以继续修改它"""
+        self.seq += 1
+        msg["seq"] = self.seq
+        to = msg.get("to") or PUBLIC
+        if to == PUBLIC:
+            box = self._public
+        else:
+            box = self._inboxes.get(to)
+            if box is None:
+                box = self._inboxes[to] = deque(maxlen=self.inbox_cap)
+            tick = msg.get("tick", 0)
+            self._last_tick[to] = max(self._last_tick.get(to, 0), tick)
+            if msg.get("priority") == "high":
+                self._last_urgent[to] = max(self._last_urgent.get(to, 0), tick)
+        if len(box) == box.maxlen:
+            self._dropped += 1
+        box.append(msg)
+        return msg
+
+    def inbox(self, to, since=0, limit=None):
+        """某个收件人的私信（不含公共频道）"""
+        return _tail(self._inboxes.get(to, ()), since, limit)
+
+    def public(self, since=0, limit=None):
+        return _tail(self._public, since, limit)
+
+    def for_bot(self, bot_id, since=0, limit=None):
+        """bot 能看到的消息：私信 + 公共频道，按 seq 合并，取最近 limit 条"""
+        merged = list(merge(self.inbox(bot_id, since, limit), self.public(since, limit), key=lambda m: m["seq"]))
+        return merged[-limit:] if limit else merged
+
+    def since(self, seq):
+        """所有 seq 更大的消息（私信 + 公共频道），按 seq 排序。v10.23: 变更日志用"""
+        return list(merge(_tail(self._public, seq), *(_tail(b, seq) for b in self._inboxes.values()),
+                          key=lambda m: m["seq"]))
+
+    def last_ticks(self, bot_id):
+        """(最新私信 tick, 最新急信 tick)，没有时为 0"""
+        return self._last_tick.get(bot_id, 0), self._last_urgent.get(bot_id, 0)
+
+    def __len__(self):
+        return len(self._public) + sum(len(b) for b in self._inboxes.values())
+
+    # === 快照 ===
+    def to_list(self):
+        """所有保留的消息，按 seq 排序（存快照用）"""
+        return list(merge(self._public, *self._inboxes.values(), key=lambda m: m["seq"]))
+
+    @classmethod
+    def from_list(cls, msgs, **caps):
+        """从快照恢复。旧快照的消息没有 seq，按列表顺序补编号；超出上限的旧消息在写入时丢弃"""
+        board = cls(**caps)
+        for m in sorted(msgs, key=lambda m: m.get("seq", 0)):
+            seq = m.get("seq")
+            if seq:
+                board.seq = max(board.seq, seq - 1)
+            board.post(m)
+        return board
+
+    def stats(self):
+        return {
+            "seq": self.seq, "messages": len(self), "inboxes": len(self._inboxes),
+            "public": len(self._public), "dropped": self._dropped,
+            "inbox_cap": self.inbox_cap, "public_cap": self._public.maxlen,
+        }
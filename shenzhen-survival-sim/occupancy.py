@@ -0,0 +1,139 @@
+"""
+v10.18 地点占用索引 (Occupancy)
+===============================
+过去地点成员 world["locations"][loc]["bots"] 是普通列表，每次移动、死亡、被驱逐都要先 `in` 再 `.remove()`；
+execute_generic 解析社交对象要遍历所有 bot 比较名字，对话后果和 NPC 回嘴要遍历所有地点的所有 NPC。
+bot 数上百之后这些线性查找都在世界锁里。
+
+现在：
+- 地点成员是 OccupantSet：dict 键保序的集合，加入/移除/成员判断 O(1)，迭代顺序就是进入顺序，
+  视图里转成列表后与过去的 API 输出一致
+- Occupancy 记下每个 bot 当前所在的地点，move 一步完成"离开旧地点 + 进入新地点"
+- 名字索引：bot 名字 -> bot_id（出生、恢复、代际传承时登记，死亡时注销），
+  NPC 名字 -> NPC（地点初始化时登记；不同地点可能有同名 NPC，按地点顺序保留全部）
+- v10.27: 成员有变化的地点记在 touched 里，按 bot 发布视图时取走（take_touched），
+  只刷新这些地点里的人的感知包
+
+所有方法都在世界锁内调用，本模块不加锁。
+"""
+
+
+class OccupantSet:
+    """保持插入顺序的集合（地点里的 bot_id）"""
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items=()):
+        self._items = dict.fromkeys(items)
+
+    def add(self, item):
+        self._items[item] = None
+
+    def discard(self, item):
+        self._items.pop(item, None)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"OccupantSet({list(self._items)!r})"
+
+
+class Occupancy:
+    """地点成员 + bot / NPC 名字索引，持有 world 的引用"""
+
+    def __init__(self, world):
+        self.world = world
+        self._where = {}      # bot_id -> 所在地点
+        self._bot_ids = {}    # bot 名字 -> bot_id
+        self._names = {}      # bot_id -> 登记时的名字
+        self._npcs = {}       # NPC 名字 -> [npc, ...]（地点顺序）
+        self._touched = set()  # 上次 take_touched 之后成员有变化的地点
+
+    def reset(self):
+        """地点重新初始化后调用：清空 bot 索引，重建 NPC 索引"""
+        self._where.clear()
+        self._bot_ids.clear()
+        self._names.clear()
+        self._npcs.clear()
+        self._touched.clear()
+        for loc_data in self.world["locations"].values():
+            for npc in loc_data.get("npcs", []):
+                if npc.get("name"):
+                    self._npcs.setdefault(npc["name"], []).append(npc)
+
+    # === 地点成员 ===
+    def move(self, bot_id, dest):
+        """离开当前地点（如果有）并进入 dest；dest 不存在时只离开"""
+        self.leave(bot_id)
+        loc = self.world["locations"].get(dest)
+        if loc is not None:
+            loc["bots"].add(bot_id)
+            self._where[bot_id] = dest
+            self._touched.add(dest)
+
+    def leave(self, bot_id):
+        old = self._where.pop(bot_id, None)
+        if old is not None:
+            self.world["locations"][old]["bots"].discard(bot_id)
+            self._touched.add(old)
+
+    def take_touched(self):
+        """取走并清空成员有变化的地点"""
+        touched, self._touched = self._touched, set()
+        return touched
+
+    def location_of(self, bot_id):
+        return self._where.get(bot_id)
+
+    # === bot 生命周期 ===
+    def spawn(self, bot_id):
+        """bot 出生 / 从快照恢复 / 代际传承换人：登记名字并放进 bot["location"]"""
+        bot = self.world["bots"][bot_id]
+        self._index_name(bot_id, bot.get("name"))
+        self.move(bot_id, bot.get("location"))
+
+    def die(self, bot_id):
+        """bot 死亡：离开地点并注销名字"""
+        self.leave(bot_id)
+        self._index_name(bot_id, None)
+
+    def _index_name(self, bot_id, name):
+        old = self._names.pop(bot_id, None)
+        if old is not None and self._bot_ids.get(old) == bot_id:
+            del self._bot_ids[old]
+        if name:
+            self._names[bot_id] = name
+            self._bot_ids[name] = bot_id
+
+    # === 查找 ===
+    def resolve_bot(self, ref):
+        """bot_id 或 bot 名字 -> bot_id（找不到返回 None）"""
+        if ref in self.world["bots"]:
+            return ref
+        return self._bot_ids.get(ref)
+
+    def bot_named(self, name):
+        """活着的 bot 名字 -> bot_id"""
+        return self._bot_ids.get(name)
+
+    def npc(self, name, location=None):
+        """名字对应的 NPC，有同名时优先 location 里的那个"""
+        found = self._npcs.get(name)
+        if not found:
+            return None
+        if location is not None:
+            here = self.world["locations"].get(location, {}).get("npcs", [])
+            for npc in found:
+                if any(n is npc for n in here):
+                    return npc
+        return found[0]
+
+    def npcs_named(self, name):
+        return self._npcs.get(name, [])
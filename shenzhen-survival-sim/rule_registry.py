@@ -0,0 +1,143 @@
+"""
+v10.21 规则注册表 (Rule Registry)
+=================================
+过去 world["active_rules"] 是一个只增不减的列表：耐久度归零或被 modify_rule 关掉的规则只是标记 active=False，
+永远留在列表里。tick_rules 每个 tick 把整张列表（包括早就失效的规则）走一遍，
+get_rules_summary、规则判断的提示词、去重检查也都各自重新扫描、重新过滤。
+
+现在：
+- 活规则按 id 存在保序 dict 里，迭代顺序就是创建顺序（与过去列表里活规则的顺序一致）
+- 按 触发方式 × 地点 分桶，location 为 None 的是全局桶；另有按地点（不分触发方式）的桶，
+  tick_rules 只处理有人的地点的规则，地点规则摘要只看本地点 + 全局两个桶
+- 失效的规则移进有界归档（RULE_ARCHIVE_CAP，写入时丢弃最旧的），带上 archived_tick，
+  通过 /rules/archive 分页查看；归档的规则不会再被 modify_rule 唤醒
+- 规则的 trigger 和 location 创建后不再改变（modify_rule 只能改耐久、衰减和开关），所以分桶是稳定的
+
+所有方法都在世界锁内调用，本模块不加锁。
+快照里活规则存成普通列表（旧快照里 active=False 的规则读回时直接进归档）。
+"""
+
+from collections import deque
+from heapq import merge
+from itertools import chain
+
+from config import RULE_ARCHIVE_CAP
+
+
+class RuleRegistry:
+    """活规则 + 分桶索引 + 失效规则归档"""
+
+    def __init__(self, archive_cap=RULE_ARCHIVE_CAP):
+        self._live = {}                                  # 规则 id -> 规则（创建顺序）
+        self._order = {}                                 # 规则 id -> 创建序号
+        self._seq = 0
+        self._index = {}                                 # trigger -> {location -> {id: 规则}}
+        self._at = {}                                    # location -> {id: 规则}（None 为全局）
+        self._archive = deque(maxlen=max(1, archive_cap))
+        self._archived_total = 0
+
+    def add(self, rule):
+        rid = rule["id"]
+        if rid in self._live:
+            self._unindex(self._live[rid])
+        self._seq += 1
+        self._order[rid] = self._seq
+        self._live[rid] = rule
+        loc = rule.get("location")
+        self._index.setdefault(rule.get("trigger", "every_tick"), {}).setdefault(loc, {})[rid] = rule
+        self._at.setdefault(loc, {})[rid] = rule
+        return rule
+
+    def _unindex(self, rule):
+        rid, loc = rule["id"], rule.get("location")
+        self._live.pop(rid, None)
+        self._order.pop(rid, None)
+        buckets = self._index.get(rule.get("trigger", "every_tick"), {})
+        for index, key in ((buckets, loc), (self._at, loc)):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(rid, None)
+                if not bucket:
+                    del index[key]
+
+    def expire(self, rule, tick):
+        """规则失效：移出活规则和所有桶，放进归档"""
+        self._unindex(rule)
+        record = {k: v for k, v in rule.items() if k != "_triggered_bots"}
+        record["active"] = False
+        record["archived_tick"] = tick
+        self._archive.append(record)
+        self._archived_total += 1
+        return record
+
+    # === 查找 ===
+    def get(self, rule_id):
+        return self._live.get(rule_id)
+
+    def __iter__(self):
+        return iter(self._live.values())
+
+    def __len__(self):
+        return len(self._live)
+
+    def bucket(self, trigger, location):
+        """某触发方式在某地点（None 为全局）的规则，{id: 规则}"""
+        return self._index.get(trigger, {}).get(location, {})
+
+    def located(self, trigger):
+        """某触发方式的地点桶：[(地点, {id: 规则})]，不含全局桶"""
+        return [(loc, rules) for loc, rules in self._index.get(trigger, {}).items() if loc is not None]
+
+    def triggered(self, trigger):
+        """某触发方式的所有规则（全局 + 各地点）"""
+        return list(chain.from_iterable(r.values() for r in self._index.get(trigger, {}).values()))
+
+    def at(self, location):
+        """某地点生效的规则：本地点的 + 全局的，按创建顺序"""
+        order = self._order.get
+        return list(merge(self._at.get(location, {}).values(), self._at.get(None, {}).values(),
+                          key=lambda r: order(r["id"], 0)))
+
+    def archived(self, offset=0, limit=50):
+        """归档的一页：(归档总条数, 规则列表)，最近失效的在前"""
+        offset = max(0, offset)
+        newest = list(reversed(self._archive))
+        return len(newest), newest[offset:offset + max(0, limit)]
+
+    def restore_archive(self, records):
+        """v10.25: 快照冷段延后读回的归档接在现有归档前面（它们更早失效）"""
+        newer = list(self._archive)
+        self._archive.clear()
+        self._archive.extend(chain(records, newer))
+        self._archived_total += len(records)
+
+    # === 快照 ===
+    def to_list(self):
+        return [{k: v for k, v in r.items() if k != "_triggered_bots"} for r in self._live.values()]
+
+    def archive_list(self):
+        return list(self._archive)
+
+    @classmethod
+    def from_list(cls, rules, archive=(), **caps):
+        """从规则列表恢复。active=False 的规则（旧快照）直接进归档"""
+        registry = cls(**caps)
+        for record in archive:
+            registry._archive.append(record)
+            registry._archived_total += 1
+        for rule in rules:
+            if rule.get("active", True):
+                registry.add(rule)
+            else:
+                registry.expire(rule, rule.get("last_triggered_tick", -1))
+        return registry
+
+    def stats(self):
+        return {
+            "live": len(self._live),
+            "archived": len(self._archive),
+            "archived_total": self._archived_total,
+            "archive_cap": self._archive.maxlen,
+            "by_trigger": {t: sum(len(b) for b in locs.values()) for t, locs in self._index.items()},
+            "locations": sum(1 for loc in self._at if loc is not None),
+        }
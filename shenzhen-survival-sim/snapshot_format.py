@@ -0,0 +1,183 @@
+"""
+v10.25 分段快照格式 (Snapshot Format)
+=====================================
+过去快照是一整个 JSON 文档：启动时 json.load 整个文件（整段文本 + 整棵对象树同时在内存里），
+读完才能开始恢复，文件越大、跑得越久，引擎就越晚能开始服务。
+
+现在快照是压缩的 JSON Lines（版本 2）：
+- 第一行是文件头：{"format": "mineclaw-snapshot", "version": 2, "tick": ..., "wal_seq": ..., "hot": [...], "cold": [...]}
+  （wal_seq 在文件头里也放一份，启动时不用读热段就能知道每一代快照对应的日志位置）
+- 热段在前：时间、天气、Bot、地点、活规则、留言板等恢复世界必需的状态。
+  实体段（bots / locations / active_rules）先写一行空容器，之后一行一个实体
+- 一行 {"s": "_hot_end"} 标记热段结束
+- 冷段在后：事件、朋友圈、相册、墓地、城市传说、规则归档等历史，每段一行
+- 压缩：默认 gzip（标准库）；装了 zstandard 时可选 zstd（SNAPSHOT_COMPRESSION）。
+  读取时按文件开头的魔数识别，不看配置；不是压缩流的文件按旧版整文件 JSON 读
+
+读取是流式的：解压和 JSON 解析逐行进行，任何时候内存里只有一行（一个实体 / 一个段）的文本。
+启动恢复只读到热段结束就返回，冷段交给后台线程接着同一个流往下读，引擎不用等历史读完就能开始服务。
+
+用法:
+    with open(tmp, "wb") as f:
+        write_snapshot(f, snapshot, "gzip")
+    reader = SnapshotReader(path)
+    hot = reader.read_hot()                     # 文件坏了 / 版本不认识时抛 READ_ERRORS 里的异常
+    for name, value in reader.read_cold(): ...  # 可以在别的线程里读
+    reader.close()
+"""
+
+import gzip
+import io
+import json
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard 是可选依赖，没装时只用 gzip
+    zstandard = None
+
+log = logging.getLogger("world")
+
+FORMAT = "mineclaw-snapshot"
+VERSION = 2
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+HOT_END = "_hot_end"
+
+ENTITY_SECTIONS = ("bots", "locations", "active_rules")     # 一行一个实体
+COLD_SECTIONS = ("events", "moments", "gallery", "graveyard", "urban_legends", "rule_archive")
+
+READ_ERRORS = (OSError, EOFError, ValueError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def resolve_compression(name):
+    """配置的压缩方式 -> 实际使用的（zstd 没装时退回 gzip）"""
+    if name == "zstd" and zstandard is None:
+        log.warning("[SNAPSHOT] 未安装 zstandard，快照改用 gzip 压缩")
+        return "gzip"
+    return name if name in ("gzip", "zstd", "json") else "gzip"
+
+
+def write_snapshot(f, snapshot, compression="gzip"):
+    """把快照分段写进二进制文件 f（不关闭 f），返回未压缩的字节数"""
+    if compression == "json":
+        data = json.dumps(snapshot, ensure_ascii=False).encode("utf-8")
+        f.write(data)
+        return len(data)
+    if compression == "zstd":
+        stream = zstandard.ZstdCompressor(level=3).stream_writer(f, closefd=False)
+    else:
+        stream = gzip.GzipFile(fileobj=f, mode="wb", compresslevel=5)
+    raw = 0
+
+    def emit(obj):
+        nonlocal raw
+        line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        stream.write(line)
+        raw += len(line)
+
+    hot = [name for name in snapshot if name not in COLD_SECTIONS]
+    cold = [name for name in COLD_SECTIONS if name in snapshot]
+    with stream:
+        emit({"format": FORMAT, "version": VERSION, "tick": snapshot.get("time", {}).get("tick"),
+              "wal_seq": snapshot.get("wal_seq"), "hot": hot, "cold": cold})
+        for name in hot:
+            value = snapshot[name]
+            if name in ENTITY_SECTIONS and isinstance(value, dict):
+                emit({"s": name, "v": {}})
+                for key, entity in value.items():
+                    emit({"s": name, "k": key, "e": entity})
+            elif name in ENTITY_SECTIONS and isinstance(value, list):
+                emit({"s": name, "v": []})
+                for entity in value:
+                    emit({"s": name, "e": entity})
+            else:
+                emit({"s": name, "v": value})
+        emit({"s": HOT_END})
+        for name in cold:
+            emit({"s": name, "v": snapshot[name]})
+    return raw
+
+
+class SnapshotReader:
+    """流式读取一份快照：先读热段，冷段之后（可以在另一个线程里）接着读"""
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.compression = None
+        self._raw = open(path, "rb")
+        self._text = None
+        self._legacy = None
+        self.header = None
+        try:
+            magic = self._raw.read(4)
+            self._raw.seek(0)
+            if magic[:2] == GZIP_MAGIC:
+                self.compression = "gzip"
+                self._text = io.TextIOWrapper(gzip.GzipFile(fileobj=self._raw), encoding="utf-8")
+            elif magic == ZSTD_MAGIC:
+                if zstandard is None:
+                    raise ValueError("快照是 zstd 压缩的，需要 pip install zstandard")
+                self.compression = "zstd"
+                self._text = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(self._raw),
+                                              encoding="utf-8")
+            else:
+                self.compression, self.version = "json", 1
+        except Exception:
+            self.close()
+            raise
+
+    def _records(self):
+        for line in self._text:
+            if line.strip():
+                yield json.loads(line)
+
+    def read_header(self):
+        """只读文件头（分段快照的第一行）。旧版 JSON 快照没有文件头，返回 None"""
+        if self.version == 1:
+            return None
+        if self.header is None:
+            header = next(self._records(), None)
+            if not header or header.get("format") != FORMAT:
+                raise ValueError("不是分段快照文件")
+            version = header.get("version")
+            if not isinstance(version, int) or version > VERSION:
+                raise ValueError(f"快照格式版本 {version} 不支持（最高 {VERSION}）")
+            self.header, self.version = header, version
+        return self.header
+
+    def read_hot(self):
+        """读文件头和热段，返回快照 dict（只含热段）。旧版 JSON 快照一次读完，全部算热段"""
+        if self.version == 1:
+            self._legacy = json.load(io.TextIOWrapper(self._raw, encoding="utf-8"))
+            return self._legacy
+        self.read_header()
+        snap = {}
+        for rec in self._records():
+            name = rec["s"]
+            if name == HOT_END:
+                return snap
+            if "e" not in rec:
+                snap[name] = rec["v"]
+            elif "k" in rec:
+                snap[name][rec["k"]] = rec["e"]
+            else:
+                snap[name].append(rec["e"])
+        raise EOFError("快照在热段结束前被截断")
+
+    def read_cold(self):
+        """逐段产出冷段 (段名, 值)。必须在 read_hot 之后调用"""
+        if self.version == 1:
+            return
+        for rec in self._records():
+            yield rec["s"], rec["v"]
+
+    def close(self):
+        for f in (self._text, self._raw):
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
@@ -0,0 +1,191 @@
+"""
+v10.22 快照服务 (Snapshot Service)
+==================================
+过去 _do_auto_save 和 /admin/save_snapshot 在世界锁里拼好快照后直接 json.dump 到 SNAPSHOT_PATH
+（管理接口还带 indent=2 美化），每 10 个 tick 引擎就要停下来等序列化和写盘；写到一半崩溃，
+唯一的快照文件也就坏了。
+
+现在快照分两步：
+- 世界锁内：拼出快照 dict 后用 marshal 往返一次，得到与世界不再共享任何容器的独立副本
+  （快照里只有 JSON 类型，marshal 是 C 实现，比 json.dumps 便宜得多，更不用说写盘）
+- 后台写线程：json 序列化 → 写临时文件 → fsync → 轮换旧版本 → os.replace 原子替换，
+  保留最近 SNAPSHOT_GENERATIONS 份（SNAPSHOT_PATH、.1、.2 ...）
+
+写线程只有一个，同一时刻最多一份待写快照：写盘期间又来了新快照时，只保留最新的那份（旧的直接丢弃）。
+读取时从最新一份开始尝试，解析失败（写坏、被截断）就退回上一代。
+
+v10.25: 文件格式见 snapshot_format.py（压缩的分段 JSON Lines，热段在前、冷段在后，流式编解码）。
+load 只读到热段结束就返回，冷段的读取器交给调用方在后台接着读；旧版整文件 JSON 快照照样能读。
+
+用法:
+    snapshots = SnapshotService(SNAPSHOT_PATH)
+    snapshots.start()
+    with lock:
+        snapshots.submit(build_snapshot(), tick)   # 世界锁内只做一次 marshal 往返
+    snapshots.flush(timeout=10)                    # 需要等落盘时（如管理接口）
+    snap, path, cold = snapshots.load()            # 启动恢复：热段 + 冷段读取器
+"""
+
+import logging
+import marshal
+import os
+import time
+from threading import Condition, Thread
+
+from config import SNAPSHOT_GENERATIONS, SNAPSHOT_COMPRESSION
+from snapshot_format import SnapshotReader, write_snapshot, resolve_compression, READ_ERRORS
+
+log = logging.getLogger("world")
+
+
+def detach(snapshot):
+    """快照的独立副本：之后世界怎么改都不会影响它（只支持 JSON 类型）"""
+    return marshal.loads(marshal.dumps(snapshot))
+
+
+class SnapshotService:
+    """单线程的后台快照写入器"""
+
+    def __init__(self, path, generations=SNAPSHOT_GENERATIONS, on_written=None, compression=SNAPSHOT_COMPRESSION):
+        self.path = path
+        self.generations = max(1, generations)
+        self.compression = resolve_compression(compression)
+        self.on_written = on_written  # v10.23: 落盘后回调（快照副本），变更日志据此压缩旧段
+        self._cv = Condition()
+        self._pending = None      # (序号, tick, 快照)，只保留最新一份
+        self._writing = False
+        self._submitted = 0       # 已提交的快照序号
+        self._done = 0            # 已处理完（写成或失败）的快照序号
+        self._thread = None
+        self._stats = {
+            "written": 0, "failed": 0, "superseded": 0,
+            "last_tick": None, "last_bytes": 0, "last_raw_bytes": 0, "last_ms": 0.0, "max_ms": 0.0,
+            "capture_ms": 0.0, "load_hot_ms": 0.0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, snapshot, tick):
+        """交给写线程（在世界锁内调用）。返回本次快照的序号，可传给 flush"""
+        t0 = time.perf_counter()
+        copy = detach(snapshot)
+        with self._cv:
+            if self._pending is not None:
+                self._stats["superseded"] += 1
+            self._submitted += 1
+            self._pending = (self._submitted, tick, copy)
+            self._stats["capture_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            self._cv.notify_all()
+            return self._submitted
+
+    def flush(self, seq=None, timeout=None):
+        """等到序号 seq（默认为最近一次提交）的快照处理完。超时返回 False"""
+        with self._cv:
+            target = self._submitted if seq is None else seq
+            return self._cv.wait_for(lambda: self._done >= target, timeout)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                self._cv.wait_for(lambda: self._pending is not None)
+                seq, tick, snapshot = self._pending
+                self._pending = None
+                self._writing = True
+            try:
+                self._write(snapshot, tick)
+                if self.on_written:
+                    self.on_written(snapshot)
+            except Exception as e:
+                with self._cv:
+                    self._stats["failed"] += 1
+                log.error(f"[SNAPSHOT] 快照写入失败 (tick={tick}): {e}")
+            finally:
+                with self._cv:
+                    self._writing = False
+                    self._done = seq  # 被新快照顶替的旧序号也算处理完
+                    self._cv.notify_all()
+
+    def _write(self, snapshot, tick):
+        t0 = time.perf_counter()
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            raw = write_snapshot(f, snapshot, self.compression)  # v10.25: 边编码边压缩边写，不拼整个文档
+            size = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        # 轮换：.{n-2} -> .{n-1}，...，当前 -> .1，最后临时文件原子替换当前
+        for gen in range(self.generations - 1, 0, -1):
+            older = self._generation(gen - 1)
+            if os.path.exists(older):
+                os.replace(older, self._generation(gen))
+        os.replace(tmp, self.path)
+        self._fsync_dir()
+        elapsed = (time.perf_counter() - t0) * 1000
+        with self._cv:
+            self._stats.update(written=self._stats["written"] + 1, last_tick=tick, last_bytes=size, last_raw_bytes=raw,
+                               last_ms=round(elapsed, 2), max_ms=round(max(self._stats["max_ms"], elapsed), 2))
+        log.info(f"[SNAPSHOT] 快照已写入 tick={tick} ({size // 1024}KB，未压缩 {raw // 1024}KB, {elapsed:.0f}ms)")
+
+    def _generation(self, gen):
+        return self.path if gen == 0 else f"{self.path}.{gen}"
+
+    def _fsync_dir(self):
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def load(self):
+        """从最新一代开始读热段，返回 (热段快照, 路径, 冷段读取器)；都读不出来时返回 (None, None, None)。
+        冷段读取器用完要 close（旧版 JSON 快照的冷段已经在热段里，读取器什么都不产出）"""
+        for gen in range(self.generations):
+            path = self._generation(gen)
+            if not os.path.exists(path):
+                continue
+            t0 = time.perf_counter()
+            reader = None
+            try:
+                reader = SnapshotReader(path)
+                snap = reader.read_hot()
+            except READ_ERRORS as e:
+                if reader is not None:
+                    reader.close()
+                log.error(f"[SNAPSHOT] 快照 {path} 无法读取，尝试上一代: {e}")
+                continue
+            with self._cv:
+                self._stats["load_hot_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            return snap, path, reader
+        return None, None, None
+
+    def wal_seqs(self):
+        """v10.27: 磁盘上各代快照记录的 wal_seq，从旧到新；读不出来（旧格式、文件坏了）的记 0"""
+        out = []
+        for gen in range(self.generations - 1, -1, -1):
+            path = self._generation(gen)
+            if not os.path.exists(path):
+                continue
+            reader = None
+            try:
+                reader = SnapshotReader(path)
+                header = reader.read_header()
+                out.append((header or {}).get("wal_seq") or 0)
+            except READ_ERRORS:
+                out.append(0)
+            finally:
+                if reader is not None:
+                    reader.close()
+        return out
+
+    def stats(self):
+        with self._cv:
+            return dict(self._stats, pending=self._pending is not None, writing=self._writing,
+                        generations=self.generations, compression=self.compression)
@@ -0,0 +1,122 @@
+"""
+v10.16 增量状态同步协议 (Delta sync_state)
+=========================================
+过去 bot 每次心跳后把完整的 core_memories / emotional_bonds / values / recent_actions POST 到
+/bot/{id}/sync_state，引擎在世界锁内整体替换这些字段。请求越来越大，而且会把引擎在
+_update_bonds_after_talk 里并发写入的关系（印象、温度变化）整个覆盖掉。
+
+协议 2：按分区打补丁
+- 每个分区用内容哈希（规范化 JSON 的 SHA-1 前 16 位）判断有没有变，没变的分区不发送
+- core_memories    {"append": [...]}          只发上次确认之后的新记忆，引擎按 summary 去重追加
+- emotional_bonds  {"upsert": {对象: 变化}}   只发有变化的关系；信任/敌意/亲密发增量（*_delta），
+                                                其他字段（label 等）发新值，引擎逐字段合并，不覆盖并发写入
+- values / recent_actions / long_term_goal / narrative_summary  小分区，变了就整体发送
+- 引擎返回各分区合并后的哈希；core_memories 附带 base（上次确认的引擎哈希），对不上
+  （引擎重启、从快照恢复等）时引擎要求 resync，下次把全部记忆重新追加一遍（去重后是幂等的）
+
+不带 "protocol" 字段的旧请求仍按整体替换处理。
+"""
+
+import hashlib
+import json
+
+PROTOCOL = 2
+BOND_COUNTERS = ("trust", "hostility", "closeness")
+CORE_MEMORY_LIMIT = 20
+
+
+def section_hash(value):
+    """分区内容哈希（键排序的 JSON，中文不转义）"""
+    blob = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def memory_key(mem):
+    """核心记忆的身份：summary 文本"""
+    return mem.get("summary", "") if isinstance(mem, dict) else str(mem)
+
+
+def diff_bonds(old, new):
+    """new 相对 old 的关系变化：{对象: {"trust_delta": .., "label": ..}}。新对象发完整值"""
+    changes = {}
+    for target, bond in new.items():
+        before = old.get(target)
+        if before is None:
+            changes[target] = dict(bond)
+            continue
+        change = {}
+        for k, v in bond.items():
+            if k in BOND_COUNTERS and isinstance(v, (int, float)):
+                delta = v - before.get(k, 0)
+                if delta:
+                    change[f"{k}_delta"] = delta
+            elif before.get(k) != v:
+                change[k] = v
+        if change:
+            changes[target] = change
+    return changes
+
+
+def merge_bond(bond, change):
+    """把一个对象的关系变化合并进引擎侧的关系（原地修改）"""
+    for k, v in change.items():
+        if k.endswith("_delta") and k[:-6] in BOND_COUNTERS:
+            field = k[:-6]
+            bond[field] = max(0, min(100, bond.get(field, 0) + v))
+        else:
+            bond[k] = v
+    return bond
+
+
+def append_memories(existing, new, limit=CORE_MEMORY_LIMIT):
+    """按 summary 去重追加，返回保留最近 limit 条的新列表"""
+    seen = {memory_key(m) for m in existing}
+    merged = list(existing)
+    for mem in new:
+        key = memory_key(mem)
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(mem)
+    return merged[-limit:]
+
+
+class SyncTracker:
+    """bot 侧：记住上次被引擎确认的内容，生成下一次的补丁"""
+
+    def __init__(self):
+        self.hashes = {}        # 分区 -> 上次确认时本地内容的哈希
+        self.engine_hashes = {} # 分区 -> 引擎返回的合并后哈希
+        self.sent_memories = set()
+        self.sent_bonds = {}    # 上次确认时的关系快照
+
+    def build(self, sections):
+        """sections: {分区: 当前本地值}。返回 (patch, 本次的本地哈希)；没有变化时 patch 为空"""
+        patch, local = {}, {}
+        for name, value in sections.items():
+            h = section_hash(value)
+            local[name] = h
+            if self.hashes.get(name) == h:
+                continue
+            if name == "core_memories":
+                fresh = [m for m in value if memory_key(m) not in self.sent_memories]
+                if fresh:
+                    patch[name] = {"append": fresh, "base": self.engine_hashes.get(name)}
+            elif name == "emotional_bonds":
+                changes = diff_bonds(self.sent_bonds, value)
+                if changes:
+                    patch[name] = {"upsert": changes}
+            else:
+                patch[name] = value
+        return patch, local
+
+    def ack(self, sections, local, response):
+        """引擎确认后记下已同步的内容；引擎要求 resync 的分区下次全量重发"""
+        self.hashes.update(local)
+        self.engine_hashes.update(response.get("hashes", {}))
+        self.sent_memories = {memory_key(m) for m in sections.get("core_memories", [])}
+        self.sent_bonds = json.loads(json.dumps(sections.get("emotional_bonds", {})))
+        for name in response.get("resync", []):
+            self.hashes.pop(name, None)
+            self.engine_hashes.pop(name, None)
+            if name == "core_memories":
+                self.sent_memories = set()
@@ -6,8 +6,9 @@ v6 新增: 天气显示、朋友圈面板、情绪可视化、新闻/热搜、
 """
 import os, json, logging
 import requests
+import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, StreamingResponse
 import uvicorn
 from config import LOGS_DIR, SELFIES_DIR, AVATAR_DIRS
 
@@ -15,21 +16,55 @@ app = FastAPI()
 ENGINE = "http://localhost:8000"
 log = logging.getLogger("dashboard")
 
+# v10.5: 复用连接，并透传 ETag / If-None-Match，引擎没变化时直接回 304
+_engine = requests.Session()
+_PASSTHROUGH_HEADERS = ("ETag", "Cache-Control", "X-World-Version")
+# SSE 转发走异步客户端：每个浏览器连接只是事件循环里的一个协程，不占线程池里的线程
+# 引擎每15秒发一次保活注释，60秒收不到任何数据视为断线
+_stream_client = httpx.AsyncClient(timeout=httpx.Timeout(60, connect=5))
+
+def _proxy_get(path, request, fallback):
+    try:
+        headers = {}
+        if request.headers.get("if-none-match"):
+            headers["If-None-Match"] = request.headers["if-none-match"]
+        r = _engine.get(f"{ENGINE}{path}", headers=headers, timeout=5)
+        passthrough = {k: r.headers[k] for k in _PASSTHROUGH_HEADERS if k in r.headers}
+        if r.status_code == 304:
+            return Response(status_code=304, headers=passthrough)
+        return Response(content=r.content, status_code=r.status_code, media_type="application/json", headers=passthrough)
+    except:
+        return fallback
+
 # ===== 代理API =====
 @app.get("/api/world")
-def api_world():
+def api_world(request: Request):
+    return _proxy_get("/world", request, {"error": "engine offline"})
+
+@app.get("/api/stream")
+async def api_stream(request: Request):
+    """v10.7: 转发引擎的 SSE 推送流（含断线续推的 Last-Event-ID）"""
+    headers = {}
+    if request.headers.get("last-event-id"):
+        headers["Last-Event-ID"] = request.headers["last-event-id"]
     try:
-        r = requests.get(f"{ENGINE}/world", timeout=5)
-        return r.json()
-    except:
-        return {"error": "engine offline"}
+        r = await _stream_client.send(_stream_client.build_request("GET", f"{ENGINE}/stream", headers=headers),
+                                      stream=True)
+    except httpx.HTTPError:
+        return JSONResponse({"error": "engine offline"}, 502)
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw():
+                yield chunk
+        except httpx.HTTPError as e:
+            log.warning(f"[STREAM] 引擎推送流中断: {e}")
+        finally:
+            await r.aclose()
+    return StreamingResponse(relay(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/api/bot/{bot_id}/detail")
-def api_detail(bot_id: str):
-    try:
-        return requests.get(f"{ENGINE}/bot/{bot_id}/detail", timeout=5).json()
-    except:
-        return {"error": "engine offline"}
+def api_detail(bot_id: str, request: Request):
+    return _proxy_get(f"/bot/{bot_id}/detail", request, {"error": "engine offline"})
 
 @app.get("/api/logs/{name}")
 def api_logs(name: str):
@@ -41,25 +76,16 @@ def api_logs(name: str):
     return {"lines": lines[-80:]}
 
 @app.get("/api/messages/{bot_id}")
-def api_messages(bot_id: str):
-    try:
-        return requests.get(f"{ENGINE}/messages/{bot_id}", timeout=5).json()
-    except:
-        return {"messages": []}
+def api_messages(bot_id: str, request: Request):
+    return _proxy_get(f"/messages/{bot_id}", request, {"messages": []})
 
 @app.get("/api/moments")
-def api_moments():
-    try:
-        return requests.get(f"{ENGINE}/moments", timeout=5).json()
-    except:
-        return {"moments": []}
+def api_moments(request: Request):
+    return _proxy_get("/moments", request, {"moments": []})
 
 @app.get("/api/gallery")
-def api_gallery():
-    try:
-        return requests.get(f"{ENGINE}/gallery", timeout=5).json()
-    except:
-        return {"photos": []}
+def api_gallery(request: Request):
+    return _proxy_get("/gallery", request, {"photos": []})
 
 @app.post("/api/send_message")
 async def api_send_message(request: Request):
@@ -86,32 +112,20 @@ async def api_add_bot(request: Request):
 
 # v9.0 进化引擎API代理
 @app.get("/api/evolution")
-def api_evolution():
-    try:
-        return requests.get(f"{ENGINE}/evolution", timeout=5).json()
-    except:
-        return {"error": "engine offline"}
+def api_evolution(request: Request):
+    return _proxy_get("/evolution", request, {"error": "engine offline"})
 
 @app.get("/api/reputation")
-def api_reputation():
-    try:
-        return requests.get(f"{ENGINE}/reputation", timeout=5).json()
-    except:
-        return {"reputation_board": []}
+def api_reputation(request: Request):
+    return _proxy_get("/reputation", request, {"reputation_board": []})
 
 @app.get("/api/graveyard")
-def api_graveyard():
-    try:
-        return requests.get(f"{ENGINE}/graveyard", timeout=5).json()
-    except:
-        return {"graveyard": []}
+def api_graveyard(request: Request):
+    return _proxy_get("/graveyard", request, {"graveyard": []})
 
 @app.get("/api/legends")
-def api_legends():
-    try:
-        return requests.get(f"{ENGINE}/legends", timeout=5).json()
-    except:
-        return {"urban_legends": []}
+def api_legends(request: Request):
+    return _proxy_get("/legends", request, {"urban_legends": []})
 
 # ===== 静态文件 =====
 @app.get("/avatars/{filename}")
@@ -783,10 +797,18 @@ async function fetchChat() {
 
 async function fetchMoments() {
     try {
+        // 推送模式下直接用镜像里的朋友圈，不再轮询
+        if (streamLive) { renderMoments(Object.values(mirror.moments).sort((a,b)=>a.tick-b.tick)); return; }
         const resp = await fetch('/api/moments');
         const data = await resp.json();
+        renderMoments(data.moments || []);
+    } catch(e){}
+}
+
+function renderMoments(list) {
+    try {
         const c = document.getElementById('momentsContent');
-        const moments = (data.moments || []).reverse();
+        const moments = [...list].reverse();
         if (moments.length === 0) {
             c.innerHTML = '<div style="text-align:center;color:#444;padding:40px;font-size:12px;">还没有人发过朋友圈</div>';
             return;
@@ -958,12 +980,56 @@ async function fetchEvolution() {
     }
 }
 
+let worldEtag = null;
 async function fetchWorld() {
     try {
+        // 浏览器会自动带 If-None-Match 复验；ETag 没变说明世界没变，跳过重绘
         const resp = await fetch('/api/world');
+        const etag = resp.headers.get('ETag');
+        if (etag && etag === worldEtag) return;
+        worldEtag = etag;
         worldState = await resp.json();
         if (worldState.error) return;
+        renderWorld();
+    } catch(e){}
+}
+
+// ===== v10.7: /stream 推送（失败时退回 3 秒轮询） =====
+let mirror = {bots:{}, locations:{}, moments:{}, events:{}, rules:{}, globals:{}};
+let streamLive = false;
+let pollTimer = null;
+function applyChanges(diff) {
+    if (diff.reset) mirror = {bots:{}, locations:{}, moments:{}, events:{}, rules:{}, globals:{}};
+    for (const kind of Object.keys(mirror)) Object.assign(mirror[kind], diff[kind] || {});
+    for (const [kind, keys] of Object.entries(diff.removed || {})) for (const k of keys) delete mirror[kind][k];
+    const byTick = (a,b) => a.tick-b.tick;
+    worldState = Object.assign({}, mirror.globals, {
+        bots: mirror.bots, locations: mirror.locations,
+        events: Object.values(mirror.events).sort(byTick).slice(-10),
+        moments: Object.values(mirror.moments).sort(byTick).slice(-20),
+        active_rules: Object.values(mirror.rules),
+    });
+}
+function startPolling() {
+    if (!pollTimer) { pollTimer = setInterval(fetchWorld, 3000); fetchWorld(); }
+}
+function startWorldStream() {
+    if (typeof EventSource === 'undefined') { startPolling(); return; }
+    const es = new EventSource('/api/stream');
+    es.addEventListener('changes', ev => {
+        streamLive = true;
+        if (pollTimer) { clearInterval(pollTimer); pollTimer = null; }
+        try { applyChanges(JSON.parse(ev.data)); renderWorld(); } catch(e){}
+        if (currentView==='moments') fetchMoments();
+    });
+    es.onerror = () => {
+        // 从没连上过就退回轮询；连上过则交给 EventSource 自动续连
+        if (!streamLive) { es.close(); startPolling(); }
+    };
+}
 
+function renderWorld() {
+    try {
         // Clock
         if (worldState.time) {
             const h = worldState.time.virtual_hour;
@@ -1325,8 +1391,8 @@ setInterval(() => {
     else if (currentView==='gallery') fetchGallery();
     else if (currentView==='events') fetchEvents();
 }, 3000);
-setInterval(fetchWorld, 3000);
-fetchLog(); fetchWorld();
+startWorldStream();
+fetchLog();
 </script>
 </body>
 </html>""")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 测试不调用 LLM，也不写变更日志 / 历史库 / LLM 缓存（config 在 import 时读环境变量）
+os.environ.setdefault("OPENAI_API_KEY", "test")
+for key in ("WAL_DIR", "HISTORY_DB_PATH", "LLM_CACHE_PATH"):
+    os.environ[key] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+import pytest
+
+from history_store import HistoryStore
+
+engine = pytest.importorskip("world_engine_v8")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.sqlite3"), flush_ms=10)
+
+
+def test_keyed_records_replace_and_unkeyed_append(store):
+    store.record("moment", {"id": "m1", "likes": []}, tick=1, bot="bot_1", key="m1")
+    store.record("moment", {"id": "m1", "likes": ["bot_2"]}, tick=1, bot="bot_1", key="m1")
+    store.record("event", {"event": "开张"}, tick=1)
+    store.record("event", {"event": "开张"}, tick=2)
+    assert store.query("moment") == (1, [{"id": "m1", "likes": ["bot_2"]}])
+    assert store.query("event")[0] == 2
+
+
+def test_query_filters_and_pages(store):
+    for tick in range(10):
+        store.record("action", {"tick": tick}, tick=tick, bot=f"bot_{tick % 2}", type="move")
+    total, rows = store.query("action", bot="bot_1", offset=1, limit=2)
+    assert total == 5 and [r["tick"] for r in rows] == [7, 5]           # 最新的在前
+    assert store.query("action", since_tick=3, until_tick=4)[0] == 2
+
+
+def test_delete_after(store):
+    store.record("event", {"tick": 1}, tick=1)
+    store.record("event", {"tick": 5}, tick=5)
+    store.record("moment", {"id": "m1"}, tick=1, key="m1")
+    assert store.delete_after(3) == 1
+    assert store.query("event") == (1, [{"tick": 1}])
+    # since 之后写入的记录也删掉，rewritten 里的种类只按 tick 删
+    store.record("event", {"tick": 2}, tick=2)
+    store.record("moment", {"id": "m1", "likes": ["bot_2"]}, tick=1, key="m1")
+    assert store.delete_after(3, since=0, rewritten=("moment",)) == 2
+    assert store.query("moment")[0] == 1
+
+
+def test_disabled_store():
+    store = HistoryStore("")
+    store.record("event", {"tick": 1}, tick=1)
+    assert store.query("event") == (0, []) and store.delete_after(0) == 0
+
+
+def test_one_death_stores_every_legend(store, monkeypatch):
+    bot = engine.create_bot("bot_1")
+    bot["core_memories"] = [{"summary": f"记忆{i}"} for i in range(3)]
+    loc = bot["location"]
+    monkeypatch.setitem(engine.world, "bots", {"bot_1": bot})
+    monkeypatch.setitem(engine.world, "locations", {loc: {"bots": engine.OccupantSet(["bot_1"]), "public_memory": []}})
+    for key, value in (("urban_legends", []), ("graveyard", []), ("events", []),
+                       ("message_board", engine.MessageBoard()), ("generation_count", 0)):
+        monkeypatch.setitem(engine.world, key, value)
+    monkeypatch.setattr(engine, "history", store)
+    monkeypatch.setattr(engine, "_spawn_new_generation_bot", lambda *a: None)
+
+    engine.handle_bot_death("bot_1")
+
+    legends = engine.world["urban_legends"]
+    assert len({legend["id"] for legend in legends}) == 3
+    total, rows = store.query("legend")
+    assert total == 3 and sorted(r["content"] for r in rows) == ["记忆0", "记忆1", "记忆2"]
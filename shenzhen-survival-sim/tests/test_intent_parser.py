@@ -0,0 +1,76 @@
+import pytest
+
+from intent_parser import IntentParser
+
+LOCATIONS = {"华强北": {}, "福田CBD": {}, "宝安城中村": {}}
+FOOD_MENU = {"路边摊炒粉": {"cost": 12}, "便利店饭团": {"cost": 8}}
+JOBS = {"华强北": [{"title": "电子产品销售"}]}
+PERSONAS = {"bot_1": {"name": "阿强"}, "bot_2": {"name": "小美"}}
+
+
+@pytest.fixture
+def parser():
+    return IntentParser(LOCATIONS, FOOD_MENU, JOBS, PERSONAS)
+
+
+def test_move(parser):
+    call, confidence, kind = parser.parse("去华强北", location="宝安城中村")
+    assert kind == "move"
+    assert call["tool"] == "move"
+    assert call["args"] == {"destination": "华强北", "mode": "walk"}
+    assert confidence >= 0.9
+
+
+def test_move_mode_and_home(parser):
+    call, _, _ = parser.parse("打车去福田CBD", location="华强北")
+    assert call["args"]["mode"] == "taxi"
+    call, _, kind = parser.parse("回家", location="华强北", home="宝安城中村")
+    assert (kind, call["args"]["destination"]) == ("move", "宝安城中村")
+
+
+def test_continue_without_task_falls_back(parser):
+    assert parser.parse("继续工作", location="华强北") == (None, 0.0, None)
+    done = {"task_name": "送外卖", "status": "done"}
+    assert parser.parse("继续工作", location="华强北", current_task=done)[0] is None
+
+
+def test_continue_with_task(parser):
+    task = {"task_name": "送外卖", "status": "in_progress"}
+    call, _, kind = parser.parse("继续工作", location="华强北", current_task=task)
+    assert kind == "continue"
+    assert call["args"]["purpose"] == "继续送外卖"
+
+
+def test_eat_uses_alias_and_current_price(parser):
+    call, _, kind = parser.parse("吃炒粉", location="宝安城中村", food_prices={"路边摊炒粉": 15})
+    assert kind == "eat"
+    assert call["args"] == {"resource": "money", "amount": 15, "purpose": "吃路边摊炒粉"}
+
+
+def test_work_only_matches_local_jobs(parser):
+    assert parser.parse("去做电子产品销售", location="华强北")[2] == "work"
+    assert parser.parse("做电子产品销售", location="福田CBD")[0] is None
+
+
+def test_talk_confidence_depends_on_nearby(parser):
+    call, near, kind = parser.parse("找小美聊天", location="华强北", nearby=("bot_2",))
+    assert kind == "talk" and call["args"]["target"] == "bot_2"
+    _, far, _ = parser.parse("找小美聊天", location="华强北")
+    assert far < near
+
+
+def test_negation_and_compound_plans(parser):
+    assert parser.parse("不去华强北", location="宝安城中村")[0] is None
+    assert parser.parse("去华强北吗", location="宝安城中村")[0] is None
+    # 只看第一个分句，多个分句时置信度打折
+    _, single, _ = parser.parse("去华强北", location="宝安城中村")
+    call, multi, _ = parser.parse("去华强北，然后吃炒粉", location="宝安城中村")
+    assert call["args"]["destination"] == "华强北" and multi < single
+
+
+def test_stats(parser):
+    parser.record("move")
+    parser.record(None)
+    stats = parser.stats()
+    assert stats["fast"] == 1 and stats["llm"] == 1 and stats["by_kind"] == {"move": 1}
+    assert stats["fast_rate"] == 0.5
@@ -0,0 +1,81 @@
+import pytest
+
+from world_rules_engine import (RuleError, compile_condition, compile_effect, compile_rule, compile_rules, create_rule,
+                                parse_rule_defs)
+
+
+def _rule(effects, condition=None, trigger="every_tick"):
+    return create_rule(name="测试规则", creator_id="bot_1", creator_name="阿强", location="华强北",
+                       trigger=trigger, condition=condition or {}, effects=effects, description="测试")
+
+
+@pytest.mark.parametrize("effect", [
+    "modify_bot_attr",                                              # 不是对象
+    {"type": "summon_dragon"},                                      # 未知效果类型
+    {"type": "modify_bot_attr", "attr": "charisma", "delta": 5},    # 不能改的属性
+    {"type": "modify_bot_attr", "attr": "hp", "delta": "5"},        # 非数值参数
+    {"type": "modify_bot_attr", "attr": "hp", "delta": True},       # bool 不算数值
+    {"type": "modify_bot_emotion", "emotion": "", "delta": 3},
+])
+def test_bad_effect_rejected(effect):
+    with pytest.raises(RuleError):
+        compile_effect(effect)
+    with pytest.raises(RuleError):
+        _rule([effect])
+
+
+def test_bad_rule_shape_rejected():
+    with pytest.raises(RuleError):
+        _rule({"type": "narrative", "text": "x"})                   # effects 不是列表
+    with pytest.raises(RuleError):
+        _rule([], trigger="on_full_moon")
+    with pytest.raises(RuleError):
+        _rule([], condition={"bot_mood": "happy"})                  # 未知条件
+    with pytest.raises(RuleError):
+        _rule([], condition={"time_between": [6]})
+
+
+def test_rule_error_is_value_error():
+    assert issubclass(RuleError, ValueError)
+
+
+def test_condition_constant_folding():
+    assert compile_condition({}) is True
+    assert compile_condition({"random": 1}) is True
+    assert compile_condition({"and": [{"random": 0}, {"bot_attr_lt": ["hp", 30]}]}) is False
+    cond = compile_condition({"and": [{"random": 1}, {"bot_attr_lt": ["hp", 30]}]})
+    assert cond({"hp": 10}, 12) is True and cond({"hp": 50}, 12) is False
+
+
+def test_modify_bot_attr_effect():
+    run = compile_effect({"type": "modify_bot_attr", "attr": "satiety", "delta": 35, "cost_money": 12})
+    bot = {"satiety": 80, "money": 20}
+    affected, _ = run({"bot": bot, "bot_id": "bot_1", "rule_location": "华强北"}, {})
+    assert affected == ("bot_1",) and bot == {"satiety": 100, "money": 8}
+    # 付不起时不生效
+    affected, _ = run({"bot": bot, "bot_id": "bot_1", "rule_location": "华强北"}, {})
+    assert affected == () and bot == {"satiety": 100, "money": 8}
+
+
+def test_compile_rules_deactivates_invalid():
+    good = _rule([{"type": "narrative", "text": "街头有人弹吉他"}])
+    bad = dict(good, id="rule_bad", effects=[{"type": "summon_dragon"}])
+    world = {"active_rules": [good, bad]}
+    assert compile_rules(world) == 1
+    assert good["active"] is True and bad["active"] is False
+
+
+@pytest.mark.parametrize("hour", [25, -3, 12.5, "8", True])
+def test_bad_trigger_hour_rejected(hour):
+    rule = _rule([], trigger="on_time")
+    rule["trigger_hour"] = hour
+    with pytest.raises(RuleError):
+        compile_rule(rule)
+
+
+def test_parse_rule_defs_checks_trigger_hour():
+    world = {"active_rules": [], "time": {"tick": 7}}
+    defs = [{"name": "午夜烟花", "trigger": "on_time", "trigger_hour": 25, "effects": []},
+            {"name": "早市开张", "trigger": "on_time", "trigger_hour": 6, "effects": []}]
+    rules = parse_rule_defs(world, defs, "bot_1", "阿强", "华强北")
+    assert [(r["name"], r["trigger_hour"]) for r in rules] == [("早市开张", 6)]
@@ -0,0 +1,137 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from snapshot_format import (COLD_SECTIONS, HOT_END, READ_ERRORS, SnapshotReader, resolve_compression,
+                             write_snapshot, zstandard)
+
+SNAPSHOT = {
+    "time": {"tick": 42, "virtual_day": 3},
+    "weather": {"current": "晴"},
+    "bots": {"bot_1": {"name": "阿强", "hp": 88.5}, "bot_2": {"name": "小美", "hp": 70}},
+    "locations": {"华强北": {"vibe": "热闹"}},
+    "active_rules": [{"id": "rule_a", "durability": 100}],
+    "message_board": [{"seq": 1, "from": "bot_1", "to": "bot_2", "msg": "在吗"}],
+    "wal_seq": 17,
+    "events": [{"tick": 41, "event": "台风预警"}],
+    "moments": [{"id": "m1", "content": "打卡华强北"}],
+    "graveyard": [],
+    "rule_archive": [{"id": "rule_old"}],
+}
+
+
+def _write(tmp_path, snapshot, compression):
+    path = tmp_path / "snap.json"
+    with open(path, "wb") as f:
+        raw = write_snapshot(f, snapshot, compression)
+    assert raw > 0
+    return path
+
+
+def _read_all(path):
+    reader = SnapshotReader(str(path))
+    try:
+        snap = reader.read_hot()
+        hot = dict(snap)
+        snap.update(reader.read_cold())
+        return reader, hot, snap
+    finally:
+        reader.close()
+
+
+COMPRESSIONS = ["gzip", "json"] + (["zstd"] if zstandard is not None else [])
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_round_trip(tmp_path, compression):
+    reader, hot, snap = _read_all(_write(tmp_path, SNAPSHOT, compression))
+    assert snap == SNAPSHOT
+    assert reader.compression == compression
+    if compression != "json":
+        # 分段快照：热段里没有冷段，冷段之后再读
+        assert reader.version == 2
+        assert not set(COLD_SECTIONS) & set(hot)
+
+
+def test_header(tmp_path):
+    reader = SnapshotReader(str(_write(tmp_path, SNAPSHOT, "gzip")))
+    try:
+        header = reader.read_header()
+        assert header["tick"] == 42 and header["wal_seq"] == 17
+        assert header["cold"] == [name for name in COLD_SECTIONS if name in SNAPSHOT]
+        assert reader.read_header() is header
+        assert reader.read_hot()["bots"] == SNAPSHOT["bots"]     # 读过文件头之后照常读热段
+    finally:
+        reader.close()
+
+
+def test_legacy_json_has_no_header(tmp_path):
+    path = tmp_path / "legacy.json"
+    path.write_text(json.dumps(SNAPSHOT), encoding="utf-8")
+    reader, _, snap = _read_all(path)
+    assert reader.version == 1 and snap == SNAPSHOT
+    reader = SnapshotReader(str(path))
+    assert reader.read_header() is None
+    reader.close()
+
+
+def _gzip_lines(tmp_path, lines):
+    path = tmp_path / "crafted.json"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+    return path
+
+
+def test_truncated_hot_section_raises(tmp_path):
+    path = _gzip_lines(tmp_path, [{"format": "mineclaw-snapshot", "version": 2, "hot": ["time"], "cold": []},
+                                  {"s": "time", "v": {"tick": 1}}])
+    reader = SnapshotReader(str(path))
+    with pytest.raises(EOFError):
+        reader.read_hot()
+    reader.close()
+
+
+def test_truncated_gzip_stream_raises(tmp_path):
+    data = _write(tmp_path, SNAPSHOT, "gzip").read_bytes()
+    path = tmp_path / "cut.json"
+    path.write_bytes(data[: len(data) // 2])
+    with pytest.raises(READ_ERRORS):
+        _read_all(path)
+
+
+@pytest.mark.parametrize("header", [
+    {"format": "mineclaw-snapshot", "version": 99},
+    {"format": "someone-else", "version": 2},
+])
+def test_unknown_header_rejected(tmp_path, header):
+    reader = SnapshotReader(str(_gzip_lines(tmp_path, [header, {"s": HOT_END}])))
+    with pytest.raises(ValueError):
+        reader.read_hot()
+    reader.close()
+
+
+def test_resolve_compression():
+    assert resolve_compression("json") == "json"
+    assert resolve_compression("lz4") == "gzip"
+    assert resolve_compression("zstd") == ("zstd" if zstandard is not None else "gzip")
+
+
+def test_write_counts_uncompressed_bytes():
+    buf = io.BytesIO()
+    raw = write_snapshot(buf, SNAPSHOT, "gzip")
+    lines = gzip.decompress(buf.getvalue())
+    assert raw == len(lines)
+
+
+def test_service_reads_wal_seq_of_every_generation(tmp_path):
+    from snapshot_service import SnapshotService
+
+    path = tmp_path / "world.json"
+    for suffix, wal_seq in ((".2", 5), ("", 12)):
+        with open(f"{path}{suffix}", "wb") as f:
+            write_snapshot(f, dict(SNAPSHOT, wal_seq=wal_seq), "gzip")
+    (tmp_path / "world.json.1").write_bytes(b"\x1f\x8b broken")
+    # 从旧到新；读不出来的一代记 0（它之后的日志段都不能删）
+    assert SnapshotService(str(path), generations=3).wal_seqs() == [5, 0, 12]
@@ -0,0 +1,101 @@
+import copy
+
+import pytest
+
+from tick_checkpoints import TickCheckpoints
+
+
+def _state(tick):
+    return {
+        "time": {"tick": tick},
+        "bots": {"bot_1": {"hp": 90, "money": 100, "action_log": [{"tick": 0, "action": "出门"}]},
+                 "bot_2": {"hp": 80, "money": 50, "action_log": []}},
+        "locations": {"华强北": {"vibe": "热闹", "public_memory": []}},
+        "active_rules": [{"id": "rule_a", "durability": 100}],
+        "message_board": [{"seq": 1, "msg": "在吗"}],
+        "events": [{"tick": 0, "event": "开张"}],
+    }
+
+
+def _ring(ticks=3, capacity=10):
+    ring, state = TickCheckpoints(capacity=capacity), _state(1)
+    history = {}
+    for tick in range(1, ticks + 1):
+        state["time"]["tick"] = tick
+        state["bots"]["bot_1"]["money"] += 10
+        state["events"].append({"tick": tick, "event": f"事件{tick}"})
+        ring.capture(state, tick)
+        history[tick] = copy.deepcopy(state)
+    return ring, state, history
+
+
+def test_state_restores_each_tick():
+    ring, _, history = _ring()
+    assert ring.ticks() == [1, 2, 3]
+    for tick, expected in history.items():
+        assert ring.state(tick) == expected
+    assert ring.state(99) is None
+
+
+def test_checkpoint_is_isolated_from_later_changes():
+    ring, state, _ = _ring(ticks=1)
+    state["bots"]["bot_1"]["action_log"].append({"tick": 1, "action": "吃饭"})
+    restored = ring.state(1)
+    assert len(restored["bots"]["bot_1"]["action_log"]) == 1
+    restored["bots"]["bot_2"]["hp"] = 0                       # 每次还原都是全新的对象
+    assert ring.state(1)["bots"]["bot_2"]["hp"] == 80
+
+
+def test_unchanged_parts_are_shared():
+    ring, _, _ = _ring(ticks=2)
+    first, second = (entry[2] for entry in ring._ring)
+    assert second["bots"]["bot_2"] is first["bots"]["bot_2"]                 # 整个实体没变
+    assert second["bots"]["bot_1"]["hp"] is first["bots"]["bot_1"]["hp"]     # 实体里没变的字段
+    assert second["locations"]["华强北"] is first["locations"]["华强北"]
+    assert second["events"][0] is first["events"][0]                         # 列表里没变的元素
+    stats = ring.stats()
+    assert stats["checkpoints"] == 2 and stats["shared_bytes"] < stats["full_bytes"]
+
+
+def test_same_tick_replaces_previous_capture():
+    ring, state, _ = _ring(ticks=2)
+    state["bots"]["bot_2"]["money"] = 7
+    ring.capture(state, 2)
+    assert ring.ticks() == [1, 2]
+    assert ring.state(2)["bots"]["bot_2"]["money"] == 7
+
+
+def test_truncate_after():
+    ring, _, history = _ring(ticks=5)
+    ring.truncate_after(3)
+    assert ring.ticks() == [1, 2, 3]
+    assert ring.state(3) == history[3]
+    assert ring.captured_at(3) is not None and ring.captured_at(4) is None
+
+
+def test_ring_drops_oldest():
+    ring, _, _ = _ring(ticks=5, capacity=3)
+    assert ring.ticks() == [3, 4, 5]
+    assert ring.stats()["oldest_tick"] == 3
+
+
+def test_disabled_ring():
+    ring = TickCheckpoints(capacity=0)
+    ring.capture(_state(1), 1)
+    assert not ring.enabled and ring.ticks() == [] and ring.state(1) is None
+
+
+def test_rewind_invalidates_in_flight_actions(tmp_path, monkeypatch):
+    engine = pytest.importorskip("world_engine_v8")
+    from snapshot_service import SnapshotService
+
+    monkeypatch.setattr(engine, "snapshots", SnapshotService(str(tmp_path / "world.json")))
+    monkeypatch.setattr(engine, "inject_news", lambda: None)           # 全新世界的开场新闻要调 LLM
+    engine.init_world()
+    with engine.lock:
+        state = engine._build_snapshot()
+        versions = {bid: engine._bot_versions.get(bid, 0) for bid in engine.world["bots"]}
+        engine._rewind_world(state)
+        # 倒带前拿到的行动票据版本号全部失效，提交时会重新校验
+        assert all(engine._bot_versions[bid] > v for bid, v in versions.items())
+        assert set(engine.world["bots"]) == set(versions)
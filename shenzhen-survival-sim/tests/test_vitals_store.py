@@ -0,0 +1,94 @@
+import copy
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+engine = pytest.importorskip("world_engine_v8")
+
+LOCATIONS = ("华强北", "福田CBD", "宝安城中村", "南山科技园")
+WEATHER_MOOD = {"anxiety": 8, "sadness": 2}
+
+
+class LowRng:
+    """随机量都取区间下界，两个版本才能逐值比较"""
+
+    def integers(self, low, high, size):
+        return np.full(size, low)
+
+    def uniform(self, low, high, size):
+        return np.full(size, low)
+
+
+def _bots(n, seed=1):
+    rng = random.Random(seed)
+    bots = {}
+    for i in range(n):
+        bots[f"bot_{i}"] = {
+            "name": f"居民{i}", "status": "alive", "home": "宝安城中村",
+            "hp": rng.uniform(0, 100), "satiety": rng.randint(0, 100), "energy": rng.randint(0, 100),
+            "phone_battery": rng.randint(20, 100), "money": rng.randint(0, 300),
+            "location": rng.choice(LOCATIONS), "gender": rng.choice(["男", "女", ""]),
+            "is_sleeping": rng.random() < 0.3, "_hunger_warned": rng.random() < 0.5,
+            "emotions": {k: rng.uniform(0, 100) for k in engine.EMOTION_DECAY},
+            "desires": {k: rng.choice([rng.uniform(0, 100), 85, 95]) for k in engine.DESIRE_GROWTH_PER_TICK},
+        }
+    return bots
+
+
+@pytest.fixture
+def world(monkeypatch):
+    monkeypatch.setitem(engine.world, "locations", {loc: {"bots": engine.OccupantSet()} for loc in LOCATIONS})
+    monkeypatch.setitem(engine.world, "bots", {})
+    monkeypatch.setattr(engine.random, "randint", lambda a, b: a)
+    monkeypatch.setattr(engine.random, "uniform", lambda a, b: a)
+    monkeypatch.setattr(engine.vitals, "_rng", LowRng())
+    return engine.world
+
+
+def _load(world, bots):
+    world["bots"].clear()
+    world["bots"].update(copy.deepcopy(bots))
+    for loc in world["locations"].values():
+        loc["bots"] = engine.OccupantSet()
+    for bid, bot in world["bots"].items():
+        world["locations"][bot["location"]]["bots"].add(bid)
+    return list(world["bots"].items())
+
+
+def _assert_same(scalar, vector):
+    for bid, expected in scalar.items():
+        got = vector[bid]
+        assert set(got) == set(expected), bid
+        for key, value in expected.items():
+            if isinstance(value, dict):
+                assert got[key] == pytest.approx(value, abs=1e-9), (bid, key)
+            else:
+                assert got[key] == value and type(got[key]) is type(value), (bid, key)
+
+
+@pytest.mark.parametrize("hour", [3, 12, 22])
+def test_vector_matches_scalar(world, hour):
+    bots = _bots(300)
+    alive = _load(world, bots)
+    awake_scalar = [bid for bid, bot in alive if engine._tick_vitals(bid, bot, hour, WEATHER_MOOD)]
+    scalar = copy.deepcopy(world["bots"])
+
+    alive = _load(world, bots)
+    awake_vector = [bid for bid, _ in engine.vitals.tick(alive, hour, WEATHER_MOOD)[0]]
+
+    assert awake_vector == awake_scalar
+    _assert_same(scalar, world["bots"])
+
+
+def test_events(world):
+    bots = _bots(50)
+    bots["bot_0"].update(is_sleeping=True, energy=95)
+    bots["bot_1"].update(is_sleeping=False, satiety=0, _hunger_warned=False)
+    _, events = engine.vitals.tick(_load(world, bots), 12, {})
+    assert "bot_0" in events["woke"]
+    assert "bot_1" in events["hunger_warn"] and "bot_1" in events["starving"]
+
+
+def test_empty():
+    assert engine.vitals.tick([], 12, {}) == ([], {"woke": [], "hunger_warn": [], "overwork_warn": [], "starving": []})
@@ -0,0 +1,183 @@
+import json
+import os
+import time
+
+from message_board import MessageBoard
+from world_wal import WorldLog, _list_delta, apply_list_delta
+
+
+def _state(**over):
+    state = {
+        "time": {"tick": 1},
+        "bots": {"bot_1": {"hp": 90, "money": 100, "location": "华强北"},
+                 "bot_2": {"hp": 80, "money": 50, "location": "福田CBD"}},
+        "active_rules": [{"id": "rule_a", "durability": 100}],
+        "events": [{"tick": 1, "event": "开张"}],
+    }
+    state.update(over)
+    return state
+
+
+def _log(path, **kw):
+    wal = WorldLog(directory=str(path), group_commit_ms=1, **kw)
+    wal.start()
+    return wal
+
+
+def _records(path):
+    out = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            out.extend(json.loads(line) for line in f)
+    return out
+
+
+def _wait_compacted(path, timeout=2.0):
+    deadline = time.time() + timeout
+    while os.listdir(path) and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_replay_rebuilds_state(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    state = _state()
+    wal.commit(state, board, 1)
+    state["bots"]["bot_1"]["money"] = 130
+    del state["bots"]["bot_2"]
+    state["active_rules"][0]["durability"] = 95
+    board.post({"from": "bot_1", "to": "bot_2", "msg": "在吗", "tick": 2})
+    assert wal.commit(state, board, 2) == 2
+    assert wal.commit(state, board, 2) == 2          # 没变化时不产生记录
+    assert wal.flush(timeout=5)
+
+    restored = WorldLog(directory=str(tmp_path)).replay(None)
+    assert restored["wal_seq"] == 2
+    assert restored["bots"] == state["bots"]
+    assert restored["active_rules"] == state["active_rules"]
+    assert [m["msg"] for m in restored["message_board"]] == ["在吗"]
+
+
+def test_list_sections_logged_as_deltas(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    events = [{"tick": i, "event": f"事件{i}"} for i in range(10)]
+    wal.commit(_state(events=list(events)), board, 1)
+    events = events[2:] + [{"tick": 10, "event": "事件10"}]      # 热窗口截断 + 新事件
+    events[0] = dict(events[0], likes=1)                        # 就地修改
+    wal.commit(_state(events=list(events)), board, 2)
+    assert wal.flush(timeout=5)
+
+    last = _records(tmp_path)[-1]
+    assert "events" not in last.get("set", {})
+    assert last["list"]["events"] == {"drop": 2, "replace": [[0, events[0]]], "append": [events[-1]]}
+    assert WorldLog(directory=str(tmp_path)).replay(None)["events"] == events
+
+
+def test_list_delta_helpers():
+    old = tuple(b"%d" % i for i in range(5))
+    new = old[1:] + (b"x",)
+    drop, replace, append = _list_delta(old, new)
+    assert (drop, replace, append) == (1, [], [b"x"])
+    assert _list_delta((), new) is None
+    assert _list_delta(old, (b"a", b"b")) is None              # 完全换掉：整段记录更划算
+    items = [0, 1, 2, 3]
+    assert apply_list_delta(items, {"drop": 1, "replace": [[0, 9]], "append": [4]}) == [9, 2, 3, 4]
+
+
+def test_dirty_commit_only_diffs_given_entities(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    state = _state()
+    wal.commit(state, board, 1)
+    state["bots"]["bot_1"]["money"] = 1
+    state["bots"]["bot_2"]["money"] = 2
+    only_bot_1 = dict(state, bots={"bot_1": state["bots"]["bot_1"]})
+    wal.commit(only_bot_1, board, 2, dirty={"bots": ["bot_1"]})
+    wal.commit(state, board, 3)                                  # 全量提交补上 bot_2
+    assert wal.flush(timeout=5)
+
+    records = _records(tmp_path)
+    assert list(records[1]["patch"]["bots"]) == ["bot_1"] and "delete" not in records[1]
+    assert list(records[2]["patch"]["bots"]) == ["bot_2"]
+
+
+def test_skip_sections(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    wal.commit(_state(), board, 1, skip=("events",))
+    assert wal.flush(timeout=5)
+    assert "events" not in _records(tmp_path)[0].get("set", {})
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    state = _state()
+    for money in (110, 120, 130):
+        state["bots"]["bot_1"]["money"] = money
+        wal.commit(state, board, money)
+    assert wal.flush(timeout=5)
+    segment = os.path.join(tmp_path, sorted(os.listdir(tmp_path))[-1])
+    with open(segment, "ab") as f:
+        f.write(b'{"seq": 4, "tick": 140, "patch": {"bots": {"bot_1": {"se')  # 崩溃时写了一半
+
+    restarted = WorldLog(directory=str(tmp_path))
+    restored = restarted.replay(None)
+    assert restored["wal_seq"] == 3
+    assert restored["bots"]["bot_1"]["money"] == 130
+    assert restarted.seq == 3                                    # 新记录接着完整的最后一条编号
+
+
+def test_replay_starts_after_snapshot_and_keeps_baseline(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    state = _state()
+    wal.commit(state, board, 1)
+    snapshot = json.loads(json.dumps(dict(state, wal_seq=wal.mark_checkpoint(1))))
+    state["bots"]["bot_2"]["hp"] = 10
+    wal.commit(state, board, 2)
+    assert wal.flush(timeout=5)
+
+    restarted = _log(tmp_path)
+    restored = restarted.replay(snapshot)
+    assert restored["wal_seq"] == 2 and restored["bots"]["bot_2"]["hp"] == 10
+    # 比较基准是回放后的状态：重启后第一次提交只记真正的变化
+    state["bots"]["bot_1"]["hp"] = 1
+    assert restarted.commit(state, board, 3) == 3
+    assert restarted.flush(timeout=5)
+    last = _records(tmp_path)[-1]
+    assert last["patch"] == {"bots": {"bot_1": {"set": {"hp": 1}, "unset": []}}}
+    assert "set" not in last
+
+
+def test_cold_section_deltas_wait_for_restore(tmp_path):
+    wal, board = _log(tmp_path), MessageBoard()
+    events = [{"tick": i, "event": f"事件{i}"} for i in range(5)]
+    wal.commit(_state(events=list(events)), board, 1)
+    snapshot = json.loads(json.dumps(dict(_state(events=list(events)), wal_seq=wal.mark_checkpoint(1))))
+    events.append({"tick": 5, "event": "事件5"})
+    wal.commit(_state(events=list(events)), board, 2)
+    assert wal.flush(timeout=5)
+
+    hot = {k: v for k, v in snapshot.items() if k != "events"}      # 冷段还没读
+    restarted = WorldLog(directory=str(tmp_path))
+    restored = restarted.replay(hot)
+    assert "events" not in restored and restarted.pending_sections() == ["events"]
+    assert restarted.apply_pending("events", list(snapshot["events"])) == events
+    assert restarted.pending_sections() == []
+
+
+def test_compaction_keeps_segments_older_generations_need(tmp_path):
+    wal, board = _log(tmp_path, keep_checkpoints=2), MessageBoard()
+    wal.seed_checkpoints([0])                                    # 磁盘上有一代不知道 wal_seq 的快照
+    wal.commit(_state(), board, 1)
+    assert wal.flush(timeout=5)
+    wal.compact(wal.mark_checkpoint(1))
+    time.sleep(0.1)
+    assert os.listdir(tmp_path)
+
+    wal.compact(wal.mark_checkpoint(2))                          # 那一代轮换出去之后才删
+    _wait_compacted(tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_disabled_log_is_a_no_op():
+    wal = WorldLog(directory="")
+    assert wal.commit(_state(), MessageBoard(), 1) == 0
+    assert wal.replay(None) is None
+    assert wal.flush() is True
@@ -0,0 +1,154 @@
+"""
+v10.26 逐 tick 检查点 (Tick Checkpoints)
+========================================
+排查一段涌现出来的剧情、或者行动后果判定（_judge_consequence）顺带生成的一条坏规则时，过去只能从磁盘上唯一的快照恢复，
+那份快照最多落后 10 个 tick（开了变更日志后检查点更稀），而且恢复就得重启引擎。
+
+现在引擎每个 tick 结束时在内存里拍一份检查点，放进有界的环（CHECKPOINT_RING_TICKS 份，满了丢最旧的）：
+- 检查点的内容与快照相同（_build_snapshot），按段存成 marshal 字节；
+  bots / locations / active_rules / message_board 按实体、再按字段存，
+  其他列表段（事件、朋友圈、墓地……）按元素存成 bytes 的元组
+- 结构共享：和上一份检查点相比没变的段、实体、字段，直接引用上一份里的同一个 bytes 对象（实体的字段全没变时
+  连字段表也共用），所以每份检查点只为变了的字段付出内存，环的总内存与变化量成正比，而不是 tick 数 × 世界大小
+- bytes 不可变，检查点拍下之后世界怎么改都不会影响它；恢复时 marshal.loads 出全新的对象
+
+用法（都在世界锁内调用，本模块不加锁）:
+    checkpoints.capture(state, tick)        # tick 结束时
+    state = checkpoints.state(tick)         # 还原出快照结构的 dict，交给快照恢复流程
+    checkpoints.captured_at(tick)           # 拍下的时间（倒带时清理历史库用）
+    checkpoints.truncate_after(tick)        # 倒带之后，更晚的检查点作废
+"""
+
+import marshal
+import time
+from collections import deque
+
+from config import CHECKPOINT_RING_TICKS
+
+# 按实体存的段：段名 -> 列表形式时实体的 key 字段（None 表示段本身就是 {key: 实体}）
+ENTITY_SECTIONS = {"bots": None, "locations": None, "active_rules": "id", "message_board": "seq"}
+
+
+def _share(blob, prev):
+    """与上一份相同就引用上一份的对象"""
+    return prev if prev == blob else blob
+
+
+class TickCheckpoints:
+    """每 tick 一份、结构共享的世界检查点环"""
+
+    def __init__(self, capacity=CHECKPOINT_RING_TICKS):
+        self.capacity = max(0, capacity)
+        self._ring = deque(maxlen=max(1, self.capacity))   # (tick, 拍下的时间, 段)
+        self._stats = {"captured": 0, "last_ms": 0.0, "max_ms": 0.0, "rewinds": 0, "forks": 0}
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def capture(self, state, tick):
+        """拍一份检查点。state 是快照结构的 dict；同一个 tick 重复拍时替换掉上一份"""
+        if not self.enabled:
+            return
+        t0 = time.perf_counter()
+        if self._ring and self._ring[-1][0] == tick:
+            self._ring.pop()
+        last = self._ring[-1][2] if self._ring else {}
+        sections = {}
+        for name, value in state.items():
+            if name in ENTITY_SECTIONS:
+                sections[name] = self._capture_entities(value, ENTITY_SECTIONS[name], last.get(name) or {})
+            elif isinstance(value, list):
+                # 列表会追加、会从头截断，按内容找上一份里相同的元素
+                prev = last.get(name)
+                index = {b: b for b in prev} if isinstance(prev, tuple) else {}
+                blobs = tuple(index.get(b, b) for b in map(marshal.dumps, value))
+                sections[name] = prev if blobs == prev else blobs
+            else:
+                sections[name] = _share(marshal.dumps(value), last.get(name))
+        self._ring.append((tick, time.time(), sections))
+        elapsed = (time.perf_counter() - t0) * 1000
+        self._stats.update(captured=self._stats["captured"] + 1, last_ms=round(elapsed, 2),
+                           max_ms=round(max(self._stats["max_ms"], elapsed), 2))
+
+    @staticmethod
+    def _capture_entities(value, key_field, prev):
+        items = value.items() if key_field is None else ((item[key_field], item) for item in value)
+        out = {}
+        for key, item in items:
+            old = prev.get(key)
+            if old is None:
+                out[key] = {f: marshal.dumps(v) for f, v in item.items()}
+                continue
+            fields = {f: _share(marshal.dumps(v), old.get(f)) for f, v in item.items()}
+            same = len(fields) == len(old) and all(b is old.get(f) for f, b in fields.items())
+            out[key] = old if same else fields
+        return out
+
+    # === 查找 / 还原 ===
+    def _find(self, tick):
+        for entry in self._ring:
+            if entry[0] == tick:
+                return entry
+        return None
+
+    def captured_at(self, tick):
+        """tick 那一份检查点拍下的时间（time.time()），没有时返回 None"""
+        entry = self._find(tick)
+        return entry[1] if entry else None
+
+    def ticks(self):
+        return [entry[0] for entry in self._ring]
+
+    def state(self, tick):
+        """还原 tick 那一份检查点（快照结构的全新 dict），没有时返回 None"""
+        entry = self._find(tick)
+        if entry is None:
+            return None
+        state = {}
+        for name, value in entry[2].items():
+            if isinstance(value, tuple):
+                state[name] = [marshal.loads(b) for b in value]
+                continue
+            if name not in ENTITY_SECTIONS:
+                state[name] = marshal.loads(value)
+                continue
+            entities = {key: {f: marshal.loads(b) for f, b in fields.items()} for key, fields in value.items()}
+            state[name] = entities if ENTITY_SECTIONS[name] is None else list(entities.values())
+        return state
+
+    def truncate_after(self, tick):
+        """丢掉 tick 之后的检查点（倒带之后它们属于被放弃的那条时间线）"""
+        while self._ring and self._ring[-1][0] > tick:
+            self._ring.pop()
+
+    def count(self, what):
+        self._stats[what] += 1
+
+    def stats(self):
+        """环的占用：shared_bytes 是去重后实际占用的字节，full_bytes 是每份都完整复制时需要的字节"""
+        seen, shared, full = set(), 0, 0
+
+        def add(blob):
+            nonlocal shared, full
+            full += len(blob)
+            if id(blob) not in seen:
+                seen.add(id(blob))
+                shared += len(blob)
+
+        for _, _, sections in self._ring:
+            for name, value in sections.items():
+                if isinstance(value, tuple):
+                    for blob in value:
+                        add(blob)
+                    continue
+                if name not in ENTITY_SECTIONS:
+                    add(value)
+                    continue
+                for fields in value.values():
+                    for blob in fields.values():
+                        add(blob)
+        ticks = self.ticks()
+        return dict(self._stats, capacity=self.capacity, checkpoints=len(ticks),
+                    oldest_tick=ticks[0] if ticks else None, newest_tick=ticks[-1] if ticks else None,
+                    shared_bytes=shared, full_bytes=full)
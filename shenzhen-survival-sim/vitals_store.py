@@ -0,0 +1,241 @@
+"""
+v10.19 列式生命体征 (Vitals Store)
+=================================
+world_tick 过去对每个活着的 bot 逐个执行生命体征规则：hp / 饱腹 / 能量 / 手机电量、五种情绪、五种欲望，
+每一项都是 dict 的 get + min/max，求"附近有没有人 / 有没有异性"还要扫一遍同地点的 bot。
+几十个 bot 时无所谓，模拟成千上万居民时这段循环就占满了 tick 临界区。
+
+VitalsStore 把这些规则改成按列的数组运算（需要 numpy，可选依赖）：
+- 每个 bot 分配一个固定槽位，按槽位缓存不变的数据（欲望倍率 profile）
+- 每 tick 把活着的 bot 的体征一次性读成列（hp、饱腹、能量、电量、金钱、情绪×5、欲望×5、是否睡着、地点、性别），
+  睡眠恢复、衰老、昼夜能量、电量、饥饿/金钱/疲惫情绪、情绪衰减、天气、孤独感、欲望增长和截断都是整列运算，
+  "附近有人 / 有异性" 按地点做计数（bincount），不再逐个扫描
+- 算完写回 bot dict；需要打日志的事件（自然醒、饥饿/过劳加速衰老、饥饿中）作为列表返回
+
+bot dict 仍然是世界状态的唯一来源：行动、事件、快照、视图都直接读写 dict，JSON 编码也绕不过 dict 本身，
+所以这里每 tick 读入、写回，而不是让 dict 变成数组的视图。规则与 world_engine_v8._tick_vitals 一一对应，
+随机数（电量、欲望回落）用 numpy 的生成器，与逐 bot 版本的随机序列不同。
+
+只在世界锁内调用，本模块不加锁。
+"""
+
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，没装时 world_tick 只走逐 bot 版本
+    np = None
+
+EMOTION_DEFAULTS = {"happiness": 50, "sadness": 10, "anger": 5, "anxiety": 20, "loneliness": 30}
+DESIRE_DEFAULT = 20
+_vitals_of = itemgetter("hp", "satiety", "energy", "money")
+
+
+def _as_numbers(col):
+    """写回用的列表；整列都是整数时保持 int（100 而不是 100.0），否则逐个判断"""
+    if np.array_equal(col, np.floor(col)):
+        return col.astype(np.int64).tolist()
+    return [int(v) if v == int(v) else v for v in col.tolist()]
+
+
+def _values(d, keys, getter, default):
+    """一次取出多个键（C 层 itemgetter）；缺键时逐个用默认值补"""
+    try:
+        return getter(d)
+    except KeyError:
+        return tuple(d.get(k, default(k)) for k in keys)
+
+
+class VitalsStore:
+    """按槽位组织的生命体征列，tick() 对所有活着的 bot 做一次整列更新"""
+
+    def __init__(self, *, aging_base, hunger_mult, overwork_mult, satiety_decay,
+                 energy_day_cost, energy_night_recover, energy_sleep_recover,
+                 emotion_decay, desire_growth, desire_profiles, default_profile):
+        self.enabled = np is not None
+        self.aging_base = aging_base
+        self.hunger_mult = hunger_mult
+        self.overwork_mult = overwork_mult
+        self.satiety_decay = satiety_decay
+        self.energy_day_cost = energy_day_cost
+        self.energy_night_recover = energy_night_recover
+        self.energy_sleep_recover = energy_sleep_recover
+        self.emotions = tuple(dict.fromkeys(list(EMOTION_DEFAULTS) + list(emotion_decay)))
+        self.emotion_decay = emotion_decay
+        self.desires = tuple(desire_growth)
+        self._emotions_of = itemgetter(*self.emotions)
+        self._desires_of = itemgetter(*self.desires)
+        self.desire_growth = desire_growth
+        self.desire_profiles = desire_profiles
+        self.default_profile = default_profile
+        self._slots = {}        # bot_id -> 槽位
+        self._codes = {}        # 地点 / 性别 -> 整数编码
+        self._profile = None    # (槽位, 欲望) 的倍率
+        if self.enabled:
+            self._rng = np.random.default_rng()
+            self._profile = np.ones((16, len(self.desires)))
+
+    def slot(self, bot_id):
+        """bot 的槽位（第一次出现时分配，代际传承复用 bot_id 时沿用）"""
+        slot = self._slots.get(bot_id)
+        if slot is None:
+            slot = self._slots[bot_id] = len(self._slots)
+            if slot >= len(self._profile):
+                grown = np.ones((len(self._profile) * 2, len(self.desires)))
+                grown[:len(self._profile)] = self._profile
+                self._profile = grown
+            profile = self.desire_profiles.get(bot_id, self.default_profile)
+            self._profile[slot] = [profile.get(f"{d}_mult", 1.0) for d in self.desires]
+        return slot
+
+    def _code(self, value):
+        return self._codes.setdefault(value, len(self._codes))
+
+    # === 读入 / 写回 ===
+    def _gather(self, alive):
+        emo_keys, des_keys = self.emotions, self.desires
+        emo_default = lambda k: EMOTION_DEFAULTS.get(k, 0)
+        des_default = lambda k: DESIRE_DEFAULT
+        rows, flags = [], []
+        for bid, bot in alive:
+            rows.append(
+                _vitals_of(bot) + (bot.get("phone_battery", 100),)
+                + _values(bot.get("emotions", {}), emo_keys, self._emotions_of, emo_default)
+                + _values(bot.get("desires", {}), des_keys, self._desires_of, des_default)
+            )
+            flags.append((
+                bool(bot.get("is_sleeping", False)), bool(bot.get("_hunger_warned")), bool(bot.get("_overwork_warned")),
+                self._code(("loc", bot["location"])), self._code(("gender", bot.get("gender") or "")),
+                self.slot(bid),
+            ))
+        return np.array(rows, dtype=float), np.array(flags, dtype=np.int64)
+
+    def _scatter(self, alive, cols, emotions, desires, awake_mask, hunger_warn, overwork_warn):
+        emo_keys, des_keys = self.emotions, self.desires
+        hp, satiety, energy, phone, aging = cols
+        hp, aging = hp.tolist(), aging.tolist()
+        satiety, energy, phone = _as_numbers(satiety), _as_numbers(energy), _as_numbers(phone)
+        emotions, desires = emotions.tolist(), desires.tolist()
+        awake_mask, hunger_warn, overwork_warn = awake_mask.tolist(), hunger_warn.tolist(), overwork_warn.tolist()
+        for i, (bid, bot) in enumerate(alive):
+            bot["satiety"] = satiety[i]
+            bot["energy"] = energy[i]
+            bot["phone_battery"] = phone[i]
+            bot.setdefault("emotions", {}).update(zip(emo_keys, emotions[i]))
+            if not awake_mask[i]:
+                continue
+            bot["hp"] = hp[i] if hp[i] > 0 else 0
+            bot["aging_rate"] = aging[i]
+            bot["_hunger_warned"] = hunger_warn[i]
+            bot["_overwork_warned"] = overwork_warn[i]
+            bot.setdefault("desires", {}).update(zip(des_keys, desires[i]))
+
+    # === 每 tick 的规则 ===
+    def tick(self, alive, hour, weather_mood):
+        """alive: [(bot_id, bot)]，全部是活着的 bot。更新它们的体征并写回。
+        返回 (醒着的 [(bot_id, bot)], 事件 {"woke"/"hunger_warn"/"overwork_warn"/"starving": [bot_id]})"""
+        events = {"woke": [], "hunger_warn": [], "overwork_warn": [], "starving": []}
+        if not alive:
+            return [], events
+        vals, flags = self._gather(alive)
+        n, ne = len(alive), len(self.emotions)
+        hp, satiety, energy, money, phone = (vals[:, i].copy() for i in range(5))
+        emo = vals[:, 5:5 + ne].copy()
+        des = vals[:, 5 + ne:].copy()
+        sleeping = flags[:, 0].astype(bool)
+        awake = ~sleeping
+        was_hunger, was_overwork = flags[:, 1].astype(bool), flags[:, 2].astype(bool)
+        loc, gender, slots = flags[:, 3], flags[:, 4], flags[:, 5]
+        col = {k: i for i, k in enumerate(self.emotions)}
+
+        def emo_add(mask, key, delta):
+            j = col[key]
+            emo[mask, j] = np.clip(emo[mask, j] + delta, 0, 100)
+
+        # --- 睡眠：能量/电量恢复，焦虑/愤怒/孤独缓解 ---
+        energy[sleeping] = np.minimum(100, energy[sleeping] + self.energy_sleep_recover)
+        satiety[sleeping] = np.maximum(0, satiety[sleeping] - 1)
+        for key, delta in (("anxiety", -3), ("anger", -2), ("loneliness", -1)):
+            j = col[key]
+            emo[sleeping, j] = np.maximum(0, emo[sleeping, j] + delta)
+        phone[sleeping] = np.minimum(100, phone[sleeping] + 15)
+        woke = sleeping & (7 <= hour < 23) & (energy >= 80)
+
+        # --- 醒着：衰老（饥饿/过劳加速）、饱腹、昼夜能量 ---
+        hungry_aging = awake & (satiety <= 10)
+        overwork = awake & (energy < 10)
+        aging = self.aging_base * np.where(hungry_aging, self.hunger_mult, 1.0) * np.where(overwork, self.overwork_mult, 1.0)
+        hp[awake] = np.maximum(0, np.round(hp[awake] - aging[awake], 3))
+        aging = np.round(aging, 4)
+        satiety[awake] = np.maximum(0, satiety[awake] - self.satiety_decay)
+        if hour >= 22 or hour < 6:
+            energy[awake] = np.minimum(100, energy[awake] + self.energy_night_recover)
+        else:
+            energy[awake] = np.maximum(0, energy[awake] - self.energy_day_cost)
+
+        # --- 手机电量：低于 80 慢充，否则缓慢消耗（不低于 30） ---
+        low = awake & (phone < 80)
+        high = awake & ~(phone < 80)
+        phone[low] = np.minimum(100, phone[low] + self._rng.integers(3, 9, int(low.sum())))
+        phone[high] = np.maximum(30, phone[high] - self._rng.integers(0, 3, int(high.sum())))
+
+        # --- 情绪 ---
+        starving = awake & (satiety <= 0)
+        emo_add(starving, "sadness", 3)
+        emo_add(starving, "anxiety", 2)
+        for key, delta in self.emotion_decay.items():
+            emo_add(awake, key, delta)
+        for key, delta in weather_mood.items():
+            if key in col:
+                emo_add(awake, key, delta)
+        # 同地点的其他 bot（所有活着的 bot 都在 alive 里，死亡的已离开地点）
+        n_codes = len(self._codes)
+        here = np.bincount(loc, minlength=n_codes)
+        alone = awake & (here[loc] <= 1)
+        emo_add(alone, "loneliness", 0.5)
+        emo_add(awake & ~alone, "loneliness", -5)
+        poor, tight = money < 50, (money >= 50) & (money < 100)
+        emo_add(awake & poor, "anxiety", 3)
+        emo_add(awake & poor, "sadness", 2)
+        emo_add(awake & tight, "anxiety", 1)
+        tired = awake & (energy < 20)
+        emo_add(tired, "sadness", 2)
+        emo_add(tired, "happiness", -3)
+
+        # --- 欲望增长 ---
+        mult = self._profile[slots].copy()
+        for j, key in enumerate(self.desires):
+            if key == "security":
+                mult[(hp < 30) | poor, j] *= 1.5
+            elif key == "greed":
+                mult[money < 100, j] *= 1.3
+            elif key == "lust":
+                mult[(energy > 60) & (satiety > 30), j] *= 1.2
+                if hour >= 22 or hour <= 5:
+                    mult[:, j] *= 1.5
+                # 同地点有异性：该地点有性别的人数 - 与自己同性别的人数 > 0
+                empty = self._codes.get(("gender", ""))
+                has_gender = gender != empty if empty is not None else np.ones(n, dtype=bool)
+                pair = np.bincount(loc * n_codes + gender, minlength=n_codes * n_codes)
+                gendered = np.bincount(loc[has_gender], minlength=n_codes)
+                others = gendered[loc] - np.where(has_gender, pair[loc * n_codes + gender], 0)
+                mult[others > 0, j] *= 1.3
+        growth = np.array([self.desire_growth[k] for k in self.desires]) * mult
+        capped = des >= 90
+        slow = (des >= 80) & ~capped
+        grown = np.where(slow, des + growth * 0.3, des + growth)
+        grown = np.minimum(100, grown)
+        fallback = np.maximum(0, des - self._rng.uniform(0.5, 1.5, des.shape))
+        des = np.where(awake[:, None], np.where(capped, fallback, grown), des)
+
+        hunger_warn = np.where(awake, hungry_aging, was_hunger)
+        overwork_warn = np.where(awake, overwork, was_overwork)
+        self._scatter(alive, (hp, satiety, energy, phone, aging), emo, des, awake, hunger_warn, overwork_warn)
+
+        ids = [bid for bid, _ in alive]
+        for name, mask in (("woke", woke), ("hunger_warn", hungry_aging & ~was_hunger),
+                           ("overwork_warn", overwork & ~was_overwork), ("starving", starving)):
+            events[name] = [ids[i] for i in np.flatnonzero(mask)]
+        for i in np.flatnonzero(woke):
+            alive[i][1]["is_sleeping"] = False
+        return [alive[i] for i in np.flatnonzero(awake)], events
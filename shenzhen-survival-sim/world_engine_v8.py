@@ -21,16 +21,32 @@ v8 原有:
 
 import os, sys, json, random, time, logging, subprocess, re
 from datetime import datetime
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 from typing import Optional
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
-from world_rules_engine import tick_rules, generate_rules_from_action, get_rules_summary, get_attraction_signals
-from config import get_openai_client, get_grok_api_key, LOGS_DIR, SELFIES_DIR, SNAPSHOT_PATH, BOT_AGENT_SCRIPT, PROJECT_ROOT, AVATAR_DIRS, OPENAI_MODEL_NANO, OPENAI_MODEL_MINI
+from world_rules_engine import tick_rules, compile_rules, should_judge_rules, build_rule_prompt, build_rule_section, request_rule_completion, parse_rule_response, parse_rule_defs, get_rules_summary, get_attraction_signals
+from background_jobs import JobQueue, PRIORITY_HIGH, PRIORITY_LOW
+from world_view import ViewStore, etag_matches, content_key, encode
+from sync_protocol import PROTOCOL as SYNC_PROTOCOL, section_hash, append_memories, merge_bond
+from world_stream import StreamHub, parse_event_id
+from llm_gateway import get_llm_gateway
+from intent_parser import IntentParser
+from message_board import MessageBoard, PUBLIC
+from snapshot_service import SnapshotService
+from snapshot_format import COLD_SECTIONS, write_snapshot
+from tick_checkpoints import TickCheckpoints
+from world_wal import WorldLog
+from rule_registry import RuleRegistry
+from occupancy import Occupancy, OccupantSet
+from vitals_store import VitalsStore
+from history_store import get_history_store, KINDS as HISTORY_KINDS
+from config import get_grok_api_key, LOGS_DIR, SELFIES_DIR, SNAPSHOT_PATH, BOT_AGENT_SCRIPT, BOT_RUNNER_SCRIPT, BOT_RUNNER_SHARDS, PROJECT_ROOT, AVATAR_DIRS, OPENAI_MODEL_NANO, OPENAI_MODEL_MINI, BG_JOB_WORKERS, DEFERRED_WORKERS, INTENT_FAST_PATH_THRESHOLD, VITALS_VECTOR_MIN_BOTS, HISTORY_HOT_EVENTS, HISTORY_HOT_GRAVES, HISTORY_HOT_LEGENDS, FORK_DIR
 
 # ============================================================
 # 日志（使用 config 中的路径，兼容本机与服务器）
@@ -56,10 +72,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-World-Version"],
 )
 
-client = get_openai_client()
+client = get_llm_gateway()  # v10.9: 所有 LLM 调用经网关限流/重试/统计
 lock = Lock()
+# v10.3: tick 中的 LLM 副任务（新闻/叙事/氛围）在后台线程执行，结果在下个 tick 边界应用
+jobs = JobQueue(workers=BG_JOB_WORKERS)
+# v10.10: execute() 里即发即忘的后果（对话关系/社会后果/NPC回嘴、自拍、死亡传承）
+# 在固定大小的线程池里按优先级执行，算完立刻持锁串行写回并发布视图
+deferred = JobQueue(workers=DEFERRED_WORKERS, maxsize=256, name="deferred",
+                    commit_lock=lock, on_commit=lambda: publish_views(*_ACTION_GROUPS, bots=()))
+# v10.23: 每次提交把变化的内容追加进变更日志（组提交），快照退居为检查点，落盘后压缩旧段
+world_log = WorldLog()
+# v10.22: 快照在锁内只拍副本，序列化、fsync 和原子替换在后台写线程，保留最近几代
+snapshots = SnapshotService(SNAPSHOT_PATH, on_written=lambda snap: world_log.compact(snap.get("wal_seq")))
+# v10.24: 事件/朋友圈/留言/墓地/传说/行动日志/公共记忆全量写进 SQLite，内存只留热窗口
+history = get_history_store()
+# v10.25: 快照冷段（历史）在后台恢复，恢复完之前不拍检查点（否则新快照里会缺这段历史）
+cold_restored = Event()
+cold_restored.set()
+# v10.26: 每个 tick 结束拍一份结构共享的内存检查点，供倒带 / 分叉
+checkpoints = TickCheckpoints()
+# v10.4: GET 端点读取的预序列化视图，写者在锁内发布，读者无锁
+views = ViewStore()
+# v10.7: /stream 推送连接，视图发布后唤醒
+stream_hub = StreamHub()
 
 # ============================================================
 # Grok 图像生成（Key 来自 config.get_grok_api_key）
@@ -286,6 +324,9 @@ PERSONAS = {
                "home": "宝安城中村", "start_loc": "华强北", "money": 400, "hp": 100},
 }
 
+# v10.12: 工具解析前的规则意图识别
+intents = IntentParser(LOCATIONS, FOOD_MENU, JOBS, PERSONAS)
+
 FAMILY_RELATIONS = {
     "bot_3": {"parents": ["bot_8"], "children": []},
     "bot_8": {"parents": [], "children": ["bot_3"]},
@@ -384,7 +425,7 @@ world = {
     "events": [],          # 世界事件历史
     "active_effects": [],
     "world_narrative": "这座城市刚刚苏醒，故事还没有开始。",
-    "message_board": [],   # 消息板
+    "message_board": MessageBoard(),   # 消息板 (v10.17: 按收件人分箱的有界收件箱)
     "moments": [],         # 朋友圈 (所有帖子)
     "gallery": [],         # 照片墙
     "food_prices": {},      # v8.3.2: 动态食物价格
@@ -395,9 +436,20 @@ world = {
     "graveyard": [],             # 墓地 (死亡bot的记录)
     "reputation_board": {},      # 全局声望榜 {bot_id: {score, tags, deeds}}
     # === v10.1: 世界规则引擎 ===
-    "active_rules": [],             # 活跃的世界运行规则
+    "active_rules": RuleRegistry(), # 活跃的世界运行规则（v10.21: 按触发方式 × 地点分桶，失效的进归档）
 }
 
+# v10.18: 地点成员与 bot/NPC 名字索引（需持有 lock）
+occupancy = Occupancy(world)
+# v10.19: 居民多时 world_tick 的列式生命体征（需要 numpy）
+vitals = VitalsStore(
+    aging_base=AGING_BASE, hunger_mult=AGING_HUNGER_MULT, overwork_mult=AGING_OVERWORK_MULT,
+    satiety_decay=SATIETY_DECAY, energy_day_cost=ENERGY_DAY_COST,
+    energy_night_recover=ENERGY_NIGHT_RECOVER, energy_sleep_recover=ENERGY_SLEEP_RECOVER,
+    emotion_decay=EMOTION_DECAY, desire_growth=DESIRE_GROWTH_PER_TICK,
+    desire_profiles=BOT_DESIRE_PROFILES, default_profile=DEFAULT_DESIRE_PROFILE,
+)
+
 
 def create_bot(bot_id):
     p = PERSONAS[bot_id]
@@ -455,13 +507,78 @@ def create_bot(bot_id):
     }
 
 
+def _restore_world(snap, exact=False):
+    """把快照结构的 dict 恢复进世界（地点已初始化、bots 为空时调用）。
+    v10.26: 从快照恢复和倒带到内存检查点共用；exact=True 时 bot 的所有字段原样恢复（检查点来自同一进程）"""
+    world["time"] = snap["time"]
+    world["events"] = snap.get("events", [])
+    world["message_board"] = MessageBoard.from_list(snap.get("message_board", []))
+    world["moments"] = snap.get("moments", [])
+    world["gallery"] = snap.get("gallery", [])
+    world["world_narrative"] = snap.get("world_narrative", "")
+    world["news_feed"] = snap.get("news_feed", [])
+    world["hot_topics"] = snap.get("hot_topics", [])
+    world["weather"] = snap.get("weather", world["weather"])
+    world["food_prices"] = snap.get("food_prices", {})
+    # v9.0: 恢复进化引擎数据
+    world["world_modifications"] = snap.get("world_modifications", [])
+    world["urban_legends"] = snap.get("urban_legends", [])
+    world["generation_count"] = snap.get("generation_count", 0)
+    world["graveyard"] = snap.get("graveyard", [])
+    world["reputation_board"] = snap.get("reputation_board", {})
+    world["active_effects"] = snap.get("active_effects", [])  # v10.26: 只有内存检查点带这一段
+    world["active_rules"] = RuleRegistry.from_list(snap.get("active_rules", []), snap.get("rule_archive", []))
+    rejected = compile_rules(world)  # v10.20: 恢复的规则重新编译，不合法的直接停用
+    if rejected:
+        log.warning(f"[RULES] 快照中有{rejected}条规则不合法，已停用")
+
+    for bid, bdata in snap.get("bots", {}).items():
+        bot = create_bot(bid)
+        if exact:
+            bot.update(bdata)
+        else:
+            # 恢复数值
+            for key in ["hp", "money", "energy", "satiety", "status", "job", "location",
+                        "skills", "inventory", "relationships", "action_log", "is_sleeping",
+                        "current_task", "selfie_count", "desires", "emotions",
+                        "phone_battery", "values", "core_memories", "emotional_bonds",
+                        "long_term_goal", "pending_reply_to", "recent_actions_synced",
+                        "narrative_summary", "current_activity",
+                        # v9.0
+                        "reputation", "created_things", "generation",
+                        "inherited_from", "known_legends"]:
+                if key in bdata:
+                    bot[key] = bdata[key]
+        # 家庭关系：如果快照中为空则用默认值
+        family = bdata.get("family", {})
+        if not family or (not family.get("parents") and not family.get("children")):
+            bot["family"] = FAMILY_RELATIONS.get(bid, {"parents": [], "children": []})
+        else:
+            bot["family"] = family
+        # 确保v8新字段存在
+        if "emotions" not in bot or not bot["emotions"]:
+            bot["emotions"] = {"happiness": 50, "sadness": 10, "anger": 5, "anxiety": 20, "loneliness": 30}
+        if "phone_battery" not in bot:
+            bot["phone_battery"] = 100
+        world["bots"][bid] = bot
+        occupancy.spawn(bid)
+
+    # v9.0: 恢复地点的公共记忆和改造
+    for loc_name in world["locations"]:
+        loc_snap = snap.get("locations", {}).get(loc_name, {})
+        if loc_snap:
+            world["locations"][loc_name]["public_memory"] = loc_snap.get("public_memory", [])
+            world["locations"][loc_name]["modifications"] = loc_snap.get("modifications", [])
+            world["locations"][loc_name]["vibe"] = loc_snap.get("vibe", "普通")
+
+
 def init_world():
     # 初始化地点
     for loc_name, loc_data in LOCATIONS.items():
         world["locations"][loc_name] = {
             "desc": loc_data["desc"],
             "type": loc_data["type"],
-            "bots": [],
+            "bots": OccupantSet(),     # v10.18: 保序集合，由 occupancy 维护
             "npcs": generate_npcs(loc_name),
             "items": [],
             "jobs": JOBS.get(loc_name, []),
@@ -470,80 +587,35 @@ def init_world():
             "modifications": [],       # 这个地点的永久改造 [{name, creator, desc, tick}]
             "vibe": "普通",             # 地点氛围(由历史事件塾积而成)
         }
+    occupancy.reset()
 
-    # 尝试从快照恢复
-    snapshot_path = SNAPSHOT_PATH
-    if os.path.exists(snapshot_path):
+    # 尝试从快照恢复（v10.22: 最新一份读不出来时退回上一代；v10.23: 再回放快照之后的变更日志）
+    # v10.25: 这里只读热段，冷段（历史）交给后台线程
+    snap, snapshot_path, cold = snapshots.load()
+    # v10.27: 压缩要等最老一代快照用不到的段，重启后先记下磁盘上各代快照的 wal_seq
+    world_log.seed_checkpoints(snapshots.wal_seqs())
+    try:
+        snap = world_log.replay(snap)
+    except Exception as e:
+        log.error(f"[WAL] 变更日志回放失败，只用快照恢复: {e}")
+    if snap is not None:
         try:
-            with open(snapshot_path, "r") as f:
-                snap = json.load(f)
-            world["time"] = snap["time"]
-            world["events"] = snap.get("events", [])
-            world["message_board"] = snap.get("message_board", [])
-            world["moments"] = snap.get("moments", [])
-            world["gallery"] = snap.get("gallery", [])
-            world["world_narrative"] = snap.get("world_narrative", "")
-            world["news_feed"] = snap.get("news_feed", [])
-            world["hot_topics"] = snap.get("hot_topics", [])
-            world["weather"] = snap.get("weather", world["weather"])
-            world["food_prices"] = snap.get("food_prices", {})
-            # v9.0: 恢复进化引擎数据
-            world["world_modifications"] = snap.get("world_modifications", [])
-            world["urban_legends"] = snap.get("urban_legends", [])
-            world["generation_count"] = snap.get("generation_count", 0)
-            world["graveyard"] = snap.get("graveyard", [])
-            world["reputation_board"] = snap.get("reputation_board", {})
-            world["active_rules"] = snap.get("active_rules", [])
-
-            for bid, bdata in snap.get("bots", {}).items():
-                bot = create_bot(bid)
-                # 恢复数值
-                for key in ["hp", "money", "energy", "satiety", "status", "job", "location",
-                            "skills", "inventory", "relationships", "action_log", "is_sleeping",
-                            "current_task", "selfie_count", "desires", "emotions",
-                            "phone_battery", "values", "core_memories", "emotional_bonds",
-                            "long_term_goal", "pending_reply_to", "recent_actions_synced",
-                            "narrative_summary", "current_activity",
-                            # v9.0
-                            "reputation", "created_things", "generation",
-                            "inherited_from", "known_legends"]:
-                    if key in bdata:
-                        bot[key] = bdata[key]
-                # 家庭关系：如果快照中为空则用默认值
-                family = bdata.get("family", {})
-                if not family or (not family.get("parents") and not family.get("children")):
-                    bot["family"] = FAMILY_RELATIONS.get(bid, {"parents": [], "children": []})
-                else:
-                    bot["family"] = family
-                # 确保v8新字段存在
-                if "emotions" not in bot or not bot["emotions"]:
-                    bot["emotions"] = {"happiness": 50, "sadness": 10, "anger": 5, "anxiety": 20, "loneliness": 30}
-                if "phone_battery" not in bot:
-                    bot["phone_battery"] = 100
-                world["bots"][bid] = bot
-                loc = bot["location"]
-                if loc in world["locations"] and bid not in world["locations"][loc]["bots"]:
-                    world["locations"][loc]["bots"].append(bid)
-
-            # v9.0: 恢复地点的公共记忆和改造
-            for loc_name in world["locations"]:
-                loc_snap = snap.get("locations", {}).get(loc_name, {})
-                if loc_snap:
-                    world["locations"][loc_name]["public_memory"] = loc_snap.get("public_memory", [])
-                    world["locations"][loc_name]["modifications"] = loc_snap.get("modifications", [])
-                    world["locations"][loc_name]["vibe"] = loc_snap.get("vibe", "普通")
-
-            log.info(f"从快照恢复成功: tick={world['time']['tick']}, {len(world['bots'])}个Bot")
+            _restore_world(snap)
+            log.info(f"从快照恢复成功: {snapshot_path} tick={world['time']['tick']}, {len(world['bots'])}个Bot")
+            if cold is not None:
+                # 变更日志回放已经给出的段是更新的值，快照里的冷段跳过
+                _start_cold_restore(cold, {name for name in COLD_SECTIONS if name in snap})
             return
         except Exception as e:
             log.error(f"快照恢复失败: {e}")
+    if cold is not None:
+        cold.close()
 
     # 全新世界
     for bid in PERSONAS:
         bot = create_bot(bid)
         world["bots"][bid] = bot
-        loc = bot["location"]
-        world["locations"][loc]["bots"].append(bid)
+        occupancy.spawn(bid)
 
     # 初始新闻
     inject_news()
@@ -623,9 +695,10 @@ def init_world():
             durability=800, decay_rate=0.01,
         ),
     ]
+    world["active_rules"] = RuleRegistry()
     for sr in seed_rules:
         sr["created_tick"] = 0
-    world["active_rules"] = seed_rules
+        world["active_rules"].add(sr)
     log.info(f"v10.1: 注入{len(seed_rules)}条种子规则")
 
     log.info("全新世界初始化完成")
@@ -685,10 +758,36 @@ def update_weather():
 # ============================================================
 # 新闻/信息注入
 # ============================================================
+def _news_job():
+    """v10.3: 构建新闻/热搜任务（需持有 lock），返回 (compute, apply)。
+    compute 只使用入队时的虚拟时间，不读 world。"""
+    vdt = world["time"]["virtual_datetime"]
+    tick = world["time"]["tick"]
+
+    def compute():
+        return fetch_real_news(vdt, tick), generate_hot_topics(vdt)
+
+    def apply(result):
+        _apply_news(*result)
+
+    return compute, apply
+
+
 def inject_news():
-    """注入新闻到世界中"""
+    """注入新闻到世界中（同步执行，仅用于初始化；tick 中用 schedule_news 走后台队列）"""
+    compute, apply = _news_job()
+    apply(compute())
+
+
+def schedule_news():
+    """v10.3: 把新闻/热搜刷新交给后台队列（需持有 lock）"""
+    compute, apply = _news_job()
+    jobs.submit("news", compute, apply)
+
+
+def _apply_news(real_news, hot_topics):
+    """把新闻和热搜写入世界（需持有 lock）"""
     # 先尝试从真实新闻API获取
-    real_news = fetch_real_news()
     if real_news:
         world["news_feed"] = real_news[-5:]
     else:
@@ -701,11 +800,11 @@ def inject_news():
         ]
 
     # 生成热搜话题
-    world["hot_topics"] = generate_hot_topics()
+    world["hot_topics"] = hot_topics
     log.info(f"📰 新闻注入: {len(world['news_feed'])}条新闻, {len(world['hot_topics'])}个热搜")
 
 
-def fetch_real_news():
+def fetch_real_news(virtual_datetime, tick):
     """尝试从真实新闻源获取深圳相关新闻"""
     try:
         import requests as req
@@ -717,31 +816,32 @@ def fetch_real_news():
 - 涉及深圳的经济、生活、科技、社会等不同方面
 - 有正面也有负面
 - 像真实新闻标题一样简洁
-- 当前虚拟时间: {world['time']['virtual_datetime']}
+- 当前虚拟时间: {virtual_datetime}
 
 只输出3行新闻标题，不要编号，不要其他文字。"""}],
             temperature=0.9, max_tokens=200,
         )
         lines = [l.strip() for l in resp.choices[0].message.content.strip().split("\n") if l.strip()]
         return [
-            {"headline": l, "source": "AI深圳日报", "tick": world["time"]["tick"],
-             "time": world["time"]["virtual_datetime"]}
+            {"headline": l, "source": "AI深圳日报", "tick": tick,
+             "time": virtual_datetime}
             for l in lines[:5]
         ]
     except:
         return []
 
 
-def generate_hot_topics():
+def generate_hot_topics(virtual_datetime):
     """生成热搜话题"""
     try:
         resp = client.chat.completions.create(
             model=OPENAI_MODEL_NANO,
             messages=[{"role": "user", "content": f"""生成5个当前深圳年轻人会讨论的热搜话题。
 要求：包含社会话题、娱乐八卦、生活吐槽等。简短，像微博热搜。
-当前虚拟时间: {world['time']['virtual_datetime']}
+当前虚拟时间: {virtual_datetime}
 只输出5行话题，不要编号。"""}],
             temperature=0.9, max_tokens=150,
+            cache=True,  # v10.11: 同一虚拟时间的热搜直接复用（重启后也不重复请求）
         )
         lines = [l.strip().lstrip("#").strip() for l in resp.choices[0].message.content.strip().split("\n") if l.strip()]
         return lines[:5]
@@ -752,8 +852,159 @@ def generate_hot_topics():
 # ============================================================
 # 世界 Tick
 # ============================================================
+_tick_stats = {"count": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0, "last_jobs_applied": 0}
+
+
+def _tick_vitals(bid, bot, h, weather_mood):
+    """v10.19: 单个 bot 每 tick 的生命体征规则（睡眠恢复、衰老、饱腹/能量/电量、情绪衰减、欲望增长），需持有 lock。
+    睡着的 bot 只做睡眠恢复，返回 False；醒着的返回 True，由 world_tick 继续做死亡检测、工作进度和自动入睡。
+    居民多时 world_tick 改用 vitals_store.VitalsStore 的列式版本，两者规则必须保持一致。"""
+    emotions = bot.get("emotions", {})
+
+    # === 睡眠系统 ===
+    if bot.get("is_sleeping", False):
+        bot["energy"] = min(100, bot["energy"] + ENERGY_SLEEP_RECOVER)
+        bot["satiety"] = max(0, bot["satiety"] - 1)
+        # 睡觉时情绪恢复
+        emotions["anxiety"] = max(0, emotions.get("anxiety", 20) - 3)
+        emotions["anger"] = max(0, emotions.get("anger", 5) - 2)
+        emotions["loneliness"] = max(0, emotions.get("loneliness", 30) - 1)
+        bot["emotions"] = emotions
+        # 手机充电
+        bot["phone_battery"] = min(100, bot.get("phone_battery", 50) + 15)
+        # 自动起床
+        if 7 <= h < 23 and bot["energy"] >= 80:
+            bot["is_sleeping"] = False
+            log.info(f"{bid} 自然醒了 (能量={bot['energy']})")
+        return False
+
+    # === 正常状态: 寿命衰老 ===
+    aging_rate = AGING_BASE
+    # 饥饿加速衰老
+    if bot["satiety"] <= 10:
+        aging_rate *= AGING_HUNGER_MULT
+        if not bot.get("_hunger_warned"):
+            log.warning(f"⚠️ {bid} 饥饿加速衰老! (x{AGING_HUNGER_MULT})")
+            bot["_hunger_warned"] = True
+    else:
+        bot["_hunger_warned"] = False
+    # 过劳加速衰老 (能量<10且没睡觉)
+    if bot["energy"] < 10 and not bot.get("is_sleeping", False):
+        aging_rate *= AGING_OVERWORK_MULT
+        if not bot.get("_overwork_warned"):
+            log.warning(f"⚠️ {bid} 过劳加速衰老! (x{AGING_OVERWORK_MULT})")
+            bot["_overwork_warned"] = True
+    else:
+        bot["_overwork_warned"] = False
+    bot["hp"] = max(0, round(bot["hp"] - aging_rate, 3))
+    bot["aging_rate"] = round(aging_rate, 4)
+    bot["satiety"] = max(0, bot["satiety"] - SATIETY_DECAY)
+
+    # 能量
+    if h >= 22 or h < 6:
+        bot["energy"] = min(100, bot["energy"] + ENERGY_NIGHT_RECOVER)
+    else:
+        bot["energy"] = max(0, bot["energy"] - ENERGY_DAY_COST)
+
+    # 手机电量：自动慢充，作为背景变量不影响决策
+    if bot.get("phone_battery", 100) < 80:
+        bot["phone_battery"] = min(100, bot.get("phone_battery", 100) + random.randint(3, 8))
+    else:
+        bot["phone_battery"] = max(30, bot.get("phone_battery", 100) - random.randint(0, 2))
+
+    # 饥饿惩罚（寿命加速衰老已在上面处理，这里只加情绪影响）
+    if bot["satiety"] <= 0:
+        emotions["sadness"] = min(100, emotions.get("sadness", 10) + 3)
+        emotions["anxiety"] = min(100, emotions.get("anxiety", 20) + 2)
+        log.warning(f"{bid} 饥饿中，加速衰老中!")
+
+    # === 情绪自然衰减/增长 ===
+    for emo_key, decay in EMOTION_DECAY.items():
+        old = emotions.get(emo_key, 0)
+        emotions[emo_key] = max(0, min(100, old + decay))
+
+    # 天气影响情绪
+    for emo_key, delta in weather_mood.items():
+        emotions[emo_key] = max(0, min(100, emotions.get(emo_key, 0) + delta))
+
+    # v8.3: 孤独感重新平衡 - 降低增长速度，提高社交减少量
+    loc = bot["location"]
+    nearby = [b for b in world["locations"].get(loc, {}).get("bots", []) if b != bid]
+    if not nearby:
+        emotions["loneliness"] = min(100, emotions.get("loneliness", 30) + 0.5)
+    else:
+        emotions["loneliness"] = max(0, emotions.get("loneliness", 30) - 5)
+
+    # 金钱焦虑
+    if bot["money"] < 50:
+        emotions["anxiety"] = min(100, emotions.get("anxiety", 20) + 3)
+        emotions["sadness"] = min(100, emotions.get("sadness", 10) + 2)
+    elif bot["money"] < 100:
+        emotions["anxiety"] = min(100, emotions.get("anxiety", 20) + 1)
+
+    # 能量低时疲惫感
+    if bot["energy"] < 20:
+        emotions["sadness"] = min(100, emotions.get("sadness", 10) + 2)
+        emotions["happiness"] = max(0, emotions.get("happiness", 50) - 3)
+
+    # 无聊/无事可做时happiness自然下降
+    # （已经通过EMOTION_DECAY实现）
+
+    bot["emotions"] = emotions
+
+    # === 欲望自然增长 ===
+    desires = bot.get("desires", {})
+    profile = BOT_DESIRE_PROFILES.get(bid, DEFAULT_DESIRE_PROFILE)
+    for d_key, base_growth in DESIRE_GROWTH_PER_TICK.items():
+        mult = profile.get(f"{d_key}_mult", 1.0)
+        if d_key == "security" and (bot["hp"] < 30 or bot["money"] < 50):
+            mult *= 1.5
+        if d_key == "greed" and bot["money"] < 100:
+            mult *= 1.3
+        if d_key == "lust" and bot["energy"] > 60 and bot["satiety"] > 30:
+            mult *= 1.2
+        if d_key == "lust":
+            if h >= 22 or h <= 5:
+                mult *= 1.5
+            gender = bot.get("gender", "")
+            for ob in nearby:
+                other = world["bots"].get(ob, {})
+                if other.get("gender") and other.get("gender") != gender and other.get("status") == "alive":
+                    mult *= 1.3
+                    break
+        old_val = desires.get(d_key, 20)
+        # 欲望超90自动衰减，80-90增长变慢
+        if old_val >= 90:
+            desires[d_key] = max(0, old_val - random.uniform(0.5, 1.5))
+        elif old_val >= 80:
+            desires[d_key] = min(100, old_val + base_growth * mult * 0.3)
+        else:
+            desires[d_key] = min(100, old_val + base_growth * mult)
+    bot["desires"] = desires
+    return True
+
+
+def _tick_vitals_vector(alive, h, weather_mood):
+    """v10.19: _tick_vitals 的列式版本，一次更新所有活着的 bot（需持有 lock）。返回醒着的 [(bot_id, bot)]"""
+    awake, events = vitals.tick(alive, h, weather_mood)
+    bots = world["bots"]
+    for bid in events["woke"]:
+        log.info(f"{bid} 自然醒了 (能量={bots[bid]['energy']})")
+    for bid in events["hunger_warn"]:
+        log.warning(f"⚠️ {bid} 饥饿加速衰老! (x{AGING_HUNGER_MULT})")
+    for bid in events["overwork_warn"]:
+        log.warning(f"⚠️ {bid} 过劳加速衰老! (x{AGING_OVERWORK_MULT})")
+    for bid in events["starving"]:
+        log.warning(f"{bid} 饥饿中，加速衰老中!")
+    return awake
+
+
 def world_tick():
     with lock:
+        # v10.3: 临界区计时；先应用上一轮后台任务的结果（tick 边界）
+        tick_start = time.perf_counter()
+        jobs_applied = jobs.drain()
+
         t = world["time"]
         t["tick"] += 1
         t["virtual_hour"] = (6 + t["tick"]) % 24
@@ -766,153 +1017,35 @@ def world_tick():
         # 每日6:00更新天气和新闻
         if vh == 6 and t["tick"] > 1:
             update_weather()
-            inject_news()
+            schedule_news()
         # 每6个tick也刷新一次新闻和热搜，保持内容新鲜
         elif t["tick"] % 6 == 0:
-            inject_news()
+            schedule_news()
 
         # 天气效果
         weather_info = WEATHER_TYPES.get(world["weather"]["current"], {})
         weather_mood = weather_info.get("mood_effect", {})
 
-        alive_count = 0
-        for bid, bot in world["bots"].items():
-            if bot["status"] != "alive":
-                continue
-            alive_count += 1
-
-            h = t["virtual_hour"]
+        # v10.19: 生命体征。居民数达到 VITALS_VECTOR_MIN_BOTS 且装了 numpy 时整列运算，否则逐 bot 计算
+        h = t["virtual_hour"]
+        alive = [(bid, bot) for bid, bot in world["bots"].items() if bot["status"] == "alive"]
+        alive_count = len(alive)
+        if vitals.enabled and alive_count >= VITALS_VECTOR_MIN_BOTS:
+            awake = _tick_vitals_vector(alive, h, weather_mood)
+        else:
+            awake = [(bid, bot) for bid, bot in alive if _tick_vitals(bid, bot, h, weather_mood)]
+        for bid, bot in awake:
             emotions = bot.get("emotions", {})
 
-            # === 睡眠系统 ===
-            if bot.get("is_sleeping", False):
-                bot["energy"] = min(100, bot["energy"] + ENERGY_SLEEP_RECOVER)
-                bot["satiety"] = max(0, bot["satiety"] - 1)
-                # 睡觉时情绪恢复
-                emotions["anxiety"] = max(0, emotions.get("anxiety", 20) - 3)
-                emotions["anger"] = max(0, emotions.get("anger", 5) - 2)
-                emotions["loneliness"] = max(0, emotions.get("loneliness", 30) - 1)
-                bot["emotions"] = emotions
-                # 手机充电
-                bot["phone_battery"] = min(100, bot.get("phone_battery", 50) + 15)
-                # 自动起床
-                if 7 <= h < 23 and bot["energy"] >= 80:
-                    bot["is_sleeping"] = False
-                    log.info(f"{bid} 自然醒了 (能量={bot['energy']})")
-                continue
-
-            # === 正常状态: 寿命衰老 ===
-            aging_rate = AGING_BASE
-            # 饥饿加速衰老
-            if bot["satiety"] <= 10:
-                aging_rate *= AGING_HUNGER_MULT
-                if not bot.get("_hunger_warned"):
-                    log.warning(f"⚠️ {bid} 饥饿加速衰老! (x{AGING_HUNGER_MULT})")
-                    bot["_hunger_warned"] = True
-            else:
-                bot["_hunger_warned"] = False
-            # 过劳加速衰老 (能量<10且没睡觉)
-            if bot["energy"] < 10 and not bot.get("is_sleeping", False):
-                aging_rate *= AGING_OVERWORK_MULT
-                if not bot.get("_overwork_warned"):
-                    log.warning(f"⚠️ {bid} 过劳加速衰老! (x{AGING_OVERWORK_MULT})")
-                    bot["_overwork_warned"] = True
-            else:
-                bot["_overwork_warned"] = False
-            bot["hp"] = max(0, round(bot["hp"] - aging_rate, 3))
-            bot["aging_rate"] = round(aging_rate, 4)
-            bot["satiety"] = max(0, bot["satiety"] - SATIETY_DECAY)
-
-            # 能量
-            if h >= 22 or h < 6:
-                bot["energy"] = min(100, bot["energy"] + ENERGY_NIGHT_RECOVER)
-            else:
-                bot["energy"] = max(0, bot["energy"] - ENERGY_DAY_COST)
-
-            # 手机电量：自动慢充，作为背景变量不影响决策
-            if bot.get("phone_battery", 100) < 80:
-                bot["phone_battery"] = min(100, bot.get("phone_battery", 100) + random.randint(3, 8))
-            else:
-                bot["phone_battery"] = max(30, bot.get("phone_battery", 100) - random.randint(0, 2))
-
-            # 饥饿惩罚（寿命加速衰老已在上面处理，这里只加情绪影响）
-            if bot["satiety"] <= 0:
-                emotions["sadness"] = min(100, emotions.get("sadness", 10) + 3)
-                emotions["anxiety"] = min(100, emotions.get("anxiety", 20) + 2)
-                log.warning(f"{bid} 饥饿中，加速衰老中!")
-
-            # === 情绪自然衰减/增长 ===
-            for emo_key, decay in EMOTION_DECAY.items():
-                old = emotions.get(emo_key, 0)
-                emotions[emo_key] = max(0, min(100, old + decay))
-
-            # 天气影响情绪
-            for emo_key, delta in weather_mood.items():
-                emotions[emo_key] = max(0, min(100, emotions.get(emo_key, 0) + delta))
-
-            # v8.3: 孤独感重新平衡 - 降低增长速度，提高社交减少量
-            loc = bot["location"]
-            nearby = [b for b in world["locations"].get(loc, {}).get("bots", []) if b != bid]
-            if not nearby:
-                emotions["loneliness"] = min(100, emotions.get("loneliness", 30) + 0.5)
-            else:
-                emotions["loneliness"] = max(0, emotions.get("loneliness", 30) - 5)
-
-            # 金钱焦虑
-            if bot["money"] < 50:
-                emotions["anxiety"] = min(100, emotions.get("anxiety", 20) + 3)
-                emotions["sadness"] = min(100, emotions.get("sadness", 10) + 2)
-            elif bot["money"] < 100:
-                emotions["anxiety"] = min(100, emotions.get("anxiety", 20) + 1)
-
-            # 能量低时疲惫感
-            if bot["energy"] < 20:
-                emotions["sadness"] = min(100, emotions.get("sadness", 10) + 2)
-                emotions["happiness"] = max(0, emotions.get("happiness", 50) - 3)
-
-            # 无聊/无事可做时happiness自然下降
-            # （已经通过EMOTION_DECAY实现）
-
-            bot["emotions"] = emotions
-
-            # === 欲望自然增长 ===
-            desires = bot.get("desires", {})
-            profile = BOT_DESIRE_PROFILES.get(bid, DEFAULT_DESIRE_PROFILE)
-            for d_key, base_growth in DESIRE_GROWTH_PER_TICK.items():
-                mult = profile.get(f"{d_key}_mult", 1.0)
-                if d_key == "security" and (bot["hp"] < 30 or bot["money"] < 50):
-                    mult *= 1.5
-                if d_key == "greed" and bot["money"] < 100:
-                    mult *= 1.3
-                if d_key == "lust" and bot["energy"] > 60 and bot["satiety"] > 30:
-                    mult *= 1.2
-                if d_key == "lust":
-                    if vh >= 22 or vh <= 5:
-                        mult *= 1.5
-                    gender = bot.get("gender", "")
-                    for ob in nearby:
-                        other = world["bots"].get(ob, {})
-                        if other.get("gender") and other.get("gender") != gender and other.get("status") == "alive":
-                            mult *= 1.3
-                            break
-                old_val = desires.get(d_key, 20)
-                # 欲望超90自动衰减，80-90增长变慢
-                if old_val >= 90:
-                    desires[d_key] = max(0, old_val - random.uniform(0.5, 1.5))
-                elif old_val >= 80:
-                    desires[d_key] = min(100, old_val + base_growth * mult * 0.3)
-                else:
-                    desires[d_key] = min(100, old_val + base_growth * mult)
-            bot["desires"] = desires
-
             # 死亡检测
             if bot["hp"] <= 0:
                 bot["status"] = "dead"
                 log.error(f"!!! {bid} 已死亡 !!! HP归零")
-                if bid in world["locations"].get(loc, {}).get("bots", []):
-                    world["locations"][loc]["bots"].remove(bid)
-                # v9.0: 触发代际传承机制
-                Thread(target=handle_bot_death, args=(bid,), daemon=True).start()
+                occupancy.die(bid)
+                _bump_bot_version(bid)
+                # v9.0: 触发代际传承机制（v10.10: 交给 deferred 在本次 tick 之后持锁串行执行）
+                if not deferred.submit(f"death:{bid}@{world['time']['tick']}", None, lambda _, bid=bid: handle_bot_death(bid), priority=PRIORITY_HIGH):
+                    handle_bot_death(bid)
 
             # === 工作进度推进 ===
             task = bot.get("current_task")
@@ -980,12 +1113,10 @@ def world_tick():
                     # 钱不够交租，被驱逐到东门老街
                     bot2["money"] = 0
                     if bot2["location"] == home:
-                        old_loc = bot2["location"]
-                        if bid2 in world["locations"][old_loc]["bots"]:
-                            world["locations"][old_loc]["bots"].remove(bid2)
                         bot2["location"] = "东门老街"
                         bot2["home"] = "东门老街"  # 无家可归
-                        world["locations"]["东门老街"]["bots"].append(bid2)
+                        occupancy.move(bid2, "东门老街")
+                        _bump_bot_version(bid2)
                     log.warning(f"{bid2} 交不起房租，被驱逐到东门老街!")
 
             # v9.0: 年龄增长 (每虚拟1天 = 1岁)
@@ -1025,6 +1156,7 @@ def world_tick():
         # === 被动朋友圈互动：每tick每个bot有概率刷朋友圈点赞 ===
         recent_moments = world.get("moments", [])[-10:]
         if recent_moments:
+            liked = {}
             for bid, bot in world["bots"].items():
                 if bot["status"] != "alive" or bot.get("is_sleeping"):
                     continue
@@ -1033,6 +1165,9 @@ def world_tick():
                         if m["bot_id"] != bid and bid not in m.get("likes", []):
                             if random.random() < 0.4:  # 40%概率点赞
                                 m["likes"].append(bid)
+                                liked[id(m)] = m
+            for m in liked.values():  # v10.24: 点赞变化的朋友圈在历史库里整条替换
+                _record_moment(m)
 
         # === v9.0: 每天传播城市传说 ===
         if vh == 20:
@@ -1072,32 +1207,48 @@ def world_tick():
         except Exception as e:
             log.error(f"[RULES] tick_rules失败: {e}")
 
+        # v10.24: 事件/墓地/传说内存里只留热窗口，完整历史在历史库
+        _trim_hot_windows()
+
         # 清理过期效果
         world["active_effects"] = [e for e in world["active_effects"] if e["expires_tick"] > t["tick"]]
 
-        active_rule_count = sum(1 for r in world.get('active_rules', []) if r.get('active', True))
+        active_rule_count = len(world["active_rules"])
         log.info(f'存活Bot数: {alive_count}/{len(world["bots"])} | 活跃规则: {active_rule_count}')
 
+        elapsed_ms = (time.perf_counter() - tick_start) * 1000
+        _tick_stats["count"] += 1
+        _tick_stats["last_ms"] = elapsed_ms
+        _tick_stats["max_ms"] = max(_tick_stats["max_ms"], elapsed_ms)
+        _tick_stats["total_ms"] += elapsed_ms
+        _tick_stats["last_jobs_applied"] = jobs_applied
+
+        # v10.26: tick 结束拍一份内存检查点（倒带 / 分叉用，不计入 tick 临界区耗时统计）
+        _capture_checkpoint()
+
+        # v10.4: tick 结束后发布只读视图（不计入 tick 临界区耗时统计）
+        publish_views()
+
 
 # distribute_hp 已移除 - 寿命不可逆
 
 
 def _generate_world_narrative(t):
-    """每天22:00生成世界叙事摘要"""
-    try:
-        day = t["virtual_day"]
-        events_today = [e for e in world["events"] if f"第{day}天" in e.get("time", "")]
-        events_text = "; ".join([e["event"] for e in events_today[-5:]]) if events_today else "平静的一天"
-        
-        bot_summaries = []
-        for bid, bot in world["bots"].items():
-            if bot["status"] != "alive":
-                continue
-            recent = bot.get("action_log", [])[-3:]
-            actions = "; ".join([a.get("plan", "")[:30] for a in recent]) if recent else "无"
-            bot_summaries.append(f"{bot['name']}(HP:{bot['hp']:.1f},¥{bot['money']}): {actions}")
-        
-        prompt = f"""你是深圳这座城市的观察者。今天是模拟世界的第{day}天。
+    """每天22:00生成世界叙事摘要。
+    v10.3: 在锁内拼好 prompt，LLM 调用交给后台队列，结果在下个 tick 写回。"""
+    day = t["virtual_day"]
+    events_today = [e for e in world["events"] if f"第{day}天" in e.get("time", "")]
+    events_text = "; ".join([e["event"] for e in events_today[-5:]]) if events_today else "平静的一天"
+    
+    bot_summaries = []
+    for bid, bot in world["bots"].items():
+        if bot["status"] != "alive":
+            continue
+        recent = bot.get("action_log", [])[-3:]
+        actions = "; ".join([a.get("plan", "")[:30] for a in recent]) if recent else "无"
+        bot_summaries.append(f"{bot['name']}(HP:{bot['hp']:.1f},¥{bot['money']}): {actions}")
+    
+    prompt = f"""你是深圳这座城市的观察者。今天是模拟世界的第{day}天。
 天气: {world['weather']['current']}
 今天发生的事件: {events_text}
 居民动态:
@@ -1105,27 +1256,86 @@ def _generate_world_narrative(t):
 
 请用2-3句话写一段"城市日记"，像一个旁观者记录这座城市今天的故事。
 要求：有文学感，关注人物命运，不要列举。只输出日记内容。"""
-        
+
+    def compute():
         resp = client.chat.completions.create(
             model=OPENAI_MODEL_NANO,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.8, max_tokens=150,
         )
-        narrative = resp.choices[0].message.content.strip()
+        return resp.choices[0].message.content.strip()
+
+    def apply(narrative):
         world["world_narrative"] = narrative
         log.info(f"📖 世界叙事: {narrative}")
-    except Exception as e:
-        log.error(f"世界叙事生成失败: {e}")
+
+    jobs.submit("world_narrative", compute, apply)
+
+
+# ============================================================
+# v10.24 历史：内存热窗口 + 历史库
+# ============================================================
+def add_world_event(entry, bot_id=None, location=None, event_type="world"):
+    """追加一条世界事件并记进历史库（需持有 lock）。内存里的列表由 _trim_hot_windows 截到热窗口"""
+    world["events"].append(entry)
+    history.record("event", entry, tick=entry.get("tick"), bot=bot_id, location=location, type=event_type)
+    return entry
+
+
+def _log_action(bot, entry):
+    """追加一条行动日志并记进历史库（需持有 lock），内存里只留最近 30~50 条"""
+    bot["action_log"].append(entry)
+    act = entry.get("tool_call") or entry.get("action")
+    act_type = (act.get("tool") or act.get("type") or act.get("category")) if isinstance(act, dict) else None
+    history.record("action", entry, tick=entry.get("tick"), bot=bot.get("id"), location=bot.get("location"), type=act_type)
+    if len(bot["action_log"]) > 50:
+        bot["action_log"] = bot["action_log"][-30:]
+
+
+def _record_moment(moment):
+    """朋友圈按 id 记进历史库；点赞、评论之后再调用一次，整条替换"""
+    history.record("moment", moment, tick=moment.get("tick"), bot=moment.get("bot_id"),
+                   location=moment.get("location"), key=moment.get("id"))
+
+
+def _record_legend(legend):
+    """城市传说按 id 记进历史库；传播次数变化后再调用一次，整条替换"""
+    history.record("legend", legend, tick=legend.get("origin_tick"), bot=legend.get("original_bot"),
+                   location=legend.get("location"), key=legend.get("id"))
+
+
+_history_message_seq = 0  # 已记进历史库的留言板 seq
+
+
+def _record_messages():
+    """把上次之后投递的留言按 seq 记进历史库（publish_views 里调用，需持有 lock）。
+    留言的 bot 列是收件人，type 列是发件人"""
+    global _history_message_seq
+    board = world["message_board"]
+    if board.seq < _history_message_seq:  # 换了一块新留言板（重置世界）
+        _history_message_seq = 0
+    for m in board.since(_history_message_seq):
+        history.record("message", m, tick=m.get("tick"), bot=m.get("to") or "public", type=m.get("from"), key=m["seq"])
+    _history_message_seq = board.seq
+
+
+def _trim_hot_windows():
+    """事件、墓地、城市传说内存里只留最近的一段（需持有 lock），更早的在历史库里查"""
+    for key, keep in (("events", HISTORY_HOT_EVENTS), ("graveyard", HISTORY_HOT_GRAVES),
+                      ("urban_legends", HISTORY_HOT_LEGENDS)):
+        items = world.get(key)
+        if items and len(items) > max(1, keep):
+            world[key] = items[-max(1, keep):]
 
 
 def trigger_event():
     event = random.choice(RANDOM_EVENTS)
-    world["events"].append({
+    add_world_event({
         "tick": world["time"]["tick"],
         "time": world["time"]["virtual_datetime"],
         "event": event["name"],
         "desc": event["desc"],
-    })
+    }, event_type="random")
     world["active_effects"].append({
         "effect": event["effect"],
         "expires_tick": world["time"]["tick"] + 2,
@@ -1234,7 +1444,7 @@ def trigger_personal_fate(bot_id=None):
         bot["current_task"] = None
 
     # 通过消息板发送给目标bot，让它在下一次心跳时感知到
-    world["message_board"].append({
+    fate_msg = world["message_board"].post({
         "to": target,
         "from": "fate",
         "msg": f"【命运事件】{event['name']}: {event['desc']}",
@@ -1243,12 +1453,12 @@ def trigger_personal_fate(bot_id=None):
     })
 
     # 记录到世界事件
-    world["events"].append({
+    add_world_event({
         "tick": world["time"]["tick"],
         "time": world["time"]["virtual_datetime"],
         "event": f"{bot['name']}: {event['name']}",
         "desc": event["desc"],
-    })
+    }, target, bot["location"], "fate")
 
     # 如果涉及其他bot（借钱、八卦），随机选择一个附近的bot作为关联方
     if event.get("social"):
@@ -1259,9 +1469,9 @@ def trigger_personal_fate(bot_id=None):
             other_name = world["bots"][other].get("name", "?")
             if event["social"] == "borrow_request":
                 # 让目标bot知道是谁借钱
-                world["message_board"][-1]["msg"] += f" (是{other_name}向你借钱)"
+                fate_msg["msg"] += f" (是{other_name}向你借钱)"
             elif event["social"] == "gossip_victim":
-                world["message_board"][-1]["msg"] += f" (似乎是{other_name}在说)"
+                fate_msg["msg"] += f" (似乎是{other_name}在说)"
 
     log.warning(f'☄️ 命运事件: {bot["name"]}({target}) - {event["name"]}')
 
@@ -1322,6 +1532,7 @@ def judge_world_modification(bot_id, bot, action_desc, result_narrative):
             model=OPENAI_MODEL_NANO,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3, max_tokens=200,
+            cache=True,  # v10.11: 常见计划的判断结果可复用
         )
         raw = resp.choices[0].message.content.strip()
         if raw.startswith("```"): raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
@@ -1376,12 +1587,12 @@ def judge_world_modification(bot_id, bot, action_desc, result_narrative):
         add_public_memory(loc, f"{bot.get('name', bot_id)}在这里{data.get('desc', '')}", bot_id, "creation")
         
         # 广播给所有人
-        world["events"].append({
+        add_world_event({
             "tick": world["time"]["tick"],
             "time": world["time"]["virtual_datetime"],
             "event": f"🌟 {bot.get('name', bot_id)}创造了[{data.get('name', '')}]",
             "desc": data.get("desc", ""),
-        })
+        }, bot_id, loc, "creation")
         
         # 如果是开店/摆摊，添加新的工作机会
         if mod_type in ("open_shop", "start_business"):
@@ -1429,6 +1640,7 @@ def add_public_memory(location, event_desc, actor_id, impact_type="neutral"):
     }
     loc = world["locations"][location]
     loc["public_memory"].append(memory_entry)
+    history.record("memory", memory_entry, tick=memory_entry["tick"], bot=actor_id, location=location, type=impact_type)
     # 保留最近30条
     if len(loc["public_memory"]) > 30:
         loc["public_memory"] = loc["public_memory"][-25:]
@@ -1439,17 +1651,14 @@ def add_public_memory(location, event_desc, actor_id, impact_type="neutral"):
 
 
 def _update_location_vibe(location):
-    """根据公共记忆更新地点氛围"""
-    try:
-        loc = world["locations"][location]
-        memories = loc["public_memory"][-15:]
-        mem_text = "\n".join([f"- {m['event']} ({m['impact']})" for m in memories])
-        mods = loc.get("modifications", [])[-5:]
-        mods_text = "\n".join([f"- {m['name']}: {m['desc']}" for m in mods]) if mods else "无"
-        
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL_NANO,
-            messages=[{"role": "user", "content": f"""根据以下历史事件，用一个词或短语描述这个地点的氛围。
+    """根据公共记忆更新地点氛围。
+    v10.3: 锁内拼 prompt，LLM 调用交给后台队列（同一地点未完成时不重复入队）。"""
+    loc = world["locations"][location]
+    memories = loc["public_memory"][-15:]
+    mem_text = "\n".join([f"- {m['event']} ({m['impact']})" for m in memories])
+    mods = loc.get("modifications", [])[-5:]
+    mods_text = "\n".join([f"- {m['name']}: {m['desc']}" for m in mods]) if mods else "无"
+    prompt = f"""根据以下历史事件，用一个词或短语描述这个地点的氛围。
 
 地点: {location}
 原始描述: {loc['desc']}
@@ -1461,14 +1670,21 @@ def _update_location_vibe(location):
 {mods_text}
 
 请用一个词或短语描述氛围(如"温馨的"/"紧张的"/"充满创意的"/"冷漠的"/"热闹的"):
-只输出氛围词，不要其他文字。"""}],
+只输出氛围词，不要其他文字。"""
+
+    def compute():
+        resp = client.chat.completions.create(
+            model=OPENAI_MODEL_NANO,
+            messages=[{"role": "user", "content": prompt}],
             temperature=0.5, max_tokens=20,
         )
-        vibe = resp.choices[0].message.content.strip().strip('"').strip()
-        loc["vibe"] = vibe[:10]  # 限制长度
+        return resp.choices[0].message.content.strip().strip('"').strip()
+
+    def apply(vibe):
+        world["locations"][location]["vibe"] = vibe[:10]  # 限制长度
         log.info(f"[v9.0] {location} 氛围更新为: {vibe}")
-    except Exception as e:
-        log.error(f"[v9.0] 氛围更新失败: {e}")
+
+    jobs.submit(f"vibe:{location}", compute, apply)
 
 
 def update_reputation(bot_id, delta, deed_desc):
@@ -1561,6 +1777,8 @@ def handle_bot_death(bot_id):
     bot = world["bots"].get(bot_id)
     if not bot:
         return
+    # v10.27: 遗产、传说、新居民牵动很多 bot，提交后刷新所有 bot 的视图
+    _touch_bots(*world["bots"])
     
     bot_name = bot.get("name", bot_id)
     loc = bot["location"]
@@ -1595,7 +1813,7 @@ def handle_bot_death(bot_id):
     if closest_contact and inheritance > 0:
         world["bots"][closest_contact]["money"] += inheritance
         heir_name = world["bots"][closest_contact].get("name", closest_contact)
-        world["message_board"].append({
+        world["message_board"].post({
             "to": closest_contact, "from": "system",
             "msg": f"【遗产】{bot_name}已经离开了这个世界。作为最亲近的人，你继承了{inheritance}元遗产。",
             "tick": world["time"]["tick"], "priority": "high",
@@ -1607,10 +1825,10 @@ def handle_bot_death(bot_id):
     if core_memories:
         # 选取最重要的记忆转化为传说
         best_memories = core_memories[-3:]  # 最近3条
-        for mem in best_memories:
+        for i, mem in enumerate(best_memories):
             summary = mem.get("summary", "") if isinstance(mem, dict) else str(mem)
             legend = {
-                "id": f"legend_{world['time']['tick']}_{bot_id}",
+                "id": f"legend_{world['time']['tick']}_{bot_id}_{i}",  # v10.27: 同一次死亡的几条传说各自一个 id
                 "original_bot": bot_id,
                 "original_name": bot_name,
                 "content": summary,
@@ -1620,6 +1838,7 @@ def handle_bot_death(bot_id):
                 "spread_count": 0,  # 传播次数
             }
             world["urban_legends"].append(legend)
+            _record_legend(legend)
         log.info(f"  {len(best_memories)}条核心记忆转化为城市传说")
     
     # === 3. 记录到墓地 ===
@@ -1639,6 +1858,7 @@ def handle_bot_death(bot_id):
         "narrative_summary": bot.get("narrative_summary", ""),
     }
     world["graveyard"].append(grave)
+    history.record("grave", grave, tick=grave["death_tick"], bot=bot_id, location=loc)
     
     # === 4. 地点公共记忆 ===
     add_public_memory(loc, f"{bot_name}在这里离开了世界", bot_id, "death")
@@ -1648,7 +1868,7 @@ def handle_bot_death(bot_id):
     for target_id in bonds:
         if target_id.startswith("bot_") and target_id in world["bots"]:
             if world["bots"][target_id]["status"] == "alive":
-                world["message_board"].append({
+                world["message_board"].post({
                     "to": target_id, "from": "system",
                     "msg": f"【讣告】{bot_name}已经离开了这个世界。",
                     "tick": world["time"]["tick"], "priority": "high",
@@ -1658,12 +1878,12 @@ def handle_bot_death(bot_id):
     _spawn_new_generation_bot(bot_id, bot)
     
     # 世界事件
-    world["events"].append({
+    add_world_event({
         "tick": world["time"]["tick"],
         "time": world["time"]["virtual_datetime"],
         "event": f"💀 {bot_name}离开了这个世界",
         "desc": f"{bot_name}的一生结束了。{bot.get('narrative_summary', '')}",
-    })
+    }, bot_id, loc, "death")
 
 
 def _spawn_new_generation_bot(dead_bot_id, dead_bot):
@@ -1733,9 +1953,7 @@ def _spawn_new_generation_bot(dead_bot_id, dead_bot):
     
     # 放入世界
     world["bots"][dead_bot_id] = new_bot
-    loc = new_bot["location"]
-    if loc in world["locations"] and dead_bot_id not in world["locations"][loc]["bots"]:
-        world["locations"][loc]["bots"].append(dead_bot_id)
+    occupancy.spawn(dead_bot_id)
     
     # 启动新的bot_agent进程
     try:
@@ -1755,21 +1973,23 @@ def _spawn_new_generation_bot(dead_bot_id, dead_bot):
         with open(os.path.join(PROJECT_ROOT, f"persona_override_{dead_bot_id}.json"), "w") as f:
             json.dump(persona_override, f, ensure_ascii=False)
         
-        subprocess.Popen(
-["python3", BOT_AGENT_SCRIPT],
-        env=dict(os.environ, BOT_ID=dead_bot_id)
-        )
+        # v10.14: runner 模式下由 bot_runner 自己发现新居民，不再单独拉起进程
+        if not BOT_RUNNER_SHARDS:
+            subprocess.Popen(
+                ["python3", BOT_AGENT_SCRIPT],
+                env=dict(os.environ, BOT_ID=dead_bot_id)
+            )
         log.info(f"  新bot {template['name']}({dead_bot_id}) 已生成并启动 (第{gen}代)")
     except Exception as e:
         log.error(f"  启动新bot失败: {e}")
     
     # 全局事件
-    world["events"].append({
+    add_world_event({
         "tick": world["time"]["tick"],
         "time": world["time"]["virtual_datetime"],
         "event": f"🌟 新居民{template['name']}来到了深圳",
         "desc": f"来自{template['origin']}的{template['name']}，{template['bg'][:30]}",
-    })
+    }, dead_bot_id, event_type="birth")
 
 
 def spread_urban_legends():
@@ -1787,7 +2007,8 @@ def spread_urban_legends():
                 known.append(legend["id"])
                 bot["known_legends"] = known[-10:]  # 最多记住10个
                 legend["spread_count"] = legend.get("spread_count", 0) + 1
-                world["message_board"].append({
+                _record_legend(legend)
+                world["message_board"].post({
                     "to": bot_id, "from": "rumor",
                     "msg": f"【城市传说】听说{legend['original_name']}曾经: {legend['content'][:60]}",
                     "tick": world["time"]["tick"], "priority": "normal",
@@ -1805,7 +2026,7 @@ def process_action(bot_id, plan):
     if plan.strip() in ("起床", "醒来", "起来"):
         action = {"category": "survive", "type": "wake_up", "desc": plan}
         result = execute(bot_id, action)
-        bot["action_log"].append({
+        _log_action(bot, {
             "tick": world["time"]["tick"],
             "time": world["time"]["virtual_datetime"],
             "plan": plan, "action": action, "result": result
@@ -1914,15 +2135,13 @@ def process_action(bot_id, plan):
         action = {"category": "free", "desc": plan}
 
     result = execute(bot_id, action)
-    bot["action_log"].append({
+    _log_action(bot, {
         "tick": world["time"]["tick"],
         "time": world["time"]["virtual_datetime"],
         "plan": plan,
         "action": action,
         "result": result
     })
-    if len(bot["action_log"]) > 50:
-        bot["action_log"] = bot["action_log"][-30:]
 
     # v8.4: 更新当前活动描述（供其他bot观察）
     activity_desc = action.get("desc", "")[:40] if action.get("desc") else plan[:40]
@@ -1964,10 +2183,8 @@ def execute(bot_id, action):
                 return interpret_free_action(bot_id, bot, desc or f"在{dest}随便逛逛")
         if dest in LOCATIONS and dest != bot["location"]:
             old_loc = bot["location"]
-            if bot_id in world["locations"][old_loc]["bots"]:
-                world["locations"][old_loc]["bots"].remove(bot_id)
             bot["location"] = dest
-            world["locations"][dest]["bots"].append(bot_id)
+            occupancy.move(bot_id, dest)
             bot["energy"] = max(0, bot["energy"] - 5)
             # 台风天移动有风险
             if world["weather"]["current"] == "台风":
@@ -2060,7 +2277,7 @@ def execute(bot_id, action):
     elif act == "talk":
         target = action.get("target", "")
         message = action.get("message", "你好")
-        world["message_board"].append({
+        world["message_board"].post({
             "tick": world["time"]["tick"],
             "time": world["time"]["virtual_datetime"],
             "from": bot_id,
@@ -2089,33 +2306,29 @@ def execute(bot_id, action):
         log.info(f"{bot_id}: {msg}")
 
         # === 互动后更新双方关系记忆 ===
-        def _update_bonds_after_talk():
-            try:
-                bot_name = bot.get("name", bot_id)
-                # 确定对方信息
-                if target.startswith("bot_") and target in world["bots"]:
-                    target_bot = world["bots"][target]
-                    target_name = target_bot.get("name", target)
-                    target_personality = target_bot.get("personality", "")
-                else:
-                    # NPC
-                    target_name = target
-                    target_personality = ""
-                    for loc_data in world["locations"].values():
-                        for npc in loc_data.get("npcs", []):
-                            if npc.get("name") == target:
-                                target_personality = npc.get("personality", npc.get("desc", ""))
-                                break
-
-                # 获取双方之前的互动历史
-                prev_interactions = []
-                for entry in bot.get("action_log", [])[-20:]:
-                    entry_str = str(entry.get("result", "")) + str(entry.get("plan", ""))
-                    if target_name in entry_str or target in entry_str:
-                        prev_interactions.append(entry_str[:80])
-                history_text = "\n".join(prev_interactions[-5:]) if prev_interactions else "这是第一次互动"
-
-                bond_prompt = f"""两个人刚刚进行了一次对话。请判断这次互动给双方留下了什么印象。
+        # v10.10: 对话的三个后果（关系、社会后果、NPC回嘴）不再各起一个线程：
+        # 提示词在锁内拼好，LLM 在 deferred 工作线程里调用，结果持锁串行写回
+        bot_name = bot.get("name", bot_id)
+        # 确定对方信息
+        if target.startswith("bot_") and target in world["bots"]:
+            target_bot = world["bots"][target]
+            target_name = target_bot.get("name", target)
+            target_personality = target_bot.get("personality", "")
+        else:
+            # NPC
+            target_name = target
+            npc = occupancy.npc(target, bot["location"])
+            target_personality = npc.get("personality", npc.get("desc", "")) if npc else ""
+
+        # 获取双方之前的互动历史
+        prev_interactions = []
+        for entry in bot.get("action_log", [])[-20:]:
+            entry_str = str(entry.get("result", "")) + str(entry.get("plan", ""))
+            if target_name in entry_str or target in entry_str:
+                prev_interactions.append(entry_str[:80])
+        history_text = "\n".join(prev_interactions[-5:]) if prev_interactions else "这是第一次互动"
+
+        bond_prompt = f"""两个人刚刚进行了一次对话。请判断这次互动给双方留下了什么印象。
 
 {bot_name}对{target_name}说: "{message}"
 
@@ -2136,19 +2349,23 @@ def execute(bot_id, action):
 warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降温。
 只输出JSON。"""
 
-                resp = client.chat.completions.create(
-                    model=OPENAI_MODEL_NANO,
-                    messages=[{"role": "user", "content": bond_prompt}],
-                    temperature=0.4, max_tokens=200,
-                )
-                raw = resp.choices[0].message.content.strip()
-                if raw.startswith("```"): raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-                start = raw.find("{")
-                end = raw.rfind("}") + 1
-                if start >= 0 and end > start:
-                    raw = raw[start:end]
-                bond_data = json.loads(raw)
+        def _talk_bonds_compute():
+            resp = client.chat.completions.create(
+                model=OPENAI_MODEL_NANO,
+                messages=[{"role": "user", "content": bond_prompt}],
+                temperature=0.4, max_tokens=200,
+            )
+            raw = resp.choices[0].message.content.strip()
+            if raw.startswith("```"): raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
+            start = raw.find("{")
+            end = raw.rfind("}") + 1
+            if start >= 0 and end > start:
+                raw = raw[start:end]
+            return json.loads(raw)
 
+        def _update_bonds_after_talk(bond_data):
+            _touch_bots(bot_id, target)
+            try:
                 # 更新发起者的bonds
                 if "emotional_bonds" not in bot:
                     bot["emotional_bonds"] = {}
@@ -2186,12 +2403,11 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
             except Exception as e:
                 log.error(f"[关系更新失败] {bot_id}->{target}: {e}")
 
-        Thread(target=_update_bonds_after_talk, daemon=True).start()
+        talk_key = f"{bot_id}->{target}@{world['time']['tick']}"
+        deferred.submit(f"talk_bonds:{talk_key}", _talk_bonds_compute, _update_bonds_after_talk, priority=PRIORITY_LOW)
 
         # === v8.4: 对话后果判定 — 让说话有重量 ===
-        def _judge_talk_consequences():
-            try:
-                consequence_prompt = f"""两个人刚刚进行了一次对话。请判断这次对话是否产生了以下任何一种社会后果。
+        consequence_prompt = f"""两个人刚刚进行了一次对话。请判断这次对话是否产生了以下任何一种社会后果。
 
 {bot.get('name', bot_id)}对{target}说: "{message}"
 
@@ -2204,21 +2420,26 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
   "promise_content": "如果是承诺，承诺了什么"
 }}}}
 只输出JSON。"""
-                resp = client.chat.completions.create(
-                    model=OPENAI_MODEL_NANO,
-                    messages=[{"role": "user", "content": consequence_prompt}],
-                    temperature=0.3, max_tokens=150,
-                )
-                raw = resp.choices[0].message.content.strip()
-                if raw.startswith("```"): raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-                start = raw.find("{")
-                end = raw.rfind("}") + 1
-                if start >= 0 and end > start:
-                    raw = raw[start:end]
-                cdata = json.loads(raw)
 
+        def _talk_consequence_compute():
+            resp = client.chat.completions.create(
+                model=OPENAI_MODEL_NANO,
+                messages=[{"role": "user", "content": consequence_prompt}],
+                temperature=0.3, max_tokens=150,
+            )
+            raw = resp.choices[0].message.content.strip()
+            if raw.startswith("```"): raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
+            start = raw.find("{")
+            end = raw.rfind("}") + 1
+            if start >= 0 and end > start:
+                raw = raw[start:end]
+            return json.loads(raw)
+
+        def _judge_talk_consequences(cdata):
+            try:
                 if not cdata.get("has_consequence"):
                     return
+                _touch_bots(bot_id, target)
 
                 ctype = cdata.get("type", "none")
                 detail = cdata.get("detail", "")
@@ -2227,20 +2448,19 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
                     # 八卦传播：将信息传递给第三方
                     gossip_target = cdata["gossip_about"]
                     # 找到被八卦的bot
-                    for bid2, b2 in world["bots"].items():
-                        if b2.get("name") == gossip_target and bid2 != bot_id and bid2 != target:
-                            world["message_board"].append({
-                                "to": bid2, "from": "rumor",
-                                "msg": f"【流言】有人在背后议论你: {detail}",
-                                "tick": world["time"]["tick"], "priority": "normal",
-                            })
-                            log.info(f"[八卦传播] {bot_id}和{target}在议论{gossip_target}: {detail}")
-                            break
+                    bid2 = occupancy.bot_named(gossip_target)
+                    if bid2 and bid2 != bot_id and bid2 != target:
+                        world["message_board"].post({
+                            "to": bid2, "from": "rumor",
+                            "msg": f"【流言】有人在背后议论你: {detail}",
+                            "tick": world["time"]["tick"], "priority": "normal",
+                        })
+                        log.info(f"[八卦传播] {bot_id}和{target}在议论{gossip_target}: {detail}")
 
                 elif ctype == "promise":
                     # 记录承诺，待实现
                     promise = cdata.get("promise_content", detail)
-                    bot["action_log"].append({
+                    _log_action(bot, {
                         "tick": world["time"]["tick"],
                         "time": world["time"]["virtual_datetime"],
                         "plan": f"承诺: {promise}",
@@ -2268,7 +2488,7 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
                 elif ctype == "request":
                     # 请求帮助，通知对方
                     if target.startswith("bot_") and target in world["bots"]:
-                        world["message_board"].append({
+                        world["message_board"].post({
                             "to": target, "from": bot_id,
                             "msg": f"【请求】{bot.get('name', bot_id)}向你提出了请求: {detail}",
                             "tick": world["time"]["tick"], "priority": "high",
@@ -2278,38 +2498,29 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
             except Exception as e:
                 log.error(f"[对话后果判定失败] {bot_id}->{target}: {e}")
 
-        Thread(target=_judge_talk_consequences, daemon=True).start()
+        deferred.submit(f"talk_consequence:{talk_key}", _talk_consequence_compute, _judge_talk_consequences)
 
         # === NPC会“回嘴”：用LLM生成NPC的回应 ===
         # NPC互动计数（用于NPC演化）
         if not target.startswith("bot_"):
-            for loc_data in world["locations"].values():
-                for npc in loc_data.get("npcs", []):
-                    if npc.get("name") == target:
-                        npc["interaction_count"] = npc.get("interaction_count", 0) + 1
+            for npc in occupancy.npcs_named(target):
+                npc["interaction_count"] = npc.get("interaction_count", 0) + 1
         npc_reply = ""
         if not target.startswith("bot_"):
-            def _generate_npc_reply():
-                try:
-                    # 找到NPC信息
-                    npc_info = None
-                    for loc_data in world["locations"].values():
-                        for npc in loc_data.get("npcs", []):
-                            if npc.get("name") == target:
-                                npc_info = npc
-                                break
-                    npc_desc = npc_info.get("desc", "") if npc_info else ""
-                    npc_personality = npc_info.get("personality", npc_desc) if npc_info else target
-
-                    # 获取之前的互动历史
-                    prev = []
-                    for entry in bot.get("action_log", [])[-20:]:
-                        r = str(entry.get("result", ""))
-                        if target in r:
-                            prev.append(r[:80])
-                    history = "\n".join(prev[-5:]) if prev else "这是他们第一次聊天"
-
-                    npc_prompt = f"""你是{target}，一个深圳的NPC。
+            # 找到NPC信息
+            npc_info = occupancy.npc(target, bot["location"])
+            npc_desc = npc_info.get("desc", "") if npc_info else ""
+            npc_personality = npc_info.get("personality", npc_desc) if npc_info else target
+
+            # 获取之前的互动历史
+            prev = []
+            for entry in bot.get("action_log", [])[-20:]:
+                r = str(entry.get("result", ""))
+                if target in r:
+                    prev.append(r[:80])
+            history = "\n".join(prev[-5:]) if prev else "这是他们第一次聊天"
+
+            npc_prompt = f"""你是{target}，一个深圳的NPC。
 你的身份: {npc_personality}
 
 有人对你说: "{message}"
@@ -2321,14 +2532,18 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
 请用一句话回应，符合你的身份和性格。考虑之前的互动历史，不要每次都像第一次见面。
 只输出回应内容，不要加任何前缀。"""
 
-                    resp = client.chat.completions.create(
-                        model=OPENAI_MODEL_NANO,
-                        messages=[{"role": "user", "content": npc_prompt}],
-                        temperature=0.7, max_tokens=80,
-                    )
-                    reply = resp.choices[0].message.content.strip().strip('"')
+            def _npc_reply_compute():
+                resp = client.chat.completions.create(
+                    model=OPENAI_MODEL_NANO,
+                    messages=[{"role": "user", "content": npc_prompt}],
+                    temperature=0.7, max_tokens=80,
+                )
+                return resp.choices[0].message.content.strip().strip('"')
+
+            def _generate_npc_reply(reply):
+                try:
                     # 把NPC回应写入消息板
-                    world["message_board"].append({
+                    world["message_board"].post({
                         "tick": world["time"]["tick"],
                         "time": world["time"]["virtual_datetime"],
                         "from": target,
@@ -2340,7 +2555,7 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
                 except Exception as e:
                     log.error(f"[NPC回应失败] {target}: {e}")
 
-            Thread(target=_generate_npc_reply, daemon=True).start()
+            deferred.submit(f"npc_reply:{talk_key}", _npc_reply_compute, _generate_npc_reply)
 
         return msg
 
@@ -2418,6 +2633,7 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
             "comments": [],
         }
         world["moments"].append(moment)
+        _record_moment(moment)
         if len(world["moments"]) > 200:
             world["moments"] = world["moments"][-150:]
         # 发朋友圈满足虚荣心，降低孤独感
@@ -2450,6 +2666,7 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
             for m in recent_moments:
                 if m["bot_id"] != bot_id and bot_id not in m.get("likes", []) and random.random() < 0.3:
                     m["likes"].append(bot_id)
+                    _record_moment(m)
         else:
             topics = world.get("hot_topics", [])[:3]
             info_gathered = topics
@@ -2559,7 +2776,7 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
         target_name = target.get("name", target_id)
         msg = f"和{target_name}发展了亲密关系。双方感情升温，欲望得到释放。(能量-10)"
         log.warning(f"{bot_id}: {msg}")
-        target["action_log"].append({
+        _log_action(target, {
             "tick": world["time"]["tick"],
             "action": f"{bot.get('name', bot_id)}与你发展了亲密关系",
             "result": "感情升温，欲望释放"
@@ -2581,32 +2798,33 @@ warmth_delta范围-10到+10，正数表示关系升温，负数表示关系降
         bot["desires"] = desires
         bot["emotions"] = emotions
 
+        # v10.10: 生图在 deferred 工作线程里离锁执行，结果由 deferred 持锁写回
         def _gen():
-            result = grok_generate(selfie_prompt, save_path)
+            return grok_generate(selfie_prompt, save_path)
+
+        def _save_selfie(result):
             if result["success"]:
-                with lock:
-                    world["gallery"].append({
-                        "bot_id": bot_id,
-                        "bot_name": bot.get("name", bot_id),
-                        "filename": filename,
-                        "prompt": selfie_prompt,
-                        "time": world["time"]["virtual_datetime"],
-                        "tick": tick,
-                        "url": f"/selfies/{filename}"
-                    })
+                world["gallery"].append({
+                    "bot_id": bot_id,
+                    "bot_name": bot.get("name", bot_id),
+                    "filename": filename,
+                    "prompt": selfie_prompt,
+                    "time": world["time"]["virtual_datetime"],
+                    "tick": tick,
+                    "url": f"/selfies/{filename}"
+                })
                 log.info(f"{bot_id} 拍照成功: {filename}")
             else:
                 err = result.get('error', '未知错误')
                 log.error(f"{bot_id} 拍照失败: {err}")
                 # v8.3.2: 优雅降级 - 记录失败体验而不是静默失败
-                with lock:
-                    world["events"].append({
-                        "tick": tick,
-                        "time": world["time"]["virtual_datetime"],
-                        "desc": f"{bot.get('name', bot_id)}想拍照但手机信号不好，没拍成"
-                    })
+                add_world_event({
+                    "tick": tick,
+                    "time": world["time"]["virtual_datetime"],
+                    "desc": f"{bot.get('name', bot_id)}想拍照但手机信号不好，没拍成"
+                }, bot_id, bot.get("location"), "selfie_failed")
 
-        Thread(target=_gen, daemon=True).start()
+        deferred.submit(f"selfie:{filename}", _gen, _save_selfie, priority=PRIORITY_LOW)
         msg = f"📸 正在拍照: {selfie_prompt[:60]}..."
         log.info(f"{bot_id}: {msg}")
         return msg
@@ -2718,18 +2936,13 @@ def interpret_free_action(bot_id, bot, desc):
 # v10.0: Generic 工具系统 + 反馈循环
 # ============================================================
 
-def execute_generic(bot_id, tool_call):
-    """v10.0 核心：执行 generic 工具调用，返回丰富的后果反馈。
-    5个工具: use_resource / interact / move / create / express
-    所有后果由 LLM 判断，不再硬编码。"""
+def _build_generic_context(bot_id):
+    """v10.2: 构建 generic 工具的世界上下文文本（需持有 lock）。
+    只依赖角色与地点状态，与具体工具调用无关，可在行动快照阶段提前生成。"""
     bot = world["bots"][bot_id]
-    tool = tool_call.get("tool", "")
-    args = tool_call.get("args", {})
-    desc = tool_call.get("desc", "")
     loc = bot["location"]
     loc_info = world["locations"].get(loc, {})
 
-    # 构建世界上下文给 LLM
     nearby_bots_info = []
     for nb in loc_info.get("bots", []):
         if nb != bot_id:
@@ -2741,7 +2954,7 @@ def execute_generic(bot_id, tool_call):
 
     npcs_text = ", ".join([n.get("name","?") for n in loc_info.get("npcs", [])]) if loc_info.get("npcs") else "无"
 
-    context = f"""角色: {bot.get('name', bot_id)} ({bot.get('age','?')}岁{bot.get('gender','?')})
+    return f"""角色: {bot.get('name', bot_id)} ({bot.get('age','?')}岁{bot.get('gender','?')})
 性格: {bot.get('personality','')[:60]}
 地点: {loc}
 金钱: {bot['money']}元 | 能量: {bot['energy']}/100 | 饱腹: {bot['satiety']}/100 | HP: {bot['hp']:.0f}/100
@@ -2753,7 +2966,16 @@ NPC: {npcs_text}
 天气: {world['weather'].get('condition','晴天')}
 时间: {world['time']['virtual_datetime']}"""
 
-    consequence_prompt = f"""你是深圳生存模拟的世界引擎。一个角色使用了工具，请判断后果。
+
+def _build_consequence_prompt(context, tool_call, money, energy, rule_section=None):
+    """v10.2: 由上下文快照 + 工具调用拼出后果判断 prompt（纯函数，不读 world）
+    v10.13: 带 rule_section 时同一次调用顺带判断世界规则，结果在 new_rules 字段"""
+    tool = tool_call.get("tool", "")
+    args = tool_call.get("args", {})
+    desc = tool_call.get("desc", "")
+    rule_field = ',\n  "new_rules": [新的世界规则，格式见下方，不产生规则时为空数组]' if rule_section else ""
+    rule_part = f"\n\n{rule_section}\n" if rule_section else ""
+    return f"""你是深圳生存模拟的世界引擎。一个角色使用了工具，请判断后果。
 
 {context}
 
@@ -2788,24 +3010,28 @@ NPC: {npcs_text}
     }}
   ],
   "side_effects": ["附近的人能观察到的现象(1-2条)"],
-  "feedback_to_actor": "给行动者的直接反馈(他能看到/听到/感受到什么)"
+  "feedback_to_actor": "给行动者的直接反馈(他能看到/听到/感受到什么)"{rule_field}
 }}
 
 规则：
 - 要符合现实逻辑，不要魔法
-- 花钱的事情必须检查够不够钱(当前{bot['money']}元)，不够就失败
-- 能量不够(当前{bot['energy']})也会影响结果
+- 花钱的事情必须检查够不够钱(当前{money}元)，不够就失败
+- 能量不够(当前{energy})也会影响结果
 - 创业/开店至少需要100-500元，不能空手套白狼
 - 和人互动时，对方的反应要符合对方的性格和当前状态
 - world_change只在真正产生持久影响时才填(画画、开店、种树、建东西等)，普通聊天/吃饭不算
-- social_effects只在有社交互动时才填
+- social_effects只在有社交互动时才填{rule_part}
 - 只输出JSON"""
 
+
+def _judge_consequence(consequence_prompt, bot_name, desc, with_rules=False):
+    """v10.2: 调用 LLM 判断后果（不持有 lock），失败时返回平淡的默认后果
+    v10.13: with_rules 时输出里还有 new_rules，给更多 token"""
     try:
         resp = client.chat.completions.create(
             model=OPENAI_MODEL_MINI,
             messages=[{"role": "user", "content": consequence_prompt}],
-            temperature=0.7, max_tokens=600,
+            temperature=0.7, max_tokens=1200 if with_rules else 600,
         )
         raw = resp.choices[0].message.content.strip()
         if raw.startswith("```"):
@@ -2815,17 +3041,27 @@ NPC: {npcs_text}
             raw = json_match.group(0)
         raw = re.sub(r',\s*}', '}', raw)
         raw = re.sub(r',\s*]', ']', raw)
-        result = json.loads(raw)
+        return json.loads(raw)
     except Exception as e:
-        log.error(f"[v10] execute_generic LLM失败: {e}")
-        result = {
-            "narrative": f"{bot.get('name', bot_id)}尝试{desc}，但没什么特别的事发生。",
+        log.error(f"[v10] {'后果+规则判断' if with_rules else '后果判断'} LLM失败: {e}")
+        return {
+            "narrative": f"{bot_name}尝试{desc}，但没什么特别的事发生。",
             "success": True, "money_delta": 0, "energy_delta": -3,
             "satiety_delta": 0, "happiness_delta": 0,
             "world_change": None, "social_effects": [], "side_effects": [],
             "feedback_to_actor": "一切如常。"
         }
 
+
+def _apply_generic_result(bot_id, tool_call, result):
+    """v10.2: 把后果 JSON 应用到世界（需持有 lock），返回给行动者的反馈"""
+    bot = world["bots"][bot_id]
+    tool = tool_call.get("tool", "")
+    args = tool_call.get("args", {})
+    desc = tool_call.get("desc", "")
+    loc = bot["location"]
+    loc_info = world["locations"].get(loc, {})
+
     # === 应用后果 ===
     narrative = result.get("narrative", desc)
 
@@ -2901,11 +3137,7 @@ NPC: {npcs_text}
         effect_desc = fx.get("effect", "")
 
         # 尝试匹配 target 到 bot_id
-        resolved_target = None
-        for bid, bdata in world["bots"].items():
-            if bid == target_id or bdata.get("name") == target_id:
-                resolved_target = bid
-                break
+        resolved_target = occupancy.resolve_bot(target_id)
 
         if resolved_target and resolved_target != bot_id:
             # 更新关系
@@ -2965,11 +3197,80 @@ NPC: {npcs_text}
     return feedback
 
 
-def process_action_v10(bot_id, plan):
-    """v10.0: 新的行动处理入口。
-    接受 bot 的自然语言计划，用 LLM 转换为 generic 工具调用，然后执行。
-    如果无法解析为工具调用，fallback 到旧的 process_action。"""
+def execute_generic(bot_id, tool_call):
+    """v10.0 核心：执行 generic 工具调用，返回丰富的后果反馈。
+    5个工具: use_resource / interact / move / create / express
+    所有后果由 LLM 判断，不再硬编码。
+    v10.2: 拆为 构建上下文 → LLM判断 → 应用 三步；本函数一次走完（调用方持有 lock），
+    行动管线 process_action_v10 则在 LLM 判断期间释放 lock。"""
     bot = world["bots"][bot_id]
+    context = _build_generic_context(bot_id)
+    prompt = _build_consequence_prompt(context, tool_call, bot["money"], bot["energy"])
+    result = _judge_consequence(prompt, bot.get("name", bot_id), tool_call.get("desc", ""))
+    return _apply_generic_result(bot_id, tool_call, result)
+
+
+# ============================================================
+# v10.2: 两阶段行动管线
+# 阶段一（持锁）: 读取一致的上下文快照，构建 prompt
+# LLM 阶段（不持锁）: 工具解析 / 后果判断 / 规则判断
+# 阶段二（持锁）: 校验 bot 版本号，冲突时重新验证，再提交结果
+# ============================================================
+_bot_versions = {}  # bot_id -> 单调递增的版本号（位置/生死/行动提交时递增）
+
+
+def _bump_bot_version(bot_id):
+    """递增 bot 版本号（需持有 lock）。
+    凡是会让进行中的行动失效的变化（移动、死亡、驱逐、行动提交）都要调用。
+    v10.27: 这些变化同样要刷新 bot 的视图"""
+    _bot_versions[bot_id] = _bot_versions.get(bot_id, 0) + 1
+    _touch_bots(bot_id)
+
+
+def _revalidate_action(ticket, tool_call):
+    """版本号不一致时重新验证行动是否仍可提交（需持有 lock）。
+    返回失败原因，可以提交时返回 None。"""
+    bot = world["bots"].get(ticket["bot_id"])
+    if not bot or bot["status"] != "alive":
+        return "角色已经不在了"
+    if bot.get("is_sleeping"):
+        return "已经睡着了"
+    # 移动只看终点，其他行动都依赖当时所在的地点
+    if tool_call.get("tool") != "move" and bot["location"] != ticket["location"]:
+        return f"已经不在{ticket['location']}了"
+    return None
+
+
+def _record_action(bot, plan, tool_call, feedback):
+    """写入行动日志 / 当前活动 / 反馈（需持有 lock）"""
+    _log_action(bot, {
+        "tick": world["time"]["tick"],
+        "time": world["time"]["virtual_datetime"],
+        "plan": plan,
+        "tool_call": tool_call,
+        "result": feedback,
+    })
+
+    # 更新当前活动
+    bot["current_activity"] = (tool_call.get("desc", "") or plan)[:40]
+
+    # 存储反馈供 bot 下次感知
+    bot["last_action_feedback"] = {
+        "plan": plan,
+        "narrative": feedback.get("narrative", ""),
+        "feedback": feedback.get("feedback", ""),
+        "success": feedback.get("success", True),
+        "world_change": feedback.get("world_change"),
+        "social_effects": feedback.get("social_effects", []),
+    }
+
+
+def _prepare_action(bot_id, plan):
+    """阶段一（需持有 lock）: 起床/睡觉直接执行并返回 {"done": 结果}；
+    其余行动返回 ticket，包含上下文快照、工具解析 prompt 和版本号。"""
+    bot = world["bots"].get(bot_id)
+    if not bot or bot["status"] != "alive":
+        return {"done": {"error": "bot not available"}}
     loc = bot["location"]
     loc_info = world["locations"].get(loc, {})
 
@@ -2977,25 +3278,27 @@ def process_action_v10(bot_id, plan):
     if plan.strip() in ("起床", "醒来", "起来"):
         action = {"category": "survive", "type": "wake_up", "desc": plan}
         result = execute(bot_id, action)
-        bot["action_log"].append({
+        _log_action(bot, {
             "tick": world["time"]["tick"],
             "time": world["time"]["virtual_datetime"],
             "plan": plan, "action": action, "result": result
         })
         bot["current_activity"] = "刚刚醒来"
-        return {"action": action, "result": result}
+        _bump_bot_version(bot_id)
+        return {"done": {"action": action, "result": result}}
 
     # 硬编码睡觉
     if any(kw in plan for kw in ["睡觉", "睡了", "入睡", "躺下睡"]):
         action = {"category": "survive", "type": "sleep", "desc": plan}
         result = execute(bot_id, action)
-        bot["action_log"].append({
+        _log_action(bot, {
             "tick": world["time"]["tick"],
             "time": world["time"]["virtual_datetime"],
             "plan": plan, "action": action, "result": result
         })
         bot["current_activity"] = "睡觉中"
-        return {"action": action, "result": result}
+        _bump_bot_version(bot_id)
+        return {"done": {"action": action, "result": result}}
 
     # 用 LLM 将自然语言转为 generic 工具调用
     nearby_bots = [b for b in loc_info.get("bots",[]) if b != bot_id]
@@ -3007,10 +3310,12 @@ def process_action_v10(bot_id, plan):
     all_locs = list(LOCATIONS.keys())
     existing_things = [m["name"] for m in world.get("world_modifications", []) if m.get("location") == loc]
 
+    # v10.11: 工具解析只做格式转换，不放每次心跳都在变的数值（钱/能量在后果判断里另给），
+    # 这样同一地点的同一计划提示词相同，温度为 0 的解析调用可以命中 LLM 缓存
     tool_prompt = f"""你是一个JSON转换器。将用户的自然语言计划转为一个工具调用JSON。只输出JSON。
 
 ## 上下文
-- 角色: {bot.get('name', bot_id)} (钱:{bot['money']}元, 能量:{bot['energy']}, 饱腹:{bot['satiety']})
+- 角色: {bot.get('name', bot_id)}
 - 地点: {loc}
 - 附近的人: {nearby_info if nearby_info else '无'}
 - NPC: {[n['name'] for n in loc_info.get('npcs',[])]}
@@ -3054,6 +3359,40 @@ def process_action_v10(bot_id, plan):
 
 ## JSON"""
 
+    # v10.12: 规则快速识别（锁内快照，纯内存），置信度够高时跳过 LLM 解析
+    intent = intents.parse(
+        plan, loc, home=bot.get("home"),
+        npcs=[n["name"] for n in loc_info.get("npcs", [])],
+        nearby=nearby_bots,
+        current_task=bot.get("current_task"),
+        food_prices=world.get("food_prices", {}),
+    )
+
+    # v10.13: 规则判断并入后果判断。被节流、或快速识别已确定是去别处（不走后果判断）时不拼规则部分
+    fast_call, fast_conf, _ = intent
+    fast_move = (fast_call is not None and fast_conf >= INTENT_FAST_PATH_THRESHOLD
+                 and fast_call["tool"] == "move" and fast_call["args"].get("destination") != loc)
+    rule_section = None
+    if not fast_move and should_judge_rules(world, plan):
+        rule_section = build_rule_section(world, bot_id, loc, plan)
+
+    return {
+        "bot_id": bot_id,
+        "bot_name": bot.get("name", bot_id),
+        "plan": plan,
+        "location": loc,
+        "version": _bot_versions.get(bot_id, 0),
+        "money": bot["money"],
+        "energy": bot["energy"],
+        "tool_prompt": tool_prompt,
+        "intent": intent,
+        "context": _build_generic_context(bot_id),
+        "rule_section": rule_section,
+    }
+
+
+def _parse_tool_call(tool_prompt):
+    """LLM 阶段（不持有 lock）: 自然语言计划 -> 工具调用 JSON，失败返回 None"""
     try:
         resp = client.chat.completions.create(
             model=OPENAI_MODEL_NANO,
@@ -3077,248 +3416,352 @@ def process_action_v10(bot_id, plan):
                         break
             raw = raw[start:end]
         tool_call = json.loads(raw)
+        if not isinstance(tool_call, dict):
+            return None
+        return tool_call
     except Exception as e:
-        log.error(f"[v10] LLM工具解析失败: {e}, fallback到旧逻辑")
-        return process_action(bot_id, plan)
+        log.error(f"[v10] LLM工具解析失败: {e}")
+        return None
 
-    tool_name = tool_call.get("tool", "")
 
-    # move 特殊处理（直接执行，不需要LLM判断后果）
-    if tool_name == "move":
+def _commit_move(bot_id, tool_call):
+    """阶段二: 执行跨地点移动（需持有 lock，目的地已校验）"""
+    bot = world["bots"][bot_id]
+    dest = tool_call.get("args", {}).get("destination", "")
+    mode = tool_call.get("args", {}).get("mode", "walk")
+    old_loc = bot["location"]
+    bot["location"] = dest
+    occupancy.move(bot_id, dest)
+    cost = {"walk": 0, "bus": 3, "taxi": 15}.get(mode, 0)
+    bot["money"] = max(0, bot["money"] - cost)
+    bot["energy"] = max(0, bot["energy"] - 5)
+    narrative = f"{bot.get('name',bot_id)}从{old_loc}{'走路' if mode=='walk' else '坐'+mode}到了{dest}"
+    if cost > 0:
+        narrative += f"(花了{cost}元)"
+    log.info(f"[v10] {bot.get('name',bot_id)} 移动: {old_loc} -> {dest} ({mode})")
+    return {"narrative": narrative, "success": True, "feedback": f"你到了{dest}"}
+
+
+def _commit_moment(bot_id, tool_call):
+    """阶段二: 发朋友圈（需持有 lock）"""
+    bot = world["bots"][bot_id]
+    content = tool_call.get("args", {}).get("content", "")
+    moment = {
+        "id": f"m_{world['time']['tick']}_{bot_id}",
+        "bot_id": bot_id,
+        "bot_name": bot.get("name", bot_id),
+        "author": bot_id,
+        "author_name": bot.get("name", bot_id),
+        "content": content,
+        "time": world["time"]["virtual_datetime"],
+        "tick": world["time"]["tick"],
+        "likes": [],
+        "comments": [],
+    }
+    world["moments"].append(moment)
+    _record_moment(moment)
+    if len(world["moments"]) > 100:
+        world["moments"] = world["moments"][-80:]
+    log.info(f"[v10] {bot.get('name',bot_id)} 发朋友圈: {content[:40]}")
+    return {"narrative": f"{bot.get('name',bot_id)}发了一条朋友圈: {content[:30]}...", "success": True, "feedback": "朋友圈发送成功"}
+
+
+def _commit_action(ticket, tool_call, consequence):
+    """阶段二（需持有 lock）: 版本校验 + 应用结果。
+    返回 (response, rule_prompt)；rule_prompt 非空时需要在锁外做规则判断。"""
+    bot_id = ticket["bot_id"]
+    plan = ticket["plan"]
+    bot = world["bots"].get(bot_id)
+    if not bot or bot["status"] != "alive":
+        return {"error": "bot not available"}, None
+
+    # 版本号变化说明 LLM 期间 bot 被移动/驱逐/执行过其他行动，需要重新验证
+    if _bot_versions.get(bot_id, 0) != ticket["version"]:
+        reason = _revalidate_action(ticket, tool_call)
+        if reason:
+            log.warning(f"[v10.2 CONFLICT] {ticket['bot_name']} 的行动[{plan[:30]}]作废: {reason}")
+            feedback = {"narrative": f"{ticket['bot_name']}想{plan[:30]}，但{reason}", "success": False, "feedback": f"计划落空: {reason}"}
+            _record_action(bot, plan, tool_call, feedback)
+            _bump_bot_version(bot_id)
+            return {"action": tool_call, "result": feedback, "conflict": True}, None
+        log.info(f"[v10.2] {ticket['bot_name']} 行动期间状态有变，重新验证通过")
+
+    tool_name = tool_call.get("tool", "")
+    rule_defs = None
+    if consequence is not None:
+        rule_defs = consequence.pop("new_rules", None)
+        feedback = _apply_generic_result(bot_id, tool_call, consequence)
+    elif tool_name == "move":
         dest = tool_call.get("args", {}).get("destination", "")
-        mode = tool_call.get("args", {}).get("mode", "walk")
-        if dest == bot["location"]:
-            # 同地移动 = 就地探索，转为 generic 执行
-            tool_call["tool"] = "use_resource"
-            tool_call["args"] = {"resource": "energy", "amount": 3, "purpose": f"在{loc}附近闲逛探索"}
-            tool_call["desc"] = f"在{loc}附近闲逛探索"
-            feedback = execute_generic(bot_id, tool_call)
-        elif dest in LOCATIONS:
-            old_loc = bot["location"]
-            if old_loc in world["locations"] and bot_id in world["locations"][old_loc]["bots"]:
-                world["locations"][old_loc]["bots"].remove(bot_id)
-            bot["location"] = dest
-            if bot_id not in world["locations"][dest]["bots"]:
-                world["locations"][dest]["bots"].append(bot_id)
-            cost = {"walk": 0, "bus": 3, "taxi": 15}.get(mode, 0)
-            bot["money"] = max(0, bot["money"] - cost)
-            bot["energy"] = max(0, bot["energy"] - 5)
-            narrative = f"{bot.get('name',bot_id)}从{old_loc}{'走路' if mode=='walk' else '坐'+mode}到了{dest}"
-            if cost > 0:
-                narrative += f"(花了{cost}元)"
-            log.info(f"[v10] {bot.get('name',bot_id)} 移动: {old_loc} -> {dest} ({mode})")
-            feedback = {"narrative": narrative, "success": True, "feedback": f"你到了{dest}"}
-        else:
+        if dest not in LOCATIONS:
             feedback = {"narrative": f"找不到{dest}这个地方", "success": False, "feedback": "目的地不存在"}
+        elif dest == bot["location"]:
+            # LLM 期间已经被带到了目的地（驱逐/规则吸引）
+            feedback = {"narrative": f"{ticket['bot_name']}已经在{dest}了", "success": True, "feedback": f"你已经在{dest}"}
+        else:
+            feedback = _commit_move(bot_id, tool_call)
+    else:
+        feedback = _commit_moment(bot_id, tool_call)
+
+    _record_action(bot, plan, tool_call, feedback)
+    _bump_bot_version(bot_id)
+
+    # === v10.1: 判断是否应该产生新的世界运行规则 ===
+    # v10.13: generic 行动的规则已经在后果判断里一起给出，直接注入；move / 朋友圈仍单独判断
+    rule_prompt = None
+    log.info(f"[RULES-DEBUG] 准备判断规则: {ticket['bot_name']} @ {bot['location']}, success={feedback.get('success', True)}, plan={plan[:50]}")
+    if feedback.get("success", True):
+        if consequence is not None:
+            if rule_defs:
+                _commit_rules(bot_id, bot["location"], rule_defs=rule_defs)
+        else:
+            rule_prompt = build_rule_prompt(world, bot_id, ticket["bot_name"], bot["location"], plan, feedback.get("narrative", ""))
+    return {"action": tool_call, "result": feedback}, rule_prompt
 
-    # express 中的朋友圈特殊处理
-    elif tool_name == "express" and tool_call.get("args", {}).get("channel") == "朋友圈":
-        content = tool_call.get("args", {}).get("content", "")
-        moment = {
-            "author": bot_id,
-            "author_name": bot.get("name", bot_id),
-            "content": content,
-            "time": world["time"]["virtual_datetime"],
-            "tick": world["time"]["tick"],
-            "likes": [],
-            "comments": [],
-        }
-        world["moments"].append(moment)
-        if len(world["moments"]) > 100:
-            world["moments"] = world["moments"][-80:]
-        log.info(f"[v10] {bot.get('name',bot_id)} 发朋友圈: {content[:40]}")
-        feedback = {"narrative": f"{bot.get('name',bot_id)}发了一条朋友圈: {content[:30]}...", "success": True, "feedback": "朋友圈发送成功"}
 
+def _commit_rules(bot_id, location, raw=None, rule_defs=None):
+    """规则提交（需持有 lock）: 解析、去重并注入新规则。
+    raw 是单独规则判断的原始文本；rule_defs 是后果判断 JSON 里已解析的 new_rules"""
+    bot = world["bots"].get(bot_id)
+    if not bot or bot["status"] != "alive":
+        return
+    name = bot.get("name", bot_id)
+    if rule_defs is not None:
+        new_rules = parse_rule_defs(world, rule_defs, bot_id, name, location)
     else:
-        # 所有其他工具调用走 generic 执行引擎
-        feedback = execute_generic(bot_id, tool_call)
+        new_rules = parse_rule_response(world, raw, bot_id, name, location)
+    log.info(f"[RULES-DEBUG] 规则判断结果: {len(new_rules) if new_rules else 0}条")
+    for nr in new_rules:
+        world["active_rules"].add(nr)
+        log.warning(f"[RULES] 新规则注入! [{nr['name']}] by {name} @ {location}: {nr['description'][:60]}")
+        # 同时记录到反馈中，让bot知道自己改变了世界
+        bot["last_action_feedback"]["rules_created"] = [
+            {"name": r["name"], "desc": r["description"]} for r in new_rules
+        ]
+        # 声望奖励
+        rep = bot.get("reputation", {"score": 0, "tags": [], "deeds": []})
+        rep["score"] = rep.get("score", 0) + 5
+        rep.setdefault("deeds", []).append(f"创建规则[{nr['name']}]")
+        bot["reputation"] = rep
 
-    # 记录行动日志
-    bot["action_log"].append({
-        "tick": world["time"]["tick"],
-        "time": world["time"]["virtual_datetime"],
-        "plan": plan,
-        "tool_call": tool_call,
-        "result": feedback,
-    })
-    if len(bot["action_log"]) > 50:
-        bot["action_log"] = bot["action_log"][-30:]
 
-    # 更新当前活动
-    bot["current_activity"] = (tool_call.get("desc", "") or plan)[:40]
+def process_action_v10(bot_id, plan):
+    """v10.0: 新的行动处理入口。
+    接受 bot 的自然语言计划，用 LLM 转换为 generic 工具调用，然后执行。
+    v10.2: 两阶段管线——调用方不要持有 lock，本函数只在读快照和提交时短暂加锁，
+    所有 LLM 调用都在锁外进行，多个 bot 的行动可以并发思考。
+    工具解析失败时按 use_resource 兜底，交给后果判断处理。"""
+    # === 阶段一: 快照 ===
+    with lock:
+        ticket = _prepare_action(bot_id, plan)
+        if "done" in ticket:
+            publish_views(*_ACTION_GROUPS, bots=(bot_id,))
+    if "done" in ticket:
+        return ticket["done"]
+
+    # === LLM 阶段: 工具解析 + 后果判断 ===
+    # v10.12: 常见计划（移动/吃喝/工作/继续任务/找人聊天）由规则识别，不调用 LLM
+    tool_call, confidence, kind = ticket["intent"]
+    if tool_call is not None and confidence >= INTENT_FAST_PATH_THRESHOLD:
+        log.info(f"[v10.12 FAST] {ticket['bot_name']} [{plan[:30]}] -> {kind} ({confidence})")
+        intents.record(kind)
+    else:
+        tool_call = _parse_tool_call(ticket["tool_prompt"])
+        intents.record(None)
+    if tool_call is None:
+        log.warning(f"[v10.2] {ticket['bot_name']} 工具解析失败，按 use_resource 兜底")
+        tool_call = {"tool": "use_resource", "args": {"resource": "energy", "amount": 3, "purpose": plan}, "desc": plan}
 
-    # 存储反馈供 bot 下次感知
-    bot["last_action_feedback"] = {
-        "plan": plan,
-        "narrative": feedback.get("narrative", ""),
-        "feedback": feedback.get("feedback", ""),
-        "success": feedback.get("success", True),
-        "world_change": feedback.get("world_change"),
-        "social_effects": feedback.get("social_effects", []),
-    }
+    tool_name = tool_call.get("tool", "")
+    args = tool_call.get("args", {})
+    loc = ticket["location"]
+    consequence = None
+    if tool_name == "move" and args.get("destination", "") == loc:
+        # 同地移动 = 就地探索，转为 generic 执行
+        tool_call["tool"] = "use_resource"
+        tool_call["args"] = {"resource": "energy", "amount": 3, "purpose": f"在{loc}附近闲逛探索"}
+        tool_call["desc"] = f"在{loc}附近闲逛探索"
+        tool_name = "use_resource"
+    # move / 朋友圈 直接在提交阶段执行，不需要LLM判断后果
+    if tool_name != "move" and not (tool_name == "express" and args.get("channel") == "朋友圈"):
+        # 所有其他工具调用走 generic 执行引擎
+        rule_section = ticket["rule_section"]
+        prompt = _build_consequence_prompt(ticket["context"], tool_call, ticket["money"], ticket["energy"], rule_section)
+        consequence = _judge_consequence(prompt, ticket["bot_name"], tool_call.get("desc", ""), with_rules=bool(rule_section))
 
-    # === v10.1: 判断是否应该产生新的世界运行规则 ===
-    log.info(f"[RULES-DEBUG] 准备判断规则: {bot.get('name',bot_id)} @ {loc}, success={feedback.get('success', True)}, plan={plan[:50]}")
-    if feedback.get("success", True):
-        try:
-            new_rules = generate_rules_from_action(
-                world, bot_id, bot.get("name", bot_id), loc,
-                plan, feedback.get("narrative", ""), client
-            )
-            log.info(f"[RULES-DEBUG] 规则判断结果: {len(new_rules) if new_rules else 0}条")
-            if new_rules:
-                for nr in new_rules:
-                    world["active_rules"].append(nr)
-                    log.warning(f"[RULES] 新规则注入! [{nr['name']}] by {bot.get('name',bot_id)} @ {loc}: {nr['description'][:60]}")
-                    # 同时记录到反馈中，让bot知道自己改变了世界
-                    bot["last_action_feedback"]["rules_created"] = [
-                        {"name": nr["name"], "desc": nr["description"]} for nr in new_rules
-                    ]
-                    # 声望奖励
-                    rep = bot.get("reputation", {"score": 0, "tags": [], "deeds": []})
-                    rep["score"] = rep.get("score", 0) + 5
-                    rep["deeds"].append(f"创建规则[{nr['name']}]")
-                    bot["reputation"] = rep
-        except Exception as e:
-            log.error(f"[RULES] generate_rules_from_action失败: {e}")
+    # === 阶段二: 提交 ===
+    with lock:
+        response, rule_prompt = _commit_action(ticket, tool_call, consequence)
+        commit_loc = world["bots"].get(bot_id, {}).get("location", loc)
+        publish_views(*_ACTION_GROUPS, bots=(bot_id,))
+    if not rule_prompt:
+        return response
 
-    return {"action": tool_call, "result": feedback}
+    # === 规则判断（锁外）+ 提交 ===
+    try:
+        raw = request_rule_completion(rule_prompt, client)
+    except Exception as e:
+        log.error(f"[RULES] move/朋友圈单独的规则判断(request_rule_completion)失败: {e}")
+        return response
+    with lock:
+        _commit_rules(bot_id, commit_loc, raw)
+        publish_views("world", "bots", "evolution", "rules", "location_rules", "reputation", bots=(bot_id,))
+    return response
 
 
 # ============================================================
 # API 端点
 # ============================================================
-@app.get("/world")
-def get_world():
-    with lock:
-        safe = {
-            "time": world["time"],
-            "weather": world["weather"],
-            "news_feed": world["news_feed"],
-            "hot_topics": world["hot_topics"],
-            "bots": {},
-            "locations": {},
-            "events": world["events"][-10:],
-            "active_effects": world["active_effects"],
-            "moments": world["moments"][-20:],
-            "food_prices": world.get("food_prices", {}),
-        }
-        for bid, bot in world["bots"].items():
-            safe["bots"][bid] = {
-                "id": bid, "name": bot["name"], "age": bot["age"], "gender": bot["gender"],
-                "location": bot["location"], "hp": bot["hp"], "money": bot["money"],
-                "energy": bot["energy"], "satiety": bot["satiety"], "status": bot["status"],
-                "job": bot["job"], "skills": bot["skills"], "inventory": bot["inventory"],
-                "is_sleeping": bot.get("is_sleeping", False),
-                "current_task": bot.get("current_task"),
-                "emotions": bot.get("emotions", {}),
-                "desires": bot.get("desires", {}),
-                "phone_battery": bot.get("phone_battery", 100),
-                "family": bot.get("family", {}),
-                "selfie_count": bot.get("selfie_count", 0),
-                "aging_rate": bot.get("aging_rate", AGING_BASE),
-                "emotional_bonds_summary": {k: {"label": v.get("label", ""), "closeness": v.get("closeness", 0), "latest_impression": (v.get("impressions", []) or [""])[-1]} for k, v in bot.get("emotional_bonds", {}).items()},
-                "long_term_goal": bot.get("long_term_goal"),
-                "narrative_summary": bot.get("narrative_summary"),
-                "pending_reply_to": bot.get("pending_reply_to"),
-                "core_memories": bot.get("core_memories", []),
-                "recent_actions_synced": bot.get("recent_actions_synced", []),
-                "current_activity": bot.get("current_activity", ""),
-                # v9.0
-                "reputation": bot.get("reputation", {"score": 0, "tags": [], "deeds": []}),
-                "created_things": bot.get("created_things", []),
-                "generation": bot.get("generation", 0),
-                "inherited_from": bot.get("inherited_from"),
-                # v10.0
-                "last_action_feedback": bot.get("last_action_feedback", {}),
-                "action_log": bot.get("action_log", [])[-10:],
-            }
-        for loc_name, loc_data in world["locations"].items():
-            safe["locations"][loc_name] = {
-                "desc": loc_data["desc"],
-                "type": loc_data["type"],
-                "bots": loc_data["bots"],
-                "npcs": [{"name": n["name"], "role": n["role"]} for n in loc_data["npcs"]],
-                "jobs": [{"title": j["title"], "pay": j["pay"]} for j in loc_data.get("jobs", [])],
-                # v9.0
-                "public_memory": loc_data.get("public_memory", [])[-5:],
-                "modifications": loc_data.get("modifications", []),
-                "vibe": loc_data.get("vibe", "普通"),
-            }
-        # v9.0: 添加进化引擎数据
-        safe["world_modifications"] = world.get("world_modifications", [])[-20:]
-        safe["urban_legends"] = world.get("urban_legends", [])[-10:]
-        safe["graveyard"] = world.get("graveyard", [])
-        safe["generation_count"] = world.get("generation_count", 0)
-        safe["reputation_board"] = world.get("reputation_board", {})
-        # v10.1: 保存活跃规则
-        rules_to_save = []
-        for r in world.get("active_rules", []):
-            r_copy = {k: v for k, v in r.items() if k != "_triggered_bots"}
-            rules_to_save.append(r_copy)
-        safe["active_rules"] = rules_to_save[-50:]
-        return safe
+def _safe_bot(bid, bot):
+    """v10.8: 单个 bot 的公开状态（/world 与 /bot/{id}/perception 共用，需持有 lock）"""
+    return {
+        "id": bid, "name": bot["name"], "age": bot["age"], "gender": bot["gender"],
+        "location": bot["location"], "hp": bot["hp"], "money": bot["money"],
+        "energy": bot["energy"], "satiety": bot["satiety"], "status": bot["status"],
+        "job": bot["job"], "skills": bot["skills"], "inventory": bot["inventory"],
+        "is_sleeping": bot.get("is_sleeping", False),
+        "current_task": bot.get("current_task"),
+        "emotions": bot.get("emotions", {}),
+        "desires": bot.get("desires", {}),
+        "phone_battery": bot.get("phone_battery", 100),
+        "family": bot.get("family", {}),
+        "selfie_count": bot.get("selfie_count", 0),
+        "aging_rate": bot.get("aging_rate", AGING_BASE),
+        "emotional_bonds_summary": {k: {"label": v.get("label", ""), "closeness": v.get("closeness", 0), "latest_impression": (v.get("impressions", []) or [""])[-1]} for k, v in bot.get("emotional_bonds", {}).items()},
+        "long_term_goal": bot.get("long_term_goal"),
+        "narrative_summary": bot.get("narrative_summary"),
+        "pending_reply_to": bot.get("pending_reply_to"),
+        "core_memories": bot.get("core_memories", []),
+        "recent_actions_synced": bot.get("recent_actions_synced", []),
+        "current_activity": bot.get("current_activity", ""),
+        # v9.0
+        "reputation": bot.get("reputation", {"score": 0, "tags": [], "deeds": []}),
+        "created_things": bot.get("created_things", []),
+        "generation": bot.get("generation", 0),
+        "inherited_from": bot.get("inherited_from"),
+        # v10.0
+        "last_action_feedback": bot.get("last_action_feedback", {}),
+        "action_log": bot.get("action_log", [])[-10:],
+    }
 
 
-@app.get("/bot/{bot_id}/detail")
-def get_bot_detail(bot_id: str):
-    with lock:
-        bot = world["bots"].get(bot_id)
-        if not bot:
-            return JSONResponse({"error": "not found"}, 404)
-        return {
-            "id": bot_id,
-            "name": bot["name"],
-            "age": bot["age"],
-            "gender": bot["gender"],
-            "origin": bot.get("origin", ""),
-            "edu": bot.get("edu", ""),
-            "home": bot["home"],
-            "location": bot["location"],
-            "hp": bot["hp"],
-            "money": bot["money"],
-            "energy": bot["energy"],
-            "satiety": bot["satiety"],
-            "status": bot["status"],
-            "job": bot["job"],
-            "skills": bot["skills"],
-            "inventory": bot["inventory"],
-            "relationships": bot["relationships"],
-            "family": bot.get("family", {}),
-            "is_sleeping": bot.get("is_sleeping", False),
-            "current_task": bot.get("current_task"),
-            "selfie_count": bot.get("selfie_count", 0),
-            "aging_rate": bot.get("aging_rate", AGING_BASE),
-            "emotions": bot.get("emotions", {}),
-            "desires": bot.get("desires", {}),
-            "phone_battery": bot.get("phone_battery", 100),
-            "values": bot.get("values", {}),
-            "core_memories": bot.get("core_memories", []),
-            "emotional_bonds": bot.get("emotional_bonds", {}),
-            "action_log": bot.get("action_log", [])[-15:],
-            "long_term_goal": bot.get("long_term_goal"),
-            "narrative_summary": bot.get("narrative_summary"),
-            "recent_actions_synced": bot.get("recent_actions_synced", []),
-            "pending_reply_to": bot.get("pending_reply_to"),
+_world_bot_rows = {}  # v10.27: bot_id -> (_safe_bot 的结果, 编码好的 "bot_id":{...} 片段)
+
+
+def _view_world(bot_ids=None):
+    """v10.4: /world 视图（需持有 lock）。
+    v10.27: 每个 bot 的公开状态和它的 JSON 片段缓存在 _world_bot_rows 里；给出 bot_ids 时只重建这些 bot，
+    其余沿用缓存（地点、事件、规则等全局部分每次都重建，它们的大小与 bot 数无关）"""
+    rows = _world_bot_rows
+    if bot_ids is None:
+        rows.clear()
+    else:
+        bot_ids = set(bot_ids).union(world["bots"].keys() - rows.keys())  # 还没有缓存的新 bot
+    for bid in world["bots"] if bot_ids is None else bot_ids:
+        row = _safe_bot(bid, world["bots"][bid])
+        rows[bid] = (row, encode(bid) + b":" + encode(row))
+    for bid in [bid for bid in rows if bid not in world["bots"]]:
+        del rows[bid]
+    safe = {
+        "time": world["time"],
+        "weather": world["weather"],
+        "news_feed": world["news_feed"],
+        "hot_topics": world["hot_topics"],
+        "bots": {},
+        "locations": {},
+        "events": world["events"][-10:],
+        "active_effects": world["active_effects"],
+        "moments": world["moments"][-20:],
+        "food_prices": world.get("food_prices", {}),
+    }
+    for bid in world["bots"]:
+        safe["bots"][bid] = rows[bid][0]
+    for loc_name, loc_data in world["locations"].items():
+        safe["locations"][loc_name] = {
+            "desc": loc_data["desc"],
+            "type": loc_data["type"],
+            "bots": list(loc_data["bots"]),
+            "npcs": [{"name": n["name"], "role": n["role"]} for n in loc_data["npcs"]],
+            "jobs": [{"title": j["title"], "pay": j["pay"]} for j in loc_data.get("jobs", [])],
             # v9.0
-            "reputation": bot.get("reputation", {"score": 0, "tags": [], "deeds": []}),
-            "created_things": bot.get("created_things", []),
-            "generation": bot.get("generation", 0),
-            "inherited_from": bot.get("inherited_from"),
-            "known_legends": bot.get("known_legends", []),
+            "public_memory": loc_data.get("public_memory", [])[-5:],
+            "modifications": loc_data.get("modifications", []),
+            "vibe": loc_data.get("vibe", "普通"),
         }
+    # v9.0: 添加进化引擎数据
+    safe["world_modifications"] = world.get("world_modifications", [])[-20:]
+    safe["urban_legends"] = world.get("urban_legends", [])[-10:]
+    safe["graveyard"] = world.get("graveyard", [])
+    safe["generation_count"] = world.get("generation_count", 0)
+    safe["reputation_board"] = world.get("reputation_board", {})
+    # v10.1: 保存活跃规则
+    rules_to_save = []
+    for r in world.get("active_rules", []):
+        r_copy = {k: v for k, v in r.items() if k != "_triggered_bots"}
+        rules_to_save.append(r_copy)
+    safe["active_rules"] = rules_to_save[-50:]
+    return safe
+
+
+def _encode_world(safe):
+    """v10.27: 拼出 /world 的 JSON：全局部分现编，bots 直接拼缓存的片段（不再把所有 bot 重新编码一遍）"""
+    rest = encode({k: v for k, v in safe.items() if k != "bots"})
+    bots = b",".join(_world_bot_rows[bid][1] for bid in safe["bots"])
+    return rest[:-1] + b',"bots":{' + bots + b"}}"
+
+
+def _view_bot_detail(bot_id):
+    """v10.4: /bot/{id}/detail 视图（需持有 lock）"""
+    bot = world["bots"][bot_id]
+    return {
+        "id": bot_id,
+        "name": bot["name"],
+        "age": bot["age"],
+        "gender": bot["gender"],
+        "origin": bot.get("origin", ""),
+        "edu": bot.get("edu", ""),
+        "home": bot["home"],
+        "location": bot["location"],
+        "hp": bot["hp"],
+        "money": bot["money"],
+        "energy": bot["energy"],
+        "satiety": bot["satiety"],
+        "status": bot["status"],
+        "job": bot["job"],
+        "skills": bot["skills"],
+        "inventory": bot["inventory"],
+        "relationships": bot["relationships"],
+        "family": bot.get("family", {}),
+        "is_sleeping": bot.get("is_sleeping", False),
+        "current_task": bot.get("current_task"),
+        "selfie_count": bot.get("selfie_count", 0),
+        "aging_rate": bot.get("aging_rate", AGING_BASE),
+        "emotions": bot.get("emotions", {}),
+        "desires": bot.get("desires", {}),
+        "phone_battery": bot.get("phone_battery", 100),
+        "values": bot.get("values", {}),
+        "core_memories": bot.get("core_memories", []),
+        "emotional_bonds": bot.get("emotional_bonds", {}),
+        "action_log": bot.get("action_log", [])[-15:],
+        "long_term_goal": bot.get("long_term_goal"),
+        "narrative_summary": bot.get("narrative_summary"),
+        "recent_actions_synced": bot.get("recent_actions_synced", []),
+        "pending_reply_to": bot.get("pending_reply_to"),
+        # v9.0
+        "reputation": bot.get("reputation", {"score": 0, "tags": [], "deeds": []}),
+        "created_things": bot.get("created_things", []),
+        "generation": bot.get("generation", 0),
+        "inherited_from": bot.get("inherited_from"),
+        "known_legends": bot.get("known_legends", []),
+    }
 
 
 @app.post("/bot/{bot_id}/action")
 async def bot_action(bot_id: str, request: Request):
     data = await request.json()
     plan = data.get("plan", "idle")
-    with lock:
-        bot = world["bots"].get(bot_id)
-        if not bot or bot["status"] != "alive":
-            return {"error": "bot not available"}
-        result = process_action_v10(bot_id, plan)
-    return result
+    # v10.2: 管线内部自行分段加锁，放到线程池里跑，避免 LLM 调用阻塞事件循环
+    return await run_in_threadpool(process_action_v10, bot_id, plan)
 
 
 @app.post("/bot/{bot_id}/update_inner")
@@ -3339,13 +3782,58 @@ async def update_inner(bot_id: str, request: Request):
             bot["emotional_bonds"] = data["emotional_bonds"]
         if "emotions" in data:
             bot["emotions"] = data["emotions"]
+        publish_views("world", "bots", bots=(bot_id,))
     return {"ok": True}
 
 
+def _apply_sync_patch(bot, patch):
+    """v10.16: 按分区合并增量同步（需持有 lock），返回 (各分区合并后的哈希, 需要重发的分区)"""
+    hashes, resync = {}, []
+    mems = patch.get("core_memories")
+    if mems:
+        base = mems.get("base")
+        if base and base != section_hash(bot.get("core_memories", [])):
+            # 引擎侧记忆和 bot 上次确认的不一致（重启/快照恢复），让 bot 下次全部重新追加
+            resync.append("core_memories")
+        bot["core_memories"] = append_memories(bot.get("core_memories", []), mems.get("append", []))
+        hashes["core_memories"] = section_hash(bot["core_memories"])
+    bonds = patch.get("emotional_bonds")
+    if bonds:
+        table = bot.setdefault("emotional_bonds", {})
+        for target, change in bonds.get("upsert", {}).items():
+            if isinstance(change, dict):
+                merge_bond(table.setdefault(target, {"trust": 50, "hostility": 0, "closeness": 0, "label": "陌生人"}), change)
+        hashes["emotional_bonds"] = section_hash(table)
+    if patch.get("values"):
+        bot["values"] = patch["values"]
+        hashes["values"] = section_hash(bot["values"])
+    if "recent_actions" in patch:
+        bot["recent_actions_synced"] = patch["recent_actions"][-10:]
+        hashes["recent_actions"] = section_hash(bot["recent_actions_synced"])
+    for key in ("long_term_goal", "narrative_summary"):
+        if patch.get(key):
+            bot[key] = patch[key]
+            hashes[key] = section_hash(bot[key])
+    return hashes, resync
+
+
 @app.post("/bot/{bot_id}/sync_state")
 async def sync_state(bot_id: str, request: Request):
-    """v8.3: 统一状态同步总线 - bot_agent每次心跳后同步完整状态"""
+    """v8.3: 统一状态同步总线 - bot_agent每次心跳后同步状态
+    v10.16: 协议 2 只发有变化的分区（记忆追加、关系逐字段合并），不再整体覆盖；旧请求仍整体替换"""
     data = await request.json()
+    if data.get("protocol") == SYNC_PROTOCOL:
+        patch = data.get("patch", {})
+        with lock:
+            bot = world["bots"].get(bot_id)
+            if not bot:
+                return {"error": "not found"}
+            hashes, resync = _apply_sync_patch(bot, patch)
+            if data.get("clear_pending_reply"):
+                bot["pending_reply_to"] = None
+            if patch or data.get("clear_pending_reply"):
+                publish_views("world", "bots", "messages", bots=(bot_id,))
+        return {"ok": True, "hashes": hashes, "resync": resync}
     with lock:
         bot = world["bots"].get(bot_id)
         if not bot:
@@ -3371,25 +3859,25 @@ async def sync_state(bot_id: str, request: Request):
         # 清除已回应的pending_reply
         if data.get("clear_pending_reply"):
             bot["pending_reply_to"] = None
+        publish_views("world", "bots", "messages", bots=(bot_id,))
     return {"ok": True}
 
 
-@app.get("/messages/{bot_id}")
-def get_messages(bot_id: str):
-    with lock:
-        msgs = [m for m in world["message_board"] if m.get("to") == bot_id or m.get("to") == "public"]
-        bot = world["bots"].get(bot_id, {})
-        return {
-            "messages": msgs[-20:],
-            "pending_reply_to": bot.get("pending_reply_to"),
-        }
+def _view_messages(bot_id, since=0):
+    """v10.4: /messages/{id} 视图（需持有 lock）。v10.17: 直接取收件箱 + 公共频道的尾部"""
+    bot = world["bots"].get(bot_id, {})
+    return {
+        "messages": world["message_board"].for_bot(bot_id, since, limit=20),
+        "pending_reply_to": bot.get("pending_reply_to"),
+        "seq": world["message_board"].seq,
+    }
 
 
 @app.post("/admin/send_message")
 async def admin_send_message(request: Request):
     data = await request.json()
     with lock:
-        world["message_board"].append({
+        world["message_board"].post({
             "tick": world["time"]["tick"],
             "time": world["time"]["virtual_datetime"],
             "from": data.get("from", "系统"),
@@ -3397,13 +3885,13 @@ async def admin_send_message(request: Request):
             "msg": data.get("message", ""),
             "priority": data.get("priority", "normal"),
         })
+        publish_views("messages", bots=())
     return {"ok": True}
 
 
-@app.get("/moments")
-def get_moments():
-    with lock:
-        return {"moments": world["moments"][-50:]}
+def _view_moments():
+    """v10.4: /moments 视图（需持有 lock）"""
+    return {"moments": world["moments"][-50:]}
 
 
 @app.post("/moments/{moment_id}/like")
@@ -3415,6 +3903,8 @@ async def like_moment(moment_id: str, request: Request):
             if m["id"] == moment_id:
                 if bot_id not in m["likes"]:
                     m["likes"].append(bot_id)
+                    _record_moment(m)
+                publish_views("world", "moments", bots=())
                 return {"ok": True}
     return {"error": "moment not found"}
 
@@ -3431,175 +3921,717 @@ async def comment_moment(moment_id: str, request: Request):
                     "content": data.get("content", ""),
                     "tick": world["time"]["tick"],
                 })
+                _record_moment(m)
+                publish_views("world", "moments", bots=())
                 return {"ok": True}
     return {"error": "moment not found"}
 
 
-@app.get("/gallery")
-def get_gallery():
-    with lock:
-        return {"photos": world["gallery"][-30:]}
+def _view_gallery():
+    """v10.4: /gallery 视图（需持有 lock）"""
+    return {"photos": world["gallery"][-30:]}
 
 
-@app.get("/world_narrative")
-def get_world_narrative():
-    with lock:
-        return {"narrative": world.get("world_narrative", "这座城市刚刚苏醒，故事还没有开始。")}
+def _view_world_narrative():
+    """v10.4: /world_narrative 视图（需持有 lock）"""
+    return {"narrative": world.get("world_narrative", "这座城市刚刚苏醒，故事还没有开始。")}
 
 
 # === v9.0 进化引擎专用端点 ===
-@app.get("/evolution")
-def get_evolution_data():
-    """v9.0: 获取所有进化引擎数据"""
-    with lock:
-        return {
-            "world_modifications": world.get("world_modifications", []),
-            "urban_legends": world.get("urban_legends", []),
-            "graveyard": world.get("graveyard", []),
-            "generation_count": world.get("generation_count", 0),
-            "reputation_board": world.get("reputation_board", {}),
-            "location_vibes": {loc: data.get("vibe", "普通") for loc, data in world["locations"].items()},
-            "location_memories": {loc: data.get("public_memory", [])[-10:] for loc, data in world["locations"].items()},
-            "location_modifications": {loc: data.get("modifications", []) for loc, data in world["locations"].items()},
-            # v10.1: 规则引擎数据
-            "active_rules": [
-                {
-                    "id": r["id"],
-                    "name": r["name"],
-                    "creator_name": r.get("creator_name", "?"),
-                    "location": r.get("location"),
-                    "description": r.get("description", ""),
-                    "durability": round(r.get("durability", 0), 1),
-                    "execution_count": r.get("execution_count", 0),
-                    "active": r.get("active", True),
-                }
-                for r in world.get("active_rules", [])
-            ],
-            "active_rules_count": sum(1 for r in world.get("active_rules", []) if r.get("active", True)),
-        }
-
-
-@app.get("/rules")
-def get_rules():
-    """v10.1: 获取所有世界规则"""
-    with lock:
-        rules = []
-        for r in world.get("active_rules", []):
-            rules.append({
+def _view_evolution():
+    """v9.0: 获取所有进化引擎数据（v10.4: 视图构建，需持有 lock）"""
+    return {
+        "world_modifications": world.get("world_modifications", []),
+        "urban_legends": world.get("urban_legends", []),
+        "graveyard": world.get("graveyard", []),
+        "generation_count": world.get("generation_count", 0),
+        "reputation_board": world.get("reputation_board", {}),
+        "location_vibes": {loc: data.get("vibe", "普通") for loc, data in world["locations"].items()},
+        "location_memories": {loc: data.get("public_memory", [])[-10:] for loc, data in world["locations"].items()},
+        "location_modifications": {loc: data.get("modifications", []) for loc, data in world["locations"].items()},
+        # v10.1: 规则引擎数据
+        "active_rules": [
+            {
                 "id": r["id"],
                 "name": r["name"],
-                "creator": r.get("creator", ""),
                 "creator_name": r.get("creator_name", "?"),
                 "location": r.get("location"),
-                "trigger": r.get("trigger", "every_tick"),
                 "description": r.get("description", ""),
                 "durability": round(r.get("durability", 0), 1),
-                "decay_rate": r.get("decay_rate", 0.1),
                 "execution_count": r.get("execution_count", 0),
                 "active": r.get("active", True),
-                "created_tick": r.get("created_tick", 0),
-                "effects_summary": str(r.get("effects", []))[:100],
-            })
-        return {"rules": rules, "active_count": sum(1 for r in rules if r.get("active", True))}
+            }
+            for r in world.get("active_rules", [])
+        ],
+        "active_rules_count": sum(1 for r in world.get("active_rules", []) if r.get("active", True)),
+    }
+
+
+def _view_rules():
+    """v10.1: 获取所有世界规则（v10.4: 视图构建，需持有 lock）"""
+    rules = []
+    for r in world.get("active_rules", []):
+        rules.append({
+            "id": r["id"],
+            "name": r["name"],
+            "creator": r.get("creator", ""),
+            "creator_name": r.get("creator_name", "?"),
+            "location": r.get("location"),
+            "trigger": r.get("trigger", "every_tick"),
+            "description": r.get("description", ""),
+            "durability": round(r.get("durability", 0), 1),
+            "decay_rate": r.get("decay_rate", 0.1),
+            "execution_count": r.get("execution_count", 0),
+            "active": r.get("active", True),
+            "created_tick": r.get("created_tick", 0),
+            "effects_summary": str(r.get("effects", []))[:100],
+        })
+    return {"rules": rules, "active_count": sum(1 for r in rules if r.get("active", True))}
+
+
+def _view_location_rules(location):
+    """v10.1: 获取某地点的活跃规则摘要（v10.4: 视图构建，需持有 lock）"""
+    summaries = get_rules_summary(world, location)
+    return {"location": location, "rules": summaries}
+
+
+def _view_location_history(loc_name):
+    """v9.0: 获取地点历史（v10.4: 视图构建，需持有 lock）"""
+    loc = world["locations"][loc_name]
+    return {
+        "name": loc_name,
+        "desc": loc["desc"],
+        "vibe": loc.get("vibe", "普通"),
+        "public_memory": loc.get("public_memory", []),
+        "modifications": loc.get("modifications", []),
+        "current_bots": list(loc["bots"]),
+    }
+
+
+def _view_reputation():
+    """v9.0: 获取声望榜（v10.4: 视图构建，需持有 lock）"""
+    board = []
+    for bid, bot in world["bots"].items():
+        rep = bot.get("reputation", {"score": 0, "tags": [], "deeds": []})
+        board.append({
+            "bot_id": bid,
+            "name": bot.get("name", bid),
+            "score": rep.get("score", 0),
+            "tags": rep.get("tags", []),
+            "deeds": rep.get("deeds", [])[-5:],
+            "generation": bot.get("generation", 0),
+            "status": bot.get("status", "alive"),
+        })
+    board.sort(key=lambda x: x["score"], reverse=True)
+    return {"reputation_board": board}
+
+
+def _view_graveyard():
+    """v9.0: 获取墓地记录（v10.4: 视图构建，需持有 lock）"""
+    return {"graveyard": world.get("graveyard", [])}
+
+
+def _view_legends():
+    """v9.0: 获取城市传说（v10.4: 视图构建，需持有 lock）"""
+    return {"urban_legends": world.get("urban_legends", [])}
+
+
+# === v10.8: 单个 bot 的感知包 ===
+PERCEPTION_MESSAGES = 8   # 收件箱最近条数
+PERCEPTION_MOMENTS = 5    # 别人的朋友圈最近条数
+
+
+def _view_perceptions(bot_ids=None):
+    """v10.8: /bot/{id}/perception 视图（需持有 lock）。
+    只包含 think_and_plan / reflect 用到的内容：自身状态、同地点的人、地点记忆与规则、
+    收件箱、别人的朋友圈、新闻热搜、城市传说。同地点的人直接取 location["bots"] 索引。
+    v10.27: 给出 bot_ids 时只构建这些 bot 的感知包"""
+    board = world["message_board"]
+    recent_moments = world["moments"][-50:]
+    shared = {
+        "time": world["time"],
+        "weather": world["weather"],
+        "news_feed": world["news_feed"][:3],
+        "hot_topics": world["hot_topics"][:3],
+        "events": world["events"][-3:],
+        "urban_legends": world.get("urban_legends", [])[-3:],
+        "world_modifications": world.get("world_modifications", [])[-5:],
+        "narrative": world.get("world_narrative", ""),
+    }
+    loc_cache = {}
+    out = {}
+    bots = world["bots"]
+    for bid in bots if bot_ids is None else bot_ids:
+        bot = bots[bid]
+        loc_name = bot["location"]
+        if loc_name not in loc_cache:
+            loc_data = world["locations"].get(loc_name, {})
+            loc_cache[loc_name] = {
+                "name": loc_name,
+                "desc": loc_data.get("desc", ""),
+                "type": loc_data.get("type", ""),
+                "bots": list(loc_data.get("bots", [])),
+                "npcs": [{"name": n["name"], "role": n["role"]} for n in loc_data.get("npcs", [])],
+                "jobs": [{"title": j["title"], "pay": j["pay"]} for j in loc_data.get("jobs", [])],
+                "public_memory": loc_data.get("public_memory", [])[-3:],
+                "modifications": loc_data.get("modifications", []),
+                "vibe": loc_data.get("vibe", "普通"),
+                "recent_events": loc_data.get("recent_events", [])[-5:],
+                "rules": get_rules_summary(world, loc_name)[:5],
+            }
+        location = loc_cache[loc_name]
+        nearby = {}
+        for nb in location["bots"]:
+            ob = world["bots"].get(nb)
+            if nb == bid or not ob:
+                continue
+            nearby[nb] = {
+                "id": nb, "name": ob["name"], "gender": ob["gender"], "location": ob["location"],
+                "is_sleeping": ob.get("is_sleeping", False),
+                "current_activity": ob.get("current_activity", ""),
+            }
+        moments = [m for m in recent_moments if m.get("bot_id") != bid][-PERCEPTION_MOMENTS:]
+        out[bid] = dict(
+            shared,
+            self=_safe_bot(bid, bot),
+            location=location,
+            nearby=nearby,
+            messages=board.for_bot(bid, limit=PERCEPTION_MESSAGES),
+            pending_reply_to=bot.get("pending_reply_to"),
+            moments=moments,
+        )
+    return out
+
+
+_bot_status_rows = {}  # v10.27: bot_id -> 调度信号，按 bot 发布时只重算涉及的 bot
+
+
+def _view_bot_status(bot_ids=None):
+    """v10.15: /bots/status 调度视图（需持有 lock）。
+    bot_runner 的心跳调度器据此给所有 bot 排紧迫度：饥饿/寿命/焦虑、待回应的对话、最近的私信与急信。
+    v10.17: 每个收件人最新一条私信和急信的 tick 由留言板在写入时记录，不再扫描。
+    v10.27: 给出 bot_ids 时只重算这些 bot 的一行，其余沿用上次的结果"""
+    board = world["message_board"]
+    bots = _bot_status_rows
+    if bot_ids is None:
+        bots.clear()
+    for bid in world["bots"] if bot_ids is None else bot_ids:
+        bot = world["bots"][bid]
+        pending = bot.get("pending_reply_to")
+        last_msg, last_urgent = board.last_ticks(bid)
+        bots[bid] = {
+            "name": bot["name"], "status": bot["status"],
+            "is_sleeping": bot.get("is_sleeping", False),
+            "hp": bot["hp"], "energy": bot["energy"], "satiety": bot["satiety"],
+            "anxiety": bot.get("emotions", {}).get("anxiety", 20),
+            "pending_reply_tick": pending.get("tick", 0) if pending else None,
+            "last_message_tick": last_msg,
+            "last_urgent_tick": last_urgent,
+        }
+    return {
+        "tick": world["time"]["tick"],
+        "virtual_hour": world["time"]["virtual_hour"],
+        "bots": bots,
+    }
+
+
+# ============================================================
+# v10.4: 只读视图发布 + GET 端点
+# 写者（tick / 行动提交 / 写端点）在锁内调用 publish_views，
+# GET 端点只读取已发布的 bytes，不再持有世界锁
+# ============================================================
+_VIEW_BUILDERS = {
+    "world": lambda: {"": _view_world()},
+    "bots": lambda: {bid: _view_bot_detail(bid) for bid in world["bots"]},
+    "messages": lambda: {bid: _view_messages(bid) for bid in world["bots"]},
+    "moments": lambda: {"": _view_moments()},
+    "gallery": lambda: {"": _view_gallery()},
+    "world_narrative": lambda: {"": _view_world_narrative()},
+    "evolution": lambda: {"": _view_evolution()},
+    "rules": lambda: {"": _view_rules()},
+    "location_rules": lambda: {loc: _view_location_rules(loc) for loc in world["locations"]},
+    "location_history": lambda: {loc: _view_location_history(loc) for loc in world["locations"]},
+    "reputation": lambda: {"": _view_reputation()},
+    "graveyard": lambda: {"": _view_graveyard()},
+    "legends": lambda: {"": _view_legends()},
+    "perception": _view_perceptions,
+    "bot_status": lambda: {"": _view_bot_status()},
+}
+
+# v10.8: 感知包由这些分组的数据拼成，任一分组重新发布时感知包跟着刷新
+# v10.15: 调度视图（bot_status）同样由 bot 状态和留言板拼成，随感知包一起刷新
+_PERCEPTION_SOURCES = {"world", "bots", "messages", "moments", "location_rules", "world_narrative"}
+_PERCEPTION_VIEWS = ("perception", "bot_status")
+
+# v10.27: 按 bot 发布。过去每次行动提交、状态同步、后台后果提交都整组重建所有 bot 的详情 / 收件箱 /
+# 感知包 / 调度信号（1000 个 bot 时约 500ms，全在世界锁里）。现在这几组只重建涉及的 bot：
+# 调用方给出的 bot + _touch_bots 记下的 + 新私信的收件人 + 成员有变化的地点里的人。
+# 其他 bot 感知包里的共享部分（事件、朋友圈、新闻、公共频道……）等到 tick 结束的全量发布再刷新。
+# /world 同样按 bot 发布：只重建涉及的 bot，其余 bot 拼接缓存的 JSON 片段（见 _view_world）。
+_BOT_VIEW_BUILDERS = {
+    "world": lambda ids: {"": _view_world(ids)},
+    "bots": lambda ids: {bid: _view_bot_detail(bid) for bid in ids},
+    "messages": lambda ids: {bid: _view_messages(bid) for bid in ids},
+    "perception": _view_perceptions,
+    "bot_status": lambda ids: {"": _view_bot_status(ids)},
+}
+_BOT_KEYED = ("bots", "messages", "perception")   # key 就是 bot_id 的分组，按 bot 发布时只更新给出的条目
+# 行动 / 后台后果可能改到的分组。单条的分组构建和编码都很便宜，内容没变时视图表不会升版本
+_ACTION_GROUPS = ("world", "bots", "messages", "moments", "gallery", "evolution", "rules",
+                  "location_rules", "location_history", "reputation")
+_dirty_bots = set()       # 上次发布之后状态变了、但不是发布调用方给出的 bot
+_view_message_seq = 0     # 视图已经反映到的留言板 seq
+
+
+def _touch_bots(*bot_ids):
+    """v10.27: 记下状态变了的 bot（需持有 lock），下一次按 bot 发布时刷新它们的视图"""
+    _dirty_bots.update(bot_ids)
+
+
+def _take_view_targets(bots):
+    """v10.27: 这次发布要刷新的 bot（需持有 lock），同时清空积累的脏标记。
+    bots 为 None（全量发布）、或换了一块留言板时返回 None。
+    公共频道的新留言不算：所有人的收件箱 / 感知包都会变，但为一条公共留言重建所有 bot 太贵，
+    和感知包里的其他共享部分一样等 tick 结束的全量发布"""
+    global _view_message_seq
+    board = world["message_board"]
+    fresh = board.since(_view_message_seq) if bots is not None and board.seq >= _view_message_seq else None
+    _view_message_seq = board.seq
+    touched = occupancy.take_touched()
+    targets = _dirty_bots | set(bots or ())
+    _dirty_bots.clear()
+    if fresh is None:
+        return None
+    for m in fresh:
+        to = m.get("to") or PUBLIC
+        if to != PUBLIC:
+            targets.add(to)
+    locations = world["locations"]
+    for loc in touched:
+        if loc in locations:
+            targets.update(locations[loc]["bots"])
+    return [bid for bid in targets if bid in world["bots"]]
+
+
+def _world_entities(safe, bot_ids=None):
+    """v10.6: 把 /world 视图拆成实体，供 /world/changes 逐个比对。
+    朋友圈按 /moments 的窗口（最近50条）跟踪，事件没有 id，用内容摘要作 key。
+    v10.27: 按 bot 发布时只给出涉及的 bot（实体类 bots 部分更新）"""
+    split = ("bots", "locations", "moments", "events", "active_rules")
+    return {
+        "bots": safe["bots"] if bot_ids is None else {bid: safe["bots"][bid] for bid in bot_ids},
+        "locations": safe["locations"],
+        "moments": {m.get("id") or content_key(m): m for m in world["moments"][-50:]},
+        "events": {content_key(e): e for e in safe["events"]},
+        "rules": {r["id"]: r for r in safe["active_rules"]},
+        "globals": {k: v for k, v in safe.items() if k not in split},
+    }
+
+
+def publish_views(*groups, bots=None):
+    """重新构建并发布视图（需持有 lock）。不传分组时发布全部视图。
+    v10.27: 给出 bots（可以为空）时按 bot 发布：单 bot 的分组只重建涉及的 bot（见 _take_view_targets）"""
+    names = groups or tuple(_VIEW_BUILDERS)
+    if _PERCEPTION_SOURCES.intersection(names):
+        names = names + tuple(g for g in _PERCEPTION_VIEWS if g not in names)
+    targets = None
+    try:
+        targets = _take_view_targets(bots)
+        if targets is None:
+            built = {g: _VIEW_BUILDERS[g]() for g in names}
+            partial = ()
+        else:
+            built = {g: (_BOT_VIEW_BUILDERS[g](targets) if g in _BOT_VIEW_BUILDERS else _VIEW_BUILDERS[g]())
+                     for g in names}
+            partial = _BOT_KEYED
+        entities = None
+        if "world" in built:
+            safe = built["world"][""]
+            entities = _world_entities(safe, targets)
+            built["world"] = {"": _encode_world(safe)}
+        if views.publish(built, entities, partial):
+            stream_hub.notify()
+    except Exception as e:
+        log.error(f"[VIEW] 视图发布失败 {names}: {e}")
+    # v10.24: 新投递的留言记进历史库（留言板本身是有界的，溢出的旧留言只在历史库里）
+    try:
+        _record_messages()
+    except Exception as e:
+        log.error(f"[HISTORY] 留言记录失败: {e}")
+    # v10.23: 发布视图就是一次提交，顺带把变化追加进变更日志
+    # v10.27: 按 bot 发布时只比较涉及的 bot；其他 bot 的变化由 tick 结束的全量提交补上。
+    # 冷段还在恢复时不比较冷段：世界里此时只有启动后的新条目，记下来回放时会盖掉快照里的历史
+    try:
+        dirty = None if targets is None else {"bots": targets}
+        skip = () if cold_restored.is_set() else COLD_SECTIONS
+        world_log.commit(_build_snapshot(messages=False, bots=targets), world["message_board"],
+                         world["time"]["tick"], ",".join(groups) or "all", dirty=dirty, skip=skip)
+    except Exception as e:
+        log.error(f"[WAL] 提交记录失败: {e}")
+
+
+def _serve_view(request, group, key="", missing=None, missing_status=200):
+    """返回已发布的视图；不存在时返回 missing。
+    v10.5: 带 ETag，If-None-Match 命中时返回空的 304。"""
+    entry = views.get_entry(group, key)
+    if entry is None:
+        return JSONResponse(missing if missing is not None else {"error": "not found"}, missing_status)
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-World-Version": str(views.version)}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/world")
+def get_world(request: Request):
+    return _serve_view(request, "world")
+
+
+@app.get("/world/changes")
+def get_world_changes(since: int = 0, epoch: str = ""):
+    """v10.6: 增量变更流。返回版本号 > since 的 bot/地点/朋友圈/事件/规则/全局字段，
+    以及 removed 墓碑；reset=true 时为全量，客户端应丢弃本地状态。
+    下次请求带上响应里的 version 和 epoch。"""
+    version, body = views.changes_since(since, epoch or None)
+    return Response(content=body, media_type="application/json", headers={"X-World-Version": str(version)})
+
+
+@app.get("/stream")
+async def world_stream(request: Request, since: int = 0, epoch: str = ""):
+    """v10.7: SSE 推送。每次 tick / 行动提交后推送一帧 event: changes，
+    data 与 /world/changes 相同；慢客户端的多次更新会合并成一帧。
+    断线重连时浏览器自动带 Last-Event-ID，从断点继续。"""
+    last_epoch, last_version = parse_event_id(request.headers.get("last-event-id"))
+    if last_epoch:
+        since, epoch = last_version, last_epoch
+    return StreamingResponse(
+        stream_hub.events(views, since, epoch or None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/bot/{bot_id}/detail")
+def get_bot_detail(bot_id: str, request: Request):
+    return _serve_view(request, "bots", bot_id, {"error": "not found"}, 404)
+
+
+@app.get("/bot/{bot_id}/perception")
+def get_bot_perception(bot_id: str, request: Request):
+    """v10.8: bot 心跳用的感知包，一次请求代替 /world + /messages + /moments + /rules + /world_narrative"""
+    return _serve_view(request, "perception", bot_id, {"error": "not found"}, 404)
+
+
+@app.get("/bots/status")
+def get_bots_status(request: Request):
+    """v10.15: 所有 bot 的调度信号（状态、饥饿/寿命/焦虑、待回应对话、最新私信/急信的 tick），支持 ETag"""
+    return _serve_view(request, "bot_status")
+
+
+@app.get("/messages/{bot_id}")
+def get_messages(bot_id: str, request: Request, since: int = 0):
+    """v10.17: since > 0 时只返回 seq 更大的消息（直接读留言板，不走已发布视图）"""
+    if since > 0:
+        with lock:
+            return _view_messages(bot_id, since)
+    return _serve_view(request, "messages", bot_id, {"messages": [], "pending_reply_to": None})
+
+
+@app.get("/moments")
+def get_moments(request: Request):
+    return _serve_view(request, "moments")
+
+
+@app.get("/gallery")
+def get_gallery(request: Request):
+    return _serve_view(request, "gallery")
+
+
+@app.get("/world_narrative")
+def get_world_narrative(request: Request):
+    return _serve_view(request, "world_narrative")
+
+
+@app.get("/evolution")
+def get_evolution_data(request: Request):
+    """v9.0: 获取所有进化引擎数据"""
+    return _serve_view(request, "evolution")
+
+
+@app.get("/rules")
+def get_rules(request: Request):
+    """v10.1: 获取所有世界规则"""
+    return _serve_view(request, "rules")
+
+
+@app.get("/rules/archive")
+def get_rules_archive(offset: int = 0, limit: int = 50):
+    """v10.21: 已失效规则的归档，分页（最近失效的在前；直接读注册表，不走已发布视图）"""
+    limit = max(1, min(200, limit))
+    with lock:
+        total, rules = world["active_rules"].archived(offset, limit)
+    return {"total": total, "offset": offset, "limit": limit, "rules": rules}
 
 
 @app.get("/rules/{location}")
-def get_location_rules(location: str):
+def get_location_rules(location: str, request: Request):
     """v10.1: 获取某地点的活跃规则摘要"""
-    with lock:
-        summaries = get_rules_summary(world, location)
-        return {"location": location, "rules": summaries}
+    return _serve_view(request, "location_rules", location, {"location": location, "rules": []})
 
 
 @app.get("/location/{loc_name}/history")
-def get_location_history(loc_name: str):
-    """v9.0: 获取地点历史"""
-    with lock:
-        loc = world["locations"].get(loc_name)
-        if not loc:
-            return JSONResponse({"error": "location not found"}, 404)
-        return {
-            "name": loc_name,
-            "desc": loc["desc"],
-            "vibe": loc.get("vibe", "普通"),
-            "public_memory": loc.get("public_memory", []),
-            "modifications": loc.get("modifications", []),
-            "current_bots": loc["bots"],
-        }
+def get_location_history(loc_name: str, request: Request, offset: Optional[int] = None, limit: int = 50):
+    """v9.0: 获取地点历史。v10.24: 带 offset 时从历史库分页查完整的公共记忆（最新的在前）"""
+    if offset is None or not history.enabled:
+        return _serve_view(request, "location_history", loc_name, {"error": "location not found"}, 404)
+    if loc_name not in LOCATIONS:
+        return JSONResponse({"error": "location not found"}, 404)
+    limit = max(1, min(200, limit))
+    total, memories = history.query("memory", location=loc_name, offset=offset, limit=limit)
+    return {"name": loc_name, "total": total, "offset": offset, "limit": limit, "public_memory": memories}
 
 
 @app.get("/reputation")
-def get_reputation_board():
+def get_reputation_board(request: Request):
     """v9.0: 获取声望榜"""
-    with lock:
-        board = []
-        for bid, bot in world["bots"].items():
-            rep = bot.get("reputation", {"score": 0, "tags": [], "deeds": []})
-            board.append({
-                "bot_id": bid,
-                "name": bot.get("name", bid),
-                "score": rep.get("score", 0),
-                "tags": rep.get("tags", []),
-                "deeds": rep.get("deeds", [])[-5:],
-                "generation": bot.get("generation", 0),
-                "status": bot.get("status", "alive"),
-            })
-        board.sort(key=lambda x: x["score"], reverse=True)
-        return {"reputation_board": board}
+    return _serve_view(request, "reputation")
 
 
 @app.get("/graveyard")
-def get_graveyard():
-    """v9.0: 获取墓地记录"""
-    with lock:
-        return {"graveyard": world.get("graveyard", [])}
+def get_graveyard(request: Request, offset: Optional[int] = None, limit: int = 50):
+    """v9.0: 获取墓地记录。v10.24: 内存里只有最近的墓地记录，带 offset 时从历史库分页查全部（最新的在前）。
+    v10.27: 不带 offset 时返回已发布的热窗口视图（带 ETag），不再每次从历史库读出全部墓地记录"""
+    if offset is None or not history.enabled:
+        return _serve_view(request, "graveyard")
+    limit = max(1, min(200, limit))
+    total, graves = history.query("grave", offset=offset, limit=limit)
+    return {"total": total, "offset": offset, "limit": limit, "graveyard": graves}
+
+
+@app.get("/history")
+def get_history(kind: str = "event", bot: Optional[str] = None, location: Optional[str] = None,
+                type: Optional[str] = None, since_tick: Optional[int] = None, until_tick: Optional[int] = None,
+                offset: int = 0, limit: int = 50):
+    """v10.24: 历史库分页查询（不占世界锁）。kind: event/moment/message/grave/legend/action/memory；
+    可按 bot、地点、类型、tick 范围过滤，最新的在前。留言的 bot 是收件人、type 是发件人"""
+    if kind not in HISTORY_KINDS:
+        return JSONResponse({"error": f"unknown kind: {kind}", "kinds": list(HISTORY_KINDS)}, 400)
+    limit = max(1, min(200, limit))
+    total, items = history.query(kind, bot=bot, location=location, type=type,
+                                 since_tick=since_tick, until_tick=until_tick, offset=offset, limit=limit)
+    return {"kind": kind, "total": total, "offset": offset, "limit": limit, "items": items,
+            "enabled": history.enabled}
 
 
 @app.get("/legends")
-def get_urban_legends():
+def get_urban_legends(request: Request):
     """v9.0: 获取城市传说"""
+    return _serve_view(request, "legends")
+
+
+@app.get("/admin/tick_stats")
+def get_tick_stats():
+    """v10.3: tick 临界区耗时 + 后台任务队列状态（v10.10: 含行动后果队列深度，v10.17: 含留言板占用，
+    v10.21: 含规则注册表，v10.22: 含快照写线程，v10.23: 含变更日志，v10.24: 含历史库，v10.26: 含内存检查点）"""
+    count = _tick_stats["count"] or 1
     with lock:
-        return {"urban_legends": world.get("urban_legends", [])}
+        board = world["message_board"].stats()
+        rules = world["active_rules"].stats()
+        ring = checkpoints.stats()
+    return {
+        "tick": {
+            "count": _tick_stats["count"],
+            "last_ms": round(_tick_stats["last_ms"], 2),
+            "max_ms": round(_tick_stats["max_ms"], 2),
+            "avg_ms": round(_tick_stats["total_ms"] / count, 2),
+            "last_jobs_applied": _tick_stats["last_jobs_applied"],
+        },
+        "jobs": jobs.stats(),
+        "deferred": deferred.stats(),
+        "stream": stream_hub.stats(),
+        "message_board": board,
+        "rules": rules,
+        "snapshot": dict(snapshots.stats(), cold_restoring=not cold_restored.is_set()),
+        "wal": world_log.stats(),
+        "history": history.stats(),
+        "checkpoints": ring,
+    }
+
+
+@app.get("/admin/llm_stats")
+def get_llm_stats():
+    """v10.9: LLM 网关统计（按调用点的次数/失败/重试/排队/延迟/token，各模型当前并发）
+    v10.12: intent 为快速意图识别命中情况（fast 为跳过 LLM 解析的次数）"""
+    return dict(client.stats(), intent=intents.stats())
+
+
+def _build_snapshot(messages=True, bots=None):
+    """拼出快照 dict（需持有 lock）。v10.22: 两个保存入口共用，并带上规则注册表
+    v10.23: 变更日志每次提交也用它比较（messages=False：留言板按 seq 单独记录）
+    v10.27: 给出 bots 时只放这些 bot（变更日志只比较涉及的 bot）"""
+    snapshot = {
+        "time": world["time"],
+        "weather": world["weather"],
+        "news_feed": world["news_feed"],
+        "hot_topics": world["hot_topics"],
+        "bots": {},
+        "locations": {},
+        "events": world["events"][-50:],
+        "moments": world["moments"][-100:],
+        "gallery": world["gallery"],
+        "world_narrative": world.get("world_narrative", ""),
+        "food_prices": world.get("food_prices", {}),
+        # v9.0
+        "world_modifications": world.get("world_modifications", []),
+        "urban_legends": world.get("urban_legends", []),
+        "generation_count": world.get("generation_count", 0),
+        "graveyard": world.get("graveyard", []),
+        "reputation_board": world.get("reputation_board", {}),
+        # v10.22: 规则（恢复时一直在读，但过去从没写进快照）
+        "active_rules": world["active_rules"].to_list(),
+        "rule_archive": world["active_rules"].archive_list(),
+    }
+    if messages:
+        snapshot["message_board"] = world["message_board"].to_list()
+    for bid in world["bots"] if bots is None else bots:
+        bot = world["bots"][bid]
+        snapshot["bots"][bid] = dict(bot)
+        snapshot["bots"][bid]["action_log"] = bot["action_log"][-20:]
+        snapshot["bots"][bid]["long_term_goal"] = bot.get("long_term_goal")
+        snapshot["bots"][bid]["pending_reply_to"] = bot.get("pending_reply_to")
+        snapshot["bots"][bid]["recent_actions_synced"] = bot.get("recent_actions_synced", [])
+        snapshot["bots"][bid]["narrative_summary"] = bot.get("narrative_summary")
+    # v9.0: 保存地点公共记忆
+    for loc_name, loc_data in world["locations"].items():
+        snapshot["locations"][loc_name] = {
+            "public_memory": loc_data.get("public_memory", []),
+            "modifications": loc_data.get("modifications", []),
+            "vibe": loc_data.get("vibe", "普通"),
+        }
+    return snapshot
+
+
+def _capture_checkpoint():
+    """v10.26: 拍一份内存检查点（需持有 lock）：快照内容 + 生效中的事件效果"""
+    try:
+        state = _build_snapshot()
+        state["active_effects"] = world["active_effects"]
+        checkpoints.capture(state, world["time"]["tick"])
+    except Exception as e:
+        log.error(f"[CHECKPOINT] 检查点拍摄失败: {e}")
+
+
+def _rewind_world(state):
+    """v10.26: 用检查点替换当前世界（需持有 lock）。
+    走与快照恢复相同的流程，地点的 NPC、工作岗位这些不在快照里的内容保持现状；
+    留言 seq 不回退，新留言不会和被放弃的那条时间线撞号（变更日志、历史库都按 seq 记）。
+    v10.27: 倒带前后出现过的 bot 都递增版本号，倒带前准备、倒带后才提交的行动会按当前状态重新校验"""
+    seq = world["message_board"].seq
+    before = list(world["bots"])
+    world["bots"].clear()
+    for loc in world["locations"].values():
+        loc["bots"] = OccupantSet()
+    occupancy.reset()
+    _restore_world(state, exact=True)
+    world["message_board"].seq = max(world["message_board"].seq, seq)
+    for bid in set(before) | set(world["bots"]):
+        _bump_bot_version(bid)
+
+
+def _rewind_history(tick, captured):
+    """v10.27: 倒带后让历史库也回到检查点（需持有 lock）：删掉被放弃那条时间线写进去的记录，
+    朋友圈、城市传说按检查点里的内容整条重写（之后的点赞、传播次数作废）。
+    检查点里的事件、朋友圈只是快照那段尾巴（50 / 100 条），历史库开着时从库里补回完整的热窗口"""
+    deleted = history.delete_after(tick, since=captured, rewritten=("moment", "legend"))
+    for moment in world["moments"]:
+        _record_moment(moment)
+    for legend in world.get("urban_legends", []):
+        _record_legend(legend)
+    if not history.enabled:
+        return deleted
+    _, events = history.query("event", until_tick=tick, limit=HISTORY_HOT_EVENTS)
+    if len(events) > len(world["events"]):
+        world["events"] = events[::-1]
+    _, moments = history.query("moment", until_tick=tick, limit=150)  # 与发朋友圈时截断后的条数一致
+    if len(moments) > len(world["moments"]):
+        world["moments"] = moments[::-1]
+    return deleted
 
 
 @app.post("/admin/save_snapshot")
-async def save_snapshot():
+def save_snapshot():
+    """v10.22: 锁内只拍下快照副本，等后台写线程落盘（不阻塞 tick）"""
+    if not cold_restored.wait(timeout=30):
+        return {"ok": False, "error": "snapshot cold sections still restoring"}
     with lock:
-        snapshot = {
-            "time": world["time"],
-            "weather": world["weather"],
-            "news_feed": world["news_feed"],
-            "hot_topics": world["hot_topics"],
-            "bots": {},
-            "locations": {},
-            "events": world["events"][-50:],
-            "message_board": world["message_board"][-100:],
-            "moments": world["moments"][-100:],
-            "gallery": world["gallery"],
-            "world_narrative": world.get("world_narrative", ""),
-            # v9.0
-            "world_modifications": world.get("world_modifications", []),
-            "urban_legends": world.get("urban_legends", []),
-            "generation_count": world.get("generation_count", 0),
-            "graveyard": world.get("graveyard", []),
-            "reputation_board": world.get("reputation_board", {}),
-        }
-        for bid, bot in world["bots"].items():
-            snapshot["bots"][bid] = dict(bot)
-            snapshot["bots"][bid]["action_log"] = bot["action_log"][-20:]
-            snapshot["bots"][bid]["long_term_goal"] = bot.get("long_term_goal")
-            snapshot["bots"][bid]["pending_reply_to"] = bot.get("pending_reply_to")
-            snapshot["bots"][bid]["recent_actions_synced"] = bot.get("recent_actions_synced", [])
-        # v9.0: 保存地点公共记忆
-        for loc_name, loc_data in world["locations"].items():
-            snapshot["locations"][loc_name] = {
-                "public_memory": loc_data.get("public_memory", []),
-                "modifications": loc_data.get("modifications", []),
-                "vibe": loc_data.get("vibe", "普通"),
-            }
-        with open(SNAPSHOT_PATH, "w") as f:
-            json.dump(snapshot, f, ensure_ascii=False, indent=2)
-    return {"ok": True, "tick": world["time"]["tick"]}
+        tick = world["time"]["tick"]
+        snapshot = _build_snapshot()
+        snapshot["wal_seq"] = _mark_checkpoint(snapshot, tick)
+        seq = snapshots.submit(snapshot, tick)
+    written = snapshots.flush(seq, timeout=30)
+    return {"ok": written, "tick": tick, "snapshot": snapshots.stats()}
+
+
+@app.get("/admin/checkpoints")
+def list_checkpoints():
+    """v10.26: 内存里的逐 tick 检查点（可倒带 / 分叉的 tick）与结构共享后的占用"""
+    with lock:
+        return {"ticks": checkpoints.ticks(), "stats": checkpoints.stats()}
+
+
+@app.post("/admin/checkpoints/{tick}/rewind")
+def rewind_to_checkpoint(tick: int):
+    """v10.26: 把世界倒回第 tick 个 tick 结束时的状态。之后的检查点作废，并马上拍一份快照，
+    变更日志从这份快照重新接上（重启不会回放被放弃的那条时间线）。
+    v10.27: 历史库里检查点之后的记录一并删掉（见 _rewind_history）。
+    倒带前开始、倒带后才拿到 LLM 结果的行动：bot 版本号已变，提交前按倒带后的状态重新校验，不合法的放弃。
+    已经在后台队列里的其他 LLM 结果（后果回写、规则等）仍会写回；bot 进程自己的记忆不会倒带"""
+    if not cold_restored.wait(timeout=30):
+        return JSONResponse({"error": "snapshot cold sections still restoring"}, 503)
+    with lock:
+        state = checkpoints.state(tick)
+        if state is None:
+            return JSONResponse({"error": "checkpoint not found", "ticks": checkpoints.ticks()}, 404)
+        _rewind_world(state)
+        try:
+            deleted = _rewind_history(tick, checkpoints.captured_at(tick))
+            log.info(f"[CHECKPOINT] 历史库删掉了 {deleted} 条被放弃的记录")
+        except Exception as e:
+            log.error(f"[CHECKPOINT] 历史库倒带失败: {e}")
+        checkpoints.truncate_after(tick)
+        checkpoints.count("rewinds")
+        publish_views()
+    log.warning(f"[CHECKPOINT] 世界已倒回 tick={tick}")
+    _do_auto_save()
+    return {"ok": True, "tick": tick, "bots": len(world["bots"]), "checkpoints": checkpoints.ticks()}
+
+
+@app.post("/admin/checkpoints/{tick}/fork")
+def fork_from_checkpoint(tick: int):
+    """v10.26: 把第 tick 个 tick 的检查点导出成一份独立的快照文件（FORK_DIR），当前世界不受影响。
+    另起一个引擎指向它（SNAPSHOT_PATH，另配 WAL_DIR / HISTORY_DB_PATH / 端口，WORLD_ENGINE_URL 让它拉起的 bot 连过去）
+    就能从这里跑 what-if"""
+    with lock:
+        state = checkpoints.state(tick)
+        if state is None:
+            return JSONResponse({"error": "checkpoint not found", "ticks": checkpoints.ticks()}, 404)
+        checkpoints.count("forks")
+    # v10.27: 扩展名跟着实际的压缩方式（分段快照是压缩的 JSON Lines）
+    fork_dir = os.path.join(FORK_DIR, f"world_fork_t{tick}_{int(time.time())}")
+    ext = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}.get(snapshots.compression, ".json")
+    path = fork_dir + ext
+    try:
+        os.makedirs(FORK_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            write_snapshot(f, state, snapshots.compression)
+    except OSError as e:
+        log.error(f"[CHECKPOINT] 分叉快照写入失败: {e}")
+        return JSONResponse({"error": str(e)}, 500)
+    log.info(f"[CHECKPOINT] 从 tick={tick} 分叉: {path}")
+    return {"ok": True, "tick": tick, "path": path,
+            "run": f"SNAPSHOT_PATH={path} WAL_DIR={fork_dir}_wal HISTORY_DB_PATH={fork_dir}_history.sqlite3 "
+                   f"WORLD_ENGINE_URL=http://localhost:8100 uvicorn world_engine_v8:app --port 8100"}
 
 
 # 静态文件服务
@@ -3616,47 +4648,64 @@ if os.path.exists(avatar_dir):
 # ============================================================
 # 启动
 # ============================================================
+def _start_cold_restore(reader, skip):
+    """v10.25: 后台接着读快照的冷段（事件/朋友圈/墓地/传说/规则归档等），每读完一段在锁内并进世界。
+    启动后新产生的条目排在恢复的历史后面；skip 里的段不用快照里的值。
+    v10.27: 变更日志里这一段的列表差异在这里补上，补完的值同时成为日志的比较基准"""
+    cold_restored.clear()
+
+    def _merge(name, value):
+        value = world_log.apply_pending(name, list(value))
+        world_log.seed_section(name, value)
+        if name == "rule_archive":
+            world["active_rules"].restore_archive(value)
+        else:
+            world[name] = value + world.get(name, [])
+
+    def _run():
+        t0, merged = time.perf_counter(), []
+        try:
+            for name, value in reader.read_cold():
+                if name in skip:
+                    continue
+                with lock:
+                    _merge(name, value)
+                merged.append(name)
+        except Exception as e:
+            log.error(f"[SNAPSHOT] 冷段读取失败，只恢复了 {merged}: {e}")
+        finally:
+            reader.close()
+            with lock:
+                # 快照里没有这一段、日志里却有它的差异：从空列表开始补
+                for name in world_log.pending_sections():
+                    if name not in skip and name not in merged:
+                        _merge(name, [])
+                _trim_hot_windows()
+                cold_restored.set()  # 先置位：这次发布要把冷段（连同恢复期间的新条目）记进日志
+                publish_views()
+        log.info(f"[SNAPSHOT] 冷段恢复完成 {merged} ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+
+    Thread(target=_run, name="snapshot-cold", daemon=True).start()
+
+
+def _mark_checkpoint(snapshot, tick):
+    """v10.23: 快照即检查点（需持有 lock），返回快照应记录的 wal_seq。
+    v10.27: 先把还没提交的变化记进日志，快照正好是日志里这条记录之后的状态"""
+    state = {k: v for k, v in snapshot.items() if k != "message_board"}
+    return world_log.mark_checkpoint(tick, state, world["message_board"])
+
+
 def _do_auto_save():
-    """自动保存快照（非async版本，供tick循环调用）"""
+    """自动保存快照（供tick循环调用）。v10.22: 锁内只拍下副本，序列化和写盘在后台写线程"""
+    if not cold_restored.is_set():
+        log.info("快照冷段还在恢复，跳过本次自动保存")
+        return
     try:
         with lock:
-            snapshot = {
-                "time": world["time"],
-                "weather": world["weather"],
-                "news_feed": world["news_feed"],
-                "hot_topics": world["hot_topics"],
-                "bots": {},
-                "locations": {},
-                "events": world["events"][-50:],
-                "message_board": world["message_board"][-100:],
-                "moments": world["moments"][-100:],
-                "gallery": world["gallery"],
-                "world_narrative": world.get("world_narrative", ""),
-                "food_prices": world.get("food_prices", {}),
-                # v9.0
-                "world_modifications": world.get("world_modifications", []),
-                "urban_legends": world.get("urban_legends", []),
-                "generation_count": world.get("generation_count", 0),
-                "graveyard": world.get("graveyard", []),
-                "reputation_board": world.get("reputation_board", {}),
-            }
-            for bid, bot in world["bots"].items():
-                snapshot["bots"][bid] = dict(bot)
-                snapshot["bots"][bid]["action_log"] = bot["action_log"][-20:]
-                snapshot["bots"][bid]["long_term_goal"] = bot.get("long_term_goal")
-                snapshot["bots"][bid]["pending_reply_to"] = bot.get("pending_reply_to")
-                snapshot["bots"][bid]["recent_actions_synced"] = bot.get("recent_actions_synced", [])
-                snapshot["bots"][bid]["narrative_summary"] = bot.get("narrative_summary")
-            # v9.0: 保存地点公共记忆
-            for loc_name, loc_data in world["locations"].items():
-                snapshot["locations"][loc_name] = {
-                    "public_memory": loc_data.get("public_memory", []),
-                    "modifications": loc_data.get("modifications", []),
-                    "vibe": loc_data.get("vibe", "普通"),
-                }
-            with open(SNAPSHOT_PATH, "w") as f:
-                json.dump(snapshot, f, ensure_ascii=False)
-        log.info(f"自动快照已保存 (tick={world['time']['tick']})")
+            snapshot = _build_snapshot()
+            snapshot["wal_seq"] = _mark_checkpoint(snapshot, world["time"]["tick"])  # v10.23: 快照即检查点
+            snapshots.submit(snapshot, world["time"]["tick"])
+        log.info(f"自动快照已提交 (tick={world['time']['tick']})")
         log.info(f"  v9.0: {len(world.get('world_modifications',[]))}个世界改造, {len(world.get('urban_legends',[]))}个城市传说, {len(world.get('graveyard',[]))}个墓地记录")
     except Exception as e:
         log.error(f"自动快照保存失败: {e}")
@@ -3669,12 +4718,17 @@ def start_tick_loop():
         while True:
             try:
                 world_tick()
-                # 每10个tick自动保存一次快照
-                if world["time"]["tick"] % 10 == 0:
+                # 每10个tick自动保存一次快照（v10.23: 开了变更日志时按检查点间隔/日志大小）
+                tick = world["time"]["tick"]
+                if world_log.checkpoint_due(tick) if world_log.enabled else tick % 10 == 0:
                     _do_auto_save()
             except Exception as e:
                 log.error(f"Tick异常: {e}")
             _time.sleep(15)  # 每15秒一个tick (加速模式)
+    jobs.start()
+    deferred.start()
+    world_log.start()
+    snapshots.start()
     t = Thread(target=_loop, daemon=True)
     t.start()
     log.info("Tick循环已启动 (15秒/tick 加速模式, 每10tick自动保存快照)")
@@ -3683,8 +4737,19 @@ def start_tick_loop():
 @app.on_event("startup")
 def on_startup():
     init_world()
+    with lock:
+        publish_views()
     start_tick_loop()
     log.info("=== 深圳生存模拟 v9.0 世界引擎启动 (自我进化: 世界改造/地点记忆+声望/代际传承) ===")
+    # v10.14: runner 模式——按分片拉起 bot_runner，每个 runner 在一个进程里托管多个 bot
+    if BOT_RUNNER_SHARDS:
+        for shard in range(BOT_RUNNER_SHARDS):
+            try:
+                subprocess.Popen(["python3", BOT_RUNNER_SCRIPT, "--shard", str(shard), "--shards", str(BOT_RUNNER_SHARDS)])
+                log.info(f"Bot runner 分片 {shard}/{BOT_RUNNER_SHARDS} 已启动")
+            except Exception as e:
+                log.error(f"启动 Bot runner 分片 {shard} 失败: {e}")
+        return
     # 启动Bot进程
     for bot_id in PERSONAS:
         bot = world["bots"].get(bot_id)
@@ -45,6 +45,8 @@ effect 类型:
 - {"type": "spawn_event", "event_name": "...", "event_desc": "..."}
 - {"type": "modify_rule", "target_rule": "...", "changes": {...}}  # 规则修改规则
 - {"type": "narrative", "text": "..."}  # 产生叙事文本
+
+v10.20: 规则在创建时编译成闭包（见"规则编译器"一节），条件/效果写错的规则在创建时就被拒绝（RuleError）。
 """
 
 import json
@@ -53,6 +55,9 @@ import random
 import re
 import uuid
 
+from rule_registry import RuleRegistry
+from history_store import get_history_store
+
 try:
     from config import OPENAI_MODEL_MINI
 except ImportError:
@@ -61,9 +66,13 @@ except ImportError:
 log = logging.getLogger("world")
 
 
+class RuleError(ValueError):
+    """规则定义不合法：条件或效果无法编译"""
+
+
 def create_rule(name, creator_id, creator_name, location, trigger, condition, effects, description, durability=100, decay_rate=0.1):
-    """创建一条新的世界规则"""
-    return {
+    """创建一条新的世界规则。v10.20: 创建时即编译校验，条件/效果不合法时抛 RuleError"""
+    rule = {
         "id": f"rule_{uuid.uuid4().hex[:8]}",
         "name": name,
         "creator": creator_id,
@@ -80,346 +89,548 @@ def create_rule(name, creator_id, creator_name, location, trigger, condition, ef
         "execution_count": 0,
         "last_triggered_tick": -1,
     }
+    compile_rule(rule)
+    return rule
 
 
-def evaluate_condition(condition, context):
-    """评估条件表达式。
-    context = {
-        "bot": bot_dict or None,
-        "location": location_name,
-        "world": world_dict,
-        "tick": int,
-        "virtual_hour": int,
-    }
-    """
-    if not condition:
+# ============================================================
+# v10.20 规则编译器
+# ============================================================
+# 过去 tick_rules 对每条规则 × 每个 bot × 每个 tick 递归解释条件 dict（evaluate_condition），
+# 效果再按 type 字符串走一长串 if/elif（apply_effect）。
+# 写错的规则（未知条件、未知效果、非数值参数）不会报错，只会每 tick 静默失效或静默为真。
+#
+# 现在规则在创建时（create_rule）或从快照恢复时（compile_rules）编译一次：
+# - 条件编译成 fn(bot, 虚拟小时) -> bool；常量折叠（random>=1、全天时间段、and/or 里的常量），
+#   always / 恒真条件不再调用，恒假的 every_tick 规则直接跳过 bot 遍历
+# - and / or 里按代价重排：时间段、随机门先判断，通过了才读 bot 属性
+# - 每个效果编译成专门的闭包，参数在编译时取好、校验好
+# - 未知条件键、未知效果类型、非数值参数、不存在的属性都在编译时抛 RuleError，规则不会进入世界
+# 编译结果按规则 id 缓存在本模块里（不进 world，不影响视图和快照的序列化）。
+
+TRIGGERS = ("every_tick", "on_enter", "on_time", "on_interact")
+CONDITION_KEYS = {"always", "random", "time_between", "bot_at", "bot_attr_lt", "bot_attr_gt", "and", "or"}
+BOT_ATTRS = ("hp", "money", "energy", "satiety", "phone_battery", "age")  # 条件可比较的数值属性
+MODIFIABLE_ATTRS = ("hp", "money", "energy", "satiety", "phone_battery")  # modify_bot_attr 可改（money 只截下限）
+
+_compiled = {}  # 规则 id -> (规则 dict, CompiledRule)
+
+
+def _number(value, what):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError(f"{what} 需要数值: {value!r}")
+    return value
+
+
+def _choice(value, allowed, what):
+    if value not in allowed:
+        raise RuleError(f"{what} 不支持: {value!r}")
+    return value
+
+
+def _always(bot, vh):
+    return True
+
+
+def _cost(cond):
+    """and/or 里子条件的判断顺序：时间 < 随机 < 读 bot 属性 < 复合条件"""
+    for key, cost in (("time_between", 0), ("random", 1), ("bot_at", 2), ("bot_attr_lt", 2), ("bot_attr_gt", 2)):
+        if key in cond:
+            return cost
+    return 3
+
+
+def compile_condition(cond):
+    """编译条件表达式，返回常量 True / False 或 fn(bot, vh) -> bool。
+    与旧解释器的语义一致：空条件为真，同一个 dict 里多个键时按 always、random、time_between、
+    bot_at、bot_attr_lt、bot_attr_gt、and、or 的顺序只看第一个；bot 为 None 时 bot 条件为假。"""
+    if not cond:
         return True
-    
-    if condition.get("always"):
+    if not isinstance(cond, dict):
+        raise RuleError(f"条件必须是对象: {cond!r}")
+    unknown = set(cond) - CONDITION_KEYS
+    if unknown:
+        raise RuleError(f"未知条件: {sorted(unknown)}")
+
+    if cond.get("always"):
         return True
-    
-    if "random" in condition:
-        return random.random() < condition["random"]
-    
-    if "time_between" in condition:
-        start, end = condition["time_between"]
-        vh = context.get("virtual_hour", 12)
-        if start <= end:
-            return start <= vh <= end
-        else:  # 跨午夜
-            return vh >= start or vh <= end
-    
-    if "bot_at" in condition:
-        bot = context.get("bot")
-        if not bot:
+
+    if "random" in cond:
+        p = _number(cond["random"], "random")
+        if p <= 0:
             return False
-        return bot.get("location") == condition["bot_at"]
-    
-    if "bot_attr_lt" in condition:
-        bot = context.get("bot")
+        if p >= 1:
+            return True
+        rnd = random.random
+        return lambda bot, vh: rnd() < p
+
+    if "time_between" in cond:
+        span = cond["time_between"]
+        if not isinstance(span, (list, tuple)) or len(span) != 2:
+            raise RuleError(f"time_between 需要 [开始, 结束]: {span!r}")
+        start, end = _number(span[0], "time_between"), _number(span[1], "time_between")
+        if start <= end:
+            if start <= 0 and end >= 23:
+                return True
+            return lambda bot, vh: start <= vh <= end
+        return lambda bot, vh: vh >= start or vh <= end  # 跨午夜
+
+    if "bot_at" in cond:
+        loc = cond["bot_at"]
+        if not isinstance(loc, str):
+            raise RuleError(f"bot_at 需要地点名: {loc!r}")
+        return lambda bot, vh: bool(bot) and bot.get("location") == loc
+
+    for key in ("bot_attr_lt", "bot_attr_gt"):
+        if key in cond:
+            pair = cond[key]
+            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                raise RuleError(f"{key} 需要 [属性, 数值]: {pair!r}")
+            attr = _choice(pair[0], BOT_ATTRS, key)
+            val = _number(pair[1], key)
+            if key == "bot_attr_lt":
+                return lambda bot, vh: bool(bot) and bot.get(attr, 0) < val
+            return lambda bot, vh: bool(bot) and bot.get(attr, 0) > val
+
+    for key in ("and", "or"):
+        if key in cond:
+            subs = cond[key]
+            if not isinstance(subs, list):
+                raise RuleError(f"{key} 需要条件列表: {subs!r}")
+            # 子条件的随机门彼此独立，按代价重排不改变整体概率
+            ordered = sorted(subs, key=lambda c: _cost(c) if isinstance(c, dict) else 3)
+            fns = []
+            for compiled in map(compile_condition, ordered):
+                if compiled is (key == "or"):   # and 遇到 False / or 遇到 True：整体是常量
+                    return compiled
+                if compiled is not (key == "and"):  # 丢掉不影响结果的常量
+                    fns.append(compiled)
+            if not fns:
+                return key == "and"
+            if len(fns) == 1:
+                return fns[0]
+            if key == "and":
+                return lambda bot, vh: all(f(bot, vh) for f in fns)
+            return lambda bot, vh: any(f(bot, vh) for f in fns)
+
+    return True  # 只有 {"always": false}：旧解释器按未知条件处理，为真
+
+
+def _effect_location(effect, ctx):
+    """效果作用的地点：效果里写了 location 就用它，否则用规则所在地点"""
+    return effect["location"] if "location" in effect else ctx["rule_location"]
+
+
+# === 效果：每个 type 一个编译函数，返回 fn(ctx, world) -> (affected_bot_ids, narrative) ===
+def _fx_modify_bot_attr(effect):
+    attr = _choice(effect.get("attr"), MODIFIABLE_ATTRS, "modify_bot_attr.attr")
+    delta = _number(effect.get("delta", 0), "delta")
+    cost = _number(effect.get("cost_money", 0), "cost_money")
+    text = effect.get("narrative", "")
+    unbounded = attr == "money"  # 体征是 0~100 的百分比，钱没有上限
+
+    def run(ctx, world):
+        bot = ctx["bot"]
         if not bot:
-            return False
-        attr, val = condition["bot_attr_lt"]
-        return bot.get(attr, 0) < val
-    
-    if "bot_attr_gt" in condition:
-        bot = context.get("bot")
+            return (), ""
+        if cost > 0:
+            if bot.get("money", 0) < cost:  # 付不起
+                return (), ""
+            bot["money"] -= cost
+        old = bot.get(attr, 0)
+        if not isinstance(old, (int, float)):
+            return (), ""
+        bot[attr] = max(0, old + delta if unbounded else min(100, old + delta))
+        return (ctx["bot_id"],), text
+    return run
+
+
+def _fx_modify_bot_emotion(effect):
+    emo = effect.get("emotion", "happiness")  # 种子规则也会写 vanity 这类额外的情绪键
+    if not isinstance(emo, str) or not emo:
+        raise RuleError(f"modify_bot_emotion.emotion 需要情绪名: {emo!r}")
+    delta = _number(effect.get("delta", 0), "delta")
+
+    def run(ctx, world):
+        bot = ctx["bot"]
         if not bot:
-            return False
-        attr, val = condition["bot_attr_gt"]
-        return bot.get(attr, 0) > val
-    
-    if "and" in condition:
-        return all(evaluate_condition(c, context) for c in condition["and"])
-    
-    if "or" in condition:
-        return any(evaluate_condition(c, context) for c in condition["or"])
-    
-    # 未知条件默认为True
-    return True
+            return (), ""
+        emotions = bot.setdefault("emotions", {})
+        emotions[emo] = max(0, min(100, emotions.get(emo, 0) + delta))
+        return (ctx["bot_id"],), ""
+    return run
+
+
+def _fx_attract_bot(effect):
+    chance = _number(effect.get("chance", 0.1), "chance")
+    message = effect.get("message", "")
+    if chance <= 0:
+        return None
+
+    def run(ctx, world):
+        target_loc = _effect_location(effect, ctx)
+        # 概率门在遍历 bot 之前
+        if not target_loc or random.random() >= chance:
+            return (), ""
+        for bid, bot in world["bots"].items():
+            if bot["status"] == "alive" and not bot.get("is_sleeping") and bot["location"] != target_loc:
+                if random.random() < 0.3:  # 不是每个人都会被吸引
+                    # 不直接移动bot，而是给bot一个"吸引信号"，只保留最近3个
+                    signals = bot.get("attraction_signals", [])
+                    signals.append({"location": target_loc, "reason": message, "tick": ctx["tick"]})
+                    bot["attraction_signals"] = signals[-3:]
+                    return (bid,), ""
+        return (), ""
+    return run
+
+
+def _fx_generate_income(effect):
+    amount = _number(effect.get("amount", 1), "amount")
+    if effect.get("target", "creator") != "creator":
+        return None  # 只支持给创造者产生收入
+    text = f"收入+{amount}元"
+
+    def run(ctx, world):
+        creator_id = ctx["rule_creator"]
+        creator_bot = world["bots"].get(creator_id)
+        if creator_bot and creator_bot["status"] == "alive":
+            creator_bot["money"] += amount
+            return (creator_id,), text
+        return (), ""
+    return run
+
+
+def _fx_add_public_memory(effect):
+    content = effect.get("content", "")
+    if not content:
+        return None
+
+    def run(ctx, world):
+        loc_name = _effect_location(effect, ctx)
+        loc = world["locations"].get(loc_name)
+        if loc:
+            memory = loc.setdefault("public_memory", [])
+            entry = {
+                "event": content,
+                "actor": ctx["rule_creator"],
+                "tick": ctx["tick"],
+                "impact": "rule_effect",
+            }
+            memory.append(entry)
+            # v10.24: 内存里只留最近的，完整历史在历史库
+            get_history_store().record("memory", entry, tick=ctx["tick"], bot=ctx["rule_creator"],
+                                       location=loc_name, type="rule_effect")
+            if len(memory) > 30:
+                loc["public_memory"] = memory[-25:]
+        return (), ""
+    return run
+
+
+def _fx_spawn_event(effect):
+    name = effect.get("event_name", "未知事件")
+    desc = effect.get("event_desc", "")
+
+    def run(ctx, world):
+        event = {
+            "tick": ctx["tick"],
+            "time": world["time"]["virtual_datetime"],
+            "event": name,
+            "desc": desc,
+        }
+        world["events"].append(event)
+        get_history_store().record("event", event, tick=ctx["tick"], bot=ctx["rule_creator"],
+                                   location=ctx["rule_location"], type="rule")
+        return (), ""
+    return run
+
+
+def _fx_modify_location_desc(effect):
+    append_text = effect.get("append", "")
+    if not append_text:
+        return None
+
+    def run(ctx, world):
+        loc = world["locations"].get(_effect_location(effect, ctx))
+        if loc and append_text not in loc.get("desc", ""):
+            loc["desc"] = loc["desc"].rstrip() + "。" + append_text
+        return (), ""
+    return run
+
+
+def _fx_narrative(effect):
+    text = effect.get("text", "")
+    if not text:
+        return None
+    result = ((), text)
+    return lambda ctx, world: result
+
+
+def _fx_modify_rule(effect):
+    """规则修改规则——元编程。只允许改耐久、衰减和开关"""
+    target_rule_id = effect.get("target_rule", "")
+    changes = effect.get("changes", {})
+    if not isinstance(changes, dict):
+        raise RuleError(f"modify_rule.changes 需要对象: {changes!r}")
+    changes = {k: v for k, v in changes.items() if k in ("durability", "decay_rate", "active")}
+    if not target_rule_id or not changes:
+        return None
+
+    def run(ctx, world):
+        target = world["active_rules"].get(target_rule_id)  # 已归档的规则不会被唤醒
+        if target is not None:
+            target.update(changes)
+        return (), ""
+    return run
+
+
+_EFFECT_COMPILERS = {
+    "modify_bot_attr": _fx_modify_bot_attr,
+    "modify_bot_emotion": _fx_modify_bot_emotion,
+    "attract_bot": _fx_attract_bot,
+    "generate_income": _fx_generate_income,
+    "add_public_memory": _fx_add_public_memory,
+    "spawn_event": _fx_spawn_event,
+    "modify_location_desc": _fx_modify_location_desc,
+    "narrative": _fx_narrative,
+    "modify_rule": _fx_modify_rule,
+}
 
 
-def apply_effect(effect, context, world):
-    """应用一条效果。返回 (affected_bot_ids, narrative_text)"""
-    etype = effect.get("type", "")
-    affected = []
-    narrative = ""
-    
+def compile_effect(effect):
+    """编译一条效果，返回 fn(ctx, world) -> (affected, narrative)；注定无效果的返回 None"""
+    if not isinstance(effect, dict):
+        raise RuleError(f"效果必须是对象: {effect!r}")
+    compiler = _EFFECT_COMPILERS.get(effect.get("type", ""))
+    if compiler is None:
+        raise RuleError(f"未知效果类型: {effect.get('type')!r}")
+    return compiler(effect)
+
+
+class CompiledRule:
+    """一条规则的编译结果：cond 是常量 True / False 或 fn(bot, vh)，effects 是效果闭包列表"""
+
+    __slots__ = ("cond", "effects")
+
+    def __init__(self, cond, effects):
+        self.cond = cond
+        self.effects = effects
+
+    def matches(self, bot, vh):
+        cond = self.cond
+        return cond if cond is True or cond is False else cond(bot, vh)
+
+
+def compile_rule(rule):
+    """校验并编译一条规则（结果按 id 缓存）。不合法时抛 RuleError"""
+    _compiled.pop(rule["id"], None)
+    trigger = rule.get("trigger", "every_tick")
+    _choice(trigger, TRIGGERS, "trigger")
+    if trigger == "on_time":
+        hour = rule.get("trigger_hour", 12)  # v10.27: 越界的钟点永远不会触发，和写错的条件一样拒绝
+        if isinstance(hour, bool) or not isinstance(hour, int) or not 0 <= hour <= 23:
+            raise RuleError(f"trigger_hour 需要 0~23 的整数: {hour!r}")
+    effects = rule.get("effects", [])
+    if not isinstance(effects, list):
+        raise RuleError(f"effects 需要列表: {effects!r}")
+    compiled = CompiledRule(
+        compile_condition(rule.get("condition", {})),
+        [fn for fn in map(compile_effect, effects) if fn is not None],
+    )
+    _compiled[rule["id"]] = (rule, compiled)
+    return compiled
+
+
+def compile_rules(world):
+    """编译 world 里所有活跃规则（从快照恢复后调用）。不合法的规则标记为失效，返回失效条数"""
+    rejected = 0
+    for rule in world.get("active_rules", []):
+        if rule.get("active", True) and _compiled_rule(rule) is None:
+            rejected += 1
+    return rejected
+
+
+def _compiled_rule(rule):
+    """取规则的编译结果；没编译过（或规则 dict 被替换）时现编，不合法时让规则失效并返回 None"""
+    entry = _compiled.get(rule["id"])
+    if entry is not None and entry[0] is rule:
+        return entry[1]
     try:
-        if etype == "modify_bot_attr":
-            # 修改bot的某个属性
-            bot = context.get("bot")
-            if bot:
-                attr = effect["attr"]
-                delta = effect.get("delta", 0)
-                cost_money = effect.get("cost_money", 0)
-                
-                # 检查是否付得起
-                if cost_money > 0 and bot.get("money", 0) < cost_money:
-                    return affected, ""
-                
-                if cost_money > 0:
-                    bot["money"] -= cost_money
-                
-                old_val = bot.get(attr, 0)
-                if isinstance(old_val, (int, float)):
-                    bot[attr] = max(0, min(100, old_val + delta))
-                    affected.append(context.get("bot_id", ""))
-                    narrative = effect.get("narrative", "")
-                    
-        elif etype == "modify_bot_emotion":
-            bot = context.get("bot")
-            if bot:
-                emotions = bot.get("emotions", {})
-                emo = effect.get("emotion", "happiness")
-                delta = effect.get("delta", 0)
-                emotions[emo] = max(0, min(100, emotions.get(emo, 0) + delta))
-                bot["emotions"] = emotions
-                affected.append(context.get("bot_id", ""))
-                
-        elif etype == "attract_bot":
-            # 吸引附近的bot到某个地点
-            chance = effect.get("chance", 0.1)
-            target_loc = effect.get("location", context.get("rule_location", ""))
-            message = effect.get("message", "")
-            if target_loc and random.random() < chance:
-                # 找一个不在该地点的随机bot
-                for bid, bot in world["bots"].items():
-                    if bot["status"] == "alive" and not bot.get("is_sleeping") and bot["location"] != target_loc:
-                        if random.random() < 0.3:  # 不是每个人都会被吸引
-                            # 不直接移动bot，而是给bot一个"吸引信号"
-                            if "attraction_signals" not in bot:
-                                bot["attraction_signals"] = []
-                            bot["attraction_signals"].append({
-                                "location": target_loc,
-                                "reason": message,
-                                "tick": context.get("tick", 0),
-                            })
-                            # 只保留最近3个信号
-                            bot["attraction_signals"] = bot["attraction_signals"][-3:]
-                            affected.append(bid)
-                            break
-                            
-        elif etype == "generate_income":
-            # 给创造者产生收入
-            target = effect.get("target", "creator")
-            amount = effect.get("amount", 1)
-            if target == "creator":
-                creator_id = context.get("rule_creator", "")
-                creator_bot = world["bots"].get(creator_id)
-                if creator_bot and creator_bot["status"] == "alive":
-                    creator_bot["money"] += amount
-                    affected.append(creator_id)
-                    narrative = f"收入+{amount}元"
-                    
-        elif etype == "add_public_memory":
-            loc_name = effect.get("location", context.get("rule_location", ""))
-            content = effect.get("content", "")
-            loc = world["locations"].get(loc_name)
-            if loc and content:
-                if "public_memory" not in loc:
-                    loc["public_memory"] = []
-                loc["public_memory"].append({
-                    "event": content,
-                    "actor": context.get("rule_creator", "system"),
-                    "tick": context.get("tick", 0),
-                    "impact": "rule_effect",
-                })
-                if len(loc["public_memory"]) > 30:
-                    loc["public_memory"] = loc["public_memory"][-25:]
-                    
-        elif etype == "spawn_event":
-            # 产生一个事件
-            world["events"].append({
-                "tick": context.get("tick", 0),
-                "time": world["time"]["virtual_datetime"],
-                "event": effect.get("event_name", "未知事件"),
-                "desc": effect.get("event_desc", ""),
-            })
-            
-        elif etype == "modify_location_desc":
-            loc_name = effect.get("location", context.get("rule_location", ""))
-            loc = world["locations"].get(loc_name)
-            if loc:
-                append_text = effect.get("append", "")
-                if append_text and append_text not in loc.get("desc", ""):
-                    loc["desc"] = loc["desc"].rstrip() + "。" + append_text
-                    
-        elif etype == "narrative":
-            narrative = effect.get("text", "")
-            
-        elif etype == "modify_rule":
-            # 规则修改规则——元编程
-            target_rule_id = effect.get("target_rule", "")
-            changes = effect.get("changes", {})
-            rules = world.get("active_rules", [])
-            for r in rules:
-                if r["id"] == target_rule_id:
-                    for k, v in changes.items():
-                        if k in ("durability", "decay_rate", "active"):
-                            r[k] = v
-                    break
-                    
-    except Exception as e:
-        log.error(f"[RULES] apply_effect 失败: {etype} - {e}")
-    
-    return affected, narrative
+        return compile_rule(rule)
+    except RuleError as e:
+        rule["active"] = False
+        log.error(f"[RULES] 规则[{rule.get('name', rule['id'])}]不合法，已停用: {e}")
+        return None
+
+
+def _run_effects(rule, compiled, ctx, world, narratives):
+    # 每个效果单独兜底：一个效果出错不影响同一条规则的其他效果
+    for fn in compiled.effects:
+        try:
+            _, narr = fn(ctx, world)
+        except Exception as e:
+            log.error(f"[RULES] 规则[{rule.get('name', rule['id'])}]效果执行失败: {e}")
+            continue
+        if narr and narratives is not None:
+            narratives.append(narr)
+
+
+def _runnable(rule):
+    """本 tick 还要执行的规则的编译结果（可能刚被 modify_rule 关掉，或条件恒假）"""
+    if not rule.get("active", True):
+        return None
+    compiled = _compiled_rule(rule)
+    if compiled is None or compiled.cond is False:
+        return None
+    return compiled
+
+
+def _tick_every(world, rule, bot_ids, tick, vh, narratives):
+    """every_tick：对 bot_ids 里每个醒着的存活 bot 检查条件并应用效果"""
+    compiled = _runnable(rule)
+    if compiled is None:
+        return
+    bots = world["bots"]
+    rule_loc = rule.get("location")
+    creator = rule.get("creator", "")
+    for bid in bot_ids:
+        bot = bots.get(bid)
+        if not bot or bot["status"] != "alive" or bot.get("is_sleeping"):
+            continue
+        if not compiled.matches(bot, vh):
+            continue
+        ctx = {
+            "bot": bot, "bot_id": bid, "location": bot.get("location", ""),
+            "tick": tick, "virtual_hour": vh,
+            "rule_location": rule_loc, "rule_creator": creator,
+        }
+        _run_effects(rule, compiled, ctx, world, narratives)
+        rule["execution_count"] = rule.get("execution_count", 0) + 1
+        rule["last_triggered_tick"] = tick
+
+
+def _tick_on_enter(world, rule, bot_ids, tick, vh):
+    """on_enter：_triggered_bots 记录已经触发过、还没离开的bot，新进入的才触发"""
+    triggered_bots = rule.get("_triggered_bots", set())
+    if isinstance(triggered_bots, list):
+        triggered_bots = set(triggered_bots)
+    compiled = _runnable(rule)
+    if compiled is not None:
+        bots = world["bots"]
+        rule_loc = rule.get("location")
+        for bid in bot_ids:
+            bot = bots.get(bid)
+            if bid in triggered_bots or not bot or bot["status"] != "alive":
+                continue
+            if compiled.matches(bot, vh):
+                ctx = {
+                    "bot": bot, "bot_id": bid, "location": rule_loc,
+                    "tick": tick, "virtual_hour": vh,
+                    "rule_location": rule_loc, "rule_creator": rule.get("creator", ""),
+                }
+                _run_effects(rule, compiled, ctx, world, None)
+                triggered_bots.add(bid)
+                rule["execution_count"] = rule.get("execution_count", 0) + 1
+    # 清理已离开的bot
+    rule["_triggered_bots"] = triggered_bots.intersection(bot_ids)
+
+
+def _tick_on_time(world, rule, tick, vh):
+    """on_time：到了 trigger_hour 触发一次"""
+    target_hour = rule.get("trigger_hour", 12)
+    if vh != target_hour or rule.get("last_triggered_tick", -1) >= tick - 1:
+        return
+    compiled = _runnable(rule)
+    if compiled is None or not compiled.matches(None, vh):
+        return
+    rule_loc = rule.get("location")
+    ctx = {
+        "bot": None, "bot_id": None, "location": rule_loc,
+        "tick": tick, "virtual_hour": vh,
+        "rule_location": rule_loc, "rule_creator": rule.get("creator", ""),
+    }
+    _run_effects(rule, compiled, ctx, world, None)
+    rule["execution_count"] = rule.get("execution_count", 0) + 1
+    rule["last_triggered_tick"] = tick
 
 
 def tick_rules(world):
-    """每个 tick 执行所有活跃规则。这是规则引擎的心脏。"""
+    """每个 tick 执行所有活跃规则。这是规则引擎的心脏。v10.20: 执行的是编译后的条件与效果
+    v10.21: 规则在注册表里按触发方式 × 地点分桶，失效的规则移进归档；地点规则只在地点有人时才执行"""
     if "active_rules" not in world:
-        world["active_rules"] = []
+        world["active_rules"] = RuleRegistry()
     
-    rules = world["active_rules"]
+    registry = world["active_rules"]
     tick = world["time"]["tick"]
     vh = world["time"]["virtual_hour"]
+    locations = world["locations"]
     
     tick_narratives = []  # 本tick产生的叙事
     
-    for rule in rules:
-        if not rule.get("active", True):
-            continue
-            
-        # 耐久度衰减
-        rule["durability"] = rule.get("durability", 100) - rule.get("decay_rate", 0.1)
-        if rule["durability"] <= 0:
-            rule["active"] = False
+    # 耐久度衰减；耐久度归零或被 modify_rule 关掉的规则移进归档
+    for rule in list(registry):
+        if rule.get("active", True):
+            rule["durability"] = rule.get("durability", 100) - rule.get("decay_rate", 0.1)
+            if rule["durability"] > 0:
+                continue
             log.warning(f"[RULES] 规则[{rule['name']}]耐久度归零，已失效")
             tick_narratives.append(f"{rule['name']}已经消失了")
-            continue
-        
-        trigger = rule.get("trigger", "every_tick")
-        rule_loc = rule.get("location")
-        
-        if trigger == "every_tick":
-            # 对规则所在地点的每个bot检查条件并应用效果
-            if rule_loc:
-                loc_data = world["locations"].get(rule_loc, {})
-                bot_ids = loc_data.get("bots", [])
-            else:
-                # 全局规则，对所有存活bot
-                bot_ids = [bid for bid, b in world["bots"].items() if b["status"] == "alive"]
-            
-            for bid in bot_ids:
-                bot = world["bots"].get(bid)
-                if not bot or bot["status"] != "alive" or bot.get("is_sleeping"):
-                    continue
-                
-                ctx = {
-                    "bot": bot,
-                    "bot_id": bid,
-                    "location": bot.get("location", ""),
-                    "world": world,
-                    "tick": tick,
-                    "virtual_hour": vh,
-                    "rule_location": rule_loc,
-                    "rule_creator": rule.get("creator", ""),
-                }
-                
-                if evaluate_condition(rule.get("condition", {}), ctx):
-                    for eff in rule.get("effects", []):
-                        affected, narr = apply_effect(eff, ctx, world)
-                        if narr:
-                            tick_narratives.append(narr)
-                    rule["execution_count"] = rule.get("execution_count", 0) + 1
-                    rule["last_triggered_tick"] = tick
-                    
-        elif trigger == "on_enter":
-            # 检查是否有新bot进入该地点（通过比较上一tick的bot列表）
-            # 简化处理：每tick只对在该地点的bot执行一次，通过execution记录避免重复
-            if rule_loc:
-                loc_data = world["locations"].get(rule_loc, {})
-                for bid in loc_data.get("bots", []):
-                    bot = world["bots"].get(bid)
-                    if not bot or bot["status"] != "alive":
-                        continue
-                    # 用一个set记录已经触发过的bot
-                    triggered_bots = rule.get("_triggered_bots", set())
-                    if isinstance(triggered_bots, list):
-                        triggered_bots = set(triggered_bots)
-                    if bid not in triggered_bots:
-                        ctx = {
-                            "bot": bot, "bot_id": bid,
-                            "location": rule_loc, "world": world,
-                            "tick": tick, "virtual_hour": vh,
-                            "rule_location": rule_loc,
-                            "rule_creator": rule.get("creator", ""),
-                        }
-                        if evaluate_condition(rule.get("condition", {}), ctx):
-                            for eff in rule.get("effects", []):
-                                apply_effect(eff, ctx, world)
-                            triggered_bots.add(bid)
-                            rule["execution_count"] = rule.get("execution_count", 0) + 1
-                    rule["_triggered_bots"] = triggered_bots
-                    
-                # 清理已离开的bot
-                current_bots = set(loc_data.get("bots", []))
-                rule["_triggered_bots"] = rule.get("_triggered_bots", set()) & current_bots
-                
-        elif trigger == "on_time":
-            # 特定时间触发
-            target_hour = rule.get("trigger_hour", 12)
-            if vh == target_hour and rule.get("last_triggered_tick", -1) < tick - 1:
-                ctx = {
-                    "bot": None, "bot_id": None,
-                    "location": rule_loc, "world": world,
-                    "tick": tick, "virtual_hour": vh,
-                    "rule_location": rule_loc,
-                    "rule_creator": rule.get("creator", ""),
-                }
-                if evaluate_condition(rule.get("condition", {}), ctx):
-                    for eff in rule.get("effects", []):
-                        apply_effect(eff, ctx, world)
-                    rule["execution_count"] = rule.get("execution_count", 0) + 1
-                    rule["last_triggered_tick"] = tick
+        registry.expire(rule, tick)
+        _compiled.pop(rule["id"], None)
+    
+    # every_tick：全局规则对所有存活bot，地点规则只看有人的地点
+    global_rules = list(registry.bucket("every_tick", None).values())
+    if global_rules:
+        alive = [bid for bid, b in world["bots"].items() if b["status"] == "alive"]
+        for rule in global_rules:
+            _tick_every(world, rule, alive, tick, vh, tick_narratives)
+    for loc_name, rules in registry.located("every_tick"):
+        occupants = locations.get(loc_name, {}).get("bots")
+        if occupants:
+            occupants = list(occupants)
+            for rule in list(rules.values()):
+                _tick_every(world, rule, occupants, tick, vh, tick_narratives)
+    
+    # on_enter：地点空了只需要清空触发记录
+    for loc_name, rules in registry.located("on_enter"):
+        occupants = list(locations.get(loc_name, {}).get("bots", []))
+        for rule in list(rules.values()):
+            if occupants or rule.get("_triggered_bots"):
+                _tick_on_enter(world, rule, occupants, tick, vh)
     
-    # 清理失效规则（保留在列表中但标记为inactive，用于历史记录）
-    active_count = sum(1 for r in rules if r.get("active", True))
-    total_count = len(rules)
+    for rule in registry.triggered("on_time"):
+        _tick_on_time(world, rule, tick, vh)
     
     if tick_narratives:
-        log.info(f"[RULES] Tick {tick}: {active_count}/{total_count}条规则活跃, 产生{len(tick_narratives)}条叙事")
+        log.info(f"[RULES] Tick {tick}: {len(registry)}条规则活跃, 产生{len(tick_narratives)}条叙事")
     
     return tick_narratives
 
 
-def generate_rules_from_action(world, bot_id, bot_name, location, action_desc, narrative, client):
-    """让 LLM 判断一个行动是否应该产生新的世界规则。
-    返回规则列表（可能为空）。
-    
-    这是最关键的函数——它让 LLM 把 bot 的行动翻译成世界运行规则。
-    """
-    
-    bot = world["bots"].get(bot_id, {})
-    loc = world["locations"].get(location, {})
-    
+def should_judge_rules(world, action_desc):
+    """节流：行动过于琐碎、或活跃规则已经很多时按概率跳过规则判断（需在世界锁内调用）"""
     # 快速过滤：只过滤最简单的行动
     trivial_keywords = ["睡觉", "入睡", "躺下睡"]
     if any(k in action_desc for k in trivial_keywords):
-        return []
-    
-    # 收集当前活跃规则的摘要（显示更多信息用于去重）
-    existing_rules = [f"- [{r['name']}] by {r.get('creator_name','?')} @ {r.get('location','?')}: {r['description'][:60]}" for r in world.get("active_rules", []) if r.get("active")]
-    existing_rules_text = "\n".join(existing_rules[-20:]) if existing_rules else "暂无"
+        return False
     
-    # 去重：如果已经有太多规则，提高门槛
-    active_count = len([r for r in world.get("active_rules", []) if r.get("active")])
+    # 去重：如果已经有太多规则，提高门槛（注册表里只有活规则，直接取大小）
+    active_count = len(world.get("active_rules", ()))
     if active_count > 50:
         if random.random() > 0.15:
-            return []
+            return False
     elif active_count > 30:
         if random.random() > 0.4:
-            return []
-    
-    prompt = f"""你是深圳生存模拟的世界规则引擎。一个角色刚完成了一个行动，请判断这个行动是否应该向世界注入新的**运行规则**。
+            return False
+    return True
 
-角色: {bot_name} ({bot.get('age','?')}岁, ¥{bot.get('money',0)}, 技能:{json.dumps(bot.get('skills',{}), ensure_ascii=False)})
-地点: {location} - {loc.get('desc','')}
-行动: {action_desc}
-结果: {narrative[:200]}
 
-当前活跃的世界规则:
+def _rule_guide(world, location, money):
+    """规则判断的说明部分：已有规则、什么是规则、输出格式（单独判断和合并判断共用）"""
+    # 收集当前活跃规则的摘要（显示更多信息用于去重）
+    existing_rules = [f"- [{r['name']}] by {r.get('creator_name','?')} @ {r.get('location','?')}: {r['description'][:60]}" for r in world.get("active_rules", []) if r.get("active")]
+    existing_rules_text = "\n".join(existing_rules[-20:]) if existing_rules else "暂无"
+    
+    return f"""当前活跃的世界规则:
 {existing_rules_text}
 
 **什么是世界规则？** 规则是每个tick都会被执行的逻辑，它会真正改变世界的运行方式。例如：
@@ -479,19 +690,56 @@ def generate_rules_from_action(world, bot_id, bot_name, location, action_desc, n
 - {{"type": "narrative", "text": "叙事文本"}}
 
 规则:
-- 要符合现实逻辑（开店需要钱，当前{bot.get('money',0)}元）
+- 要符合现实逻辑（开店需要钱，当前{money}元）
 - 不要创造太强的效果（单次delta不超过20）
-- durability和decay_rate要合理（临时表演decay快，开店decay慢）
+- durability和decay_rate要合理（临时表演decay快，开店decay慢）"""
+
+
+def build_rule_prompt(world, bot_id, bot_name, location, action_desc, narrative):
+    """构建规则判断 prompt（需在世界锁内调用，读取的是当时的世界快照）。
+    行动过于琐碎或被节流时返回 None，调用方直接跳过 LLM。"""
+    if not should_judge_rules(world, action_desc):
+        return None
+    bot = world["bots"].get(bot_id, {})
+    loc = world["locations"].get(location, {})
+    return f"""你是深圳生存模拟的世界规则引擎。一个角色刚完成了一个行动，请判断这个行动是否应该向世界注入新的**运行规则**。
+
+角色: {bot_name} ({bot.get('age','?')}岁, ¥{bot.get('money',0)}, 技能:{json.dumps(bot.get('skills',{}), ensure_ascii=False)})
+地点: {location} - {loc.get('desc','')}
+行动: {action_desc}
+结果: {narrative[:200]}
+
+{_rule_guide(world, location, bot.get('money', 0))}
 - 只输出JSON数组，不要其他文字"""
 
+
+def build_rule_section(world, bot_id, location, action_desc):
+    """v10.13: 合并到后果判断 prompt 里的规则部分（需在世界锁内调用）。
+    节流由调用方先用 should_judge_rules 判断，被节流时不调用本函数，后果判断就不带规则字段。"""
+    bot = world["bots"].get(bot_id, {})
+    return f"""== 世界规则（同一个JSON里的 new_rules 字段）==
+除了后果，还请判断这个行动是否应该向世界注入新的**运行规则**，结果放在 new_rules 字段里。
+下文说的"返回"都指 new_rules 的取值；success 为 false 时 new_rules 一律为 []。
+
+{_rule_guide(world, location, bot.get('money', 0))}"""
+
+
+def request_rule_completion(prompt, client):
+    """调用 LLM 判断规则（不持有世界锁），返回原始文本"""
+    resp = client.chat.completions.create(
+        model=OPENAI_MODEL_MINI,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.4,
+        max_tokens=600,
+    )
+    return resp.choices[0].message.content
+
+
+def parse_rule_response(world, raw, bot_id, bot_name, location):
+    """解析 LLM 返回的规则 JSON 并去重，返回规则列表（可能为空）。
+    需在世界锁内调用，保证与提交时刻的活跃规则比对。"""
     try:
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL_MINI,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.4,
-            max_tokens=600,
-        )
-        raw = resp.choices[0].message.content.strip()
+        raw = (raw or "").strip()
         # 清理
         if raw.startswith("```"):
             raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
@@ -501,7 +749,15 @@ def generate_rules_from_action(world, bot_id, bot_name, location, action_desc, n
         if json_match:
             raw = json_match.group(0)
         
-        rule_defs = json.loads(raw)
+        return parse_rule_defs(world, json.loads(raw), bot_id, bot_name, location)
+    except Exception as e:
+        log.error(f"[RULES] 规则解析失败: {e}")
+        return []
+
+
+def parse_rule_defs(world, rule_defs, bot_id, bot_name, location):
+    """把已解析的规则定义列表转换为标准规则并去重（需在世界锁内调用）"""
+    try:
         if not isinstance(rule_defs, list):
             return []
         
@@ -533,40 +789,60 @@ def generate_rules_from_action(world, bot_id, bot_name, location, action_desc, n
             if is_duplicate(rd["name"], rd.get("description", "")):
                 log.info(f"[RULES] 去重跳过: [{rd['name']}] 与已有规则太相似")
                 continue
-            rule = create_rule(
-                name=rd["name"],
-                creator_id=bot_id,
-                creator_name=bot_name,
-                location=rd.get("location", location),
-                trigger=rd.get("trigger", "every_tick"),
-                condition=rd.get("condition", {"always": True}),
-                effects=rd.get("effects", []),
-                description=rd.get("description", rd["name"]),
-                durability=min(1000, max(1, rd.get("durability", 100))),
-                decay_rate=max(0.01, min(1.0, rd.get("decay_rate", 0.1))),
-            )
+            try:
+                rule = create_rule(
+                    name=rd["name"],
+                    creator_id=bot_id,
+                    creator_name=bot_name,
+                    location=rd.get("location", location),
+                    trigger=rd.get("trigger", "every_tick"),
+                    condition=rd.get("condition", {"always": True}),
+                    effects=rd.get("effects", []),
+                    description=rd.get("description", rd["name"]),
+                    durability=min(1000, max(1, rd.get("durability", 100))),
+                    decay_rate=max(0.01, min(1.0, rd.get("decay_rate", 0.1))),
+                )
+                if rd.get("trigger") == "on_time" and "trigger_hour" in rd:
+                    rule["trigger_hour"] = rd["trigger_hour"]
+                    compile_rule(rule)
+            except RuleError as e:
+                log.error(f"[RULES] 规则[{rd['name']}]不合法，丢弃: {e}")
+                continue
             rule["created_tick"] = world["time"]["tick"]
-            if rd.get("trigger") == "on_time" and "trigger_hour" in rd:
-                rule["trigger_hour"] = rd["trigger_hour"]
             rules.append(rule)
             
         return rules
         
+    except Exception as e:
+        log.error(f"[RULES] 规则解析失败: {e}")
+        return []
+
+
+def generate_rules_from_action(world, bot_id, bot_name, location, action_desc, narrative, client):
+    """让 LLM 判断一个行动是否应该产生新的世界规则。
+    返回规则列表（可能为空）。
+    
+    这是最关键的函数——它让 LLM 把 bot 的行动翻译成世界运行规则。
+    一次性完成 构建→调用→解析，调用方需自行保证 world 的一致性；
+    引擎的行动管线拆开使用这三步，以便 LLM 调用期间释放世界锁。
+    """
+    prompt = build_rule_prompt(world, bot_id, bot_name, location, action_desc, narrative)
+    if not prompt:
+        return []
+    try:
+        raw = request_rule_completion(prompt, client)
     except Exception as e:
         log.error(f"[RULES] generate_rules_from_action LLM失败: {e}")
         return []
+    return parse_rule_response(world, raw, bot_id, bot_name, location)
 
 
 def get_rules_summary(world, location=None):
     """获取规则摘要，供 bot 感知。"""
-    rules = world.get("active_rules", [])
-    active = [r for r in rules if r.get("active", True)]
-    
-    if location:
-        # 该地点的规则 + 全局规则
-        relevant = [r for r in active if r.get("location") == location or r.get("location") is None]
-    else:
-        relevant = active
+    registry = world.get("active_rules") or RuleRegistry()
+    # 该地点的规则 + 全局规则（v10.21: 直接取注册表的两个桶）
+    relevant = registry.at(location) if location else list(registry)
+    relevant = [r for r in relevant if r.get("active", True)]
     
     summaries = []
     for r in relevant[-10:]:
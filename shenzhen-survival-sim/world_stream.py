@@ -0,0 +1,103 @@
+"""
+v10.7 世界推送流 (Server-Sent Events)
+=====================================
+/stream 在每次视图发布（tick 结束、行动提交）后推送增量变更，前端和 Dashboard 不再轮询。
+
+背压策略：每个连接只有一个"有新版本"的标志位（asyncio.Event），不排队消息。
+发布线程只负责把标志位置位；连接协程被唤醒后才去 ChangeFeed 取"自上次推送以来"的
+增量。慢客户端在发送期间错过的多次发布会自然合并成一次最新的增量，内存占用与发布频率无关。
+
+用法:
+    hub = StreamHub()
+    hub.notify()                              # 发布线程（持锁或不持锁均可）
+    async for chunk in hub.events(views, ...):  # StreamingResponse 的生成器
+        ...
+"""
+
+import asyncio
+import logging
+from threading import Lock
+
+log = logging.getLogger("world")
+
+PING_INTERVAL = 15  # 秒，没有变化时发送注释行保活
+
+
+def format_event(event, data, event_id=None):
+    """编码一条 SSE 消息（data 为 bytes）"""
+    head = f"event: {event}\n"
+    if event_id is not None:
+        head += f"id: {event_id}\n"
+    return head.encode() + b"data: " + data + b"\n\n"
+
+
+def parse_event_id(last_event_id):
+    """解析 Last-Event-ID（格式: <epoch>-<version>），失败返回 (None, 0)"""
+    try:
+        epoch, version = last_event_id.rsplit("-", 1)
+        return epoch, int(version)
+    except (AttributeError, ValueError):
+        return None, 0
+
+
+class StreamHub:
+    """管理所有 SSE 连接的唤醒标志"""
+
+    def __init__(self):
+        self._clients = set()  # {(loop, asyncio.Event)}
+        self._mu = Lock()
+        self._stats = {"connected_total": 0, "frames_sent": 0, "notifies": 0}
+
+    def subscribe(self):
+        entry = (asyncio.get_running_loop(), asyncio.Event())
+        with self._mu:
+            self._clients.add(entry)
+            self._stats["connected_total"] += 1
+        return entry
+
+    def unsubscribe(self, entry):
+        with self._mu:
+            self._clients.discard(entry)
+
+    def notify(self):
+        """有新版本发布时调用（任意线程）。只置位标志，不做序列化。"""
+        with self._mu:
+            clients = list(self._clients)
+            self._stats["notifies"] += 1
+        for loop, event in clients:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭，连接随之失效
+                self.unsubscribe((loop, event))
+
+    async def events(self, views, since=0, epoch=None):
+        """一个连接的 SSE 生成器：先推一帧（since=0 时为全量），之后每次唤醒推一帧增量"""
+        entry = self.subscribe()
+        _, wake = entry
+        cursor, client_epoch = since, epoch
+        wake.set()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                wake.clear()
+                fresh_epoch = client_epoch == views.epoch
+                if fresh_epoch and cursor > 0 and views.feed.latest <= cursor:
+                    continue  # 只有与增量流无关的视图变化（如私信），不打扰客户端
+                version, body = views.changes_since(cursor, client_epoch)
+                cursor, client_epoch = version, views.epoch
+                with self._mu:
+                    self._stats["frames_sent"] += 1
+                yield format_event("changes", body, f"{views.epoch}-{version}")
+        finally:
+            self.unsubscribe(entry)
+
+    def stats(self):
+        with self._mu:
+            s = dict(self._stats)
+            s["connected"] = len(self._clients)
+        return s
@@ -0,0 +1,201 @@
+"""
+v10.4 只读视图 (Copy-on-Write World Views)
+==========================================
+GET 端点不再每次请求都持锁遍历 world 组装 dict，而是读取引擎预先发布的视图。
+
+- 引擎在每个 tick 结束、每次行动提交、以及写端点修改后，在世界锁内调用 publish()
+- publish() 把各视图序列化成 JSON bytes，然后整体替换视图表（写时复制）
+- 读者只做一次字典查找，拿到的是不可变的 bytes，完全不碰世界锁
+
+视图按分组组织，每组是 {key: bytes}，单一视图的 key 为 ""：
+    "world"            -> {"": b"..."}
+    "bots"             -> {"bot_1": b"...", "bot_2": b"..."}
+    "location_rules"   -> {"华强北": b"...", ...}
+发布时整组替换，已删除的条目（如死亡 bot）会随之消失。
+
+v10.5: 版本号与 ETag
+- 视图表带一个单调递增的世界版本号，只有视图内容真正变化时才递增
+- 每个条目记住自己最后一次变化时的版本号，作为 ETag（"<启动标识>-v<版本号>"，
+  带启动标识是为了引擎重启、版本号归零后旧 ETag 不会误命中）
+- 客户端带 If-None-Match 轮询，内容没变就拿到空的 304
+
+v10.6: 增量变更流 (ChangeFeed)
+- 发布 /world 时顺带按实体（bot / 地点 / 朋友圈 / 事件 / 规则 / 全局字段）记录内容
+- 每个实体记住最后一次变化的版本号；被移除的实体留下墓碑
+- changes_since(v) 只返回版本号 > v 的实体和墓碑，客户端据此就地打补丁
+- 墓碑只保留最近 horizon 个版本；since 早于保留范围（或换了启动标识）时返回全量并标记 reset
+
+v10.27: 按 key 部分发布
+- publish(partial=...) 里列出的分组只更新给出的条目，其余条目原样保留、也不算删除；
+  单 bot 的视图（详情 / 收件箱 / 感知包）由此只重建、只编码涉及的 bot
+- 增量变更流同样可以只更新某类实体里给出的那些
+- 条目可以直接给出编码好的 bytes（/world 由缓存的 bot 片段拼成），不再重新编码
+"""
+
+import hashlib
+import json
+import uuid
+
+
+def _json_default(obj):
+    """序列化兜底：集合转列表，其余转字符串"""
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return str(obj)
+
+
+def encode(payload):
+    """把视图对象编码为 JSON bytes（与 FastAPI 默认输出一致，不转义中文）"""
+    return json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def etag_matches(if_none_match, etag):
+    """判断 If-None-Match 请求头是否命中 ETag（支持逗号列表、弱校验前缀和 *）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def content_key(payload):
+    """无 id 的只追加条目（如事件）用内容摘要作 key"""
+    return hashlib.sha1(encode(payload)).hexdigest()[:12]
+
+
+class ChangeFeed:
+    """按实体记录变更版本号，供 /world/changes 增量拉取。
+    update 由 ViewStore.publish 在世界锁内调用；changes_since 无锁。"""
+
+    def __init__(self, horizon=500):
+        self.horizon = horizon
+        # (entities, tombstones, floor) 作为一个整体替换，读者拿到的是一致的快照
+        # entities:   {kind: {key: (bytes, version)}}
+        # tombstones: {kind: {key: version}}
+        # floor:      墓碑完整保留的最早版本号，since 早于它时只能全量
+        self._snapshot = ({}, {}, 0)
+        self.latest = 0  # 最近一次有实体变化的版本号
+
+    def update(self, entities, version, partial=()):
+        """用新的实体全集比对旧状态。entities: {kind: {key: payload}}。返回是否有变化。
+        partial 里的实体类只更新给出的 key，没给出的保持原状（不留墓碑）。"""
+        old_entities, old_tombs, floor = self._snapshot
+        new_entities = dict(old_entities)
+        new_tombs = dict(old_tombs)
+        changed = False
+        for kind, items in entities.items():
+            old_items = old_entities.get(kind, {})
+            tombs = dict(old_tombs.get(kind, {}))
+            fresh = dict(old_items) if kind in partial else {}
+            for key, payload in items.items():
+                body = encode(payload)
+                old = old_items.get(key)
+                if old is not None and old[0] == body:
+                    fresh[key] = old
+                else:
+                    fresh[key] = (body, version)
+                    tombs.pop(key, None)
+                    changed = True
+            removed = () if kind in partial else old_items.keys() - fresh.keys()
+            for key in removed:
+                tombs[key] = version
+                changed = True
+            # 超出保留范围的墓碑丢弃，同时抬高 floor
+            cutoff = version - self.horizon
+            for key, v in list(tombs.items()):
+                if v <= cutoff:
+                    del tombs[key]
+                    floor = max(floor, v)
+            new_entities[kind] = fresh
+            new_tombs[kind] = tombs
+        self._snapshot = (new_entities, new_tombs, floor)
+        if changed:
+            self.latest = version
+        return changed
+
+    def changes_since(self, since, version, epoch, client_epoch=None):
+        """构建增量响应 bytes。since 过旧或启动标识不一致时返回全量（reset=true）。"""
+        entities, tombs, floor = self._snapshot
+        reset = since <= 0 or since < floor or since > version or (client_epoch and client_epoch != epoch)
+        threshold = 0 if reset else since
+        parts = [
+            b'{"version":' + str(version).encode(),
+            b'"epoch":' + encode(epoch),
+            b'"since":' + str(threshold).encode(),
+            b'"reset":' + (b"true" if reset else b"false"),
+        ]
+        for kind, items in entities.items():
+            changed = [encode(key) + b":" + body for key, (body, v) in items.items() if v > threshold]
+            parts.append(encode(kind) + b":{" + b",".join(changed) + b"}")
+        removed = {} if reset else {
+            kind: [key for key, v in kt.items() if v > threshold] for kind, kt in tombs.items()
+        }
+        parts.append(b'"removed":' + encode({k: keys for k, keys in removed.items() if keys}))
+        return b",".join(parts) + b"}"
+
+
+class ViewStore:
+    """预序列化视图表。publish 需要调用方持有世界锁，get 无锁。
+    每个条目是 (bytes, version)，version 是该条目最后一次变化时的世界版本号。"""
+
+    def __init__(self):
+        self._groups = {}
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        self.feed = ChangeFeed()
+
+    def publish(self, groups, entities=None, partial=()):
+        """发布若干视图分组。groups: {group: {key: payload}}，整组替换。
+        内容与上次相同的条目保留原版本号；有任何变化时世界版本号 +1。
+        entities 非空时同时更新增量变更流（与视图共用同一个版本号）。
+        v10.27: partial 里的分组（以及同名的实体类）只更新给出的条目，其余保留；payload 为 bytes 时视为已编码的 JSON。"""
+        next_version = self.version + 1
+        changed = False
+        if entities:
+            changed = self.feed.update(entities, next_version, partial)
+        encoded = {}
+        for group, entries in groups.items():
+            old_entries = self._groups.get(group, {})
+            new_entries = dict(old_entries) if group in partial else {}
+            for key, payload in entries.items():
+                body = payload if isinstance(payload, bytes) else encode(payload)
+                old = old_entries.get(key)
+                if old is not None and old[0] == body:
+                    new_entries[key] = old
+                else:
+                    new_entries[key] = (body, next_version)
+                    changed = True
+            if old_entries.keys() - new_entries.keys():
+                changed = True  # 有条目被删除
+            encoded[group] = new_entries
+        merged = dict(self._groups)
+        merged.update(encoded)
+        if changed:
+            self.version = next_version
+        self._groups = merged  # 引用替换是原子的，读者要么看到旧表，要么看到新表
+        return changed
+
+    def get(self, group, key=""):
+        """读取视图 bytes，不存在时返回 None"""
+        entry = self._groups.get(group, {}).get(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, group, key=""):
+        """读取 (bytes, etag)，不存在时返回 None"""
+        entry = self._groups.get(group, {}).get(key)
+        if entry is None:
+            return None
+        return entry[0], f'"{self.epoch}-v{entry[1]}"'
+
+    def changes_since(self, since, client_epoch=None):
+        """/world/changes 的响应，返回 (version, bytes)"""
+        version = self.version
+        return version, self.feed.changes_since(since, version, self.epoch, client_epoch)
+
+    def groups(self):
+        """已发布的分组名"""
+        return list(self._groups)